@@ -1,16 +1,30 @@
-from fastapi import APIRouter, Security, HTTPException, Body, Path, Query, Depends, WebSocket, WebSocketDisconnect
-from typing import List, Dict, Optional, Union
+from fastapi import APIRouter, Security, HTTPException, Body, Header, Path, Query, Depends, WebSocket, WebSocketDisconnect
+from typing import List, Dict, Optional, Tuple, Union
 from pydantic import BaseModel, Field, field_validator
 from enum import Enum
 from common.auth import azure_scheme, scopes
-from common.log import logger
+from common.debounce import Debouncer
+from common.json_stream import streaming_json_response, wants_ndjson
+from common.log import log_event, logger
 from common.role_based_access import required_roles
+from common.send_queue import OverflowPolicy
+from common.snapshot_cache import SnapshotCache
 from common.socket import ConnectionManager
+from common.state_feed import StateFeedConnectionManager
 from db.future_gadget_lab_data_service import (
     FutureGadgetLabDataService,
     ExperimentStatus,
-    calculate_worldline_status,
+    InvalidContinuationTokenError,
+    READING_VALUE_FIELD,
 )
+from db.worldline_history import build_worldline_history
+from db.async_future_gadget_lab_data_service import (
+    AsyncFutureGadgetLabDataService,
+    ThreadPoolFutureGadgetLabDataService,
+    fgl_cosmos_connection_limits,
+)
+from os import environ as os_environ
+import time
 
 from common.config import mock_enabled, tfconfig
 
@@ -22,6 +36,7 @@ if mock_enabled:
     # Important: import this only when mock enabled - locally, because on deploy the mock folder does not exist
     from mock.mock_future_gadget_lab_data_service import MockFutureGadgetLabDataService
     fgl_service = MockFutureGadgetLabDataService()
+    cosmos_settings = None
 else:
     try:
         cosmos_endpoint_entry = tfconfig.get("cosmos_account_endpoint")
@@ -44,26 +59,155 @@ else:
         if not cosmos_container:
             raise RuntimeError("Missing Cosmos configuration value 'cosmos_container_name'")
 
-        fgl_service = FutureGadgetLabDataService(
-            cosmos_account_uri=cosmos_endpoint,
-            cosmos_database=cosmos_database,
-            cosmos_container=cosmos_container,
-        )
+        cosmos_settings = {
+            "cosmos_account_uri": cosmos_endpoint,
+            "cosmos_database": cosmos_database,
+            "cosmos_container": cosmos_container,
+        }
+        fgl_service = FutureGadgetLabDataService(**cosmos_settings)
     except KeyError as exc:  # pragma: no cover - configuration errors surfaced at runtime
         raise RuntimeError(f"Missing Cosmos configuration value from terraform outputs: {exc}") from exc
 
+# The route handlers run on the event loop; every data-service call goes
+# through this facade so the blocking Cosmos SDK runs on a bounded thread
+# pool instead (see db/async_future_gadget_lab_data_service.py). The
+# in-memory TinyDB mock is not thread-safe, so it gets a single worker.
+fgl_thread_pool_service = ThreadPoolFutureGadgetLabDataService(
+    lambda: fgl_service,
+    max_workers=1 if fgl_service.storage_backend == "tinydb" else None,
+)
+fgl_async_service = fgl_thread_pool_service
+
+# With Cosmos configured, the lifespan startup hook swaps ``fgl_async_service``
+# for a native ``azure.cosmos.aio`` client with a pooled aiohttp transport,
+# one per worker process. ``FGL_COSMOS_ASYNC=false`` keeps the thread pool.
+_FGL_COSMOS_ASYNC_ENV = "FGL_COSMOS_ASYNC"
+
+
+async def open_async_cosmos_service() -> None:
+    """Switch the routes to the native asyncio Cosmos backend, if enabled.
+
+    Called once per worker from the FastAPI lifespan startup hook. If the
+    client cannot be opened the thread-pool facade stays in place.
+    """
+    global fgl_async_service
+    if cosmos_settings is None or fgl_async_service is not fgl_thread_pool_service:
+        return
+    if os_environ.get(_FGL_COSMOS_ASYNC_ENV, "true").strip().lower() == "false":
+        logger.info("Native asyncio Cosmos backend disabled via %s", _FGL_COSMOS_ASYNC_ENV)
+        return
+
+    service = AsyncFutureGadgetLabDataService(**cosmos_settings, **fgl_cosmos_connection_limits())
+    try:
+        await service.open()
+    except Exception as exc:
+        logger.error("Failed to open asyncio Cosmos client, using thread pool instead: %s", exc)
+        await service.close()
+        return
+    fgl_async_service = service
+
+
+async def close_async_cosmos_service() -> None:
+    """Close the native asyncio Cosmos client and fall back to the thread pool."""
+    global fgl_async_service
+    service, fgl_async_service = fgl_async_service, fgl_thread_pool_service
+    if isinstance(service, AsyncFutureGadgetLabDataService):
+        await service.close()
+
 # Create connection manager for experiments only
 experiment_connection_manager = ConnectionManager(
     receiver_roles=["Admin"],
-    sender_roles=["Admin"]
+    sender_roles=["Admin"],
+    # A client that falls this far behind on CRUD events reconnects and
+    # reloads rather than silently missing some
+    overflow_policy=OverflowPolicy.DISCONNECT,
 )
 
-# Add a new connection manager for worldline status updates
-worldline_connection_manager = ConnectionManager(
+# Every worldline client may ask for the current status (the non-admin
+# "ping" below, or a resync). They are all served one shared snapshot,
+# dropped by every experiment write on this worker and reloaded at least
+# every few seconds to pick up writes handled by other workers.
+_WORLDLINE_STATUS_MAX_AGE = 5.0
+
+# A connection whose ping finds no snapshot may have one loaded at most this
+# often, in seconds; pings beyond that are ignored until a snapshot exists.
+_WORLDLINE_STATUS_REFRESH_INTERVAL = 1.0
+
+worldline_status_cache = SnapshotCache(
+    # Looked up on every load, so the lifespan can swap the backend
+    lambda: fgl_async_service.get_worldline_status(),
+    max_age=_WORLDLINE_STATUS_MAX_AGE,
+)
+
+async def _load_worldline_status() -> Dict:
+    """Current worldline status, stamped with the time in JavaScript ISO format."""
+    # Copied: the cached snapshot is shared
+    status = dict(await worldline_status_cache.get())
+    import datetime
+    now = datetime.datetime.now(datetime.timezone.utc)
+    status["timestamp"] = now.strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3] + 'Z'
+    return status
+
+# Add a new connection manager for worldline status updates. Clients that
+# send {"action": "resync"} get a numbered snapshot and then only the changed
+# fields of each update (see ``common/state_feed.py``).
+worldline_connection_manager = StateFeedConnectionManager(
     receiver_roles=None,  # Allow any authenticated user to receive
-    sender_roles=["Admin"]  # Only Admins can send
+    sender_roles=["Admin"],  # Only Admins can send
+    # Only the latest worldline snapshot matters to a slow client; deltas
+    # are never coalesced, a client that misses one resyncs
+    overflow_policy=OverflowPolicy.COALESCE_LATEST,
+    state_type="worldline_update",
+    delta_type="worldline_delta",
+    state_loader=_load_worldline_status,
 )
 
+# Each worker keeps its own worldline aggregate and status snapshot, and
+# only its own writes update them. An experiment event relayed from another
+# worker means the store changed behind this worker's back: its totals are
+# marked for a full reconciliation and its snapshot is dropped, so its next
+# status read or broadcast reflects the other worker's write. (Divergence
+# readings are only written by seeding, so no reading events are relayed.)
+_EXPERIMENT_WRITE_TYPES = ("create", "update", "delete")
+
+
+def _on_remote_experiment_event(payload: Dict) -> None:
+    """Forget the worldline state derived before another worker's experiment write."""
+    if payload.get("kind") != "server" or payload["message"].get("type") not in _EXPERIMENT_WRITE_TYPES:
+        return
+    for service in (fgl_service, fgl_async_service):
+        aggregate = getattr(service, "worldline_aggregate", None)
+        if aggregate is not None:
+            aggregate.mark_dirty()
+    worldline_status_cache.invalidate()
+
+
+experiment_connection_manager.add_remote_listener(_on_remote_experiment_event)
+
+# Clients on both sockets may narrow what they receive by subscribing to
+# topics with a control frame (see ``ConnectionManager.handle_control_frame``).
+# Experiment events, and the worldline updates they trigger, are published
+# under the experiment's topics:
+#
+#   experiment:<id>, creator:<creator_id>, status:<status>
+#
+# A client that has not subscribed to anything still receives every event.
+
+
+def _experiment_topics(*experiments: Optional[Dict]) -> List[str]:
+    """Topics an event about the given experiment state(s) is published under."""
+    topics = set()
+    for experiment in experiments:
+        if not experiment:
+            continue
+        status = experiment.get("status")
+        # Stored experiments may carry the enum member rather than its value.
+        status = getattr(status, "value", status)
+        for prefix, value in (("experiment", experiment.get("id")), ("creator", experiment.get("creator_id")), ("status", status)):
+            if value is not None:
+                topics.add(f"{prefix}:{value}")
+    return sorted(topics)
+
 # --- Pydantic Models for Request/Response Validation ---
 
 class ExperimentBase(BaseModel):
@@ -111,26 +255,72 @@ class ExperimentUpdate(BaseModel):
                 raise ValueError(f"Could not convert {v} to float")
         return v
 
+class Page(BaseModel):
+    """One page of a collection; pass ``next`` back as ``continuation``."""
+    items: List[Dict]
+    next: Optional[str] = None
+
 # --- API Routes ---
 
+# Page size used when only ``continuation`` is given, and the upper bound
+# accepted for ``limit``
+DEFAULT_PAGE_LIMIT = 100
+MAX_PAGE_LIMIT = 1000
+
+def _paged(limit: Optional[int], continuation: Optional[str]) -> bool:
+    return limit is not None or continuation is not None
+
+def _streamed(stream: bool, accept: Optional[str]) -> bool:
+    # Streaming skips ``response_model`` validation and encodes items as the
+    # storage pager yields them; NDJSON is only ever sent when asked for.
+    return stream or wants_ndjson(accept)
+
+async def _fetch_page(fetch, *args) -> Tuple[List[Dict], Optional[str]]:
+    try:
+        return await fetch(*args)
+    except InvalidContinuationTokenError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+
 # ----- EXPERIMENTS ROUTES ONLY -----
 
-@future_gadget_api_router.get("/lab-experiments", response_model=List[Dict])
+@future_gadget_api_router.get("/lab-experiments", response_model=Union[List[Dict], Page])
 @required_roles(["Admin"])
 async def get_all_experiments(
     name: Optional[str] = Query(None, description="Filter by experiment name"),
     status: Optional[ExperimentStatus] = Query(None, description="Filter by experiment status"),
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_LIMIT, description="Page size; returns a page with a next token"),
+    continuation: Optional[str] = Query(None, description="The next token of the previous page"),
+    stream: bool = Query(False, description="Stream the collection instead of building it in memory"),
+    accept: Optional[str] = Header(None),
     token=Security(azure_scheme, scopes=scopes)
 ):
-    logger.info("Future Gadget Lab API - Getting all experiments")
-    if name or status:
-        query_params = {}
-        if name:
-            query_params["name"] = name
-        if status:
-            query_params["status"] = status
-        return fgl_service.search_experiments(query_params)
-    return fgl_service.get_all_experiments()
+    """
+    Get all experiments.
+
+    With ``limit`` or ``continuation`` the response is a page; otherwise
+    ``stream=true`` or ``Accept: application/x-ndjson`` streams the whole
+    collection (see ``_streamed``).
+    """
+    log_event(logger, "info", "fgl.experiments.list", "Future Gadget Lab API - Getting all experiments")
+    query_params = {}
+    if name:
+        query_params["name"] = name
+    if status:
+        query_params["status"] = status
+    if _paged(limit, continuation):
+        items, next_token = await _fetch_page(
+            fgl_async_service.get_experiments_page,
+            limit or DEFAULT_PAGE_LIMIT,
+            continuation,
+            query_params or None,
+        )
+        return {"items": items, "next": next_token}
+    if _streamed(stream, accept):
+        items = await fgl_async_service.iter_experiments(query_params or None)
+        return streaming_json_response(items, accept)
+    if query_params:
+        return await fgl_async_service.search_experiments(query_params)
+    return await fgl_async_service.get_all_experiments()
 
 @future_gadget_api_router.get("/lab-experiments/{experiment_id}", response_model=Dict)
 @required_roles(["Admin"])
@@ -138,8 +328,11 @@ async def get_experiment_by_id(
     experiment_id: str = Path(..., description="The ID of the experiment to retrieve"),
     token=Security(azure_scheme, scopes=scopes)
 ):
-    logger.info(f"Future Gadget Lab API - Getting experiment with ID: {experiment_id}")
-    experiment = fgl_service.get_experiment_by_id(experiment_id)
+    log_event(
+        logger, "info", "fgl.experiment.get",
+        "Future Gadget Lab API - Getting experiment with ID: {experiment_id}", experiment_id=experiment_id,
+    )
+    experiment = await fgl_async_service.get_experiment_by_id(experiment_id)
     if not experiment:
         raise HTTPException(status_code=404, detail=f"Experiment with ID {experiment_id} not found")
     return experiment
@@ -150,15 +343,20 @@ async def create_experiment(
     experiment: ExperimentCreate,
     token=Security(azure_scheme, scopes=scopes)
 ):
-    logger.info(f"Future Gadget Lab API - Creating new experiment: {experiment.name}")
+    log_event(
+        logger, "info", "fgl.experiment.create",
+        "Future Gadget Lab API - Creating new experiment: {name}", name=experiment.name,
+    )
     
     # Get username directly from token
     username = getattr(token, "preferred_username", "unknown")
     
     # Create the experiment in database
-    created_experiment = fgl_service.create_experiment(experiment.model_dump())
+    created_experiment = await fgl_async_service.create_experiment(experiment.model_dump())
+    worldline_status_cache.invalidate()
     
     # Broadcast to experiment subscribers using server broadcast
+    topics = _experiment_topics(created_experiment)
     await experiment_connection_manager.broadcast_server(
         data={
             **created_experiment,
@@ -166,14 +364,16 @@ async def create_experiment(
             "type": "create"
         },
         type="create",
-        username=f"Lab Member: {username}"
+        username=f"Lab Member: {username}",
+        topics=topics,
     )
     
     # Broadcast worldline status update to all users
-    await broadcast_worldline_status(
+    worldline_broadcaster.trigger(
         experiment=created_experiment,
         username=f"Lab Member: {username}",
-        custom_message=f"New experiment '{created_experiment['name']}' created"
+        custom_message=f"New experiment '{created_experiment['name']}' created",
+        topics=topics,
     )
     
     return created_experiment
@@ -185,17 +385,23 @@ async def update_experiment(
     experiment: ExperimentUpdate = Body(...),
     token=Security(azure_scheme, scopes=scopes)
 ):
-    logger.info(f"Future Gadget Lab API - Updating experiment with ID: {experiment_id}")
-    existing_experiment = fgl_service.get_experiment_by_id(experiment_id)
+    log_event(
+        logger, "info", "fgl.experiment.update",
+        "Future Gadget Lab API - Updating experiment with ID: {experiment_id}", experiment_id=experiment_id,
+    )
+    existing_experiment = await fgl_async_service.get_experiment_by_id(experiment_id)
     if not existing_experiment:
         raise HTTPException(status_code=404, detail=f"Experiment with ID {experiment_id} not found")
     
     # Get username directly from token
     username = getattr(token, "preferred_username", "unknown")
     
-    updated_experiment = fgl_service.update_experiment(experiment_id, experiment.model_dump(exclude_unset=True))
+    updated_experiment = await fgl_async_service.update_experiment(experiment_id, experiment.model_dump(exclude_unset=True))
+    worldline_status_cache.invalidate()
     
-    # Broadcast to experiment subscribers using server broadcast
+    # Broadcast to experiment subscribers using server broadcast. Subscribers
+    # of the old status or creator learn that the experiment left it.
+    topics = _experiment_topics(existing_experiment, updated_experiment)
     await experiment_connection_manager.broadcast_server(
         data={
             **updated_experiment,
@@ -203,14 +409,16 @@ async def update_experiment(
             "type": "update"
         },
         type="update",
-        username=f"Lab Member: {username}"
+        username=f"Lab Member: {username}",
+        topics=topics,
     )
     
     # Broadcast worldline status update to all users
-    await broadcast_worldline_status(
+    worldline_broadcaster.trigger(
         experiment=updated_experiment,
         username=f"Lab Member: {username}",
-        custom_message=f"Experiment '{updated_experiment['name']}' updated"
+        custom_message=f"Experiment '{updated_experiment['name']}' updated",
+        topics=topics,
     )
     
     return updated_experiment
@@ -221,20 +429,25 @@ async def delete_experiment(
     experiment_id: str = Path(..., description="The ID of the experiment to delete"),
     token=Security(azure_scheme, scopes=scopes)
 ):
-    logger.info(f"Future Gadget Lab API - Deleting experiment with ID: {experiment_id}")
+    log_event(
+        logger, "info", "fgl.experiment.delete",
+        "Future Gadget Lab API - Deleting experiment with ID: {experiment_id}", experiment_id=experiment_id,
+    )
     
-    experiment = fgl_service.get_experiment_by_id(experiment_id)
+    experiment = await fgl_async_service.get_experiment_by_id(experiment_id)
     if not experiment:
         raise HTTPException(status_code=404, detail=f"Experiment with ID {experiment_id} not found")
     
     # Get username directly from token
     username = getattr(token, "preferred_username", "unknown")
     
-    success = fgl_service.delete_experiment(experiment_id)
+    success = await fgl_async_service.delete_experiment(experiment_id)
+    worldline_status_cache.invalidate()
     if not success:
         raise HTTPException(status_code=500, detail=f"Failed to delete experiment with ID {experiment_id}")
     
     # Broadcast to experiment subscribers using server broadcast
+    topics = _experiment_topics(experiment)
     await experiment_connection_manager.broadcast_server(
         data={
             "id": experiment_id, 
@@ -243,13 +456,15 @@ async def delete_experiment(
             "type": "delete"
         },
         type="delete",
-        username=f"Lab Member: {username}"
+        username=f"Lab Member: {username}",
+        topics=topics,
     )
     
     # Broadcast worldline status update to all users
-    await broadcast_worldline_status(
+    worldline_broadcaster.trigger(
         username=f"Lab Member: {username}",
-        custom_message=f"Experiment '{experiment['name']}' deleted"
+        custom_message=f"Experiment '{experiment['name']}' deleted",
+        topics=topics,
     )
     
     return {"message": f"Experiment with ID {experiment_id} successfully deleted"}
@@ -264,10 +479,16 @@ async def experiment_websocket_endpoint(websocket: WebSocket):
         try:
             while True:
                 data = await websocket.receive_text()
+                if await experiment_connection_manager.handle_control_frame(websocket, data):
+                    continue
                 await experiment_connection_manager.send_personal_message(f"Experiment channel: {data}", websocket)
         except WebSocketDisconnect:
             experiment_connection_manager.disconnect(websocket)
-            logger.info(f"Client disconnected from experiment WebSocket: {websocket.state.user.get('name', 'Unknown')}")
+            log_event(
+                logger, "info", "fgl.experiments_ws.disconnected",
+                "Client disconnected from experiment WebSocket: {user}",
+                user=lambda: websocket.state.user.get('name', 'Unknown'),
+            )
     except Exception as e:
         logger.error(f"Experiment WebSocket error: {str(e)}")
         if websocket in experiment_connection_manager.active_connections:
@@ -281,35 +502,51 @@ async def worldline_status_websocket_endpoint(websocket: WebSocket):
     try:
         await worldline_connection_manager.auth_connect(websocket)
         
+        # When this connection last had the worldline status loaded
+        last_refresh = float("-inf")
         try:
             while True:
-                # Wait for messages (mostly for ping/pong to keep connection alive)
+                # Wait for messages: control frames, including the heartbeat's
+                # pongs, or legacy keepalive pings
                 data = await websocket.receive_text()
+                if await worldline_connection_manager.handle_control_frame(websocket, data):
+                    continue
                 # Only respond with current worldline status to non-admin users
-                # (they can't send actual updates)
+                # (they can't send actual updates). Clients on the heartbeat
+                # (see ``common/socket.py``) need not ping at all.
                 if "Admin" not in getattr(websocket.state.user, "roles", []):
+                    # Served from the shared snapshot; a connection may only
+                    # cause a reload once per refresh interval
+                    if worldline_status_cache.peek() is None:
+                        now = time.monotonic()
+                        if now - last_refresh < _WORLDLINE_STATUS_REFRESH_INTERVAL:
+                            continue
+                        last_refresh = now
+
                     # Get current worldline status
-                    experiments = fgl_service.get_all_experiments()
-                    readings = fgl_service.get_all_divergence_readings()
-                    status = calculate_worldline_status(experiments, readings)
-                    
-                    # Add current timestamp
-                    import datetime
-                    now = datetime.datetime.now(datetime.timezone.utc)
-                    status["timestamp"] = now.strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3] + 'Z'
+                    status = await _load_worldline_status()
                     
                     # Send current status as response
                     await worldline_connection_manager.send_personal_message(status, websocket)
         except WebSocketDisconnect:
             worldline_connection_manager.disconnect(websocket)
-            logger.info(f"Client disconnected from worldline WebSocket: {websocket.state.user.get('name', 'Unknown')}")
+            log_event(
+                logger, "info", "fgl.worldline_ws.disconnected",
+                "Client disconnected from worldline WebSocket: {user}",
+                user=lambda: websocket.state.user.get('name', 'Unknown'),
+            )
     except Exception as e:
         logger.error(f"Worldline WebSocket error: {str(e)}")
         if websocket in worldline_connection_manager.active_connections:
             worldline_connection_manager.disconnect(websocket)
 
 # Add a new function to broadcast worldline status to all connected clients
-async def broadcast_worldline_status(experiment: Dict = None, username: str = "Divergence Meter", custom_message: str = None):
+async def broadcast_worldline_status(
+    experiment: Dict = None,
+    username: str = "Divergence Meter",
+    custom_message: str = None,
+    topics: Optional[List[str]] = None,
+):
     """
     Broadcast current worldline status to all connected clients using server broadcast.
     
@@ -318,26 +555,20 @@ async def broadcast_worldline_status(experiment: Dict = None, username: str = "D
                   (useful for previewing impact before saving)
         username: Optional custom username for the broadcast (defaults to "Divergence Meter")
         custom_message: Optional message to include with the broadcast
+        topics: Topics of the experiment event behind this update; None
+                sends it to every client
     
     This function can be called whenever the worldline status changes.
     """
-    # Get all experiments from the database
-    experiments = fgl_service.get_all_experiments()
-    
     # If an additional experiment is provided, include it in the calculation
+    # on top of the stored experiments
     if experiment is not None and experiment.get("world_line_change") is not None:
-        # Create a copy of experiments to avoid modifying the original list
-        calculation_experiments = experiments.copy()
-        # Add the provided experiment to the temporary calculation list
-        calculation_experiments.append(experiment)
+        preview_experiment = experiment
     else:
-        calculation_experiments = experiments
-    
-    # Get all divergence readings
-    readings = fgl_service.get_all_divergence_readings()
+        preview_experiment = None
     
-    # Calculate worldline status with the combined experiment list
-    status = calculate_worldline_status(calculation_experiments, readings)
+    # Worldline status from the maintained aggregate plus the preview
+    status = await fgl_async_service.get_worldline_status(preview_experiment=preview_experiment)
     
     # Add current timestamp
     import datetime
@@ -359,16 +590,60 @@ async def broadcast_worldline_status(experiment: Dict = None, username: str = "D
     if custom_message:
         status["message"] = custom_message
     
-    # Use the new broadcast_server method instead of broadcast
-    await worldline_connection_manager.broadcast_server(
-        data=status,
-        type="worldline_update",
-        username=username
+    # Publish as the next version of the worldline state: a full update for
+    # most clients, only the changed fields for clients that asked for deltas
+    await worldline_connection_manager.publish_state(
+        status,
+        username=username,
+        topics=topics,
     )
     
     # Return the status (useful when calling this function directly)
     return status
 
+# Writes don't await the worldline broadcast; they trigger
+# ``worldline_broadcaster``, which collapses the writes of a burst into one
+# computation and one broadcast of the state after the last of them (see
+# ``common/debounce.py``). FGL_WORLDLINE_BROADCAST_WINDOW_MS sets the
+# window; 0 still collapses writes that land while a broadcast is running.
+_WORLDLINE_BROADCAST_WINDOW_ENV = "FGL_WORLDLINE_BROADCAST_WINDOW_MS"
+_DEFAULT_WORLDLINE_BROADCAST_WINDOW_MS = 100
+
+
+def _worldline_broadcast_window() -> float:
+    """Debounce window of the worldline broadcast, in seconds."""
+    raw = os_environ.get(_WORLDLINE_BROADCAST_WINDOW_ENV, "").strip()
+    try:
+        window_ms = int(raw) if raw else _DEFAULT_WORLDLINE_BROADCAST_WINDOW_MS
+    except ValueError:
+        window_ms = _DEFAULT_WORLDLINE_BROADCAST_WINDOW_MS
+    return max(0, window_ms) / 1000
+
+
+def _merge_worldline_broadcasts(pending: Dict, latest: Dict) -> Dict:
+    """Arguments of the one broadcast standing in for two collapsed ones.
+
+    The latest write supplies the preview, sender and message. The topics
+    are the union of both, so every subscriber of an experiment changed in
+    the burst receives the update; an untargeted write reaches everyone.
+    """
+    merged = dict(latest)
+    if pending.get("topics") is None or latest.get("topics") is None:
+        merged["topics"] = None
+    else:
+        merged["topics"] = sorted(set(pending["topics"]) | set(latest["topics"]))
+    return merged
+
+
+worldline_broadcaster = Debouncer(
+    # Looked up on every run, so patching ``broadcast_worldline_status``
+    # takes effect
+    lambda **kwargs: broadcast_worldline_status(**kwargs),
+    window=_worldline_broadcast_window(),
+    merge=_merge_worldline_broadcasts,
+    name="worldline broadcast",
+)
+
 @future_gadget_api_router.get("/worldline-status", response_model=Dict)
 async def get_current_worldline_status(
     token=Security(azure_scheme, scopes=scopes)
@@ -377,16 +652,10 @@ async def get_current_worldline_status(
     Calculate the current worldline status by summing all experiment divergences.
     Returns the calculated worldline value and the closest known reading.
     """
-    logger.info("Future Gadget Lab API - Getting current worldline status")
-    
-    # Get all experiments
-    experiments = fgl_service.get_all_experiments()
-    
-    # Get all divergence readings
-    readings = fgl_service.get_all_divergence_readings()
+    log_event(logger, "info", "fgl.worldline.status", "Future Gadget Lab API - Getting current worldline status")
     
-    # Calculate worldline status
-    response = calculate_worldline_status(experiments, readings)
+    # Worldline status from the aggregate maintained by the data service
+    response = await fgl_async_service.get_worldline_status()
     
     # Add current timestamp in JavaScript ISO format: YYYY-MM-DDTHH:mm:ss.sssZ
     import datetime
@@ -403,50 +672,16 @@ async def get_worldline_history(
     Calculate worldline states after each experiment.
     Returns an array of worldline states showing how the worldline changed over time.
     """
-    logger.info("Future Gadget Lab API - Getting worldline history")
+    log_event(logger, "info", "fgl.worldline.history", "Future Gadget Lab API - Getting worldline history")
     
     # Get all experiments
-    all_experiments = fgl_service.get_all_experiments()
+    all_experiments = await fgl_async_service.get_all_experiments()
     
     # Get all divergence readings
-    readings = fgl_service.get_all_divergence_readings()
+    readings = await fgl_async_service.get_all_divergence_readings()
     
-    # Sort experiments by timestamp
-    sorted_experiments = sorted(
-        [exp for exp in all_experiments if exp.get('timestamp')],
-        key=lambda x: x.get('timestamp', ''),
-    )
-    
-    # Calculate worldline states progressively
-    history = []
-    accumulated_experiments = []
-    
-    # Add base worldline (1.0) as starting point with no experiments
-    base_state = calculate_worldline_status([], readings)
-    base_state["added_experiment"] = None
-    history.append(base_state)
-    
-    # Calculate worldline after each experiment
-    for experiment in sorted_experiments:
-        accumulated_experiments.append(experiment)
-        
-        # Calculate new state with all experiments up to this point
-        state = calculate_worldline_status(accumulated_experiments.copy(), readings)
-        
-        # Add experiment details to the state - uncomment and use this code
-        state["added_experiment"] = {
-            "id": experiment.get("id"),
-            "name": experiment.get("name"),
-            "description": experiment.get("description", ""),
-            "status": experiment.get("status"),
-            "world_line_change": experiment.get("world_line_change", 0),
-            "creator_id": experiment.get("creator_id", "Unknown"),
-            "collaborators": experiment.get("collaborators", []),
-            "results": experiment.get("results", ""),
-            "timestamp": experiment.get("timestamp")
-        }
-        
-        history.append(state)
+    # Base state plus the state after each experiment, in timestamp order
+    history = build_worldline_history(all_experiments, readings)
     
     # Add current timestamp to each state for consistency
     import datetime
@@ -458,46 +693,50 @@ async def get_worldline_history(
     
     return history
 
-@future_gadget_api_router.get("/divergence-readings", response_model=List[Dict])
+@future_gadget_api_router.get("/divergence-readings", response_model=Union[List[Dict], Page])
 async def get_divergence_readings(
     status: Optional[str] = Query(None, description="Filter by worldline status"),
     recorded_by: Optional[str] = Query(None, description="Filter by who recorded the reading"),
     min_value: Optional[float] = Query(None, description="Filter by minimum reading value"),
     max_value: Optional[float] = Query(None, description="Filter by maximum reading value"),
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_LIMIT, description="Page size; returns a page with a next token"),
+    continuation: Optional[str] = Query(None, description="The next token of the previous page"),
+    stream: bool = Query(False, description="Stream the collection instead of building it in memory"),
+    accept: Optional[str] = Header(None),
     token=Security(azure_scheme, scopes=scopes)
 ):
     """
     Get all divergence meter readings.
     This endpoint is accessible to all authenticated users.
+
+    With ``limit`` or ``continuation`` the response is a page
+    ``{"items": [...], "next": token}``. Filters are part of the storage
+    query, so they are applied before paging rather than to each page.
+    Without paging, ``stream=true`` or ``Accept: application/x-ndjson``
+    streams the matching readings.
     """
-    logger.info("Future Gadget Lab API - Getting all divergence readings")
-    readings = fgl_service.get_all_divergence_readings()
-    
-    # Apply filters if specified
-    filtered_readings = readings
+    log_event(logger, "info", "fgl.divergence_readings.list", "Future Gadget Lab API - Getting all divergence readings")
+    predicates = []
     if status:
-        filtered_readings = [r for r in filtered_readings if r.get('status') == status]
+        predicates.append(("status", "eq", status))
     if recorded_by:
-        filtered_readings = [r for r in filtered_readings if r.get('recorded_by') == recorded_by]
+        predicates.append(("recorded_by", "eq", recorded_by))
     if min_value is not None:
-        filtered_readings = [r for r in filtered_readings if get_reading_value(r) >= min_value]
+        predicates.append((READING_VALUE_FIELD, "ge", min_value))
     if max_value is not None:
-        filtered_readings = [r for r in filtered_readings if get_reading_value(r) <= max_value]
-    
-    return filtered_readings
+        predicates.append((READING_VALUE_FIELD, "le", max_value))
 
-# Helper function to extract reading value safely
-def get_reading_value(reading: Dict) -> float:
-    """Extract the reading value, handling different field names and types"""
-    value = reading.get("reading")
-    if value is None:
-        value = reading.get("value")
-    
-    # Convert to float if it's a string
-    if isinstance(value, str):
-        try:
-            return float(value)
-        except ValueError:
-            return 0.0
-    
-    return value or 0.0
\ No newline at end of file
+    if _paged(limit, continuation):
+        items, next_token = await _fetch_page(
+            fgl_async_service.get_divergence_readings_page,
+            limit or DEFAULT_PAGE_LIMIT,
+            continuation,
+            predicates or None,
+        )
+        return {"items": items, "next": next_token}
+    if _streamed(stream, accept):
+        readings = await fgl_async_service.iter_divergence_readings(predicates or None)
+        return streaming_json_response(readings, accept)
+    if predicates:
+        return await fgl_async_service.search_divergence_readings(predicates)
+    return await fgl_async_service.get_all_divergence_readings()
\ No newline at end of file
@@ -5,11 +5,13 @@ from unittest.mock import patch, MagicMock, AsyncMock
 from types import SimpleNamespace
 from fastapi import WebSocketDisconnect
 import datetime
+import json
 
 from api.future_gadget_api import future_gadget_api_router
 from common.auth import azure_scheme
 from common.role_based_access import required_roles
 from common.log import logger
+from mock.mock_future_gadget_lab_data_service import MockFutureGadgetLabDataService
 
 # Create a test app using the actual router
 app = FastAPI()
@@ -17,6 +19,14 @@ app.include_router(future_gadget_api_router)
 client = TestClient(app)
 API_PREFIX = ""
 
+# Tests patch the data service; none may see a worldline status cached by another
+@pytest.fixture(autouse=True)
+def fresh_worldline_status_cache():
+    from api.future_gadget_api import worldline_status_cache
+    worldline_status_cache.invalidate()
+    yield
+    worldline_status_cache.invalidate()
+
 # Fixture to override security and logging similar to api_test.py
 @pytest.fixture
 def mock_dependencies():
@@ -189,7 +199,7 @@ class TestExperimentEndpoints:
         current_time = datetime.datetime.now().isoformat()
         # Mock both broadcast methods
         with patch("api.future_gadget_api.experiment_connection_manager.broadcast", AsyncMock()), \
-             patch("api.future_gadget_api.broadcast_worldline_status", AsyncMock()), \
+             patch("api.future_gadget_api.worldline_broadcaster.trigger", MagicMock()), \
              patch("api.future_gadget_api.fgl_service.create_experiment", return_value={
                 "id": "EXP-002",
                 "name": "Time Leap Machine",
@@ -219,14 +229,14 @@ class TestExperimentEndpoints:
             assert data["world_line_change"] == 0.000337
             assert "timestamp" in data
             
-            # Verify broadcast_worldline_status was called
-            from api.future_gadget_api import broadcast_worldline_status
-            assert broadcast_worldline_status.called
+            # Verify the worldline broadcast was scheduled
+            from api.future_gadget_api import worldline_broadcaster
+            assert worldline_broadcaster.trigger.called
 
     def test_create_experiment_with_string_world_line_change(self, client_with_overridden_dependencies, setup_fgl_service):
         current_time = datetime.datetime.now().isoformat()
         with patch("api.future_gadget_api.experiment_connection_manager.broadcast", AsyncMock()), \
-             patch("api.future_gadget_api.broadcast_worldline_status", AsyncMock()), \
+             patch("api.future_gadget_api.worldline_broadcaster.trigger", MagicMock()), \
              patch("api.future_gadget_api.fgl_service.create_experiment", return_value={
                 "id": "EXP-002",
                 "name": "Time Leap Machine",
@@ -256,7 +266,7 @@ class TestExperimentEndpoints:
     def test_update_experiment(self, client_with_overridden_dependencies, setup_fgl_service):
         current_time = datetime.datetime.now().isoformat()
         with patch("api.future_gadget_api.experiment_connection_manager.broadcast", AsyncMock()), \
-             patch("api.future_gadget_api.broadcast_worldline_status", AsyncMock()), \
+             patch("api.future_gadget_api.worldline_broadcaster.trigger", MagicMock()), \
              patch("api.future_gadget_api.fgl_service.update_experiment", return_value={
                 "id": "EXP-001",
                 "name": "Phone Microwave (Name subject to change)",
@@ -283,24 +293,56 @@ class TestExperimentEndpoints:
             assert data["status"] == "completed"
             assert data["world_line_change"] == 0.571024
             
-            # Verify broadcast_worldline_status was called
-            from api.future_gadget_api import broadcast_worldline_status
-            assert broadcast_worldline_status.called
+            # Verify the worldline broadcast was scheduled
+            from api.future_gadget_api import worldline_broadcaster
+            assert worldline_broadcaster.trigger.called
 
     def test_delete_experiment(self, client_with_overridden_dependencies, setup_fgl_service):
         with patch("api.future_gadget_api.experiment_connection_manager.broadcast", AsyncMock()), \
-             patch("api.future_gadget_api.broadcast_worldline_status", AsyncMock()), \
+             patch("api.future_gadget_api.worldline_broadcaster.trigger", MagicMock()), \
              patch("api.future_gadget_api.fgl_service.delete_experiment", return_value=True):
             test_client, _ = client_with_overridden_dependencies
+            from api.future_gadget_api import worldline_status_cache
+            version = worldline_status_cache.version
             # Updated from /experiments to /lab-experiments
             response = test_client.delete(f"{API_PREFIX}/lab-experiments/EXP-001")
             assert response.status_code == 200
             data = response.json()
             assert "successfully deleted" in data["message"].lower()
+            # The write dropped the cached worldline status
+            assert worldline_status_cache.version == version + 1
             
-            # Verify broadcast_worldline_status was called
-            from api.future_gadget_api import broadcast_worldline_status
-            assert broadcast_worldline_status.called
+            # Verify the worldline broadcast was scheduled
+            from api.future_gadget_api import worldline_broadcaster
+            assert worldline_broadcaster.trigger.called
+
+    def test_get_experiments_page(self, client_with_overridden_dependencies, setup_fgl_service):
+        """Test that limit/continuation return a page envelope with a next token"""
+        setup_fgl_service.get_experiments_page.return_value = ([{"id": "FG-01"}], "next-token")
+        test_client, _ = client_with_overridden_dependencies
+
+        response = test_client.get(f"{API_PREFIX}/lab-experiments?limit=1&status=completed")
+
+        assert response.status_code == 200
+        assert response.json() == {"items": [{"id": "FG-01"}], "next": "next-token"}
+        setup_fgl_service.get_experiments_page.assert_called_once_with(1, None, {"status": "completed"})
+
+        # Without limit/continuation the response stays a plain list
+        assert isinstance(test_client.get(f"{API_PREFIX}/lab-experiments").json(), list)
+
+    def test_get_page_rejects_bad_continuation(self, client_with_overridden_dependencies, setup_fgl_service):
+        """Test that an invalid continuation token is a 400, and limit is bounded"""
+        from db.future_gadget_lab_data_service import InvalidContinuationTokenError
+
+        setup_fgl_service.get_divergence_readings_page.side_effect = InvalidContinuationTokenError("Invalid continuation token")
+        test_client, _ = client_with_overridden_dependencies
+
+        response = test_client.get(f"{API_PREFIX}/divergence-readings?continuation=bogus")
+        assert response.status_code == 400
+        setup_fgl_service.get_divergence_readings_page.assert_called_once_with(100, "bogus", None)
+
+        assert test_client.get(f"{API_PREFIX}/divergence-readings?limit=0").status_code == 422
+        assert test_client.get(f"{API_PREFIX}/divergence-readings?limit=1001").status_code == 422
 
     def test_get_divergence_readings(self, client_with_overridden_dependencies, setup_fgl_service):
         """Test the divergence-readings endpoint available to all authenticated users"""
@@ -328,8 +370,13 @@ class TestExperimentEndpoints:
                 "notes": "Beta worldline variant"
             }
         ]
+        # Filters now run inside the storage query, so serve them from a real
+        # in-memory store rather than a canned list.
+        service = MockFutureGadgetLabDataService()
+        for reading in sample_readings:
+            service.create_divergence_reading(reading)
         
-        with patch("api.future_gadget_api.fgl_service.get_all_divergence_readings", return_value=sample_readings):
+        with patch("api.future_gadget_api.fgl_service", service):
             test_client, _ = client_with_overridden_dependencies
             
             # Test 1: Get all readings (no filters)
@@ -381,6 +428,61 @@ class TestExperimentEndpoints:
             assert data[0]["reading"] >= 1.0
             assert data[0]["recorded_by"] == "Rintaro Okabe"
 
+            # Test 7: Filters are applied before paging
+            response = test_client.get(f"{API_PREFIX}/divergence-readings?min_value=1.0&limit=1")
+            assert response.status_code == 200
+            page = response.json()
+            assert [reading["id"] for reading in page["items"]] == ["DR-001"]
+            response = test_client.get(f"{API_PREFIX}/divergence-readings?min_value=1.0&continuation={page['next']}")
+            assert response.json() == {"items": [service.get_divergence_reading_by_id("DR-003")], "next": None}
+
+    def test_collections_stream_as_json_array_or_ndjson(self, client_with_overridden_dependencies):
+        """stream=true streams a JSON array; Accept: application/x-ndjson streams NDJSON"""
+        service = MockFutureGadgetLabDataService()
+        for i in range(3):
+            service.create_divergence_reading({"reading": i / 2, "status": "alpha"})
+            service.create_experiment({
+                "name": f"exp-{i}", "description": "d", "status": "planned", "creator_id": "c",
+            })
+
+        with patch("api.future_gadget_api.fgl_service", service):
+            test_client, _ = client_with_overridden_dependencies
+
+            response = test_client.get(f"{API_PREFIX}/divergence-readings?stream=true&min_value=0.5")
+            assert response.status_code == 200
+            assert response.headers["content-type"] == "application/json"
+            assert response.json() == service.search_divergence_readings([("reading_value", "ge", 0.5)])
+            # Byte-for-byte the same body as the buffered response
+            assert response.content == test_client.get(f"{API_PREFIX}/divergence-readings?min_value=0.5").content
+
+            response = test_client.get(
+                f"{API_PREFIX}/lab-experiments?status=planned",
+                headers={"Accept": "application/x-ndjson"},
+            )
+            assert response.status_code == 200
+            assert response.headers["content-type"] == "application/x-ndjson"
+            lines = [json.loads(line) for line in response.text.splitlines()]
+            assert [experiment["name"] for experiment in lines] == ["exp-0", "exp-1", "exp-2"]
+
+            # Paging wins over streaming
+            response = test_client.get(f"{API_PREFIX}/lab-experiments?limit=2&stream=true")
+            assert len(response.json()["items"]) == 2
+
+    def test_get_divergence_readings_pushes_filters_to_service(self, client_with_overridden_dependencies, setup_fgl_service):
+        """Test that query filters reach the data service as predicates"""
+        setup_fgl_service.search_divergence_readings.return_value = []
+        test_client, _ = client_with_overridden_dependencies
+
+        response = test_client.get(f"{API_PREFIX}/divergence-readings?status=alpha&min_value=0.5&max_value=1.5")
+
+        assert response.status_code == 200
+        setup_fgl_service.search_divergence_readings.assert_called_once_with([
+            ("status", "eq", "alpha"),
+            ("reading_value", "ge", 0.5),
+            ("reading_value", "le", 1.5),
+        ])
+        setup_fgl_service.get_all_divergence_readings.assert_not_called()
+
     def test_non_admin_access_to_divergence_readings(self, setup_fgl_service):
         """Test non-admin users can access the divergence readings endpoint"""
         # Create special test app with normal user token
@@ -557,6 +659,24 @@ class TestExperimentWebSocketEndpoints:
         # Verify disconnect was called to clean up
         assert mock_disconnect.call_count == 1
     
+    @pytest.mark.asyncio
+    async def test_experiment_websocket_handles_control_frames(self, monkeypatch, mock_websocket):
+        """Subscription control frames go to the manager instead of being echoed"""
+        mock_manager = MagicMock()
+        mock_manager.auth_connect = AsyncMock()
+        mock_manager.handle_control_frame = AsyncMock(side_effect=[True, False])
+        mock_manager.send_personal_message = AsyncMock()
+        monkeypatch.setattr("api.future_gadget_api.experiment_connection_manager", mock_manager)
+        monkeypatch.setattr("api.future_gadget_api.logger", MagicMock())
+        subscribe = '{"action": "subscribe", "topics": ["experiment:EXP-001"]}'
+        mock_websocket.receive_text = AsyncMock(side_effect=[subscribe, "hello", WebSocketDisconnect()])
+
+        from api.future_gadget_api import experiment_websocket_endpoint
+        await experiment_websocket_endpoint(mock_websocket)
+
+        assert mock_manager.handle_control_frame.await_args_list[0].args == (mock_websocket, subscribe)
+        mock_manager.send_personal_message.assert_awaited_once_with("Experiment channel: hello", mock_websocket)
+
     @pytest.mark.asyncio
     async def test_broadcast_crud_operations(self, monkeypatch, mock_websocket):
         """Test broadcasting CRUD operations data through WebSockets using broadcast_server"""
@@ -576,8 +696,8 @@ class TestExperimentWebSocketEndpoints:
         
         # Track broadcast calls with a function that stores arguments
         broadcast_server_args = []
-        async def mock_broadcast_server(data, type, username=None):
-            broadcast_server_args.append((data, type, username))
+        async def mock_broadcast_server(data, type, username=None, topics=None):
+            broadcast_server_args.append((data, type, username, topics))
             return None
         
         # Assign the mock to the manager
@@ -586,7 +706,7 @@ class TestExperimentWebSocketEndpoints:
         
         # Patch the experiment connection manager
         monkeypatch.setattr("api.future_gadget_api.experiment_connection_manager", mock_manager)
-        monkeypatch.setattr("api.future_gadget_api.broadcast_worldline_status", AsyncMock())
+        monkeypatch.setattr("api.future_gadget_api.worldline_broadcaster.trigger", MagicMock())
         
         # Bypass security by mocking the required_roles decorator
         monkeypatch.setattr("api.future_gadget_api.required_roles", lambda roles: lambda f: f)
@@ -621,12 +741,17 @@ class TestExperimentWebSocketEndpoints:
             assert broadcast_server_args[0][0]["type"] == "create"  # type field added in broadcast
             assert broadcast_server_args[0][1] == "create"  # type parameter
             assert broadcast_server_args[0][2] == f"Lab Member: {mock_username}"  # username parameter
+            # Published under the experiment's subscription topics
+            assert broadcast_server_args[0][3] == [
+                "creator:Rintaro Okabe", "experiment:EXP-001", "status:in_progress"
+            ]
             
-            # Also verify worldline status broadcast was called
-            from api.future_gadget_api import broadcast_worldline_status
-            assert broadcast_worldline_status.called
-            # Verify username was passed to broadcast_worldline_status
-            assert broadcast_worldline_status.call_args[1]["username"] == f"Lab Member: {mock_username}"
+            # Also verify the worldline status broadcast was scheduled
+            from api.future_gadget_api import worldline_broadcaster
+            assert worldline_broadcaster.trigger.called
+            # Verify username was passed on to the worldline broadcast
+            assert worldline_broadcaster.trigger.call_args[1]["username"] == f"Lab Member: {mock_username}"
+            assert worldline_broadcaster.trigger.call_args[1]["topics"] == broadcast_server_args[0][3]
 
 
 class TestWorldlineEndpoints:
@@ -634,7 +759,7 @@ class TestWorldlineEndpoints:
     
     def test_get_worldline_status(self, client_with_overridden_dependencies, setup_fgl_service):
         """Test the worldline-status endpoint returns correct data"""
-        # Mock the calculate_worldline_status function response
+        # Mock the data service's worldline status response
         mock_status = {
             "current_worldline": 1.337192,
             "base_worldline": 1.0,
@@ -650,7 +775,7 @@ class TestWorldlineEndpoints:
             }
         }
         
-        with patch("api.future_gadget_api.calculate_worldline_status", return_value=mock_status):
+        with patch("api.future_gadget_api.fgl_service.get_worldline_status", return_value=mock_status):
             test_client, _ = client_with_overridden_dependencies
             response = test_client.get(f"{API_PREFIX}/worldline-status")
             assert response.status_code == 200
@@ -692,7 +817,7 @@ class TestWorldlineEndpoints:
         ]
         
         with patch("api.future_gadget_api.fgl_service.get_all_experiments", return_value=sorted_experiments), \
-             patch("api.future_gadget_api.calculate_worldline_status", side_effect=[mock_history[0], mock_history[1]]):
+             patch("api.future_gadget_api.build_worldline_history", return_value=mock_history):
             test_client, _ = client_with_overridden_dependencies
             response = test_client.get(f"{API_PREFIX}/worldline-history")
             assert response.status_code == 200
@@ -706,23 +831,24 @@ class TestWorldlineEndpoints:
     
     @pytest.mark.asyncio
     async def test_broadcast_worldline_status(self, monkeypatch, mock_websocket):
-        """Test the broadcast_worldline_status function with new broadcast_server method"""
+        """Test the broadcast_worldline_status function publishes the worldline state"""
         # Create mocks
         mock_worldline_manager = MagicMock()
         broadcast_server_args = []
         
-        # Define mock async broadcast_server method
-        async def mock_broadcast_server(data, type, username="SERVER"):
-            broadcast_server_args.append((data, type, username))
-            return None
+        # Define mock async publish_state method; recorded like the
+        # broadcast_server call it replaced
+        async def mock_publish_state(state, username="SERVER", topics=None):
+            broadcast_server_args.append((state, "worldline_update", username))
+            return 1
         
-        # Define mock calculate method
-        def mock_calculate(experiments, readings=None):
+        # Define mock worldline status method
+        def mock_get_worldline_status(preview_experiment=None):
             return {
                 "current_worldline": 1.337192,
                 "base_worldline": 1.0,
                 "total_divergence": 0.337192,
-                "experiment_count": len(experiments),
+                "experiment_count": 1 if preview_experiment else 0,
                 "last_experiment_timestamp": None
             }
         
@@ -734,11 +860,9 @@ class TestWorldlineEndpoints:
         }
         
         # Apply patches
-        mock_worldline_manager.broadcast_server = mock_broadcast_server
+        mock_worldline_manager.publish_state = mock_publish_state
         monkeypatch.setattr("api.future_gadget_api.worldline_connection_manager", mock_worldline_manager)
-        monkeypatch.setattr("api.future_gadget_api.calculate_worldline_status", mock_calculate)
-        monkeypatch.setattr("api.future_gadget_api.fgl_service.get_all_experiments", MagicMock(return_value=[]))
-        monkeypatch.setattr("api.future_gadget_api.fgl_service.get_all_divergence_readings", MagicMock(return_value=[]))
+        monkeypatch.setattr("api.future_gadget_api.fgl_service.get_worldline_status", mock_get_worldline_status)
         
         # Import the function after patching
         from api.future_gadget_api import broadcast_worldline_status
@@ -777,6 +901,65 @@ class TestWorldlineEndpoints:
         
         # Verify no preview flag when no experiment provided
         assert "includes_preview" not in result
+
+    @pytest.mark.asyncio
+    async def test_worldline_broadcaster_collapses_bursts(self, monkeypatch):
+        """A burst of writes is computed and published once, with the final state"""
+        from api.future_gadget_api import worldline_broadcaster
+
+        published = []
+        mock_worldline_manager = MagicMock()
+
+        async def mock_publish_state(state, username="SERVER", topics=None):
+            published.append((state, username, topics))
+            return len(published)
+
+        # The stored divergence, moved by every write of the burst
+        store = {"total_divergence": 0.0}
+        computations = []
+
+        def mock_get_worldline_status(preview_experiment=None):
+            computations.append(preview_experiment)
+            return {"current_worldline": 1.0 + store["total_divergence"], **store}
+
+        mock_worldline_manager.publish_state = mock_publish_state
+        monkeypatch.setattr("api.future_gadget_api.worldline_connection_manager", mock_worldline_manager)
+        monkeypatch.setattr("api.future_gadget_api.fgl_service.get_worldline_status", mock_get_worldline_status)
+        monkeypatch.setattr(worldline_broadcaster, "window", 0.02)
+
+        for i, topic in enumerate(["experiment:EXP-001", "experiment:EXP-002", "experiment:EXP-001"]):
+            store["total_divergence"] = 0.1 * (i + 1)
+            worldline_broadcaster.trigger(
+                username=f"Lab Member: user-{i}",
+                custom_message=f"write {i}",
+                topics=[topic],
+            )
+        await worldline_broadcaster.flush()
+
+        assert len(computations) == 1
+        assert len(published) == 1
+        state, username, topics = published[0]
+        assert state["total_divergence"] == pytest.approx(0.3)
+        assert state["message"] == "write 2"
+        assert username == "Lab Member: user-2"
+        assert topics == ["experiment:EXP-001", "experiment:EXP-002"]
+
+    def test_merge_worldline_broadcasts(self):
+        """Collapsed broadcasts keep the latest message and the union of topics"""
+        from api.future_gadget_api import _merge_worldline_broadcasts
+
+        merged = _merge_worldline_broadcasts(
+            {"username": "a", "custom_message": "first", "topics": ["status:planned"]},
+            {"username": "b", "custom_message": "second", "topics": ["experiment:EXP-001"]},
+        )
+        assert merged == {
+            "username": "b",
+            "custom_message": "second",
+            "topics": ["experiment:EXP-001", "status:planned"],
+        }
+        # An untargeted broadcast reaches every client
+        assert _merge_worldline_broadcasts({"topics": None}, {"topics": ["a"]})["topics"] is None
+        assert _merge_worldline_broadcasts({"topics": ["a"]}, {"topics": None})["topics"] is None
     
     @pytest.mark.asyncio
     async def test_worldline_websocket_endpoint(self, monkeypatch, mock_websocket):
@@ -795,17 +978,16 @@ class TestWorldlineEndpoints:
         # Assign async methods
         mock_manager.auth_connect = mock_auth_connect
         mock_manager.send_personal_message = mock_send_personal_message
+        mock_manager.handle_control_frame = AsyncMock(return_value=False)
         
         # Apply patches
         monkeypatch.setattr("api.future_gadget_api.worldline_connection_manager", mock_manager)
-        monkeypatch.setattr("api.future_gadget_api.calculate_worldline_status", MagicMock(return_value={
+        monkeypatch.setattr("api.future_gadget_api.fgl_service.get_worldline_status", MagicMock(return_value={
             "current_worldline": 1.337192,
             "base_worldline": 1.0,
             "total_divergence": 0.337192,
             "experiment_count": 3
         }))
-        monkeypatch.setattr("api.future_gadget_api.fgl_service.get_all_experiments", MagicMock(return_value=[]))
-        monkeypatch.setattr("api.future_gadget_api.fgl_service.get_all_divergence_readings", MagicMock(return_value=[]))
         monkeypatch.setattr("api.future_gadget_api.logger", MagicMock())
         
         # Import the WebSocket endpoint
@@ -845,4 +1027,146 @@ class TestWorldlineEndpoints:
             pass
         
         # Verify no automatic response to Admin
-        assert len(sent_messages) == 0
\ No newline at end of file
+        assert len(sent_messages) == 0
+
+    @pytest.mark.asyncio
+    async def test_worldline_pings_share_one_status_snapshot(self, monkeypatch, mock_websocket):
+        """Pings are answered from a shared snapshot that writes invalidate"""
+        mock_manager = MagicMock()
+        sent_messages = []
+
+        async def mock_send_personal_message(message, websocket):
+            sent_messages.append(message)
+
+        mock_manager.auth_connect = AsyncMock()
+        mock_manager.send_personal_message = mock_send_personal_message
+        mock_manager.handle_control_frame = AsyncMock(return_value=False)
+        get_worldline_status = MagicMock(return_value={"current_worldline": 1.337192, "experiment_count": 3})
+        monkeypatch.setattr("api.future_gadget_api.worldline_connection_manager", mock_manager)
+        monkeypatch.setattr("api.future_gadget_api.fgl_service.get_worldline_status", get_worldline_status)
+        monkeypatch.setattr("api.future_gadget_api.logger", MagicMock())
+
+        from api.future_gadget_api import worldline_status_cache, worldline_status_websocket_endpoint
+
+        mock_websocket.state = MagicMock()
+        mock_websocket.state.user = MagicMock()
+        mock_websocket.state.user.roles = ["User"]
+
+        # Two clients, chatty ones
+        for _ in range(2):
+            mock_websocket.receive_text = AsyncMock(side_effect=["ping"] * 10 + [WebSocketDisconnect()])
+            await worldline_status_websocket_endpoint(mock_websocket)
+
+        assert len(sent_messages) == 20
+        assert all(message["current_worldline"] == 1.337192 for message in sent_messages)
+        assert get_worldline_status.call_count == 1
+
+        # A write drops the snapshot; the next ping loads the new status
+        get_worldline_status.return_value = {"current_worldline": 1.048596, "experiment_count": 4}
+        worldline_status_cache.invalidate()
+        sent_messages.clear()
+        mock_websocket.receive_text = AsyncMock(side_effect=["ping", "ping", WebSocketDisconnect()])
+        await worldline_status_websocket_endpoint(mock_websocket)
+
+        assert [message["current_worldline"] for message in sent_messages] == [1.048596, 1.048596]
+        assert get_worldline_status.call_count == 2
+
+    @pytest.mark.asyncio
+    async def test_worldline_ping_reloads_are_rate_limited(self, monkeypatch, mock_websocket):
+        """A connection cannot force a reload more than once per refresh interval"""
+        mock_manager = MagicMock()
+        sent_messages = []
+
+        async def mock_send_personal_message(message, websocket):
+            sent_messages.append(message)
+
+        mock_manager.auth_connect = AsyncMock()
+        mock_manager.send_personal_message = mock_send_personal_message
+        mock_manager.handle_control_frame = AsyncMock(return_value=False)
+        get_worldline_status = MagicMock(return_value={"current_worldline": 1.337192})
+        monkeypatch.setattr("api.future_gadget_api.worldline_connection_manager", mock_manager)
+        monkeypatch.setattr("api.future_gadget_api.fgl_service.get_worldline_status", get_worldline_status)
+        monkeypatch.setattr("api.future_gadget_api.logger", MagicMock())
+
+        from api.future_gadget_api import worldline_status_cache, worldline_status_websocket_endpoint
+
+        mock_websocket.state = MagicMock()
+        mock_websocket.state.user = MagicMock()
+        mock_websocket.state.user.roles = ["User"]
+
+        # Every ping arrives just after a write dropped the snapshot
+        pings = 0
+
+        async def ping_after_write():
+            nonlocal pings
+            pings += 1
+            if pings > 5:
+                raise WebSocketDisconnect()
+            worldline_status_cache.invalidate()
+            return "ping"
+
+        mock_websocket.receive_text = ping_after_write
+        await worldline_status_websocket_endpoint(mock_websocket)
+
+        # Only the first ping of the interval was answered
+        assert get_worldline_status.call_count == 1
+        assert len(sent_messages) == 1
+
+def test_experiment_topics_cover_old_and_new_state():
+    from api.future_gadget_api import _experiment_topics
+    from db.future_gadget_lab_data_service import ExperimentStatus
+
+    before = {"id": "EXP-001", "creator_id": "Okabe", "status": ExperimentStatus.PLANNED}
+    after = {"id": "EXP-001", "creator_id": "Okabe", "status": "completed"}
+
+    assert _experiment_topics(before, after) == [
+        "creator:Okabe", "experiment:EXP-001", "status:completed", "status:planned"
+    ]
+    assert _experiment_topics(None, {"id": "EXP-002"}) == ["experiment:EXP-002"]
+
+
+@pytest.mark.asyncio
+async def test_remote_experiment_write_refreshes_this_workers_worldline():
+    """Two workers on a shared backplane and store: a write on one is seen by the other"""
+    import api.future_gadget_api as fgl_api
+    from common.backplane import InMemoryBackplane, InMemoryBroker
+    from common.socket import ConnectionManager
+    from db.async_future_gadget_lab_data_service import ThreadPoolFutureGadgetLabDataService
+
+    local_service = MockFutureGadgetLabDataService()
+    remote_service = MockFutureGadgetLabDataService()
+    # One store, as Cosmos is for every worker
+    remote_service.db = local_service.db
+    remote_service._initialize_tinydb_tables()
+
+    broker = InMemoryBroker()
+    remote_manager = ConnectionManager()
+    remote_manager.attach_backplane(InMemoryBackplane(broker, node_id="worker-a"), "experiments")
+    fgl_api.experiment_connection_manager.attach_backplane(InMemoryBackplane(broker, node_id="worker-b"), "experiments")
+    try:
+        for manager in (remote_manager, fgl_api.experiment_connection_manager):
+            await manager.backplane.start()
+        with patch("api.future_gadget_api.fgl_service", local_service), \
+             patch("api.future_gadget_api.fgl_async_service", ThreadPoolFutureGadgetLabDataService(lambda: local_service, 1)):
+            before = local_service.get_worldline_status()["current_worldline"]
+            await fgl_api.worldline_status_cache.get()
+            version = fgl_api.worldline_status_cache.version
+
+            # Other messages on the channel leave the worker's state alone
+            await remote_manager.broadcast_server({"detail": "hello"}, "info")
+            assert not local_service.worldline_aggregate.needs_reconcile()
+            assert fgl_api.worldline_status_cache.version == version
+
+            # Worker a writes and announces it
+            created = remote_service.create_experiment({
+                "name": "Phone Microwave", "description": "D-mail", "status": "completed",
+                "creator_id": "Okabe", "world_line_change": 0.5,
+            })
+            await remote_manager.broadcast_server({**created, "type": "create"}, "create")
+
+            assert fgl_api.worldline_status_cache.version == version + 1
+            assert fgl_api.worldline_status_cache.peek() is None
+            assert local_service.get_worldline_status()["current_worldline"] == pytest.approx(before + 0.5)
+    finally:
+        fgl_api.experiment_connection_manager.detach_backplane()
+        fgl_api.worldline_status_cache.invalidate()
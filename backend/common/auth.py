@@ -1,15 +1,15 @@
 from os import environ as os_environ, path as os_path
 from fastapi_azure_auth.auth import SingleTenantAzureAuthorizationCodeBearer
 from common.config import tfconfig, mock_enabled
-from common.log import logger
+from common.log import bind_log_context, log_event, logger
+from common.jwks_cache import get_jwks_key_cache
+from common.claims_cache import verified_claims_cache
 import jwt
 from jwt import InvalidTokenError  # base class for all PyJWT decode errors
 from fastapi import HTTPException, status
 import requests
 from typing import List, Optional
 
-# Before the verify_token function, initialize the JWKS client
-
 # define scope to use in the API   
 scopes = [tfconfig["oauth2_permission_scope"]["value"]]
 
@@ -55,7 +55,8 @@ def verify_token(
         check_all: If True, user must have ALL roles; if False, ANY role is sufficient
 
     Returns:
-        The token claims dictionary if validation succeeds
+        The token claims dictionary if validation succeeds; its ``sub`` is
+        added to the current request's log context
 
     Raises:
         HTTPException: If token validation fails or roles check fails
@@ -70,38 +71,20 @@ def verify_token(
     try:
         # Use the same condition pattern for consistency
         if tfconfig["env"]["value"] != "dev" or not mock_enabled:
-            # For real Azure auth, manually verify the token
-            # Get the JWKS URL for your tenant
-            jwks_url = f"https://login.microsoftonline.com/{tfconfig['tenant_id']['value']}/discovery/v2.0/keys"
-
-            # PyJWKClient handles the kid lookup + JWKS fetch + caching for us.
-            # cache_jwk_set=True (default) keeps the JWKS in-memory between calls
-            # so we don't re-fetch on every request.
-            jwks_client = jwt.PyJWKClient(jwks_url, cache_jwk_set=True, lifespan=3600)
-
-            try:
-                # Resolves the token's `kid` header against the JWKS and returns
-                # a PyJWK with the constructed public key.
-                signing_key = jwks_client.get_signing_key_from_jwt(token)
-            except jwt.exceptions.PyJWKClientError as exc:
-                raise HTTPException(
-                    status_code=status.HTTP_401_UNAUTHORIZED,
-                    detail="Unable to find appropriate key for token validation",
-                    headers={"WWW-Authenticate": "Bearer"},
-                ) from exc
-
-            # Verify the token
-            claims = jwt.decode(
-                token,
-                signing_key.key,
-                algorithms=["RS256"],
-                audience=tfconfig["client_id"]["value"]
-            )
+            # Tokens that already passed the signature check are served from
+            # the verified-claims cache until their ``exp`` (see
+            # common/claims_cache.py), so reconnect storms with the same
+            # bearer token skip the RS256 verification entirely.
+            claims = verified_claims_cache.get(token)
+            if claims is None:
+                claims = _decode_and_verify(token)
+                verified_claims_cache.put(token, claims)
 
             # Check roles if required_roles is not empty
             if required_roles:
-                _verify_roles(claims, required_roles, check_all)
+                _verify_roles_cached(token, claims, required_roles, check_all)
 
+            bind_log_context(user_sub=claims.get("sub"))
             return claims
         else:
             # Mock implementation
@@ -128,12 +111,13 @@ def verify_token(
                     if not claims.get("roles"):
                         claims["roles"] = ["User"]
                         
-                    logger.info(f"Mock token decoded with claims: {claims}")
+                    log_event(logger, "info", "auth.mock_token.decoded", "Mock token decoded with claims: {claims}", claims=claims)
                     
                     # Check roles if required_roles is not empty
                     if required_roles:
                         _verify_roles(claims, required_roles, check_all)
                         
+                    bind_log_context(user_sub=claims["sub"])
                     return claims
                 else:
                     # For non-JWT format tokens, return a mock object
@@ -150,6 +134,7 @@ def verify_token(
                     if required_roles:
                         _verify_roles(mock_claims, required_roles, check_all)
                         
+                    bind_log_context(user_sub=mock_claims["sub"])
                     return mock_claims
             except Exception as e:
                 logger.warning(f"Failed to decode mock token, using default: {str(e)}")
@@ -165,6 +150,7 @@ def verify_token(
                 if required_roles:
                     _verify_roles(default_claims, required_roles, check_all)
                     
+                bind_log_context(user_sub=default_claims["sub"])
                 return default_claims
             
     except InvalidTokenError as e:
@@ -186,6 +172,36 @@ def verify_token(
             headers={"WWW-Authenticate": "Bearer"},
         )
 
+def _decode_and_verify(token: str) -> dict:
+    """Resolve the signing key for ``token`` and verify it (RS256 + audience)."""
+    # Get the JWKS URL for your tenant
+    jwks_url = f"https://login.microsoftonline.com/{tfconfig['tenant_id']['value']}/discovery/v2.0/keys"
+
+    # The key cache is shared by the whole process (see
+    # common/jwks_cache.py), so the JWKS is fetched once per TTL
+    # instead of once per handshake.
+    jwks_cache = get_jwks_key_cache(jwks_url)
+
+    try:
+        # Resolves the token's `kid` header against the JWKS and returns
+        # a PyJWK with the constructed public key.
+        signing_key = jwks_cache.get_signing_key_from_jwt(token)
+    except jwt.exceptions.PyJWKClientError as exc:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Unable to find appropriate key for token validation",
+            headers={"WWW-Authenticate": "Bearer"},
+        ) from exc
+
+    # Verify the token
+    return jwt.decode(
+        token,
+        signing_key.key,
+        algorithms=["RS256"],
+        audience=tfconfig["client_id"]["value"]
+    )
+
+
 # Add helper function for role verification
 def _verify_roles(claims, required_roles, check_all=False):
     """Verify that the claims contain the required roles"""
@@ -207,11 +223,33 @@ def _verify_roles(claims, required_roles, check_all=False):
     
     if not has_access:
         logger.warning(f"Role check failed - User roles: {roles}, Required roles: {required_roles}")
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN, 
-            detail="Insufficient permissions",
-            headers={"WWW-Authenticate": "Bearer"},
-        )
+        raise _insufficient_permissions()
     
-    logger.info(f"Role check successful for {required_roles}")
+    log_event(logger, "info", "auth.role_check.succeeded", "Role check successful for {roles}", roles=required_roles)
     return True
+
+
+def _verify_roles_cached(token, claims, required_roles, check_all=False):
+    """Like ``_verify_roles``, but memoise the outcome per token in the claims cache"""
+    allowed = verified_claims_cache.get_role_result(token, required_roles, check_all)
+    if allowed is None:
+        try:
+            _verify_roles(claims, required_roles, check_all)
+        except HTTPException:
+            verified_claims_cache.put_role_result(token, required_roles, check_all, False)
+            raise
+        verified_claims_cache.put_role_result(token, required_roles, check_all, True)
+        return True
+
+    if not allowed:
+        logger.warning(f"Role check failed (cached) - Required roles: {required_roles}")
+        raise _insufficient_permissions()
+    return True
+
+
+def _insufficient_permissions() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_403_FORBIDDEN, 
+        detail="Insufficient permissions",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
@@ -262,6 +262,15 @@ class TestVerifyTokenMockPath:
         assert claims["name"] == "Alice"
         assert claims["roles"] == ["Admin"]
 
+    def test_verified_sub_is_bound_to_the_log_context(self, mock_path_config, setup_mocks):
+        bind_log_context = setup_mocks['log_module'].bind_log_context
+
+        mock_path_config.verify_token(_build_test_jwt({"sub": "user-1"}))
+        bind_log_context.assert_called_once_with(user_sub="user-1")
+
+        mock_path_config.verify_token("not-a-jwt")
+        bind_log_context.assert_called_with(user_sub="mock-subject-id")
+
     def test_valid_jwt_missing_sub_is_backfilled(self, mock_path_config):
         token = _build_test_jwt({"name": "Bob", "roles": ["User"]})
         claims = mock_path_config.verify_token(token)
@@ -385,12 +394,12 @@ class TestVerifyTokenMockPath:
 
 class TestVerifyTokenRealPath:
     """Tests for verify_token in production (PyJWT + JWKS) mode.
-    The PyJWKClient and jwt.decode calls are stubbed so no network
+    The JWKS key cache and jwt.decode calls are stubbed so no network
     or cryptography key material is required."""
 
     def _stub_jwks(self, monkeypatch, *, decode_raises=None, decode_returns=None,
                    key_error=None):
-        """Patch jwt.PyJWKClient + jwt.decode inside common.auth."""
+        """Patch the JWKS key cache + jwt.decode inside common.auth."""
         mock_signing_key = MagicMock()
         mock_signing_key.key = b"fake-public-key-bytes"
 
@@ -400,7 +409,7 @@ class TestVerifyTokenRealPath:
         else:
             mock_client.get_signing_key_from_jwt.return_value = mock_signing_key
 
-        monkeypatch.setattr("common.auth.jwt.PyJWKClient", MagicMock(return_value=mock_client))
+        monkeypatch.setattr("common.auth.get_jwks_key_cache", MagicMock(return_value=mock_client))
 
         decode_mock = MagicMock(side_effect=decode_raises if decode_raises is not None
                                 else [decode_returns])
@@ -424,6 +433,22 @@ class TestVerifyTokenRealPath:
         assert kwargs["algorithms"] == ["RS256"]
         assert kwargs["audience"] == "test-client-id"
 
+    def test_verified_sub_is_bound_to_the_log_context(self, real_path_config, monkeypatch, setup_mocks):
+        from fastapi import HTTPException
+        decode_mock, _ = self._stub_jwks(monkeypatch)
+        # No ``exp``, so the claims are not cached and both calls decode.
+        decode_mock.side_effect = None
+        decode_mock.return_value = {"sub": "u", "aud": "test-client-id", "roles": ["User"]}
+        bind_log_context = setup_mocks['log_module'].bind_log_context
+
+        token = _build_test_jwt({"sub": "u"})
+        with pytest.raises(HTTPException):
+            real_path_config.verify_token(token, required_roles=["Admin"])
+        bind_log_context.assert_not_called()
+
+        real_path_config.verify_token(token)
+        bind_log_context.assert_called_once_with(user_sub="u")
+
     def test_kid_lookup_failure_raises_401(self, real_path_config, monkeypatch):
         from fastapi import HTTPException
         import jwt as _jwt
@@ -449,4 +474,134 @@ class TestVerifyTokenRealPath:
         self._stub_jwks(monkeypatch, decode_raises=RuntimeError("boom"))
         with pytest.raises(HTTPException) as excinfo:
             real_path_config.verify_token("any.token.value")
-        assert excinfo.value.status_code == 401
\ No newline at end of file
+        assert excinfo.value.status_code == 401
+
+class TestVerifyTokenRealPathWithLocalJwks:
+    """End-to-end RS256 verification against a local JWKS stand-in.
+
+    Nothing is stubbed inside ``verify_token`` itself: the process-wide
+    key cache is pointed at an in-memory JWKS document so the real kid
+    lookup, key construction and signature check all run offline."""
+
+    @pytest.fixture
+    def rsa_jwks(self):
+        import json as _json
+        from cryptography.hazmat.primitives.asymmetric import rsa
+        from jwt.algorithms import RSAAlgorithm
+
+        private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        jwk = _json.loads(RSAAlgorithm.to_jwk(private_key.public_key()))
+        jwk.update({"kid": "local-kid", "use": "sig", "alg": "RS256"})
+        return private_key, {"keys": [jwk]}
+
+    def test_signature_verified_and_jwks_fetched_once(self, real_path_config, monkeypatch, rsa_jwks):
+        import jwt as _jwt
+        from common.jwks_cache import JwksKeyCache
+
+        private_key, jwks = rsa_jwks
+        fetcher = MagicMock(return_value=jwks)
+        cache = JwksKeyCache("https://local.test/keys", fetcher=fetcher)
+        monkeypatch.setattr("common.auth.get_jwks_key_cache", lambda url: cache)
+
+        token = _jwt.encode(
+            {"sub": "u", "aud": "test-client-id", "roles": ["Admin"]},
+            private_key,
+            algorithm="RS256",
+            headers={"kid": "local-kid"},
+        )
+        for _ in range(5):
+            claims = real_path_config.verify_token(token, required_roles=["Admin"])
+            assert claims["sub"] == "u"
+
+        fetcher.assert_called_once()
+        assert cache.stats()["hits"] == 4
+
+    def test_token_signed_with_other_key_is_rejected(self, real_path_config, monkeypatch, rsa_jwks):
+        import jwt as _jwt
+        from cryptography.hazmat.primitives.asymmetric import rsa
+        from fastapi import HTTPException
+        from common.jwks_cache import JwksKeyCache
+
+        _, jwks = rsa_jwks
+        cache = JwksKeyCache("https://local.test/keys", fetcher=lambda url: jwks)
+        monkeypatch.setattr("common.auth.get_jwks_key_cache", lambda url: cache)
+
+        attacker_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        token = _jwt.encode(
+            {"sub": "u", "aud": "test-client-id"},
+            attacker_key,
+            algorithm="RS256",
+            headers={"kid": "local-kid"},
+        )
+        with pytest.raises(HTTPException) as excinfo:
+            real_path_config.verify_token(token)
+        assert excinfo.value.status_code == 401
+
+
+class TestVerifyTokenClaimsCache:
+    """verify_token serves repeated tokens from the verified-claims cache."""
+
+    @pytest.fixture(autouse=True)
+    def clear_claims_cache(self):
+        from common.claims_cache import verified_claims_cache
+        verified_claims_cache.clear()
+        yield verified_claims_cache
+        verified_claims_cache.clear()
+
+    def _stub_decode(self, monkeypatch, claims):
+        signing_key = MagicMock()
+        signing_key.key = b"fake-public-key-bytes"
+        key_cache = MagicMock()
+        key_cache.get_signing_key_from_jwt.return_value = signing_key
+        monkeypatch.setattr("common.auth.get_jwks_key_cache", MagicMock(return_value=key_cache))
+        decode_mock = MagicMock(return_value=claims)
+        monkeypatch.setattr("common.auth.jwt.decode", decode_mock)
+        return decode_mock
+
+    def test_repeated_token_is_verified_once(self, real_path_config, monkeypatch, clear_claims_cache):
+        import time as _time
+        decode_mock = self._stub_decode(
+            monkeypatch, {"sub": "u", "roles": ["Admin"], "exp": _time.time() + 600}
+        )
+        token = _build_test_jwt({"sub": "u", "n": 1})
+
+        for _ in range(3):
+            assert real_path_config.verify_token(token)["sub"] == "u"
+
+        decode_mock.assert_called_once()
+        assert clear_claims_cache.stats()["hits"] == 2
+
+    def test_role_result_is_memoised(self, real_path_config, monkeypatch):
+        import time as _time
+        self._stub_decode(monkeypatch, {"sub": "u", "roles": ["Admin", "User"], "exp": _time.time() + 600})
+        token = _build_test_jwt({"sub": "u", "n": 2})
+
+        with patch.object(real_path_config, "_verify_roles", wraps=real_path_config._verify_roles) as spy:
+            real_path_config.verify_token(token, required_roles=["Admin"])
+            real_path_config.verify_token(token, required_roles=["admin"])
+            real_path_config.verify_token(token, required_roles=["Admin", "User"], check_all=True)
+
+        # ["Admin"] and ["admin"] share one memoised result; check_all=True is
+        # a different requirement and is evaluated separately.
+        assert spy.call_count == 2
+
+    def test_cached_role_denial_still_raises_403(self, real_path_config, monkeypatch):
+        import time as _time
+        from fastapi import HTTPException
+        self._stub_decode(monkeypatch, {"sub": "u", "roles": ["User"], "exp": _time.time() + 600})
+        token = _build_test_jwt({"sub": "u", "n": 3})
+
+        for _ in range(2):
+            with pytest.raises(HTTPException) as excinfo:
+                real_path_config.verify_token(token, required_roles=["Admin"])
+            assert excinfo.value.status_code == 403
+            assert excinfo.value.detail == "Insufficient permissions"
+
+    def test_token_without_exp_is_not_cached(self, real_path_config, monkeypatch):
+        decode_mock = self._stub_decode(monkeypatch, {"sub": "u"})
+        token = _build_test_jwt({"sub": "u", "n": 4})
+
+        real_path_config.verify_token(token)
+        real_path_config.verify_token(token)
+
+        assert decode_mock.call_count == 2
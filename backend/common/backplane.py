@@ -0,0 +1,436 @@
+from collections import OrderedDict
+from os import environ as os_environ
+from typing import Any, Callable, Dict, List, Optional
+import abc
+import asyncio
+import json
+import os
+import socket
+import stat
+import struct
+import tempfile
+import uuid
+
+from common.log import logger
+
+# ---------------------------------------------------------------------------
+# Cross-worker broadcast backplane
+#
+# Production runs several gunicorn workers, and each worker has its own
+# ``ConnectionManager`` instances holding only the sockets that worker
+# accepted. Without a relay, a write handled by worker A is broadcast to
+# worker A's clients only. A ``Backplane`` carries every broadcast to the
+# other workers, whose managers deliver it to their own local sockets.
+#
+# Each relayed broadcast is wrapped in an envelope with a unique ``id`` and
+# the publishing worker's ``origin``. Receivers ignore their own envelopes
+# (the publisher has already delivered locally) and envelopes whose id they
+# have recently seen, so a transport that delivers at least once, or over
+# more than one path, never shows a client the same event twice.
+#
+# Implementations:
+#
+#   - ``InMemoryBackplane``: backplanes attached to one ``InMemoryBroker``
+#     relay to each other inside a single process (tests, local runs).
+#   - ``UnixSocketBackplane``: workers on one host exchange datagrams over
+#     Unix sockets in a shared directory. No outside service is needed.
+#     Envelopes larger than one datagram are split into numbered fragments
+#     and reassembled by the receiver, so a large broadcast (a full
+#     experiment list, say) still reaches every worker.
+#
+# Relaying between hosts (App Service scale-out) needs a networked broker;
+# such a transport only has to implement ``_transmit`` and feed incoming
+# frames to ``_receive``.
+# ---------------------------------------------------------------------------
+
+# Selects the backplane created by ``backplane_from_env``: "none" (default)
+# or "unix".
+BACKPLANE_ENV = "WS_BACKPLANE"
+
+# Directory holding the Unix backplane's sockets; every worker that should
+# share broadcasts must use the same one. The default is per user: any
+# process that can write to the directory can inject broadcasts, so it must
+# be private to the workers' user (see ``_ensure_private_directory``).
+BACKPLANE_DIR_ENV = "WS_BACKPLANE_DIR"
+DEFAULT_BACKPLANE_DIR = os.path.join(
+    os_environ.get("XDG_RUNTIME_DIR") or tempfile.gettempdir(),
+    f"fgl-ws-backplane-{os.getuid()}" if hasattr(os, "getuid") else "fgl-ws-backplane",
+)
+
+# Number of recent message ids remembered for de-duplication.
+DEDUPE_WINDOW = 4096
+
+# Largest datagram the Unix backplane sends; a datagram is delivered whole
+# or not at all. Larger envelopes are fragmented.
+MAX_DATAGRAM_BYTES = 64 * 1024
+
+# A fragment is a header (marker, message id, index, count) followed by a
+# slice of the envelope. Envelopes are JSON, so they never start with the
+# NUL marker.
+FRAGMENT_MARKER = b"\x00"
+_FRAGMENT_HEADER = struct.Struct(">c16sII")
+
+# Largest envelope the Unix backplane relays, in fragments (64 MiB).
+MAX_FRAGMENTS = 1024
+
+# How long the fragments of one envelope may wait for a busy peer to drain
+# its socket before the envelope is dropped for that peer. A lone datagram
+# never waits.
+FRAGMENT_SEND_TIMEOUT_SECONDS = 0.5
+
+# Fragmented envelopes being reassembled at once; the oldest incomplete one
+# (e.g. a fragment was dropped by a busy receiver) is discarded beyond this.
+MAX_PENDING_ENVELOPES = 64
+
+# Receives the payload of each relayed broadcast. Called on the event loop;
+# it must not block.
+BackplaneHandler = Callable[[Dict[str, Any]], None]
+
+
+def _ensure_private_directory(path: str) -> None:
+    """Create ``path`` if needed and make sure only this user can use it.
+
+    ``makedirs`` leaves an existing path alone, so a directory (or symlink)
+    planted under a shared /tmp by another user would otherwise be used as is.
+
+    Raises:
+        PermissionError: If ``path`` is a symlink or not a directory, is owned
+            by another user, or is accessible to anyone but its owner
+    """
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    info = os.lstat(path)
+    if stat.S_ISLNK(info.st_mode) or not stat.S_ISDIR(info.st_mode):
+        raise PermissionError(f"Backplane directory {path} is not a directory")
+    if info.st_uid != os.geteuid():
+        raise PermissionError(f"Backplane directory {path} is owned by uid {info.st_uid}, not by this user")
+    if stat.S_IMODE(info.st_mode) != 0o700:
+        raise PermissionError(
+            f"Backplane directory {path} has mode {stat.S_IMODE(info.st_mode):#o}, expected 0o700"
+        )
+
+
+class MessageDeduplicator:
+    """Remembers the most recent ``window`` message ids."""
+
+    def __init__(self, window: int = DEDUPE_WINDOW):
+        self.window = max(1, window)
+        self._seen: "OrderedDict[str, None]" = OrderedDict()
+
+    def first_sighting(self, message_id: str) -> bool:
+        """Record ``message_id``; False if it was already seen."""
+        if message_id in self._seen:
+            self._seen.move_to_end(message_id)
+            return False
+        self._seen[message_id] = None
+        if len(self._seen) > self.window:
+            self._seen.popitem(last=False)
+        return True
+
+
+class Backplane(abc.ABC):
+    """Relays broadcasts between the connection managers of several workers.
+
+    Managers ``subscribe`` a handler to a channel (one channel per manager)
+    and ``publish`` the broadcasts they deliver locally. Subclasses implement
+    ``_transmit`` to hand an encoded envelope to every other worker and pass
+    each frame they receive to ``_receive``.
+
+    Args:
+        node_id: Identifies this worker in envelopes (default: random)
+        dedupe_window: Number of recent message ids remembered
+    """
+
+    def __init__(self, node_id: Optional[str] = None, dedupe_window: int = DEDUPE_WINDOW):
+        self.node_id = node_id or uuid.uuid4().hex
+        self._handlers: Dict[str, BackplaneHandler] = {}
+        self._dedupe = MessageDeduplicator(dedupe_window)
+        self.published = 0
+        self.delivered = 0
+        self.duplicates = 0
+
+    def subscribe(self, channel: str, handler: BackplaneHandler) -> None:
+        self._handlers[channel] = handler
+
+    def unsubscribe(self, channel: str) -> None:
+        self._handlers.pop(channel, None)
+
+    async def start(self) -> None:
+        """Connect to the transport."""
+
+    async def close(self) -> None:
+        """Disconnect from the transport."""
+
+    async def publish(self, channel: str, payload: Dict[str, Any]) -> str:
+        """Relay ``payload`` to the other workers' subscribers of ``channel``.
+
+        Returns:
+            The envelope's message id
+        """
+        message_id = uuid.uuid4().hex
+        frame = json.dumps(
+            {"id": message_id, "origin": self.node_id, "channel": channel, "payload": payload},
+            separators=(",", ":"),
+            ensure_ascii=False,
+        ).encode("utf-8")
+        await self._transmit(frame)
+        self.published += 1
+        return message_id
+
+    @abc.abstractmethod
+    async def _transmit(self, frame: bytes) -> None:
+        """Hand an encoded envelope to every other worker."""
+
+    def _receive(self, frame: bytes) -> None:
+        """Dispatch one incoming envelope to its channel's handler."""
+        try:
+            envelope = json.loads(frame)
+            message_id = envelope["id"]
+            origin = envelope["origin"]
+            channel = envelope["channel"]
+            payload = envelope["payload"]
+        except (ValueError, TypeError, KeyError) as exc:
+            logger.warning(f"Ignoring malformed backplane message: {exc}")
+            return
+
+        if origin == self.node_id:
+            return
+        if not self._dedupe.first_sighting(message_id):
+            self.duplicates += 1
+            return
+
+        handler = self._handlers.get(channel)
+        if handler is None:
+            return
+        try:
+            handler(payload)
+        except Exception as exc:
+            logger.error(f"Error delivering backplane message on channel '{channel}': {exc}")
+            return
+        self.delivered += 1
+
+
+class InMemoryBroker:
+    """Connects the ``InMemoryBackplane`` instances of one process."""
+
+    def __init__(self):
+        self.members: List["InMemoryBackplane"] = []
+
+
+class InMemoryBackplane(Backplane):
+    """Backplane whose "workers" are other instances on the same broker.
+
+    Args:
+        broker: Shared broker (default: a private one)
+        node_id: Identifies this instance in envelopes (default: random)
+        dedupe_window: Number of recent message ids remembered
+    """
+
+    def __init__(
+        self,
+        broker: Optional[InMemoryBroker] = None,
+        node_id: Optional[str] = None,
+        dedupe_window: int = DEDUPE_WINDOW,
+    ):
+        super().__init__(node_id, dedupe_window)
+        self.broker = broker if broker is not None else InMemoryBroker()
+
+    async def start(self) -> None:
+        if self not in self.broker.members:
+            self.broker.members.append(self)
+
+    async def close(self) -> None:
+        if self in self.broker.members:
+            self.broker.members.remove(self)
+
+    async def _transmit(self, frame: bytes) -> None:
+        for member in list(self.broker.members):
+            if member is not self:
+                member._receive(frame)
+
+
+class _PendingEnvelope:
+    """The fragments of one envelope received so far."""
+
+    __slots__ = ("parts", "missing")
+
+    def __init__(self, count: int):
+        self.parts: List[Optional[bytes]] = [None] * count
+        self.missing = count
+
+
+class UnixSocketBackplane(Backplane):
+    """Backplane between worker processes on one host, over Unix datagrams.
+
+    Each worker binds ``<directory>/<node_id>.sock`` and sends every envelope
+    to each other socket in the directory. A socket file left behind by a
+    dead worker refuses datagrams and is removed on the next publish.
+    ``start`` refuses a directory that is a symlink, belongs to another user
+    or is open to anyone but its owner.
+
+    Args:
+        directory: Directory shared by all workers
+        node_id: Identifies this worker in envelopes and socket names
+        dedupe_window: Number of recent message ids remembered
+    """
+
+    def __init__(
+        self,
+        directory: str = DEFAULT_BACKPLANE_DIR,
+        node_id: Optional[str] = None,
+        dedupe_window: int = DEDUPE_WINDOW,
+    ):
+        super().__init__(node_id, dedupe_window)
+        self.directory = directory
+        self.path = os.path.join(directory, f"{self.node_id}.sock")
+        self._socket: Optional[socket.socket] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        # Fragmented envelopes being reassembled, by message id, oldest first.
+        self._partial: "OrderedDict[bytes, _PendingEnvelope]" = OrderedDict()
+
+    async def start(self) -> None:
+        if self._socket is not None:
+            return
+        # Only this user's workers may talk on the backplane.
+        _ensure_private_directory(self.directory)
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        try:
+            sock.setblocking(False)
+            sock.bind(self.path)
+        except OSError:
+            sock.close()
+            raise
+        self._socket = sock
+        self._loop = asyncio.get_running_loop()
+        self._loop.add_reader(sock.fileno(), self._on_readable)
+
+    async def close(self) -> None:
+        sock, self._socket = self._socket, None
+        if sock is None:
+            return
+        self._loop.remove_reader(sock.fileno())
+        sock.close()
+        self._partial.clear()
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+
+    def _peers(self) -> List[str]:
+        try:
+            entries = os.scandir(self.directory)
+        except FileNotFoundError:
+            return []
+        with entries:
+            return [
+                entry.path
+                for entry in entries
+                if entry.name.endswith(".sock") and entry.path != self.path
+            ]
+
+    @staticmethod
+    def _datagrams(frame: bytes) -> List[bytes]:
+        """Split an envelope into datagrams of at most ``MAX_DATAGRAM_BYTES``."""
+        if len(frame) <= MAX_DATAGRAM_BYTES:
+            return [frame]
+        chunk_size = MAX_DATAGRAM_BYTES - _FRAGMENT_HEADER.size
+        count = -(-len(frame) // chunk_size)
+        if count > MAX_FRAGMENTS:
+            raise ValueError(
+                f"Backplane message of {len(frame)} bytes exceeds {MAX_FRAGMENTS * chunk_size} bytes"
+            )
+        message_id = uuid.uuid4().bytes
+        return [
+            _FRAGMENT_HEADER.pack(FRAGMENT_MARKER, message_id, index, count)
+            + frame[index * chunk_size:(index + 1) * chunk_size]
+            for index in range(count)
+        ]
+
+    async def _transmit(self, frame: bytes) -> None:
+        sock = self._socket
+        if sock is None:
+            raise RuntimeError("Unix backplane is not started")
+        datagrams = self._datagrams(frame)
+        for peer in self._peers():
+            try:
+                await self._send_to(sock, peer, datagrams)
+            except (ConnectionRefusedError, FileNotFoundError):
+                # The worker that bound it is gone.
+                try:
+                    os.unlink(peer)
+                except FileNotFoundError:
+                    pass
+            except (BlockingIOError, TimeoutError):
+                logger.warning(f"Backplane peer {peer} is not keeping up; message dropped")
+
+    @staticmethod
+    async def _send_to(sock: socket.socket, peer: str, datagrams: List[bytes]) -> None:
+        """Send one envelope's datagrams to ``peer``, in order.
+
+        Raises:
+            BlockingIOError: If a lone datagram finds the peer's queue full
+            TimeoutError: If fragments are still unsent after
+                ``FRAGMENT_SEND_TIMEOUT_SECONDS``
+        """
+        async with asyncio.timeout(FRAGMENT_SEND_TIMEOUT_SECONDS):
+            for datagram in datagrams:
+                delay = 0.001
+                while True:
+                    try:
+                        sock.sendto(datagram, peer)
+                        break
+                    except BlockingIOError:
+                        if len(datagrams) == 1:
+                            raise
+                    # Let the peer drain its socket, then retry the fragment.
+                    await asyncio.sleep(delay)
+                    delay = min(delay * 2, 0.05)
+
+    def _on_readable(self) -> None:
+        while self._socket is not None:
+            try:
+                datagram = self._socket.recv(MAX_DATAGRAM_BYTES)
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError as exc:
+                logger.error(f"Error reading from backplane socket: {exc}")
+                return
+            self._receive_datagram(datagram)
+
+    def _receive_datagram(self, datagram: bytes) -> None:
+        if not datagram.startswith(FRAGMENT_MARKER):
+            self._receive(datagram)
+            return
+        try:
+            _, message_id, index, count = _FRAGMENT_HEADER.unpack_from(datagram)
+        except struct.error:
+            logger.warning("Ignoring truncated backplane fragment")
+            return
+        if not index < count <= MAX_FRAGMENTS:
+            logger.warning(f"Ignoring backplane fragment {index} of {count}")
+            return
+
+        pending = self._partial.get(message_id)
+        if pending is None:
+            pending = self._partial[message_id] = _PendingEnvelope(count)
+            if len(self._partial) > MAX_PENDING_ENVELOPES:
+                self._partial.popitem(last=False)
+                logger.warning("Discarding an incomplete fragmented backplane message")
+        if len(pending.parts) != count or pending.parts[index] is not None:
+            logger.warning(f"Ignoring backplane fragment {index} of {count}")
+            return
+        pending.parts[index] = datagram[_FRAGMENT_HEADER.size:]
+        pending.missing -= 1
+        if pending.missing == 0:
+            del self._partial[message_id]
+            self._receive(b"".join(pending.parts))
+
+
+def backplane_from_env() -> Optional[Backplane]:
+    """Create the backplane selected by ``WS_BACKPLANE``, if any."""
+    kind = os_environ.get(BACKPLANE_ENV, "none").strip().lower()
+    if kind in ("", "none"):
+        return None
+    if kind == "unix":
+        return UnixSocketBackplane(os_environ.get(BACKPLANE_DIR_ENV, DEFAULT_BACKPLANE_DIR))
+    logger.warning(f"Unknown {BACKPLANE_ENV} value '{kind}'; broadcasts stay within this worker")
+    return None
@@ -0,0 +1,348 @@
+import asyncio
+import json
+import os
+import socket
+import stat
+
+import pytest
+
+from common.backplane import (
+    Backplane,
+    InMemoryBackplane,
+    InMemoryBroker,
+    MAX_DATAGRAM_BYTES,
+    MessageDeduplicator,
+    UnixSocketBackplane,
+    backplane_from_env,
+)
+from common.socket import ConnectionManager
+from common.socket_test import DummyLogger, FakeWebSocket
+
+
+@pytest.fixture(autouse=True)
+def quiet_logger(monkeypatch):
+    monkeypatch.setattr("common.backplane.logger", DummyLogger())
+    monkeypatch.setattr("common.socket.logger", DummyLogger())
+
+
+async def _workers(count):
+    """Managers standing in for one channel's manager in ``count`` workers."""
+    broker = InMemoryBroker()
+    managers = []
+    for i in range(count):
+        backplane = InMemoryBackplane(broker, node_id=f"worker-{i}")
+        await backplane.start()
+        manager = ConnectionManager()
+        manager.attach_backplane(backplane, "experiments")
+        websocket = FakeWebSocket()
+        websocket.state.user = {"name": f"user-{i}"}
+        manager.active_connections = [websocket]
+        managers.append(manager)
+    return managers
+
+
+def test_backplane_transports_must_implement_transmit():
+    with pytest.raises(TypeError):
+        Backplane()
+
+    class IncompleteBackplane(Backplane):
+        pass
+
+    with pytest.raises(TypeError):
+        IncompleteBackplane()
+
+
+def test_deduplicator_forgets_ids_beyond_its_window():
+    dedupe = MessageDeduplicator(window=2)
+
+    assert dedupe.first_sighting("a") is True
+    assert dedupe.first_sighting("a") is False
+    dedupe.first_sighting("b")
+    dedupe.first_sighting("c")
+    assert dedupe.first_sighting("a") is True
+
+
+@pytest.mark.asyncio
+async def test_broadcast_server_reaches_every_worker_once():
+    managers = await _workers(3)
+
+    await managers[0].broadcast_server({"action": "create", "experiment": {"id": "EXP-1"}}, "create")
+    for manager in managers:
+        await manager.flush()
+
+    frames = [manager.active_connections.snapshot()[0].sent_texts for manager in managers]
+    # Every worker's client gets the publisher's exact frame, exactly once.
+    assert all(len(sent) == 1 for sent in frames)
+    assert len({sent[0] for sent in frames}) == 1
+    assert json.loads(frames[1][0])["experiment"] == {"id": "EXP-1"}
+
+
+@pytest.mark.asyncio
+async def test_broadcast_is_personalised_per_remote_recipient():
+    managers = await _workers(2)
+    sender = managers[0].active_connections.snapshot()[0]
+
+    await managers[0].broadcast({"record_id": "123"}, "update", sender_websocket=sender)
+    for manager in managers:
+        await manager.flush()
+
+    # skip_self only concerns the sender's own socket.
+    assert sender.sent_texts == []
+    received = managers[1].active_connections.snapshot()[0].text_jsons
+    assert [(m["record_id"], m["username"], m["type"]) for m in received] == [("123", "user-1", "update")]
+
+
+@pytest.mark.asyncio
+async def test_duplicate_and_echoed_envelopes_are_dropped():
+    backplane = InMemoryBackplane(node_id="me")
+    received = []
+    backplane.subscribe("chat", received.append)
+    frame = json.dumps({"id": "m1", "origin": "peer", "channel": "chat", "payload": {"n": 1}}).encode()
+
+    backplane._receive(frame)
+    backplane._receive(frame)
+    backplane._receive(json.dumps({"id": "m2", "origin": "me", "channel": "chat", "payload": {}}).encode())
+    backplane._receive(b"not json")
+    backplane._receive(b'{"id": "m3"}')
+
+    assert received == [{"n": 1}]
+    assert (backplane.delivered, backplane.duplicates) == (1, 1)
+
+
+@pytest.mark.asyncio
+async def test_publish_failure_does_not_affect_local_delivery():
+    class BrokenBackplane(InMemoryBackplane):
+        async def _transmit(self, frame):
+            raise OSError("broker unavailable")
+
+    manager = ConnectionManager()
+    manager.attach_backplane(BrokenBackplane(), "worldline")
+    websocket = FakeWebSocket()
+    manager.active_connections = [websocket]
+
+    await manager.broadcast_server({"current_worldline": 1.048596}, "worldline_update")
+    await manager.flush()
+
+    assert websocket.text_jsons[0]["current_worldline"] == 1.048596
+
+
+@pytest.mark.asyncio
+async def test_detach_stops_relaying():
+    managers = await _workers(2)
+    managers[1].detach_backplane()
+
+    await managers[0].broadcast_server({"action": "ping"}, "notification")
+    await managers[1].flush()
+
+    assert managers[1].active_connections.snapshot()[0].sent_texts == []
+
+
+@pytest.mark.asyncio
+async def test_unix_backplane_relays_between_sockets(tmp_path):
+    first, second = UnixSocketBackplane(str(tmp_path)), UnixSocketBackplane(str(tmp_path))
+    received = asyncio.Queue()
+    second.subscribe("chat", received.put_nowait)
+    await first.start()
+    await second.start()
+    try:
+        await first.publish("chat", {"text": "El Psy Kongroo"})
+        assert await asyncio.wait_for(received.get(), 1) == {"text": "El Psy Kongroo"}
+        # The publisher does not receive its own message.
+        assert first.delivered == 0
+    finally:
+        await first.close()
+        await second.close()
+    assert list(tmp_path.iterdir()) == []
+
+
+@pytest.mark.asyncio
+async def test_unix_backplane_removes_sockets_of_dead_workers(tmp_path):
+    dead = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+    dead.bind(str(tmp_path / "dead.sock"))
+    dead.close()
+    backplane = UnixSocketBackplane(str(tmp_path))
+    await backplane.start()
+    try:
+        await backplane.publish("chat", {"text": "hello"})
+        assert [path.name for path in tmp_path.iterdir()] == [f"{backplane.node_id}.sock"]
+    finally:
+        await backplane.close()
+
+
+@pytest.mark.asyncio
+async def test_unix_backplane_fragments_oversized_messages(tmp_path):
+    first, second = UnixSocketBackplane(str(tmp_path)), UnixSocketBackplane(str(tmp_path))
+    received = asyncio.Queue()
+    second.subscribe("experiments", received.put_nowait)
+    await first.start()
+    await second.start()
+    try:
+        # Several datagrams' worth, with multi-byte characters straddling
+        # the fragment boundaries.
+        payload = {"experiments": [{"name": f"Phone Microwave (name subject to change) №{i}"} for i in range(5000)]}
+        assert len(json.dumps(payload, ensure_ascii=False).encode()) > 3 * MAX_DATAGRAM_BYTES
+        await first.publish("experiments", payload)
+        await first.publish("experiments", {"text": "after"})
+
+        assert await asyncio.wait_for(received.get(), 1) == payload
+        assert await asyncio.wait_for(received.get(), 1) == {"text": "after"}
+        assert second._partial == {}
+    finally:
+        await first.close()
+        await second.close()
+
+
+@pytest.mark.asyncio
+async def test_unix_backplane_gives_up_on_a_peer_that_never_drains(tmp_path, monkeypatch):
+    monkeypatch.setattr("common.backplane.FRAGMENT_SEND_TIMEOUT_SECONDS", 0.05)
+    warnings = []
+    monkeypatch.setattr("common.backplane.logger.warning", warnings.append, raising=False)
+    frozen = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+    frozen.bind(str(tmp_path / "frozen.sock"))
+    backplane = UnixSocketBackplane(str(tmp_path))
+    await backplane.start()
+    try:
+        await backplane.publish("chat", {"text": "x" * (8 * MAX_DATAGRAM_BYTES)})
+        assert any("frozen.sock is not keeping up" in w for w in warnings), warnings
+    finally:
+        await backplane.close()
+        frozen.close()
+
+
+def test_unix_backplane_reassembles_interleaved_fragments_and_drops_incomplete_ones(monkeypatch):
+    monkeypatch.setattr("common.backplane.MAX_PENDING_ENVELOPES", 1)
+    backplane = UnixSocketBackplane("unused")
+    received = []
+    backplane.subscribe("chat", received.append)
+
+    def fragments(letter):
+        frame = json.dumps(
+            {"id": letter, "origin": "other", "channel": "chat", "payload": {"text": letter * 100_000}}
+        ).encode()
+        datagrams = UnixSocketBackplane._datagrams(frame)
+        assert len(datagrams) == 2 and all(len(d) <= MAX_DATAGRAM_BYTES for d in datagrams)
+        return datagrams
+
+    lost, first, second = (fragments(letter) for letter in "abc")
+    # ``lost`` never completes and is pushed out by ``first``.
+    backplane._receive_datagram(lost[0])
+    backplane._receive_datagram(first[1])
+    backplane._receive_datagram(first[0])
+    backplane._receive_datagram(lost[1])
+    assert [message["text"][0] for message in received] == ["b"]
+
+    for datagram in reversed(second):
+        backplane._receive_datagram(datagram)
+    assert [message["text"][0] for message in received] == ["b", "c"]
+    # ``lost[1]`` started a new reassembly, which ``second`` pushed out.
+    assert backplane._partial == {}
+
+
+@pytest.mark.asyncio
+async def test_broadcast_larger_than_a_datagram_reaches_other_workers(tmp_path):
+    managers = []
+    for _ in range(2):
+        backplane = UnixSocketBackplane(str(tmp_path))
+        await backplane.start()
+        manager = ConnectionManager()
+        manager.attach_backplane(backplane, "experiments")
+        manager.active_connections = [FakeWebSocket()]
+        managers.append(manager)
+    relayed = asyncio.Event()
+    managers[1].add_remote_listener(lambda payload: relayed.set())
+    try:
+        experiments = [{"id": str(i), "name": "x" * 100} for i in range(2000)]
+        await managers[0].broadcast_server({"experiments": experiments}, "notification")
+
+        await asyncio.wait_for(relayed.wait(), 1)
+        await managers[1].flush()
+        remote = managers[1].active_connections.snapshot()[0]
+        assert remote.text_jsons[0]["experiments"] == experiments
+    finally:
+        for manager in managers:
+            await manager.backplane.close()
+
+
+@pytest.mark.asyncio
+async def test_unix_backplane_creates_a_private_directory(tmp_path):
+    directory = tmp_path / "bp"
+    backplane = UnixSocketBackplane(str(directory))
+    await backplane.start()
+    try:
+        assert stat.S_IMODE(os.lstat(directory).st_mode) == 0o700
+    finally:
+        await backplane.close()
+
+
+@pytest.mark.asyncio
+async def test_unix_backplane_refuses_a_directory_others_can_reach(tmp_path):
+    shared = tmp_path / "shared"
+    shared.mkdir(mode=0o777)
+    shared.chmod(0o777)
+    with pytest.raises(PermissionError, match="mode 0o777"):
+        await UnixSocketBackplane(str(shared)).start()
+
+    private = tmp_path / "private"
+    private.mkdir(mode=0o700)
+    link = tmp_path / "link"
+    link.symlink_to(private)
+    with pytest.raises(PermissionError, match="not a directory"):
+        await UnixSocketBackplane(str(link)).start()
+
+    assert list(shared.iterdir()) == [] and list(private.iterdir()) == []
+
+
+@pytest.mark.asyncio
+async def test_unix_backplane_refuses_a_directory_owned_by_another_user(tmp_path, monkeypatch):
+    monkeypatch.setattr("common.backplane.os.geteuid", lambda: os.lstat(tmp_path).st_uid + 1)
+    with pytest.raises(PermissionError, match="owned by uid"):
+        await UnixSocketBackplane(str(tmp_path)).start()
+
+
+@pytest.mark.parametrize("value, expected", [
+    (None, type(None)),
+    ("none", type(None)),
+    ("unix", UnixSocketBackplane),
+    ("carrier-pigeon", type(None)),
+])
+def test_backplane_from_env(monkeypatch, value, expected):
+    if value is None:
+        monkeypatch.delenv("WS_BACKPLANE", raising=False)
+    else:
+        monkeypatch.setenv("WS_BACKPLANE", value)
+
+    assert isinstance(backplane_from_env(), expected)
+
+
+@pytest.mark.asyncio
+async def test_targeted_broadcast_server_is_targeted_on_every_worker():
+    managers = await _workers(2)
+    admin = FakeWebSocket()
+    admin.state.user = {"sub": "okabe", "name": "Okabe", "roles": ["Admin"]}
+    managers[1].active_connections.add(admin)
+
+    await managers[0].broadcast_server({"action": "audit"}, "notification", role="Admin")
+    await managers[1].flush()
+
+    assert [m["action"] for m in admin.text_jsons] == ["audit"]
+    assert managers[1].active_connections.snapshot()[0].sent_texts == []
+
+
+@pytest.mark.asyncio
+async def test_remote_listeners_see_relayed_envelopes_before_delivery():
+    managers = await _workers(2)
+    seen = []
+
+    def failing(payload):
+        raise RuntimeError("listener bug")
+
+    managers[1].add_remote_listener(failing)
+    managers[1].add_remote_listener(lambda payload: seen.append(payload["message"]["type"]))
+
+    await managers[0].broadcast_server({"id": "EXP-1"}, "create")
+    await managers[1].flush()
+
+    # Only envelopes from other workers, and a failing listener does not stop delivery
+    assert seen == ["create"]
+    assert len(managers[1].active_connections.snapshot()[0].sent_texts) == 1
+
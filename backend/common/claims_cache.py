@@ -0,0 +1,145 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, FrozenSet, Iterable, Optional, Tuple
+
+# ---------------------------------------------------------------------------
+# Verified-claims cache
+#
+# Clients reconnect to the worldline / experiment / chat sockets with the
+# same bearer token many times within its lifetime, and every handshake
+# used to redo the RS256 signature check. ``VerifiedClaimsCache`` remembers
+# the claims of tokens that already passed verification:
+#
+#   - Entries are keyed by the SHA-256 digest of the token, so the raw
+#     bearer token is never held in memory by the cache.
+#   - An entry expires at the token's own ``exp`` claim. Tokens without an
+#     ``exp`` are never cached, so a cache hit can never outlive the token.
+#   - The cache is a bounded LRU (``CLAIMS_CACHE_MAX_ENTRIES``).
+#   - Role checks are memoised per entry, keyed by the normalised required
+#     role set and the ``check_all`` flag, so ``_verify_roles`` runs once per
+#     (token, role requirement) pair.
+# ---------------------------------------------------------------------------
+
+CLAIMS_CACHE_MAX_ENTRIES = 4096
+
+RoleKey = Tuple[FrozenSet[str], bool]
+
+
+def _role_key(required_roles: Iterable[str], check_all: bool) -> RoleKey:
+    return frozenset(role.lower() for role in required_roles), bool(check_all)
+
+
+class _ClaimsEntry:
+    __slots__ = ("claims", "expires_at", "role_results")
+
+    def __init__(self, claims: Dict[str, Any], expires_at: float) -> None:
+        self.claims = claims
+        self.expires_at = expires_at
+        self.role_results: Dict[RoleKey, bool] = {}
+
+
+class VerifiedClaimsCache:
+    """Bounded LRU cache of verified token claims.
+
+    Args:
+        max_entries: Maximum number of tokens kept; the least recently
+            used entry is evicted first
+        clock: Wall clock returning epoch seconds (compared with ``exp``),
+            injectable for tests
+    """
+
+    def __init__(
+        self,
+        max_entries: int = CLAIMS_CACHE_MAX_ENTRIES,
+        clock: Callable[[], float] = time.time,
+    ) -> None:
+        self.max_entries = max_entries
+        self._clock = clock
+        self._entries: "OrderedDict[str, _ClaimsEntry]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = {
+            "hits": 0,
+            "misses": 0,
+            "expired": 0,
+            "evictions": 0,
+            "role_hits": 0,
+            "role_misses": 0,
+        }
+
+    @staticmethod
+    def token_digest(token: str) -> str:
+        """Return the cache key for ``token``."""
+        return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+    def get(self, token: str) -> Optional[Dict[str, Any]]:
+        """Return a copy of the cached claims for ``token``, or ``None``."""
+        with self._lock:
+            entry = self._lookup(self.token_digest(token))
+            if entry is None:
+                self._counters["misses"] += 1
+                return None
+            self._counters["hits"] += 1
+            return dict(entry.claims)
+
+    def put(self, token: str, claims: Dict[str, Any]) -> None:
+        """Cache ``claims`` for ``token`` until the token's ``exp``."""
+        expires_at = claims.get("exp")
+        if not isinstance(expires_at, (int, float)) or expires_at <= self._clock():
+            return
+        digest = self.token_digest(token)
+        with self._lock:
+            self._entries[digest] = _ClaimsEntry(dict(claims), float(expires_at))
+            self._entries.move_to_end(digest)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._counters["evictions"] += 1
+
+    def get_role_result(self, token: str, required_roles: Iterable[str], check_all: bool) -> Optional[bool]:
+        """Return the memoised role-check result, or ``None`` if not known yet."""
+        key = _role_key(required_roles, check_all)
+        with self._lock:
+            entry = self._lookup(self.token_digest(token))
+            result = entry.role_results.get(key) if entry is not None else None
+            self._counters["role_misses" if result is None else "role_hits"] += 1
+            return result
+
+    def put_role_result(self, token: str, required_roles: Iterable[str], check_all: bool, allowed: bool) -> None:
+        """Memoise a role-check result for a cached token."""
+        key = _role_key(required_roles, check_all)
+        with self._lock:
+            entry = self._lookup(self.token_digest(token))
+            if entry is not None:
+                entry.role_results[key] = allowed
+
+    def stats(self) -> Dict[str, Any]:
+        """Return a snapshot of the cache counters, including the hit rate."""
+        with self._lock:
+            snapshot: Dict[str, Any] = dict(self._counters)
+            snapshot["entries"] = len(self._entries)
+        lookups = snapshot["hits"] + snapshot["misses"]
+        snapshot["hit_rate"] = snapshot["hits"] / lookups if lookups else 0.0
+        return snapshot
+
+    def clear(self) -> None:
+        """Drop every entry and reset the counters."""
+        with self._lock:
+            self._entries.clear()
+            for name in self._counters:
+                self._counters[name] = 0
+
+    def _lookup(self, digest: str) -> Optional[_ClaimsEntry]:
+        # Caller holds ``_lock``.
+        entry = self._entries.get(digest)
+        if entry is None:
+            return None
+        if entry.expires_at <= self._clock():
+            del self._entries[digest]
+            self._counters["expired"] += 1
+            return None
+        self._entries.move_to_end(digest)
+        return entry
+
+
+verified_claims_cache = VerifiedClaimsCache()
@@ -0,0 +1,115 @@
+import pytest
+
+from common.claims_cache import VerifiedClaimsCache
+
+
+class FakeClock:
+    def __init__(self, start=1_700_000_000.0):
+        self.now = start
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture
+def cache(clock):
+    return VerifiedClaimsCache(max_entries=3, clock=clock)
+
+
+def _claims(clock, ttl=600, **extra):
+    return {"sub": "u", "roles": ["Admin"], "exp": clock.now + ttl, **extra}
+
+
+def test_put_then_get_returns_copy(cache, clock):
+    claims = _claims(clock)
+    cache.put("token-a", claims)
+
+    cached = cache.get("token-a")
+    assert cached == claims
+    cached["sub"] = "tampered"
+    assert cache.get("token-a")["sub"] == "u"
+
+
+def test_miss_for_unknown_token(cache):
+    assert cache.get("token-a") is None
+    assert cache.stats()["misses"] == 1
+
+
+def test_raw_token_is_not_stored(cache, clock):
+    cache.put("secret-bearer-token", _claims(clock))
+    assert "secret-bearer-token" not in cache._entries
+    assert VerifiedClaimsCache.token_digest("secret-bearer-token") in cache._entries
+
+
+def test_entry_expires_at_token_exp(cache, clock):
+    cache.put("token-a", _claims(clock, ttl=60))
+
+    clock.now += 59
+    assert cache.get("token-a") is not None
+    clock.now += 1
+    assert cache.get("token-a") is None
+    assert cache.stats()["expired"] == 1
+
+
+@pytest.mark.parametrize("exp", [None, "soon", -1])
+def test_tokens_without_usable_exp_are_not_cached(cache, clock, exp):
+    claims = {"sub": "u"}
+    if exp is not None:
+        claims["exp"] = clock.now + exp if isinstance(exp, int) else exp
+    cache.put("token-a", claims)
+    assert cache.get("token-a") is None
+
+
+def test_lru_eviction(cache, clock):
+    for name in ("a", "b", "c"):
+        cache.put(name, _claims(clock))
+    cache.get("a")  # "b" is now least recently used
+    cache.put("d", _claims(clock))
+
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+    assert cache.stats()["evictions"] == 1
+
+
+def test_role_results_keyed_by_normalised_roles_and_check_all(cache, clock):
+    cache.put("token-a", _claims(clock))
+    assert cache.get_role_result("token-a", ["Admin"], False) is None
+
+    cache.put_role_result("token-a", ["Admin", "User"], False, True)
+
+    assert cache.get_role_result("token-a", ["user", "ADMIN"], False) is True
+    assert cache.get_role_result("token-a", ["Admin", "User"], True) is None
+
+
+def test_role_result_for_uncached_token_is_ignored(cache):
+    cache.put_role_result("token-a", ["Admin"], False, True)
+    assert cache.get_role_result("token-a", ["Admin"], False) is None
+
+
+def test_stats_hit_rate(cache, clock):
+    cache.put("token-a", _claims(clock))
+    cache.get("token-a")
+    cache.get("token-a")
+    cache.get("token-a")
+    cache.get("token-b")
+
+    stats = cache.stats()
+    assert stats["hits"] == 3
+    assert stats["misses"] == 1
+    assert stats["hit_rate"] == 0.75
+    assert stats["entries"] == 1
+
+
+def test_clear(cache, clock):
+    cache.put("token-a", _claims(clock))
+    cache.get("token-a")
+    cache.clear()
+
+    stats = cache.stats()
+    assert stats["entries"] == 0
+    assert stats["hits"] == 0
@@ -0,0 +1,218 @@
+from typing import Any, Dict, FrozenSet, Iterable, Iterator, Optional, Tuple
+
+from fastapi import WebSocket
+
+# ---------------------------------------------------------------------------
+# Connection registry
+#
+# ``ConnectionManager`` used to keep its connections in a list: removing one
+# was an O(n) ``list.remove``, every ``websocket in active_connections``
+# check was a scan, and a loop over the list could skip a socket when
+# another coroutine disconnected one meanwhile. ``ConnectionRegistry`` is an
+# insertion-ordered set (a dict with ``None`` values) with O(1) add, remove
+# and membership, plus secondary indexes by user (the ``sub`` claim) and by
+# role, so targeted sends touch only the matching sockets.
+#
+# Connections may also subscribe to topics (opaque strings such as
+# ``experiment:EXP-001``). A connection without subscriptions receives every
+# event; once subscribed, it only receives events carrying one of its
+# topics. The topic index keeps both groups, so a topic-routed broadcast
+# reaches its audience without testing every connection.
+#
+# Iteration always walks an immutable snapshot. The snapshot is cached until
+# the next change, so repeated broadcasts do not copy the registry each time.
+# ---------------------------------------------------------------------------
+
+# Keys a connection is indexed under: its user id and its lowercased roles.
+_IndexKeys = Tuple[Optional[str], Tuple[str, ...]]
+
+
+def _index_keys(websocket: WebSocket) -> _IndexKeys:
+    user = getattr(websocket.state, "user", None)
+    if not isinstance(user, dict):
+        return None, ()
+    roles = user.get("roles") or []
+    # Roles are compared case-insensitively, as in the sender-role checks.
+    return user.get("sub"), tuple(dict.fromkeys(role.lower() for role in roles if isinstance(role, str)))
+
+
+class ConnectionRegistry:
+    """Insertion-ordered set of WebSocket connections with user and role indexes.
+
+    Args:
+        connections: Initial connections, in order
+    """
+
+    def __init__(self, connections: Iterable[WebSocket] = ()):
+        self._connections: Dict[WebSocket, _IndexKeys] = {}
+        self._by_user: Dict[str, Dict[WebSocket, None]] = {}
+        self._by_role: Dict[str, Dict[WebSocket, None]] = {}
+        self._by_topic: Dict[str, Dict[WebSocket, None]] = {}
+        self._topics_of: Dict[WebSocket, FrozenSet[str]] = {}
+        # Connections without topic subscriptions.
+        self._unfiltered: Dict[WebSocket, None] = {}
+        self._snapshot: Optional[Tuple[WebSocket, ...]] = ()
+        for websocket in connections:
+            self.add(websocket)
+
+    def __len__(self) -> int:
+        return len(self._connections)
+
+    def __contains__(self, websocket: Any) -> bool:
+        return websocket in self._connections
+
+    def __iter__(self) -> Iterator[WebSocket]:
+        return iter(self.snapshot())
+
+    def __repr__(self) -> str:
+        return f"ConnectionRegistry({list(self._connections)!r})"
+
+    def snapshot(self) -> Tuple[WebSocket, ...]:
+        """All connections, in registration order, as of now."""
+        if self._snapshot is None:
+            self._snapshot = tuple(self._connections)
+        return self._snapshot
+
+    def add(self, websocket: WebSocket) -> None:
+        """Register ``websocket``, indexed by its authenticated user, if any.
+
+        Re-adding a registered connection refreshes its index entries (e.g.
+        after ``websocket.state.user`` was set) and keeps its position.
+        """
+        if websocket in self._connections:
+            self._unindex(websocket)
+        else:
+            self._snapshot = None
+            self._unfiltered[websocket] = None
+        keys = _index_keys(websocket)
+        self._connections[websocket] = keys
+        user_id, roles = keys
+        if user_id is not None:
+            self._by_user.setdefault(user_id, {})[websocket] = None
+        for role in roles:
+            self._by_role.setdefault(role, {})[websocket] = None
+
+    def discard(self, websocket: WebSocket) -> bool:
+        """Unregister ``websocket``; False if it was not registered."""
+        if websocket not in self._connections:
+            return False
+        self._unindex(websocket)
+        self.unsubscribe(websocket)
+        self._unfiltered.pop(websocket, None)
+        del self._connections[websocket]
+        self._snapshot = None
+        return True
+
+    def clear(self) -> None:
+        self._connections.clear()
+        self._by_user.clear()
+        self._by_role.clear()
+        self._by_topic.clear()
+        self._topics_of.clear()
+        self._unfiltered.clear()
+        self._snapshot = ()
+
+    def subscribe(self, websocket: WebSocket, topics: Iterable[str]) -> FrozenSet[str]:
+        """Add topic subscriptions for a registered connection.
+
+        Returns:
+            The connection's subscriptions afterwards
+        """
+        if websocket not in self._connections:
+            raise KeyError("Connection is not registered")
+        current = self._topics_of.get(websocket, frozenset())
+        added = frozenset(topics) - current
+        for topic in added:
+            self._by_topic.setdefault(topic, {})[websocket] = None
+        subscribed = current | added
+        if subscribed:
+            self._topics_of[websocket] = subscribed
+            self._unfiltered.pop(websocket, None)
+        return subscribed
+
+    def unsubscribe(self, websocket: WebSocket, topics: Optional[Iterable[str]] = None) -> FrozenSet[str]:
+        """Drop some (default: all) topic subscriptions of a connection.
+
+        A connection left without subscriptions receives every event again.
+
+        Returns:
+            The connection's subscriptions afterwards
+        """
+        current = self._topics_of.get(websocket, frozenset())
+        removed = current if topics is None else current & frozenset(topics)
+        for topic in removed:
+            self._discard_from(self._by_topic, topic, websocket)
+        remaining = current - removed
+        if remaining:
+            self._topics_of[websocket] = remaining
+        else:
+            self._topics_of.pop(websocket, None)
+            if websocket in self._connections:
+                self._unfiltered[websocket] = None
+        return remaining
+
+    def subscriptions(self, websocket: WebSocket) -> FrozenSet[str]:
+        return self._topics_of.get(websocket, frozenset())
+
+    def for_user(self, user_id: str) -> Tuple[WebSocket, ...]:
+        """Connections of the user whose ``sub`` claim is ``user_id``."""
+        return tuple(self._by_user.get(user_id, ()))
+
+    def for_role(self, role: str) -> Tuple[WebSocket, ...]:
+        """Connections whose user has ``role`` (case-insensitive)."""
+        return tuple(self._by_role.get(role.lower(), ()))
+
+    def for_topics(self, topics: Iterable[str]) -> Tuple[WebSocket, ...]:
+        """Audience of an event carrying ``topics``.
+
+        That is every connection subscribed to one of the topics, plus
+        every connection without subscriptions.
+        """
+        return tuple(self._topic_audience(topics))
+
+    def select(
+        self,
+        user_id: Optional[str] = None,
+        role: Optional[str] = None,
+        topics: Optional[Iterable[str]] = None,
+    ) -> Tuple[WebSocket, ...]:
+        """Connections matching every given filter; all connections if none is given.
+
+        ``topics`` selects the audience of an event carrying those topics;
+        see ``for_topics``.
+        """
+        filters = []
+        if user_id is not None:
+            filters.append(self._by_user.get(user_id, {}))
+        if role is not None:
+            filters.append(self._by_role.get(role.lower(), {}))
+        if topics is not None:
+            filters.append(self._topic_audience(topics))
+        if not filters:
+            return self.snapshot()
+        # Walk the smallest candidate set; membership in the others is O(1).
+        filters.sort(key=len)
+        smallest, others = filters[0], filters[1:]
+        return tuple(ws for ws in smallest if all(ws in other for other in others))
+
+    def _topic_audience(self, topics: Iterable[str]) -> Dict[WebSocket, None]:
+        audience = dict(self._unfiltered)
+        for topic in topics:
+            audience.update(self._by_topic.get(topic, {}))
+        return audience
+
+    def _unindex(self, websocket: WebSocket) -> None:
+        user_id, roles = self._connections[websocket]
+        if user_id is not None:
+            self._discard_from(self._by_user, user_id, websocket)
+        for role in roles:
+            self._discard_from(self._by_role, role, websocket)
+
+    @staticmethod
+    def _discard_from(index: Dict[str, Dict[WebSocket, None]], key: str, websocket: WebSocket) -> None:
+        members = index.get(key)
+        if members is None:
+            return
+        members.pop(websocket, None)
+        if not members:
+            del index[key]
@@ -0,0 +1,149 @@
+import time
+from types import SimpleNamespace
+
+from common.connection_registry import ConnectionRegistry
+
+
+class _Socket:
+    def __init__(self, state):
+        self.state = state
+
+
+def _socket(sub=None, roles=()):
+    state = SimpleNamespace()
+    if sub is not None:
+        state.user = {"sub": sub, "name": sub, "roles": list(roles)}
+    return _Socket(state)
+
+
+def test_keeps_registration_order_and_ignores_duplicates():
+    first, second, third = _socket(), _socket(), _socket()
+    registry = ConnectionRegistry([first, second])
+    registry.add(third)
+    registry.add(first)
+
+    assert list(registry) == [first, second, third]
+    assert len(registry) == 3
+    assert registry.discard(second) is True
+    assert registry.discard(second) is False
+    assert second not in registry
+    assert list(registry) == [first, third]
+
+
+def test_iteration_survives_removal_during_the_loop():
+    sockets = [_socket() for _ in range(5)]
+    registry = ConnectionRegistry(sockets)
+
+    visited = []
+    for websocket in registry:
+        visited.append(websocket)
+        registry.discard(sockets[-1])
+        registry.add(_socket())
+
+    # The loop sees the connections as of its start, none skipped.
+    assert visited == sockets
+
+
+def test_snapshot_is_cached_until_the_registry_changes():
+    registry = ConnectionRegistry([_socket(), _socket()])
+
+    assert registry.snapshot() is registry.snapshot()
+    before = registry.snapshot()
+    registry.add(_socket())
+    assert registry.snapshot() is not before
+    assert len(registry.snapshot()) == 3
+
+
+def test_user_and_role_indexes():
+    okabe_phone, okabe_laptop = _socket("okabe", ["Admin"]), _socket("okabe", ["Admin"])
+    mayuri = _socket("mayuri", ["member"])
+    anonymous = _socket()
+    registry = ConnectionRegistry([okabe_phone, mayuri, okabe_laptop, anonymous])
+
+    assert registry.for_user("okabe") == (okabe_phone, okabe_laptop)
+    assert registry.for_role("admin") == (okabe_phone, okabe_laptop)
+    assert registry.for_role("MEMBER") == (mayuri,)
+    assert registry.for_user("nobody") == ()
+    assert registry.select(user_id="okabe", role="member") == ()
+    assert registry.select(user_id="mayuri", role="Member") == (mayuri,)
+    assert registry.select() == (okabe_phone, mayuri, okabe_laptop, anonymous)
+
+    registry.discard(okabe_phone)
+    registry.discard(okabe_laptop)
+    assert registry.for_user("okabe") == ()
+    assert registry.for_role("admin") == ()
+
+
+def test_re_adding_refreshes_the_index_entries():
+    websocket = _socket()
+    registry = ConnectionRegistry([websocket])
+    websocket.state.user = {"sub": "kurisu", "roles": ["Admin"]}
+
+    registry.add(websocket)
+
+    assert registry.for_user("kurisu") == (websocket,)
+    websocket.state.user = {"sub": "kurisu", "roles": []}
+    registry.add(websocket)
+    assert registry.for_role("admin") == ()
+
+
+def test_topic_subscriptions_narrow_the_audience():
+    watcher, planner, firehose = _socket("okabe", ["Admin"]), _socket("kurisu"), _socket("mayuri")
+    registry = ConnectionRegistry([watcher, planner, firehose])
+
+    assert registry.subscribe(watcher, ["experiment:EXP-001"]) == {"experiment:EXP-001"}
+    registry.subscribe(planner, ["status:planned", "creator:kurisu"])
+
+    assert set(registry.for_topics(["experiment:EXP-001", "status:completed"])) == {watcher, firehose}
+    assert set(registry.for_topics(["status:planned"])) == {planner, firehose}
+    assert registry.for_topics([]) == (firehose,)
+    assert registry.select(role="admin", topics=["status:planned"]) == ()
+
+    # Dropping the last subscription restores the full feed.
+    assert registry.unsubscribe(planner, ["status:planned"]) == {"creator:kurisu"}
+    assert registry.unsubscribe(planner) == frozenset()
+    assert set(registry.for_topics(["status:completed"])) == {planner, firehose}
+
+    registry.discard(watcher)
+    assert set(registry.for_topics(["experiment:EXP-001"])) == {planner, firehose}
+    assert registry.subscriptions(watcher) == frozenset()
+
+
+def test_registry_benchmark_with_10k_connections():
+    """Benchmark: churn and targeted lookups at 10k sockets, registry vs list."""
+    sockets = [_socket(f"user-{i}", ["Admin"] if i % 100 == 0 else []) for i in range(10_000)]
+    churn = sockets[::10]
+    lookups = [f"user-{i}" for i in range(0, 10_000, 100)]
+    registry, connections = ConnectionRegistry(sockets), list(sockets)
+
+    def timed(operation):
+        started = time.perf_counter()
+        result = operation()
+        return time.perf_counter() - started, result
+
+    def registry_churn():
+        for websocket in churn:
+            registry.discard(websocket)
+            registry.add(websocket)
+
+    def list_churn():
+        for websocket in churn:
+            connections.remove(websocket)
+            connections.append(websocket)
+
+    registry_churn_s, _ = timed(registry_churn)
+    list_churn_s, _ = timed(list_churn)
+    registry_lookup_s, found = timed(lambda: [registry.for_user(user_id) for user_id in lookups])
+    list_lookup_s, scanned = timed(lambda: [
+        [ws for ws in connections if ws.state.user["sub"] == user_id] for user_id in lookups
+    ])
+
+    print(
+        f"10k sockets, {len(churn)} disconnect+reconnect: registry {registry_churn_s * 1000:.1f}ms, "
+        f"list {list_churn_s * 1000:.1f}ms; {len(lookups)} per-user lookups: "
+        f"registry {registry_lookup_s * 1000:.2f}ms, list scan {list_lookup_s * 1000:.1f}ms"
+    )
+    assert [list(f) for f in found] == scanned
+    assert len(registry.for_role("admin")) == 100
+    assert registry_lookup_s < list_lookup_s
+    assert registry_churn_s < 0.5
@@ -0,0 +1,108 @@
+from typing import Any, Awaitable, Callable, Dict, Optional
+import asyncio
+
+from common.log import logger
+
+# ---------------------------------------------------------------------------
+# Debounced calls
+#
+# Some work only needs to reflect the latest state, not every change: a
+# bulk edit of twenty experiments used to compute and broadcast the
+# worldline status twenty times, and all but the last were stale on
+# arrival. A ``Debouncer`` collapses a burst of ``trigger`` calls into one
+# run of its function:
+#
+#   - The first trigger of a burst schedules a run ``window`` seconds later.
+#     Triggers before that run starts only update its arguments.
+#   - The run gets the latest trigger's arguments, or the result of
+#     ``merge`` over all of them.
+#   - A trigger while a run is in progress schedules one more run after it.
+#
+# So every trigger is followed by a run that starts after it. A function
+# that reads the current state when it runs therefore always publishes the
+# state after the last change, however the burst was timed. A burst waits
+# at most one window, plus the run in progress, so a steady stream of
+# triggers never starves the function.
+# ---------------------------------------------------------------------------
+
+# Combines the keyword arguments of a pending run with those of a newer
+# trigger into the arguments of the one run standing in for both.
+MergeArgs = Callable[[Dict[str, Any], Dict[str, Any]], Dict[str, Any]]
+
+
+class Debouncer:
+    """Runs a coroutine function once per burst of triggers.
+
+    Args:
+        func: Coroutine function run with the collected keyword arguments
+        window: Seconds from the first trigger of a burst to the run
+        merge: Combines pending and newer arguments (default: the newer
+            trigger's arguments replace the pending ones)
+        name: Names the function in log messages
+    """
+
+    def __init__(
+        self,
+        func: Callable[..., Awaitable[Any]],
+        window: float,
+        merge: Optional[MergeArgs] = None,
+        name: str = "call",
+    ):
+        self.func = func
+        self.window = max(0.0, window)
+        self.merge = merge
+        self.name = name
+        self._pending: Optional[Dict[str, Any]] = None
+        self._task: Optional[asyncio.Task] = None
+        self.triggered = 0
+        self.runs = 0
+        self.failures = 0
+
+    @property
+    def pending(self) -> bool:
+        """True if a run is scheduled or in progress."""
+        return self._task is not None and not self._task.done()
+
+    def trigger(self, **kwargs) -> None:
+        """Request a run with ``kwargs``; returns without waiting for it."""
+        self.triggered += 1
+        if self._pending is None or self.merge is None:
+            self._pending = kwargs
+        else:
+            self._pending = self.merge(self._pending, kwargs)
+
+        loop = asyncio.get_running_loop()
+        # A task left on another loop (e.g. a test client's, now closed)
+        # will never run; start over on this one.
+        if self._task is None or self._task.done() or self._task.get_loop() is not loop:
+            self._task = loop.create_task(self._run())
+
+    async def flush(self) -> None:
+        """Wait until the scheduled runs, if any, have finished."""
+        while self._task is not None and not self._task.done():
+            if self._task.get_loop() is not asyncio.get_running_loop():
+                return
+            await asyncio.wait({self._task})
+
+    async def close(self) -> None:
+        """Cancel the scheduled run and drop its arguments."""
+        task, self._task = self._task, None
+        self._pending = None
+        if task is None or task.done() or task.get_loop() is not asyncio.get_running_loop():
+            return
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+
+    async def _run(self) -> None:
+        while self._pending is not None:
+            await asyncio.sleep(self.window)
+            kwargs, self._pending = self._pending, None
+            self.runs += 1
+            try:
+                await self.func(**kwargs)
+            except Exception as exc:
+                self.failures += 1
+                logger.error(f"Debounced {self.name} failed: {exc}")
@@ -0,0 +1,169 @@
+import asyncio
+import random
+
+import pytest
+
+from common.debounce import Debouncer
+
+
+class Recorder:
+    """Debounced function that records the arguments and the state it saw."""
+
+    def __init__(self, state=None, delay=0.0):
+        self.state = state if state is not None else {}
+        self.delay = delay
+        self.calls = []
+        self.seen = []
+
+    async def __call__(self, **kwargs):
+        # Reads the state at the start, like a broadcast computing a snapshot
+        self.seen.append(dict(self.state))
+        self.calls.append(kwargs)
+        if self.delay:
+            await asyncio.sleep(self.delay)
+
+
+@pytest.mark.asyncio
+async def test_burst_runs_once_with_latest_arguments():
+    recorder = Recorder()
+    debouncer = Debouncer(recorder, window=0.02)
+
+    for i in range(5):
+        debouncer.trigger(value=i)
+    assert recorder.calls == []
+    await debouncer.flush()
+
+    assert recorder.calls == [{"value": 4}]
+    assert (debouncer.triggered, debouncer.runs) == (5, 1)
+    assert not debouncer.pending
+
+
+@pytest.mark.asyncio
+async def test_merge_combines_the_arguments_of_a_burst():
+    recorder = Recorder()
+
+    def merge(pending, latest):
+        return {"values": pending["values"] + latest["values"]}
+
+    debouncer = Debouncer(recorder, window=0.01, merge=merge)
+    for i in range(3):
+        debouncer.trigger(values=[i])
+    await debouncer.flush()
+
+    assert recorder.calls == [{"values": [0, 1, 2]}]
+
+
+@pytest.mark.asyncio
+async def test_trigger_during_run_schedules_one_more_run():
+    """A change made while a run is in progress is not lost"""
+    recorder = Recorder(state={"version": 0}, delay=0.03)
+    debouncer = Debouncer(recorder, window=0.0)
+
+    debouncer.trigger()
+    await asyncio.sleep(0.01)
+    assert len(recorder.calls) == 1
+
+    # Both land while the first run is still sending
+    for version in (1, 2):
+        recorder.state["version"] = version
+        debouncer.trigger()
+    await debouncer.flush()
+
+    assert [seen["version"] for seen in recorder.seen] == [0, 2]
+
+
+@pytest.mark.asyncio
+async def test_separate_bursts_run_separately():
+    recorder = Recorder()
+    debouncer = Debouncer(recorder, window=0.01)
+
+    debouncer.trigger(value="first")
+    await debouncer.flush()
+    debouncer.trigger(value="second")
+    await debouncer.flush()
+
+    assert recorder.calls == [{"value": "first"}, {"value": "second"}]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("seed", range(5))
+async def test_last_run_sees_the_final_state(seed):
+    """However a burst is timed, the last run starts after the last change"""
+    rng = random.Random(seed)
+    recorder = Recorder(state={"version": 0}, delay=0.005)
+    debouncer = Debouncer(recorder, window=0.01)
+
+    for version in range(1, 31):
+        recorder.state["version"] = version
+        debouncer.trigger(version=version)
+        await asyncio.sleep(rng.choice([0, 0, 0.002, 0.008, 0.02]))
+    await debouncer.flush()
+
+    assert recorder.seen[-1] == {"version": 30}
+    assert recorder.calls[-1] == {"version": 30}
+    # Versions are published in order, and far fewer times than changed
+    seen = [state["version"] for state in recorder.seen]
+    assert seen == sorted(seen)
+    assert debouncer.runs == len(recorder.calls) < debouncer.triggered
+
+
+@pytest.mark.asyncio
+async def test_failed_run_is_logged_and_later_triggers_still_run(monkeypatch):
+    errors = []
+    monkeypatch.setattr("common.debounce.logger.error", errors.append)
+    calls = []
+
+    async def flaky(**kwargs):
+        calls.append(kwargs)
+        if len(calls) == 1:
+            raise RuntimeError("store unavailable")
+
+    debouncer = Debouncer(flaky, window=0.0, name="worldline broadcast")
+    debouncer.trigger(value=1)
+    await debouncer.flush()
+    debouncer.trigger(value=2)
+    await debouncer.flush()
+
+    assert calls == [{"value": 1}, {"value": 2}]
+    assert debouncer.failures == 1
+    assert any("worldline broadcast failed: store unavailable" in message for message in errors)
+
+
+@pytest.mark.asyncio
+async def test_close_drops_the_pending_run():
+    recorder = Recorder()
+    debouncer = Debouncer(recorder, window=0.05)
+
+    debouncer.trigger(value=1)
+    await debouncer.close()
+    await asyncio.sleep(0.06)
+
+    assert recorder.calls == []
+    assert not debouncer.pending
+
+
+def test_task_left_on_a_closed_loop_is_replaced():
+    """A debouncer outlives the event loops of successive test clients"""
+    recorder = Recorder()
+    debouncer = Debouncer(recorder, window=0.01)
+
+    async def trigger_only():
+        debouncer.trigger(value="lost")
+
+    async def trigger_and_flush():
+        debouncer.trigger(value="delivered")
+        await debouncer.flush()
+
+    # The first loop closes before the scheduled run
+    for step in (trigger_only, trigger_and_flush):
+        loop = asyncio.new_event_loop()
+        try:
+            loop.run_until_complete(step())
+        finally:
+            loop.close()
+
+    assert recorder.calls == [{"value": "delivered"}]
+
+
+def test_negative_window_means_no_delay():
+    assert Debouncer(Recorder(), window=-1).window == 0.0
@@ -0,0 +1,111 @@
+import json
+from typing import Any, AsyncIterator, Dict, Optional
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
+
+# ---------------------------------------------------------------------------
+# Streaming JSON collection responses
+#
+# A collection route normally builds the whole result list, has FastAPI
+# validate it against ``response_model`` and serialises it in one go, so the
+# first byte leaves only after the last item was read, and the list, the
+# validated copy and the encoded body are all in memory at once.
+# ``streaming_json_response`` instead encodes items as they arrive from an
+# async iterator (the data services' lazy ``iter_*`` pagers) and flushes
+# them in chunks of about ``STREAM_CHUNK_BYTES``, so peak memory is bounded
+# by one storage page plus one chunk whatever the result size.
+#
+# Two formats are offered, chosen by the ``Accept`` header:
+#
+#   - ``application/x-ndjson``: one JSON document per line.
+#   - anything else: a single JSON array, byte-compatible with the
+#     non-streaming response body.
+#
+# Headers are sent before the first item is read, so a storage error in
+# the middle of the stream can no longer become a 5xx status. The data
+# services raise it instead of ending the collection early, and the error
+# aborts the response: the body stops without the closing ``]`` (or with
+# NDJSON lines missing) and the connection is closed without the final
+# chunk, so a client can tell the collection is incomplete. A storage error
+# before the first item still gives an empty collection.
+# ---------------------------------------------------------------------------
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+JSON_MEDIA_TYPE = "application/json"
+STREAM_CHUNK_BYTES = 64 * 1024
+
+
+def wants_ndjson(accept: Optional[str]) -> bool:
+    """Whether the ``Accept`` header asks for NDJSON."""
+    if not accept:
+        return False
+    media_types = (part.split(";", 1)[0].strip().lower() for part in accept.split(","))
+    return NDJSON_MEDIA_TYPE in media_types
+
+
+def encode_json_item(item: Any) -> bytes:
+    """Encode one item the way FastAPI's ``JSONResponse`` renders a body."""
+    return json.dumps(
+        item,
+        ensure_ascii=False,
+        allow_nan=False,
+        separators=(",", ":"),
+        default=jsonable_encoder,
+    ).encode("utf-8")
+
+
+async def iter_json_array(
+    items: AsyncIterator[Dict[str, Any]],
+    chunk_bytes: int = STREAM_CHUNK_BYTES,
+) -> AsyncIterator[bytes]:
+    """Encode ``items`` as one JSON array, yielded in chunks.
+
+    The first item is flushed as soon as it is encoded so clients see data
+    without waiting for a full chunk.
+    """
+    buffer = bytearray(b"[")
+    first = True
+    async for item in items:
+        if not first:
+            buffer += b","
+        buffer += encode_json_item(item)
+        if first or len(buffer) >= chunk_bytes:
+            yield bytes(buffer)
+            buffer.clear()
+        first = False
+    buffer += b"]"
+    yield bytes(buffer)
+
+
+async def iter_ndjson(
+    items: AsyncIterator[Dict[str, Any]],
+    chunk_bytes: int = STREAM_CHUNK_BYTES,
+) -> AsyncIterator[bytes]:
+    """Encode ``items`` as newline-delimited JSON, yielded in chunks."""
+    buffer = bytearray()
+    first = True
+    async for item in items:
+        buffer += encode_json_item(item)
+        buffer += b"\n"
+        if first or len(buffer) >= chunk_bytes:
+            yield bytes(buffer)
+            buffer.clear()
+        first = False
+    if buffer:
+        yield bytes(buffer)
+
+
+def streaming_json_response(items: AsyncIterator[Dict[str, Any]], accept: Optional[str]) -> StreamingResponse:
+    """Stream ``items`` as NDJSON or a JSON array, depending on ``accept``.
+
+    Args:
+        items: Lazily produced collection items
+        accept: The request's ``Accept`` header
+
+    Returns:
+        A ``StreamingResponse`` that encodes the items as they arrive
+    """
+    if wants_ndjson(accept):
+        return StreamingResponse(iter_ndjson(items), media_type=NDJSON_MEDIA_TYPE)
+    return StreamingResponse(iter_json_array(items), media_type=JSON_MEDIA_TYPE)
@@ -0,0 +1,108 @@
+import json
+
+import pytest
+
+from common.json_stream import (
+    NDJSON_MEDIA_TYPE,
+    iter_json_array,
+    iter_ndjson,
+    streaming_json_response,
+    wants_ndjson,
+)
+
+
+async def _items(items):
+    for item in items:
+        yield item
+
+
+async def _collect(chunks):
+    return [chunk async for chunk in chunks]
+
+
+@pytest.mark.parametrize("accept, expected", [
+    (None, False),
+    ("", False),
+    ("application/json", False),
+    ("application/x-ndjson", True),
+    ("text/csv, application/x-ndjson;q=0.9", True),
+    ("APPLICATION/X-NDJSON", True),
+])
+def test_wants_ndjson(accept, expected):
+    assert wants_ndjson(accept) is expected
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("items", [
+    [],
+    [{"id": "DR-001"}],
+    [{"id": "DR-001", "reading": 1.048596, "notes": "Steins;Gate 世界線"}, {"id": "DR-002", "tags": [1, None]}],
+])
+async def test_json_array_matches_one_shot_encoding(items):
+    """The streamed array is byte-identical to the non-streaming body"""
+    body = b"".join(await _collect(iter_json_array(_items(items))))
+
+    expected = json.dumps(items, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+    assert body == expected
+
+
+@pytest.mark.asyncio
+async def test_ndjson_is_one_document_per_line():
+    items = [{"id": i, "name": f"exp-{i}"} for i in range(3)]
+
+    body = b"".join(await _collect(iter_ndjson(_items(items))))
+
+    assert [json.loads(line) for line in body.splitlines()] == items
+    assert body.endswith(b"\n")
+    assert b"".join(await _collect(iter_ndjson(_items([])))) == b""
+
+
+@pytest.mark.asyncio
+async def test_first_item_is_flushed_then_chunks_are_bounded():
+    """The first item goes out alone; later output is batched by size"""
+    items = [{"id": i, "payload": "x" * 100} for i in range(50)]
+
+    chunks = await _collect(iter_json_array(_items(items), chunk_bytes=1024))
+
+    assert json.loads(chunks[0] + b"]") == items[:1]
+    assert all(len(chunk) < 1024 + 200 for chunk in chunks)
+    assert 3 < len(chunks) < len(items)
+    assert json.loads(b"".join(chunks)) == items
+
+
+@pytest.mark.asyncio
+async def test_items_are_pulled_lazily():
+    """Nothing is read from the source before the consumer asks for it"""
+    pulled = []
+
+    async def source():
+        for i in range(3):
+            pulled.append(i)
+            yield {"id": i}
+
+    chunks = iter_json_array(source(), chunk_bytes=1 << 20)
+    assert pulled == []
+    await chunks.__anext__()
+    assert pulled == [0]
+
+
+def test_streaming_json_response_negotiates_media_type():
+    assert streaming_json_response(_items([]), NDJSON_MEDIA_TYPE).media_type == NDJSON_MEDIA_TYPE
+    assert streaming_json_response(_items([]), "application/json").media_type == "application/json"
+    assert streaming_json_response(_items([]), None).media_type == "application/json"
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("encode", [iter_json_array, iter_ndjson])
+async def test_source_error_cuts_the_stream_off(encode):
+    """A failing source is not encoded as a complete, shorter collection"""
+    async def failing():
+        yield {"id": 1}
+        raise RuntimeError("storage failed")
+
+    chunks = []
+    with pytest.raises(RuntimeError):
+        async for chunk in encode(failing()):
+            chunks.append(chunk)
+
+    assert b"".join(chunks) in (b'[{"id":1}', b'{"id":1}\n')
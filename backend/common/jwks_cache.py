@@ -0,0 +1,237 @@
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+import jwt
+import requests
+from jwt import PyJWK, PyJWKSet
+from jwt.exceptions import PyJWKClientConnectionError, PyJWKClientError
+
+from common.log import logger
+
+# ---------------------------------------------------------------------------
+# Process-wide JWKS signing-key cache
+#
+# ``verify_token`` used to construct a fresh ``jwt.PyJWKClient`` on every
+# call, so the client's built-in JWKS cache was thrown away together with
+# the client and every WebSocket handshake paid a blocking HTTPS round trip
+# to the tenant's discovery endpoint. ``JwksKeyCache`` below is shared by
+# the whole worker process (see ``get_jwks_key_cache``) and keeps the
+# parsed keys indexed by ``kid``:
+#
+#   - Keys are served from memory for ``JWKS_CACHE_TTL_SECONDS``.
+#   - Once the key set is within ``JWKS_REFRESH_AHEAD_SECONDS`` of expiring,
+#     a hit schedules a single background refresh so hot paths never block
+#     on the fetch in steady state.
+#   - An unknown ``kid`` (Entra rolled its keys) forces a synchronous
+#     refresh, but at most once every ``JWKS_MIN_REFRESH_INTERVAL_SECONDS``
+#     so a flood of tokens with made-up ``kid`` values cannot turn into a
+#     flood of requests against login.microsoftonline.com.
+#   - A failed refresh keeps serving the previous keys; a transient outage
+#     of the discovery endpoint must not wipe a working cache.
+# ---------------------------------------------------------------------------
+
+JWKS_CACHE_TTL_SECONDS = 3600.0
+JWKS_REFRESH_AHEAD_SECONDS = 300.0
+JWKS_MIN_REFRESH_INTERVAL_SECONDS = 30.0
+JWKS_FETCH_TIMEOUT_SECONDS = 5.0
+
+
+def fetch_jwks(url: str, timeout: float = JWKS_FETCH_TIMEOUT_SECONDS) -> Dict[str, Any]:
+    """Fetch a JWK Set document over HTTPS.
+
+    Raises:
+        PyJWKClientConnectionError: If the request fails or the endpoint
+            returns a non-2xx status.
+    """
+    try:
+        response = requests.get(url, timeout=timeout)
+        response.raise_for_status()
+        return response.json()
+    except (requests.RequestException, ValueError) as exc:
+        raise PyJWKClientConnectionError(f'Fail to fetch data from the url, err: "{exc}"') from exc
+
+
+class JwksKeyCache:
+    """Thread-safe, ``kid``-indexed cache of JWKS signing keys.
+
+    Args:
+        jwks_url: The JWKS endpoint to fetch keys from
+        ttl_seconds: How long a fetched key set is considered fresh
+        refresh_ahead_seconds: Window before expiry in which a cache hit
+            triggers a background refresh
+        min_refresh_interval_seconds: Minimum spacing between refreshes
+            triggered by an unknown ``kid``
+        fetcher: Callable returning the JWKS document for a URL. Defaults to
+            ``fetch_jwks``; tests pass a local stand-in.
+        clock: Monotonic clock, injectable for tests
+    """
+
+    def __init__(
+        self,
+        jwks_url: str,
+        ttl_seconds: float = JWKS_CACHE_TTL_SECONDS,
+        refresh_ahead_seconds: float = JWKS_REFRESH_AHEAD_SECONDS,
+        min_refresh_interval_seconds: float = JWKS_MIN_REFRESH_INTERVAL_SECONDS,
+        fetcher: Optional[Callable[[str], Dict[str, Any]]] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.jwks_url = jwks_url
+        self.ttl_seconds = ttl_seconds
+        self.refresh_ahead_seconds = refresh_ahead_seconds
+        self.min_refresh_interval_seconds = min_refresh_interval_seconds
+        self._fetcher = fetcher or fetch_jwks
+        self._clock = clock
+
+        self._keys: Dict[str, PyJWK] = {}
+        self._fetched_at: Optional[float] = None
+        self._last_refresh_attempt: Optional[float] = None
+        # ``_lock`` guards the key map and counters; ``_refresh_lock`` makes
+        # the HTTPS fetch single-flight so N concurrent misses cost one fetch.
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._background_refresh: Optional[threading.Thread] = None
+        self._counters = {
+            "hits": 0,
+            "misses": 0,
+            "refreshes": 0,
+            "refresh_failures": 0,
+            "background_refreshes": 0,
+            "rate_limited": 0,
+        }
+
+    def get_signing_key_from_jwt(self, token: str) -> PyJWK:
+        """Return the signing key for a JWT by reading its ``kid`` header.
+
+        Raises:
+            jwt.DecodeError: If the token header cannot be parsed
+            PyJWKClientError: If no signing key matches the token's ``kid``
+        """
+        header = jwt.get_unverified_header(token)
+        return self.get_signing_key(header.get("kid"))
+
+    def get_signing_key(self, kid: Optional[str]) -> PyJWK:
+        """Return the signing key for ``kid``, refreshing the key set if needed.
+
+        Raises:
+            PyJWKClientError: If no signing key matches ``kid``
+        """
+        now = self._clock()
+        with self._lock:
+            key = self._keys.get(kid) if kid else None
+            fresh = self._is_fresh(now)
+            if key is not None and fresh:
+                self._counters["hits"] += 1
+                if now - self._fetched_at >= self.ttl_seconds - self.refresh_ahead_seconds:
+                    self._schedule_background_refresh()
+                return key
+            self._counters["misses"] += 1
+
+        if key is None and not kid:
+            raise PyJWKClientError('Unable to find a signing key that matches: "None"')
+
+        # Either the key set expired or Entra rolled its keys and this is a
+        # ``kid`` we have not seen yet. Both paths are rate limited; an
+        # expired-but-known key keeps being served while the endpoint is
+        # unavailable.
+        self._refresh(stale_since=now, rate_limited=True)
+        with self._lock:
+            refreshed = self._keys.get(kid)
+        if refreshed is not None:
+            return refreshed
+        if key is not None:
+            return key
+        raise PyJWKClientError(f'Unable to find a signing key that matches: "{kid}"')
+
+    def stats(self) -> Dict[str, Any]:
+        """Return a snapshot of the cache counters for metrics/diagnostics."""
+        now = self._clock()
+        with self._lock:
+            snapshot: Dict[str, Any] = dict(self._counters)
+            snapshot["keys"] = len(self._keys)
+            snapshot["age_seconds"] = None if self._fetched_at is None else now - self._fetched_at
+        return snapshot
+
+    def clear(self) -> None:
+        """Drop every cached key and reset the counters."""
+        with self._lock:
+            self._keys = {}
+            self._fetched_at = None
+            self._last_refresh_attempt = None
+            for name in self._counters:
+                self._counters[name] = 0
+
+    # ----- INTERNAL HELPERS -----
+
+    def _is_fresh(self, now: float) -> bool:
+        return self._fetched_at is not None and now - self._fetched_at < self.ttl_seconds
+
+    def _schedule_background_refresh(self) -> None:
+        # Caller holds ``_lock``.
+        if self._background_refresh is not None and self._background_refresh.is_alive():
+            return
+        self._counters["background_refreshes"] += 1
+        self._background_refresh = threading.Thread(
+            target=self._refresh,
+            kwargs={"stale_since": self._clock(), "rate_limited": True},
+            name="jwks-refresh",
+            daemon=True,
+        )
+        self._background_refresh.start()
+
+    def _refresh(self, stale_since: float, rate_limited: bool = False) -> None:
+        """Fetch the key set once, even when several threads ask concurrently.
+
+        ``stale_since`` is the caller's view of "now" when it decided a
+        refresh was needed. A thread that waited on ``_refresh_lock`` while
+        another thread refreshed sees a newer ``_fetched_at`` and returns
+        without fetching again. With ``rate_limited`` the fetch is skipped
+        if the previous attempt is younger than
+        ``min_refresh_interval_seconds``.
+        """
+        with self._refresh_lock:
+            with self._lock:
+                if self._fetched_at is not None and self._fetched_at > stale_since:
+                    return
+                now = self._clock()
+                last = self._last_refresh_attempt
+                if rate_limited and last is not None and now - last < self.min_refresh_interval_seconds:
+                    self._counters["rate_limited"] += 1
+                    return
+                self._last_refresh_attempt = now
+
+            try:
+                data = self._fetcher(self.jwks_url)
+                if not isinstance(data, dict):
+                    raise PyJWKClientError("The JWKS endpoint did not return a JSON object")
+                jwk_set = PyJWKSet.from_dict(data)
+            except Exception as exc:
+                # Any failure (network, malformed document, no usable keys)
+                # leaves the previous key set in place.
+                logger.warning(f"JWKS refresh from {self.jwks_url} failed: {exc}")
+                with self._lock:
+                    self._counters["refresh_failures"] += 1
+                return
+
+            keys = {
+                key.key_id: key
+                for key in jwk_set.keys
+                if key.public_key_use in ("sig", None) and key.key_id
+            }
+            with self._lock:
+                self._keys = keys
+                self._fetched_at = self._clock()
+                self._counters["refreshes"] += 1
+
+
+_jwks_key_caches: Dict[str, JwksKeyCache] = {}
+_jwks_key_caches_lock = threading.Lock()
+
+
+def get_jwks_key_cache(jwks_url: str) -> JwksKeyCache:
+    """Return the process-wide ``JwksKeyCache`` for ``jwks_url``."""
+    cache = _jwks_key_caches.get(jwks_url)
+    if cache is None:
+        with _jwks_key_caches_lock:
+            cache = _jwks_key_caches.setdefault(jwks_url, JwksKeyCache(jwks_url))
+    return cache
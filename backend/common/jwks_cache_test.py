@@ -0,0 +1,247 @@
+import json
+import threading
+import time
+
+import jwt
+import pytest
+from cryptography.hazmat.primitives.asymmetric import rsa
+from jwt.algorithms import RSAAlgorithm
+from jwt.exceptions import PyJWKClientConnectionError, PyJWKClientError
+
+import common.jwks_cache
+from common.jwks_cache import JwksKeyCache, get_jwks_key_cache
+
+JWKS_URL = "https://local.test/discovery/v2.0/keys"
+
+
+def _jwk(kid, use="sig"):
+    """Build a public RSA JWK dict for ``kid``."""
+    private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    jwk = json.loads(RSAAlgorithm.to_jwk(private_key.public_key()))
+    jwk.update({"kid": kid, "use": use, "alg": "RS256"})
+    return private_key, jwk
+
+
+class FakeClock:
+    def __init__(self, start=1000.0):
+        self.now = start
+
+    def __call__(self):
+        return self.now
+
+
+class LocalJwks:
+    """Local stand-in for the tenant discovery endpoint."""
+
+    def __init__(self, *jwks):
+        self.document = {"keys": list(jwks)}
+        self.calls = 0
+        self.fail = False
+
+    def __call__(self, url):
+        assert url == JWKS_URL
+        self.calls += 1
+        if self.fail:
+            raise PyJWKClientConnectionError("endpoint down")
+        return self.document
+
+
+@pytest.fixture
+def keys():
+    return {kid: _jwk(kid) for kid in ("kid-a", "kid-b")}
+
+
+def _cache(endpoint, clock, **kwargs):
+    return JwksKeyCache(JWKS_URL, fetcher=endpoint, clock=clock, **kwargs)
+
+
+def test_first_lookup_fetches_then_hits_from_memory(keys):
+    endpoint = LocalJwks(keys["kid-a"][1])
+    cache = _cache(endpoint, FakeClock())
+
+    first = cache.get_signing_key("kid-a")
+    second = cache.get_signing_key("kid-a")
+
+    assert first is second
+    assert endpoint.calls == 1
+    stats = cache.stats()
+    assert stats["misses"] == 1
+    assert stats["hits"] == 1
+    assert stats["refreshes"] == 1
+    assert stats["keys"] == 1
+
+
+def test_get_signing_key_from_jwt_verifies_token(keys):
+    private_key, jwk = keys["kid-a"]
+    cache = _cache(LocalJwks(jwk), FakeClock())
+    token = jwt.encode({"sub": "u"}, private_key, algorithm="RS256", headers={"kid": "kid-a"})
+
+    signing_key = cache.get_signing_key_from_jwt(token)
+
+    assert jwt.decode(token, signing_key.key, algorithms=["RS256"])["sub"] == "u"
+
+
+def test_encryption_keys_are_not_served(keys):
+    _, enc_jwk = _jwk("kid-enc", use="enc")
+    cache = _cache(LocalJwks(keys["kid-a"][1], enc_jwk), FakeClock())
+
+    with pytest.raises(PyJWKClientError):
+        cache.get_signing_key("kid-enc")
+
+
+def test_unknown_kid_refreshes_and_picks_up_rolled_key(keys):
+    endpoint = LocalJwks(keys["kid-a"][1])
+    clock = FakeClock()
+    cache = _cache(endpoint, clock, min_refresh_interval_seconds=30)
+    cache.get_signing_key("kid-a")
+
+    # Entra rolls its keys; the new kid shows up in the JWKS.
+    endpoint.document = {"keys": [keys["kid-a"][1], keys["kid-b"][1]]}
+    clock.now += 31
+
+    assert cache.get_signing_key("kid-b").key_id == "kid-b"
+    assert endpoint.calls == 2
+
+
+def test_unknown_kid_refresh_is_rate_limited(keys):
+    endpoint = LocalJwks(keys["kid-a"][1])
+    clock = FakeClock()
+    cache = _cache(endpoint, clock, min_refresh_interval_seconds=30)
+    cache.get_signing_key("kid-a")
+
+    for _ in range(50):
+        with pytest.raises(PyJWKClientError):
+            cache.get_signing_key("made-up-kid")
+
+    assert endpoint.calls == 1
+    assert cache.stats()["rate_limited"] == 50
+
+    clock.now += 31
+    with pytest.raises(PyJWKClientError):
+        cache.get_signing_key("made-up-kid")
+    assert endpoint.calls == 2
+
+
+def test_missing_kid_is_rejected_without_fetch(keys):
+    endpoint = LocalJwks(keys["kid-a"][1])
+    cache = _cache(endpoint, FakeClock())
+
+    with pytest.raises(PyJWKClientError):
+        cache.get_signing_key(None)
+    assert endpoint.calls == 0
+
+
+def test_expired_key_set_is_refetched(keys):
+    endpoint = LocalJwks(keys["kid-a"][1])
+    clock = FakeClock()
+    cache = _cache(endpoint, clock, ttl_seconds=100, refresh_ahead_seconds=0)
+    cache.get_signing_key("kid-a")
+
+    clock.now += 101
+    cache.get_signing_key("kid-a")
+
+    assert endpoint.calls == 2
+
+
+def test_failed_refresh_keeps_serving_stale_key(keys):
+    endpoint = LocalJwks(keys["kid-a"][1])
+    clock = FakeClock()
+    cache = _cache(endpoint, clock, ttl_seconds=100, refresh_ahead_seconds=0)
+    original = cache.get_signing_key("kid-a")
+
+    endpoint.fail = True
+    clock.now += 101
+
+    assert cache.get_signing_key("kid-a") is original
+    assert cache.stats()["refresh_failures"] == 1
+    # Still down: the next lookup inside the rate-limit window does not
+    # hammer the endpoint again.
+    assert cache.get_signing_key("kid-a") is original
+    assert endpoint.calls == 2
+
+
+def test_malformed_document_does_not_wipe_cache(keys):
+    endpoint = LocalJwks(keys["kid-a"][1])
+    clock = FakeClock()
+    cache = _cache(endpoint, clock, ttl_seconds=100, refresh_ahead_seconds=0)
+    cache.get_signing_key("kid-a")
+
+    endpoint.document = ["not", "a", "jwks"]
+    clock.now += 101
+
+    assert cache.get_signing_key("kid-a").key_id == "kid-a"
+    assert cache.stats()["refresh_failures"] == 1
+
+
+def test_hit_near_expiry_refreshes_in_background(keys):
+    endpoint = LocalJwks(keys["kid-a"][1])
+    clock = FakeClock()
+    cache = _cache(endpoint, clock, ttl_seconds=100, refresh_ahead_seconds=10)
+    cache.get_signing_key("kid-a")
+
+    clock.now += 95
+    cache.get_signing_key("kid-a")
+    cache._background_refresh.join(timeout=5)
+
+    assert endpoint.calls == 2
+    stats = cache.stats()
+    assert stats["background_refreshes"] == 1
+    assert stats["age_seconds"] == 0
+
+
+def test_concurrent_misses_share_one_fetch(keys):
+    release = threading.Event()
+    calls = []
+
+    def slow_endpoint(url):
+        calls.append(url)
+        release.wait(timeout=5)
+        return {"keys": [keys["kid-a"][1]]}
+
+    cache = JwksKeyCache(JWKS_URL, fetcher=slow_endpoint)
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(cache.get_signing_key("kid-a")))
+        for _ in range(10)
+    ]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.05)
+    release.set()
+    for thread in threads:
+        thread.join(timeout=5)
+
+    assert len(calls) == 1
+    assert len(results) == 10
+
+
+def test_clear_resets_keys_and_counters(keys):
+    endpoint = LocalJwks(keys["kid-a"][1])
+    cache = _cache(endpoint, FakeClock())
+    cache.get_signing_key("kid-a")
+
+    cache.clear()
+
+    stats = cache.stats()
+    assert stats["keys"] == 0
+    assert stats["hits"] == stats["misses"] == stats["refreshes"] == 0
+    cache.get_signing_key("kid-a")
+    assert endpoint.calls == 2
+
+
+def test_get_jwks_key_cache_is_process_wide(monkeypatch):
+    monkeypatch.setattr(common.jwks_cache, "_jwks_key_caches", {})
+
+    assert get_jwks_key_cache(JWKS_URL) is get_jwks_key_cache(JWKS_URL)
+    assert get_jwks_key_cache(JWKS_URL) is not get_jwks_key_cache(JWKS_URL + "/other")
+
+
+def test_fetch_jwks_wraps_request_errors(monkeypatch):
+    import requests
+
+    def _raise(*args, **kwargs):
+        raise requests.ConnectionError("no route")
+
+    monkeypatch.setattr(common.jwks_cache.requests, "get", _raise)
+    with pytest.raises(PyJWKClientConnectionError):
+        common.jwks_cache.fetch_jwks(JWKS_URL)
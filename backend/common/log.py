@@ -1,6 +1,16 @@
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Callable, Dict, Optional
 import threading
+import copy
+import json
 import logging
+import logging.handlers
 import os
+import queue
+import random
+import time
+import uuid
 from common.config import tfconfig, mock_enabled
 from opencensus.ext.azure.log_exporter import AzureLogHandler
 from opencensus.ext.azure.trace_exporter import AzureExporter
@@ -9,6 +19,9 @@ from opencensus.ext.azure.trace_exporter import AzureExporter
 log_level_name = os.environ.get('LOG_LEVEL', 'INFO')
 log_level = getattr(logging, log_level_name.upper(), logging.INFO)
 
+# "text" (default) or "json" for structured logs, see ``use_structured_logging``
+LOG_FORMAT = os.environ.get('LOG_FORMAT', 'text').strip().lower()
+
 class MockAzureLogHandler(logging.StreamHandler):
     """Mock handler that outputs to console instead of Azure"""
     def __init__(self, connection_string=None):
@@ -58,11 +71,466 @@ def create_fixed_logger():
     console_handler.lock = threading.RLock()
     console_handler.setLevel(log_level)  # Set the handler's level too
     logger.addHandler(console_handler)
+
+    if LOG_FORMAT == 'json':
+        use_structured_logging(logger)
     
     return logger
 
+# Queued log export
+#
+# The handlers above write inline: a StreamHandler write (and the Azure
+# handler's own bookkeeping) happens on whichever coroutine logs, and
+# every route logs at INFO. While the app is serving, ``QueuedLogExport``
+# moves the logger's handlers behind a bounded queue: the logger only
+# formats and enqueues a record, and a listener thread drains the queue in
+# batches and hands the records to the real handlers. When the queue is
+# full, records are dropped and counted rather than blocking the caller;
+# the listener reports the count through the handlers.
+#
+# The handlers are flushed when the export stops, not per batch: a
+# StreamHandler flushes on every write anyway, and flushing the Azure
+# handler would force an export instead of leaving it to its own batching.
+#
+# ``main.py``'s lifespan starts and stops the export. Outside it (tests,
+# scripts) the handlers stay attached directly, so nothing is lost for
+# want of a listener.
+
+# Records buffered before new ones are dropped; see ``log_queue_size_from_env``.
+DEFAULT_LOG_QUEUE_SIZE = 10000
+
+# Most records the listener takes off the queue at once.
+LOG_BATCH_SIZE = 256
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """Queue handler that drops, and counts, records the full queue cannot take."""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        """Copy ``record`` with its message rendered, keeping the exception.
+
+        ``QueueHandler.prepare`` pastes the traceback into the message and
+        clears ``exc_info``, so the Azure handler would log no exception and
+        the JSON ``exc`` field would stay empty. Only the arguments are
+        resolved here, while they still hold the values they were logged with.
+        """
+        record = copy.copy(record)
+        record.message = record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class BatchingQueueListener(logging.handlers.QueueListener):
+    """Queue listener that takes records off the queue in batches.
+
+    Args:
+        log_queue: The queue the ``DroppingQueueHandler`` fills
+        *handlers: The handlers records are passed to
+        queue_handler: Its drop count is reported as a warning record
+        batch_size: Most records taken off the queue at once
+    """
+
+    def __init__(self, log_queue: queue.Queue, *handlers: logging.Handler,
+                 queue_handler: DroppingQueueHandler = None, batch_size: int = LOG_BATCH_SIZE):
+        super().__init__(log_queue, *handlers, respect_handler_level=True)
+        self.queue_handler = queue_handler
+        self.batch_size = max(1, batch_size)
+        self.reported_drops = 0
+
+    def enqueue_sentinel(self) -> None:
+        # Wait for room: the listener is still draining the queue.
+        self.queue.put(self._sentinel)
+
+    def _monitor(self) -> None:
+        while True:
+            batch = [self.queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            stopping = False
+            for record in batch:
+                if record is self._sentinel:
+                    stopping = True
+                else:
+                    self.handle(record)
+            self.report_drops()
+            if stopping:
+                self.flush_handlers()
+            for _ in batch:
+                self.queue.task_done()
+            if stopping:
+                return
+
+    def flush_handlers(self) -> None:
+        for handler in self.handlers:
+            try:
+                handler.flush()
+            except Exception:
+                # A broken handler must not stop the listener
+                pass
+
+    def report_drops(self) -> None:
+        if self.queue_handler is None or self.queue_handler.dropped == self.reported_drops:
+            return
+        dropped = self.queue_handler.dropped - self.reported_drops
+        self.reported_drops = self.queue_handler.dropped
+        self.handle(logging.makeLogRecord({
+            "name": __name__,
+            "levelno": logging.WARNING,
+            "levelname": "WARNING",
+            "msg": f"Dropped {dropped} log records: log queue full ({self.queue.maxsize} records)",
+        }))
+
+
+class QueuedLogExport:
+    """Moves a logger's handlers behind a bounded queue and a listener thread.
+
+    Args:
+        target: The logger whose handlers are moved
+        queue_size: Records buffered before new ones are dropped
+        batch_size: Most records the listener takes off the queue at once
+    """
+
+    def __init__(self, target: logging.Logger, queue_size: int = DEFAULT_LOG_QUEUE_SIZE,
+                 batch_size: int = LOG_BATCH_SIZE):
+        self.logger = target
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.queue_handler = None
+        self._listener = None
+        self._handlers = []
+
+    @property
+    def running(self) -> bool:
+        return self._listener is not None
+
+    @property
+    def dropped(self) -> int:
+        """Records dropped since the export was last started."""
+        return self.queue_handler.dropped if self.queue_handler is not None else 0
+
+    def start(self) -> None:
+        """Route the logger's records through the queue."""
+        if self._listener is not None:
+            return
+        log_queue = queue.Queue(maxsize=max(1, self.queue_size))
+        self.queue_handler = DroppingQueueHandler(log_queue)
+        self._handlers = list(self.logger.handlers)
+        self._listener = BatchingQueueListener(
+            log_queue, *self._handlers, queue_handler=self.queue_handler, batch_size=self.batch_size
+        )
+        self._listener.start()
+        for handler in self._handlers:
+            self.logger.removeHandler(handler)
+        self.logger.addHandler(self.queue_handler)
+
+    def stop(self) -> None:
+        """Write out the queued records and attach the handlers directly again."""
+        if self._listener is None:
+            return
+        self.logger.removeHandler(self.queue_handler)
+        self._listener.stop()
+        self._listener.report_drops()
+        for handler in self._handlers:
+            self.logger.addHandler(handler)
+        self._listener = None
+        self._handlers = []
+
+
+def log_queue_size_from_env(target: logging.Logger) -> int:
+    """Read LOG_QUEUE_SIZE, warning through ``target`` and using the default if it is invalid."""
+    raw = os.environ.get('LOG_QUEUE_SIZE', '').strip()
+    if not raw:
+        return DEFAULT_LOG_QUEUE_SIZE
+    try:
+        size = int(raw)
+    except ValueError:
+        size = 0
+    if size < 1:
+        target.warning(f"Ignoring invalid LOG_QUEUE_SIZE value '{raw}'; using {DEFAULT_LOG_QUEUE_SIZE}")
+        return DEFAULT_LOG_QUEUE_SIZE
+    return size
+
+
+# Log events
+#
+# ``logger.info(f"...")`` builds its message before the logger looks at the
+# level, so with LOG_LEVEL=WARNING every request still pays for the INFO
+# lines on its path: formatting role lists and claims, or looking up a
+# user name for a line nobody reads. ``log_event`` checks the level first
+# and only then resolves the fields and formats the message:
+#
+#   log_event(logger, "info", "fgl.experiment.get",
+#             "Future Gadget Lab API - Getting experiment with ID: {experiment_id}",
+#             experiment_id=experiment_id)
+#
+# The message is a ``str.format`` template over the fields. A field given
+# as a callable is called only when the event is logged. The event name
+# and resolved fields travel with the record as ``event`` and
+# ``event_fields``. The record goes through the logger's own level method
+# (``logger.info`` for "info").
+#
+# Noisy events can be sampled: LOG_EVENT_SAMPLE_RATES maps event names to
+# the fraction of events logged, e.g.
+#
+#   LOG_EVENT_SAMPLE_RATES="auth.role_check.succeeded=0.01,access.role_check=0.01"
+#
+# An event takes the rate of its longest dotted prefix in the map
+# ("access.role_check" covers "access.role_check.succeeded"); events not in
+# it are always logged. A sampled event carries its rate as
+# ``event_sample_rate``, so counts can be scaled back up.
+
+_EVENT_LEVELS = {
+    "debug": logging.DEBUG,
+    "info": logging.INFO,
+    "warning": logging.WARNING,
+    "error": logging.ERROR,
+    "critical": logging.CRITICAL,
+}
+
+
+def log_event(target: logging.Logger, level: str, event: str, message: str, **fields) -> None:
+    """Log ``message`` at ``level`` if ``target`` is enabled for it.
+
+    Args:
+        target: The logger
+        level: "debug", "info", "warning", "error" or "critical"
+        event: Name of the event, e.g. "auth.role_check.succeeded"
+        message: ``str.format`` template over ``fields``
+        **fields: Values of the event; callables are resolved lazily
+    """
+    if not target.isEnabledFor(_EVENT_LEVELS[level]):
+        return
+    sample_rate = event_sampler.sample(event)
+    if sample_rate is None:
+        return
+    values = {name: value() if callable(value) else value for name, value in fields.items()}
+    extra = {"event": event, "event_fields": values}
+    if sample_rate < 1.0:
+        extra["event_sample_rate"] = sample_rate
+    getattr(target, level)(message.format(**values) if values else message, extra=extra)
+
+
+class EventSampler:
+    """Decides per event name whether a ``log_event`` is logged.
+
+    Args:
+        rates: Fraction of events logged, by event name or dotted prefix
+        rng: Returns a float in [0, 1) (default ``random.random``)
+    """
+
+    def __init__(self, rates: Optional[Dict[str, float]] = None, rng: Callable[[], float] = random.random):
+        self.rates = {event: min(1.0, max(0.0, rate)) for event, rate in (rates or {}).items()}
+        self._rng = rng
+        self._resolved: Dict[str, float] = {}
+        self.sampled_out: Dict[str, int] = {}
+
+    def rate(self, event: str) -> float:
+        rate = self._resolved.get(event)
+        if rate is None:
+            rate, prefix = 1.0, event
+            while prefix:
+                if prefix in self.rates:
+                    rate = self.rates[prefix]
+                    break
+                prefix = prefix.rpartition(".")[0]
+            self._resolved[event] = rate
+        return rate
+
+    def sample(self, event: str) -> Optional[float]:
+        """The event's sample rate if it is logged, None if it is sampled out."""
+        rate = self.rate(event)
+        if rate < 1.0 and self._rng() >= rate:
+            self.sampled_out[event] = self.sampled_out.get(event, 0) + 1
+            return None
+        return rate
+
+
+def event_sampler_from_env() -> EventSampler:
+    """Create the sampler configured by LOG_EVENT_SAMPLE_RATES."""
+    rates = {}
+    for entry in os.environ.get('LOG_EVENT_SAMPLE_RATES', '').split(','):
+        if not entry.strip():
+            continue
+        event, _, raw = entry.partition('=')
+        try:
+            rates[event.strip()] = float(raw)
+        except ValueError:
+            print(f"Ignoring invalid LOG_EVENT_SAMPLE_RATES entry '{entry.strip()}'")
+    return EventSampler(rates)
+
+
+event_sampler = event_sampler_from_env()
+
+
+# Structured logs
+#
+# With LOG_FORMAT=json every record is written as one compact JSON object:
+#
+#   {"ts":"2025-01-01T12:00:00.000Z","level":"INFO","logger":"common.log",
+#    "event":"fgl.experiment.get","msg":"...","request_id":"3f2a...",
+#    "route":"/future-gadget-lab/lab-experiments/{experiment_id}",
+#    "user_sub":"...","duration_ms":1.52,"fields":{"experiment_id":"EXP-001"}}
+#
+# The request fields come from a per-request log context (a ContextVar).
+# ``LogContextMiddleware`` opens it for every HTTP request, with the
+# request's X-Request-ID header or a new id, and logs an
+# "http.request.completed" event with the status when the request ends;
+# ``bind_log_context`` adds to it, as ``required_roles`` does with the
+# user's ``sub``. The route is the matched route's path template.
+#
+# ``LogContextFilter`` copies the context onto each record as it is
+# created, on the request's own task, so it survives the hop to the
+# ``QueuedLogExport`` listener thread. The Application Insights handler
+# keeps its plain message and gets the same values as custom dimensions.
+
+_log_context: ContextVar[Optional[dict]] = ContextVar('log_context', default=None)
+
+# Longest X-Request-ID taken over from a client
+_MAX_REQUEST_ID_LENGTH = 128
+
+
+def bind_log_context(**fields) -> None:
+    """Add ``fields`` to the current request's log context, if there is one."""
+    context = _log_context.get()
+    if context is not None:
+        context.update(fields)
+
+
+def current_log_context() -> dict:
+    """The current request's log context, with the time since it opened."""
+    context = _log_context.get()
+    if context is None:
+        return {}
+    values = {
+        name: value for name, value in context.items()
+        if name not in ('scope', 'started') and value is not None
+    }
+    route = context['scope'].get('route')
+    values['route'] = getattr(route, 'path', None) or context['scope'].get('path')
+    values['duration_ms'] = round((time.perf_counter() - context['started']) * 1000, 2)
+    return values
+
+
+class LogContextFilter(logging.Filter):
+    """Copies the current log context onto each record."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        context = current_log_context()
+        record.log_context = context
+        if not hasattr(record, 'custom_dimensions'):
+            dimensions = {name: str(value) for name, value in context.items()}
+            event = getattr(record, 'event', None)
+            if event is not None:
+                dimensions['event'] = event
+                dimensions.update((name, str(value)) for name, value in record.event_fields.items())
+            record.custom_dimensions = dimensions
+        return True
+
+
+class JsonLogFormatter(logging.Formatter):
+    """Formats a record as one compact JSON object."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds')
+                  .replace('+00:00', 'Z'),
+            'level': record.levelname,
+            'logger': record.name,
+        }
+        event = getattr(record, 'event', None)
+        if event is not None:
+            entry['event'] = event
+        entry['msg'] = record.getMessage()
+        entry.update(getattr(record, 'log_context', None) or {})
+        fields = getattr(record, 'event_fields', None)
+        if fields:
+            entry['fields'] = fields
+        sample_rate = getattr(record, 'event_sample_rate', None)
+        if sample_rate is not None:
+            entry['sample_rate'] = sample_rate
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, separators=(',', ':'), default=str)
+
+
+def use_structured_logging(target: logging.Logger) -> None:
+    """Attach the log context to ``target``'s records and write them as JSON.
+
+    Every handler except the Application Insights one gets a
+    ``JsonLogFormatter``.
+    """
+    if not any(isinstance(f, LogContextFilter) for f in target.filters):
+        target.addFilter(LogContextFilter())
+    for handler in target.handlers:
+        if handler.__class__.__name__ != 'AzureLogHandler':
+            handler.setFormatter(JsonLogFormatter())
+
+
+def _request_id(scope) -> str:
+    for name, value in scope.get('headers') or ():
+        if name == b'x-request-id':
+            request_id = value.decode('latin-1').strip()
+            if 0 < len(request_id) <= _MAX_REQUEST_ID_LENGTH and request_id.isprintable():
+                return request_id
+            break
+    return uuid.uuid4().hex
+
+
+class LogContextMiddleware:
+    """Opens a log context for each HTTP request.
+
+    Args:
+        app: The ASGI app
+        log_requests: Log an "http.request.completed" event per request
+            (default: with LOG_FORMAT=json)
+    """
+
+    def __init__(self, app, log_requests: Optional[bool] = None):
+        self.app = app
+        self.log_requests = LOG_FORMAT == 'json' if log_requests is None else log_requests
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        context = {'request_id': _request_id(scope), 'scope': scope, 'started': time.perf_counter()}
+        token = _log_context.set(context)
+        status = 500
+
+        async def send_with_status(message) -> None:
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            if self.log_requests:
+                log_event(
+                    logger, 'info', 'http.request.completed', '{method} {path} {status}',
+                    method=scope['method'], path=scope['path'], status=status,
+                )
+            _log_context.reset(token)
+
+
 # Create logger
 logger = create_fixed_logger()
+log_export = QueuedLogExport(logger, queue_size=log_queue_size_from_env(logger))
 
 # Application Insights exporter
 log_azure_exporter = MockAzureExporter() if mock_enabled else AzureExporter(
@@ -3,11 +3,15 @@ from unittest.mock import patch, MagicMock
 import logging
 import threading
 import sys
+import io
+import json
+import time
 import uuid
 
 class MockLogger:
     def __init__(self):
         self.handlers = []
+        self.filters = []
         self.level = None
         for lvl in ["debug", "info", "warning", "error", "critical", "exception"]:
             setattr(self, lvl, lambda *args, **kwargs: None)
@@ -22,6 +26,9 @@ class MockLogger:
         if handler in self.handlers:
             self.handlers.remove(handler)
 
+    def addFilter(self, log_filter):
+        self.filters.append(log_filter)
+
     def isEnabledFor(self, level):
         return True
 
@@ -152,9 +159,10 @@ class TestLogModule:
     
     def test_mock_azure_handler_initialization(self):
         """Test that MockAzureLogHandler properly initializes."""
+        # Imported first, so the module's own logger is not built with the patches
+        from common.log import MockAzureLogHandler
         with patch('logging.StreamHandler.__init__', return_value=None), \
              patch('logging.StreamHandler.setFormatter') as mock_set_formatter:
-            from common.log import MockAzureLogHandler
             handler = MockAzureLogHandler("test-connection")
             assert mock_set_formatter.called
     
@@ -163,4 +171,495 @@ class TestLogModule:
         from common.log import MockAzureExporter
         exporter = MockAzureExporter()
         result = exporter.export("test", span="test-span")
-        assert result is None
\ No newline at end of file
+        assert result is None
+
+class RecordingHandler(logging.Handler):
+    """Handler that records the messages it handles and the flushes."""
+
+    def __init__(self, level=logging.NOTSET, block=None):
+        super().__init__(level)
+        self.messages = []
+        self.threads = set()
+        self.flushes = 0
+        self.block = block
+
+    def emit(self, record):
+        if self.block is not None:
+            self.block.wait()
+        self.messages.append(record.getMessage())
+        self.threads.add(threading.get_ident())
+
+    def flush(self):
+        self.flushes += 1
+
+
+@pytest.fixture
+def queued_logger():
+    target = logging.getLogger(f"test-queued-log-{uuid.uuid4()}")
+    target.setLevel(logging.DEBUG)
+    target.propagate = False
+    yield target
+    target.handlers.clear()
+
+
+class TestQueuedLogExport:
+    def test_records_are_handled_off_the_logging_thread(self, queued_logger):
+        from common.log import DroppingQueueHandler, QueuedLogExport
+        handler = RecordingHandler()
+        queued_logger.addHandler(handler)
+        export = QueuedLogExport(queued_logger)
+
+        export.start()
+        assert export.running
+        assert [type(h) for h in queued_logger.handlers] == [DroppingQueueHandler]
+        for i in range(100):
+            queued_logger.info(f"record {i}")
+        export.stop()
+
+        assert handler.messages == [f"record {i}" for i in range(100)]
+        assert threading.get_ident() not in handler.threads
+        assert queued_logger.handlers == [handler]
+        assert not export.running
+
+    def test_handlers_are_flushed_when_the_export_stops(self, queued_logger):
+        from common.log import QueuedLogExport
+        release = threading.Event()
+        handler = RecordingHandler(block=release)
+        queued_logger.addHandler(handler)
+        export = QueuedLogExport(queued_logger, batch_size=10)
+
+        export.start()
+        queued_logger.info("first")
+        # The rest queue up behind the first record's slow write
+        for i in range(30):
+            queued_logger.info(f"record {i}")
+        release.set()
+        export.queue_handler.queue.join()
+        assert len(handler.messages) == 31
+        assert handler.flushes == 0
+
+        export.stop()
+        assert handler.flushes == 1
+
+    @pytest.mark.parametrize("value, expected, warned", [
+        (None, 10000, False),
+        ("500", 500, False),
+        ("lots", 10000, True),
+        ("0", 10000, True),
+    ])
+    def test_log_queue_size_from_env(self, monkeypatch, value, expected, warned):
+        from common.log import log_queue_size_from_env
+        if value is None:
+            monkeypatch.delenv("LOG_QUEUE_SIZE", raising=False)
+        else:
+            monkeypatch.setenv("LOG_QUEUE_SIZE", value)
+        target = MagicMock()
+
+        assert log_queue_size_from_env(target) == expected
+        assert target.warning.called is warned
+
+    def test_full_queue_drops_and_reports(self, queued_logger):
+        from common.log import QueuedLogExport
+        release = threading.Event()
+        handler = RecordingHandler(block=release)
+        queued_logger.addHandler(handler)
+        export = QueuedLogExport(queued_logger, queue_size=5)
+
+        export.start()
+        queued_logger.info("first")
+        # Let the listener pick up the first record and block on it
+        while export.queue_handler.queue.qsize():
+            threading.Event().wait(0.001)
+        for i in range(20):
+            queued_logger.info(f"record {i}")
+        assert export.dropped == 15
+        release.set()
+        export.stop()
+
+        report = "Dropped 15 log records: log queue full (5 records)"
+        assert handler.messages.count(report) == 1
+        handler.messages.remove(report)
+        assert handler.messages == ["first"] + [f"record {i}" for i in range(5)]
+
+    def test_exceptions_reach_the_handlers(self, queued_logger):
+        from common.log import JsonLogFormatter, QueuedLogExport
+
+        class KeepingHandler(RecordingHandler):
+            def __init__(self):
+                super().__init__()
+                self.records = []
+
+            def emit(self, record):
+                super().emit(record)
+                self.records.append(record)
+
+        handler = KeepingHandler()
+        queued_logger.addHandler(handler)
+        export = QueuedLogExport(queued_logger)
+
+        export.start()
+        try:
+            raise ValueError("divergence out of range")
+        except ValueError:
+            queued_logger.exception("Failed to read worldline %s", 1.048596)
+        export.stop()
+
+        [record] = handler.records
+        assert record.getMessage() == "Failed to read worldline 1.048596"
+        assert record.exc_info[0] is ValueError
+        entry = json.loads(JsonLogFormatter().format(record))
+        assert entry["msg"] == "Failed to read worldline 1.048596"
+        assert "ValueError: divergence out of range" in entry["exc"]
+        assert "Traceback" in logging.Formatter().format(record)
+
+    def test_handler_levels_are_respected(self, queued_logger):
+        from common.log import QueuedLogExport
+        handler = RecordingHandler(level=logging.WARNING)
+        queued_logger.addHandler(handler)
+        export = QueuedLogExport(queued_logger)
+
+        export.start()
+        queued_logger.info("quiet")
+        queued_logger.warning("loud")
+        export.stop()
+
+        assert handler.messages == ["loud"]
+
+    def test_start_and_stop_are_idempotent(self, queued_logger):
+        from common.log import QueuedLogExport
+        handler = RecordingHandler()
+        queued_logger.addHandler(handler)
+        export = QueuedLogExport(queued_logger)
+
+        export.stop()
+        export.start()
+        export.start()
+        queued_logger.info("once")
+        export.stop()
+        export.stop()
+
+        assert handler.messages == ["once"]
+        assert queued_logger.handlers == [handler]
+
+    def test_works_with_mock_azure_log_handler(self, queued_logger, capsys):
+        from common.log import MockAzureLogHandler, QueuedLogExport
+        queued_logger.addHandler(MockAzureLogHandler())
+        export = QueuedLogExport(queued_logger)
+
+        export.start()
+        queued_logger.info("El Psy Kongroo")
+        export.stop()
+
+        err = capsys.readouterr().err
+        assert "[MOCK AZURE LOG]" in err
+        assert "El Psy Kongroo" in err
+
+    def test_failing_flush_does_not_stop_the_listener(self, queued_logger):
+        from common.log import QueuedLogExport
+
+        class BrokenFlush(RecordingHandler):
+            def flush(self):
+                raise AttributeError("no stream")
+
+        handler = BrokenFlush()
+        queued_logger.addHandler(handler)
+        export = QueuedLogExport(queued_logger)
+
+        export.start()
+        queued_logger.info("first")
+        export.stop()
+        export.start()
+        queued_logger.info("second")
+        export.stop()
+
+        assert handler.messages == ["first", "second"]
+        assert not export.running
+
+
+class TestLogEvent:
+    def test_enabled_event_is_formatted_with_its_fields(self, queued_logger):
+        from common.log import log_event
+        handler = RecordingHandler()
+        queued_logger.addHandler(handler)
+        records = []
+        handler.emit = records.append
+
+        log_event(queued_logger, "info", "fgl.experiment.get", "Getting experiment {experiment_id}", experiment_id="EXP-001")
+
+        assert [r.getMessage() for r in records] == ["Getting experiment EXP-001"]
+        assert records[0].levelno == logging.INFO
+        assert records[0].event == "fgl.experiment.get"
+        assert records[0].event_fields == {"experiment_id": "EXP-001"}
+
+    def test_message_without_fields_is_not_formatted(self, queued_logger):
+        from common.log import log_event
+        handler = RecordingHandler()
+        queued_logger.addHandler(handler)
+
+        log_event(queued_logger, "warning", "test.braces", "Literal {braces}")
+
+        assert handler.messages == ["Literal {braces}"]
+
+    def test_disabled_event_resolves_nothing(self, queued_logger):
+        from common.log import log_event
+        queued_logger.setLevel(logging.WARNING)
+        handler = RecordingHandler()
+        queued_logger.addHandler(handler)
+
+        def expensive():
+            raise AssertionError("resolved a field of a filtered event")
+
+        log_event(queued_logger, "info", "test.filtered", "{value}", value=expensive)
+
+        assert handler.messages == []
+
+    def test_callable_fields_are_resolved_when_logged(self, queued_logger):
+        from common.log import log_event
+        handler = RecordingHandler()
+        queued_logger.addHandler(handler)
+
+        log_event(queued_logger, "error", "test.lazy", "User {user}", user=lambda: "Okabe")
+
+        assert handler.messages == ["User Okabe"]
+
+    def test_goes_through_the_level_method(self):
+        from common.log import log_event
+        target = MagicMock()
+
+        log_event(target, "info", "auth.role_check.succeeded", "Role check successful for {roles}", roles=["Admin"])
+
+        target.isEnabledFor.assert_called_once_with(logging.INFO)
+        target.info.assert_called_once_with(
+            "Role check successful for ['Admin']",
+            extra={"event": "auth.role_check.succeeded", "event_fields": {"roles": ["Admin"]}},
+        )
+
+    def test_log_event_benchmark_at_warning_level(self, queued_logger):
+        """Benchmark: INFO lines of a mock-auth request at LOG_LEVEL=WARNING, f-strings vs log_event."""
+        from common.log import log_event
+        queued_logger.setLevel(logging.WARNING)
+        queued_logger.addHandler(RecordingHandler())
+        claims = {
+            "sub": "mock-subject-id", "name": "Okabe Rintaro", "roles": ["User", "Admin"],
+            "aud": "client-id", "iss": "https://login.microsoftonline.com/tenant/v2.0",
+            "scp": "user_impersonation", "iat": 1700000000, "exp": 1700003600,
+        }
+        required_roles = ["Admin"]
+        experiment_id = "EXP-001"
+
+        def eager():
+            queued_logger.info(f"Mock token decoded with claims: {claims}")
+            queued_logger.info(f"Role check successful for {required_roles}")
+            queued_logger.info(f"Role check - Role check successful for {required_roles}")
+            queued_logger.info(f"Future Gadget Lab API - Getting experiment with ID: {experiment_id}")
+
+        def lazy():
+            log_event(queued_logger, "info", "auth.mock_token.decoded", "Mock token decoded with claims: {claims}", claims=claims)
+            log_event(queued_logger, "info", "auth.role_check.succeeded", "Role check successful for {roles}", roles=required_roles)
+            log_event(
+                queued_logger, "info", "access.role_check.succeeded",
+                "Role check - Role check successful for {roles}", roles=required_roles,
+            )
+            log_event(
+                queued_logger, "info", "fgl.experiment.get",
+                "Future Gadget Lab API - Getting experiment with ID: {experiment_id}", experiment_id=experiment_id,
+            )
+
+        requests = 20_000
+        timings = {}
+        for name, request in (("f-string", eager), ("log_event", lazy)):
+            request()  # warm up
+            started = time.perf_counter()
+            for _ in range(requests):
+                request()
+            timings[name] = (time.perf_counter() - started) / requests
+
+        print(", ".join(f"{name}: {seconds * 1e6:.2f}us/request" for name, seconds in timings.items()))
+        assert timings["log_event"] < timings["f-string"]
+
+
+class TestEventSampling:
+    def test_events_take_the_rate_of_their_longest_prefix(self):
+        from common.log import EventSampler
+        sampler = EventSampler({"auth": 0.5, "auth.role_check.succeeded": 0.01, "noisy": 2.0})
+
+        assert sampler.rate("auth.role_check.succeeded") == 0.01
+        assert sampler.rate("auth.mock_token.decoded") == 0.5
+        assert sampler.rate("authz.other") == 1.0
+        assert sampler.rate("fgl.experiment.get") == 1.0
+        assert sampler.rate("noisy.event") == 1.0
+
+    def test_sampled_out_events_are_counted(self):
+        from common.log import EventSampler
+        draws = iter([0.005, 0.5, 0.02, 0.009])
+        sampler = EventSampler({"access.role_check": 0.01}, rng=lambda: next(draws))
+
+        kept = [sampler.sample("access.role_check.succeeded") for _ in range(4)]
+
+        assert kept == [0.01, None, None, 0.01]
+        assert sampler.sampled_out == {"access.role_check.succeeded": 2}
+        # Unsampled events never draw
+        assert sampler.sample("fgl.experiment.get") == 1.0
+
+    def test_sampler_from_env(self, monkeypatch, capsys):
+        from common.log import event_sampler_from_env
+        monkeypatch.setenv("LOG_EVENT_SAMPLE_RATES", " auth.role_check.succeeded=0.01, access.role_check=0.1,broken=often,")
+
+        sampler = event_sampler_from_env()
+
+        assert sampler.rates == {"auth.role_check.succeeded": 0.01, "access.role_check": 0.1}
+        assert "broken=often" in capsys.readouterr().out
+
+    def test_log_event_skips_sampled_out_events(self, queued_logger, monkeypatch):
+        import common.log as log_module
+        draws = iter([0.5, 0.001])
+        monkeypatch.setattr(log_module, "event_sampler", log_module.EventSampler(
+            {"auth.role_check.succeeded": 0.01}, rng=lambda: next(draws),
+        ))
+        handler = RecordingHandler()
+        queued_logger.addHandler(handler)
+        records = []
+        handler.emit = records.append
+
+        for _ in range(2):
+            log_module.log_event(queued_logger, "info", "auth.role_check.succeeded", "Role check successful")
+
+        assert len(records) == 1
+        assert records[0].event_sample_rate == 0.01
+
+
+@pytest.fixture
+def structured_logger(queued_logger):
+    from common.log import use_structured_logging
+    stream = io.StringIO()
+    handler = logging.StreamHandler(stream)
+    queued_logger.addHandler(handler)
+    use_structured_logging(queued_logger)
+
+    def lines():
+        return [json.loads(line) for line in stream.getvalue().splitlines()]
+
+    return queued_logger, lines
+
+
+class TestStructuredLogging:
+    def test_event_outside_a_request_is_one_compact_json_line(self, structured_logger):
+        from common.log import log_event
+        target, lines = structured_logger
+
+        log_event(target, "info", "fgl.experiment.get", "Getting experiment {experiment_id}", experiment_id="EXP-001")
+        target.warning("plain")
+
+        event, plain = lines()
+        assert event["level"] == "INFO"
+        assert event["event"] == "fgl.experiment.get"
+        assert event["msg"] == "Getting experiment EXP-001"
+        assert event["fields"] == {"experiment_id": "EXP-001"}
+        assert event["ts"].endswith("Z")
+        assert "request_id" not in event
+        assert plain["msg"] == "plain" and "event" not in plain
+
+    def test_exceptions_are_included(self, structured_logger):
+        target, lines = structured_logger
+
+        try:
+            raise RuntimeError("divergence meter offline")
+        except RuntimeError:
+            target.exception("Reading failed")
+
+        assert "RuntimeError: divergence meter offline" in lines()[0]["exc"]
+
+    def _app(self, target):
+        from fastapi import FastAPI
+        from common.log import LogContextMiddleware, bind_log_context, log_event
+
+        app = FastAPI()
+
+        @app.get("/lab-experiments/{experiment_id}")
+        async def get_experiment(experiment_id: str):
+            bind_log_context(user_sub="okabe-sub")
+            log_event(target, "info", "fgl.experiment.get", "Getting {experiment_id}", experiment_id=experiment_id)
+            return {"id": experiment_id}
+
+        app.add_middleware(LogContextMiddleware, log_requests=True)
+        return app
+
+    def test_request_context_is_added_to_each_line(self, structured_logger, monkeypatch):
+        from fastapi.testclient import TestClient
+        import common.log as log_module
+        target, lines = structured_logger
+        monkeypatch.setattr(log_module, "logger", target)
+
+        with TestClient(self._app(target)) as client:
+            assert client.get("/lab-experiments/EXP-001", headers={"X-Request-ID": "req-42"}).status_code == 200
+            assert client.get("/missing").status_code == 404
+
+        event, completed, missing = lines()
+        for line in (event, completed):
+            assert line["request_id"] == "req-42"
+            assert line["route"] == "/lab-experiments/{experiment_id}"
+            assert line["user_sub"] == "okabe-sub"
+            assert line["duration_ms"] >= 0
+        assert completed["event"] == "http.request.completed"
+        assert completed["fields"] == {"method": "GET", "path": "/lab-experiments/EXP-001", "status": 200}
+        assert missing["fields"]["status"] == 404
+        assert missing["route"] == "/missing"
+        assert len(missing["request_id"]) == 32 and "user_sub" not in missing
+
+    @pytest.mark.parametrize("header", ["", "x" * 129, "bad\nid"])
+    def test_unusable_request_ids_are_replaced(self, header):
+        from common.log import _request_id
+
+        request_id = _request_id({"headers": [(b"x-request-id", header.encode())]})
+
+        assert len(request_id) == 32 and request_id != header
+
+    def test_context_survives_the_queued_export(self, structured_logger, monkeypatch):
+        """Records are handled on the listener thread, with the context of the request that logged them"""
+        from fastapi.testclient import TestClient
+        import common.log as log_module
+        target, lines = structured_logger
+        monkeypatch.setattr(log_module, "logger", target)
+        export = log_module.QueuedLogExport(target)
+
+        export.start()
+        with TestClient(self._app(target)) as client:
+            client.get("/lab-experiments/EXP-002")
+        export.stop()
+
+        assert [line["route"] for line in lines()] == ["/lab-experiments/{experiment_id}"] * 2
+        assert lines()[0]["user_sub"] == "okabe-sub"
+
+    def test_azure_handler_gets_custom_dimensions(self, queued_logger):
+        from common.log import log_event, use_structured_logging
+
+        class AzureLogHandler(RecordingHandler):
+            pass
+
+        handler = AzureLogHandler()
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        queued_logger.addHandler(handler)
+        records = []
+        handler.emit = records.append
+        use_structured_logging(queued_logger)
+
+        log_event(queued_logger, "info", "fgl.experiment.get", "Getting {experiment_id}", experiment_id="EXP-001")
+
+        assert handler.format(records[0]) == "Getting EXP-001"
+        assert records[0].custom_dimensions == {"event": "fgl.experiment.get", "experiment_id": "EXP-001"}
+
+    def test_middleware_passes_other_scopes_through(self):
+        import asyncio
+        from common.log import LogContextMiddleware, current_log_context
+        seen = []
+
+        async def app(scope, receive, send):
+            seen.append(current_log_context())
+
+        loop = asyncio.new_event_loop()
+        try:
+            loop.run_until_complete(LogContextMiddleware(app)({"type": "websocket"}, None, None))
+        finally:
+            loop.close()
+
+        assert seen == [{}]
@@ -2,7 +2,7 @@ import functools
 import inspect  # Add this import
 from fastapi import HTTPException
 from typing import List, Callable
-from common.log import logger  # Make sure logger is imported
+from common.log import bind_log_context, log_event, logger
 
 def required_roles(required_roles: List[str], check_all: bool = False):
     def decorator(func: Callable):
@@ -22,6 +22,7 @@ def required_roles(required_roles: List[str], check_all: bool = False):
                 logger.error(http_ex)
                 raise http_ex
 
+            bind_log_context(user_sub=getattr(token, "sub", None))
             normalized_roles = [role.lower() for role in roles]
             normalized_required_roles = [role.lower() for role in required_roles]
             
@@ -40,7 +41,10 @@ def required_roles(required_roles: List[str], check_all: bool = False):
                 logger.error(f"403 - Access denied: {http_ex.detail} (Status: {http_ex.status_code})")  # )
                 raise http_ex
                 
-            logger.info(f"Role check - Role check successful for {required_roles}")
+            log_event(
+                logger, "info", "access.role_check.succeeded",
+                "Role check - Role check successful for {roles}", roles=required_roles,
+            )
             return await func(*args, **kwargs)
         
         # Correctly set the signature using inspect module
@@ -0,0 +1,166 @@
+from collections import deque
+from enum import Enum
+from typing import Any, Callable, Deque, Dict, Iterable, List, Optional
+import asyncio
+import json
+
+from fastapi import WebSocket
+
+# ---------------------------------------------------------------------------
+# Per-connection outbound queues
+#
+# Broadcasting used to await ``send_json`` on every socket, so a slow
+# consumer pushed back on whoever was broadcasting: a REST handler, the
+# worldline ping loop, another client's chat message. Each connection now
+# owns a ``SendQueue``: producers ``put`` a message in O(1) without awaiting
+# anything, and a writer task per connection drains the queue onto the
+# socket. The queue is bounded; what happens when it is full is the
+# connection manager's ``OverflowPolicy``.
+#
+# Queues hold frames that are already JSON text (see ``encode_frame``), so a
+# broadcast encodes its payload once rather than once per recipient.
+# ---------------------------------------------------------------------------
+
+
+def encode_frame(message: Any) -> str:
+    """Encode a message exactly as Starlette's ``WebSocket.send_json`` does."""
+    return json.dumps(message, separators=(",", ":"), ensure_ascii=False)
+
+
+class OverflowPolicy(str, Enum):
+    # Discard the oldest queued message to make room for the new one.
+    DROP_OLDEST = "drop_oldest"
+    # Like DROP_OLDEST, but a message whose type is coalescable (e.g. a
+    # ``worldline_update`` snapshot) replaces the queued message of the same
+    # type instead of queueing behind it: only the latest snapshot matters.
+    COALESCE_LATEST = "coalesce_latest"
+    # Drop the connection with close code 1013 (Try Again Later); the client
+    # reconnects and re-reads state instead of silently missing events.
+    DISCONNECT = "disconnect"
+
+
+class SendQueue:
+    """Bounded outbound frame queue for one WebSocket, with its own writer task.
+
+    Args:
+        websocket: The connection the writer sends to
+        max_size: Maximum number of queued messages
+        policy: What ``put`` does when the queue is full
+        send_timeout: Maximum time, in seconds, for a single send
+        on_failure: Called with ``(websocket, exception)`` when a send fails
+            or times out; the writer stops afterwards
+        coalesce_types: Message ``type`` values coalesced under
+            ``OverflowPolicy.COALESCE_LATEST``
+    """
+
+    def __init__(
+        self,
+        websocket: WebSocket,
+        max_size: int,
+        policy: OverflowPolicy,
+        send_timeout: float,
+        on_failure: Callable[[WebSocket, BaseException], None],
+        coalesce_types: Iterable[str] = (),
+    ):
+        self.websocket = websocket
+        self.max_size = max(1, max_size)
+        self.policy = OverflowPolicy(policy)
+        self.send_timeout = send_timeout
+        self.coalesce_types = frozenset(coalesce_types)
+        self._on_failure = on_failure
+        # Each entry is a mutable ``[type, frame]`` cell, so coalescing can
+        # swap the frame of a queued cell in place.
+        self._cells: Deque[List[Any]] = deque()
+        self._coalescable_cells: Dict[str, List[Any]] = {}
+        self._wakeup = asyncio.Event()
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._writer: Optional[asyncio.Task] = None
+        self.closed = False
+        self.dropped = 0
+        self.coalesced = 0
+
+    def __len__(self) -> int:
+        return len(self._cells)
+
+    def put(self, frame: str, message_type: Optional[str] = None) -> bool:
+        """Queue an encoded text frame for sending without waiting for the peer.
+
+        Args:
+            frame: JSON text, typically from ``encode_frame``
+            message_type: The message's ``type``, used for coalescing
+
+        Returns:
+            False if the queue is full under ``OverflowPolicy.DISCONNECT``
+            (or already closed) and the caller should drop the connection;
+            True otherwise, including when an older message was dropped
+        """
+        if self.closed:
+            return False
+
+        coalescable = self.policy is OverflowPolicy.COALESCE_LATEST and message_type in self.coalesce_types
+        if coalescable:
+            cell = self._coalescable_cells.get(message_type)
+            if cell is not None:
+                cell[1] = frame
+                self.coalesced += 1
+                return True
+
+        if len(self._cells) >= self.max_size:
+            if self.policy is OverflowPolicy.DISCONNECT:
+                return False
+            self._forget(self._cells.popleft())
+            self.dropped += 1
+
+        cell = [message_type, frame]
+        self._cells.append(cell)
+        if coalescable:
+            self._coalescable_cells[message_type] = cell
+        self._idle.clear()
+        self._wakeup.set()
+        if self._writer is None:
+            self._writer = asyncio.get_running_loop().create_task(self._write_loop())
+        return True
+
+    async def join(self) -> None:
+        """Wait until every queued message has been sent (or the queue closed)."""
+        await self._idle.wait()
+
+    def close(self) -> None:
+        """Discard queued messages and stop the writer."""
+        self.closed = True
+        self._cells.clear()
+        self._coalescable_cells.clear()
+        self._idle.set()
+        writer, self._writer = self._writer, None
+        # The writer closes its own queue after a failed send; it must not
+        # cancel itself on the way out.
+        if writer is not None and writer is not asyncio.current_task():
+            writer.cancel()
+
+    def _forget(self, cell: List[Any]) -> None:
+        if self._coalescable_cells.get(cell[0]) is cell:
+            del self._coalescable_cells[cell[0]]
+
+    async def _write_loop(self) -> None:
+        while not self.closed:
+            if not self._cells:
+                self._idle.set()
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            cell = self._cells.popleft()
+            self._forget(cell)
+            try:
+                # ``asyncio.timeout`` rather than ``wait_for``: on 3.11,
+                # ``wait_for`` can swallow a cancel that races a finished
+                # send, leaving this writer idle forever at shutdown.
+                async with asyncio.timeout(self.send_timeout):
+                    await self.websocket.send_text(cell[1])
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:
+                self.close()
+                self._on_failure(self.websocket, exc)
+                return
@@ -0,0 +1,119 @@
+import asyncio
+import json
+
+import pytest
+
+from common.send_queue import OverflowPolicy, SendQueue, encode_frame
+
+
+class RecordingWebSocket:
+    def __init__(self):
+        self.sent = []
+        self.release = asyncio.Event()
+        self.release.set()
+
+    async def send_text(self, frame):
+        await self.release.wait()
+        self.sent.append(json.loads(frame))
+
+
+def _queue(websocket, policy=OverflowPolicy.DROP_OLDEST, max_size=3, failures=None):
+    return SendQueue(
+        websocket,
+        max_size=max_size,
+        policy=policy,
+        send_timeout=1.0,
+        on_failure=lambda ws, exc: failures.append(exc) if failures is not None else None,
+        coalesce_types=["worldline_update"],
+    )
+
+
+def _put(queue, message):
+    return queue.put(encode_frame(message), message.get("type"))
+
+
+def test_encode_frame_matches_starlette_send_json():
+    message = {"name": "岡部 \"Hououin\"", "values": [1.048596, None]}
+    assert encode_frame(message) == json.dumps(message, separators=(",", ":"), ensure_ascii=False)
+
+
+@pytest.mark.asyncio
+async def test_messages_are_sent_in_order():
+    websocket = RecordingWebSocket()
+    queue = _queue(websocket)
+
+    for i in range(3):
+        assert _put(queue, {"type": "create", "seq": i}) is True
+    await queue.join()
+
+    assert [message["seq"] for message in websocket.sent] == [0, 1, 2]
+    queue.close()
+
+
+@pytest.mark.asyncio
+async def test_drop_oldest_keeps_the_newest_messages():
+    websocket = RecordingWebSocket()
+    websocket.release.clear()
+    queue = _queue(websocket)
+
+    for i in range(6):
+        assert _put(queue, {"type": "create", "seq": i}) is True
+    assert len(queue) == 3
+    websocket.release.set()
+    await queue.join()
+
+    assert [message["seq"] for message in websocket.sent] == [3, 4, 5]
+    assert queue.dropped == 3
+    queue.close()
+
+
+@pytest.mark.asyncio
+async def test_coalesce_latest_replaces_queued_snapshot_in_place():
+    websocket = RecordingWebSocket()
+    websocket.release.clear()
+    queue = _queue(websocket, policy=OverflowPolicy.COALESCE_LATEST)
+
+    _put(queue, {"type": "worldline_update", "value": 1})
+    _put(queue, {"type": "create", "seq": 0})
+    _put(queue, {"type": "worldline_update", "value": 2})
+    _put(queue, {"type": "worldline_update", "value": 3})
+    assert len(queue) == 2
+    websocket.release.set()
+    await queue.join()
+
+    # The snapshot keeps its place ahead of the CRUD event, with the latest value.
+    assert websocket.sent == [{"type": "worldline_update", "value": 3}, {"type": "create", "seq": 0}]
+    assert queue.coalesced == 2
+    queue.close()
+
+
+@pytest.mark.asyncio
+async def test_disconnect_policy_refuses_when_full():
+    websocket = RecordingWebSocket()
+    websocket.release.clear()
+    queue = _queue(websocket, policy=OverflowPolicy.DISCONNECT, max_size=2)
+
+    assert _put(queue, {"type": "create"}) is True
+    assert _put(queue, {"type": "create"}) is True
+    # Snapshots are not coalesced under this policy.
+    assert _put(queue, {"type": "worldline_update"}) is False
+    queue.close()
+    assert _put(queue, {"type": "create"}) is False
+
+
+@pytest.mark.asyncio
+async def test_failed_send_stops_writer_and_reports_once():
+    class BrokenWebSocket:
+        async def send_text(self, frame):
+            raise RuntimeError("gone")
+
+    failures = []
+    queue = _queue(BrokenWebSocket(), failures=failures)
+
+    _put(queue, {"type": "create"})
+    _put(queue, {"type": "create"})
+    await queue.join()
+
+    assert [str(exc) for exc in failures] == ["gone"]
+    assert queue.closed is True
+    assert len(queue) == 0
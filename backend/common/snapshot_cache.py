@@ -0,0 +1,94 @@
+from typing import Awaitable, Callable, Generic, Optional, TypeVar
+import asyncio
+import time
+
+# ---------------------------------------------------------------------------
+# Shared snapshot cache
+#
+# Some values are read far more often than they change: every client on the
+# worldline socket may ask for the current status as often as it likes,
+# while the status only changes when an Admin writes an experiment. A
+# ``SnapshotCache`` keeps one copy of such a value for all readers:
+#
+#   - ``get`` returns the cached snapshot, loading it when there is none.
+#     Readers that arrive while a load is running share that load, so a
+#     crowd of readers costs one load, not one each.
+#   - ``invalidate`` is called after every write. It bumps ``version`` and
+#     drops the snapshot; a load that started before the write still answers
+#     its readers but is not cached.
+#   - ``max_age`` bounds how long a snapshot is served. It covers writes the
+#     cache is not told about, such as those handled by another worker.
+#
+# Snapshots are shared between readers, who must not modify them.
+# ---------------------------------------------------------------------------
+
+T = TypeVar("T")
+
+
+class SnapshotCache(Generic[T]):
+    """Caches the result of an async load until the next write.
+
+    Args:
+        loader: Coroutine function returning a fresh value
+        max_age: Seconds a snapshot is served before it is reloaded (None:
+            until invalidated)
+        clock: Monotonic clock, in seconds
+    """
+
+    def __init__(
+        self,
+        loader: Callable[[], Awaitable[T]],
+        max_age: Optional[float] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.loader = loader
+        self.max_age = max_age
+        self._clock = clock
+        self.version = 0
+        self._value: Optional[T] = None
+        self._loaded_at = 0.0
+        self._loading: Optional[asyncio.Task] = None
+        self._loading_version = -1
+        self.hits = 0
+        self.loads = 0
+
+    def peek(self) -> Optional[T]:
+        """The current snapshot, or None if it must be (re)loaded."""
+        if self._value is None:
+            return None
+        if self.max_age is not None and self._clock() - self._loaded_at >= self.max_age:
+            self._value = None
+            return None
+        return self._value
+
+    def invalidate(self) -> None:
+        """Drop the snapshot; the next ``get`` loads a new one."""
+        self.version += 1
+        self._value = None
+
+    async def get(self) -> T:
+        """The current snapshot, loading it if necessary."""
+        value = self.peek()
+        if value is not None:
+            self.hits += 1
+            return value
+
+        loop = asyncio.get_running_loop()
+        task = self._loading
+        if (
+            task is None
+            or task.done()
+            or self._loading_version != self.version
+            or task.get_loop() is not loop
+        ):
+            task = loop.create_task(self._load(self.version))
+            self._loading, self._loading_version = task, self.version
+        # A reader that goes away must not cancel the load the others wait on.
+        return await asyncio.shield(task)
+
+    async def _load(self, version: int) -> T:
+        value = await self.loader()
+        self.loads += 1
+        if version == self.version:
+            self._value, self._loaded_at = value, self._clock()
+        return value
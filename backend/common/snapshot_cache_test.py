@@ -0,0 +1,125 @@
+import asyncio
+
+import pytest
+
+from common.snapshot_cache import SnapshotCache
+
+
+class Source:
+    """Loader returning the current ``value``, optionally after a delay."""
+
+    def __init__(self, value, delay=0.0):
+        self.value = value
+        self.delay = delay
+        self.loads = 0
+
+    async def __call__(self):
+        self.loads += 1
+        value = self.value
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        return value
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.mark.asyncio
+async def test_snapshot_is_loaded_once_until_invalidated():
+    source = Source({"current_worldline": 1.337192})
+    cache = SnapshotCache(source)
+
+    assert cache.peek() is None
+    for _ in range(5):
+        assert await cache.get() == {"current_worldline": 1.337192}
+    assert source.loads == 1
+    assert (cache.loads, cache.hits) == (1, 4)
+
+    source.value = {"current_worldline": 1.048596}
+    cache.invalidate()
+    assert cache.version == 1
+    assert cache.peek() is None
+    assert await cache.get() == {"current_worldline": 1.048596}
+    assert source.loads == 2
+
+
+@pytest.mark.asyncio
+async def test_concurrent_readers_share_one_load():
+    source = Source("status", delay=0.01)
+    cache = SnapshotCache(source)
+
+    results = await asyncio.gather(*(cache.get() for _ in range(50)))
+
+    assert results == ["status"] * 50
+    assert source.loads == 1
+
+
+@pytest.mark.asyncio
+async def test_load_started_before_a_write_is_not_cached():
+    """Readers after a write never get the state from before it"""
+    source = Source("before", delay=0.02)
+    cache = SnapshotCache(source)
+
+    early = asyncio.ensure_future(cache.get())
+    await asyncio.sleep(0.005)
+    source.value = "after"
+    cache.invalidate()
+    late = await cache.get()
+
+    assert await early == "before"
+    assert late == "after"
+    assert cache.peek() == "after"
+    assert source.loads == 2
+
+
+@pytest.mark.asyncio
+async def test_snapshot_expires_after_max_age():
+    source = Source("v1")
+    clock = FakeClock()
+    cache = SnapshotCache(source, max_age=5.0, clock=clock)
+
+    assert await cache.get() == "v1"
+    source.value = "v2"
+    clock.now = 4.9
+    assert await cache.get() == "v1"
+    clock.now = 5.0
+    assert cache.peek() is None
+    assert await cache.get() == "v2"
+    assert source.loads == 2
+
+
+@pytest.mark.asyncio
+async def test_cancelled_reader_does_not_cancel_the_shared_load():
+    source = Source("status", delay=0.02)
+    cache = SnapshotCache(source)
+
+    leaving = asyncio.ensure_future(cache.get())
+    staying = asyncio.ensure_future(cache.get())
+    await asyncio.sleep(0.005)
+    leaving.cancel()
+
+    assert await staying == "status"
+    assert leaving.cancelled()
+    assert source.loads == 1
+
+
+@pytest.mark.asyncio
+async def test_failed_load_is_not_cached():
+    calls = []
+
+    async def flaky():
+        calls.append(None)
+        if len(calls) == 1:
+            raise RuntimeError("store unavailable")
+        return "status"
+
+    cache = SnapshotCache(flaky)
+    with pytest.raises(RuntimeError):
+        await cache.get()
+    assert cache.peek() is None
+    assert await cache.get() == "status"
@@ -1,11 +1,15 @@
 from fastapi import WebSocket, WebSocketDisconnect, HTTPException
 from jwt import InvalidTokenError
 from common.auth import verify_token
-from typing import List, Optional
-from common.log import logger
+from typing import Any, Callable, Dict, Iterable, List, Optional
+from common.log import log_event, logger
+from common.backplane import Backplane
+from common.connection_registry import ConnectionRegistry
+from common.send_queue import OverflowPolicy, SendQueue, encode_frame
 import asyncio
 import datetime
 import json
+import time
 
 # Maximum time (seconds) to wait for the first message from a newly-opened
 # WebSocket before closing it. Bounds the resource usage of clients that
@@ -14,6 +18,39 @@ import json
 # clients need more headroom for their auth handshake.
 AUTH_HANDSHAKE_TIMEOUT_SECONDS = 5.0
 
+# Maximum time (seconds) a connection's writer task waits for a single send.
+# A peer that cannot take a frame within this window is treated as dead and
+# evicted. Broadcasters never wait on it: they only enqueue (see
+# ``common/send_queue.py``).
+BROADCAST_SEND_TIMEOUT_SECONDS = 2.0
+
+# Messages buffered per connection before the manager's overflow policy
+# applies.
+SEND_QUEUE_SIZE = 64
+
+# Maximum time (seconds) spent closing an evicted socket. The close runs in
+# the background, but a stalled peer may never complete the close handshake.
+EVICTION_CLOSE_TIMEOUT_SECONDS = 1.0
+
+# Heartbeat for connections that opt in with ``{"action": "heartbeat"}``
+# (see ``handle_control_frame``). One task per manager wakes every
+# HEARTBEAT_INTERVAL_SECONDS, sends a ``heartbeat`` message to each opted-in
+# connection that has been silent for an interval, and evicts those silent
+# for HEARTBEAT_TIMEOUT_SECONDS. Clients answer with ``{"action": "pong"}``;
+# any frame they send counts. ASGI gives the application no access to
+# protocol-level ping/pong frames: those are uvicorn's (``ws_ping_interval``
+# / ``ws_ping_timeout``, 20 s each by default), and a peer that stops
+# answering them surfaces here as ``WebSocketDisconnect``.
+HEARTBEAT_INTERVAL_SECONDS = 20.0
+HEARTBEAT_TIMEOUT_SECONDS = 60.0
+
+# Limits on a connection's topic subscriptions (see ``handle_control_frame``).
+MAX_TOPICS_PER_CONNECTION = 100
+MAX_TOPIC_LENGTH = 200
+
+# Keys ``broadcast`` adds to every payload.
+_ENVELOPE_KEYS = frozenset({"username", "type", "timestamp"})
+
 # WebSocket connection manager
 class ConnectionManager:
     def __init__(
@@ -21,6 +58,12 @@ class ConnectionManager:
         receiver_roles: Optional[List[str]] = None,
         sender_roles: Optional[List[str]] = None,
         check_all: bool = False,
+        send_timeout: float = BROADCAST_SEND_TIMEOUT_SECONDS,
+        queue_size: int = SEND_QUEUE_SIZE,
+        overflow_policy: OverflowPolicy = OverflowPolicy.DROP_OLDEST,
+        coalesce_types: Optional[List[str]] = None,
+        heartbeat_interval: Optional[float] = HEARTBEAT_INTERVAL_SECONDS,
+        heartbeat_timeout: float = HEARTBEAT_TIMEOUT_SECONDS,
     ):
         """Initialize a connection manager with role-based permissions
 
@@ -28,8 +71,17 @@ class ConnectionManager:
             receiver_roles: Roles allowed to connect and receive data
             sender_roles: Roles allowed to send data via this WebSocket
             check_all: If True, require all roles; if False, any matching role is sufficient
+            send_timeout: Per-recipient send timeout for broadcasts, in seconds
+            queue_size: Outbound messages buffered per connection
+            overflow_policy: What a broadcast does to a connection whose queue is full
+            coalesce_types: Message types coalesced under ``OverflowPolicy.COALESCE_LATEST``
+                (default ``["worldline_update"]``)
+            heartbeat_interval: Seconds between heartbeats to opted-in
+                connections; None disables the heartbeat action
+            heartbeat_timeout: Seconds of silence after which an opted-in
+                connection is evicted
         """
-        self.active_connections: list[WebSocket] = []
+        self._connections = ConnectionRegistry()
         # Normalize the default away from ``None`` so ``self.receiver_roles``
         # / ``self.sender_roles`` are always lists. The signature default is
         # ``None`` to avoid the mutable-default-argument trap (one shared
@@ -39,11 +91,97 @@ class ConnectionManager:
         self.receiver_roles = list(receiver_roles) if receiver_roles is not None else []
         self.sender_roles = list(sender_roles) if sender_roles is not None else []
         self.check_all = check_all
+        self.send_timeout = send_timeout
+        self.queue_size = queue_size
+        self.overflow_policy = OverflowPolicy(overflow_policy)
+        self.coalesce_types = list(coalesce_types) if coalesce_types is not None else ["worldline_update"]
+        # One outbound queue (and writer task) per connection, created on the
+        # first broadcast that reaches it.
+        self._send_queues: Dict[WebSocket, SendQueue] = {}
+        # Strong references to background closes of evicted sockets, so the
+        # tasks are not garbage-collected before they finish.
+        self._close_tasks: set[asyncio.Task] = set()
+        # Relays broadcasts to this manager's counterparts in other workers;
+        # see ``attach_backplane``.
+        self.backplane: Optional[Backplane] = None
+        self.channel: Optional[str] = None
+        # Called with every envelope relayed from another worker, before it
+        # is delivered; see ``add_remote_listener``.
+        self._remote_listeners: List[Callable[[dict], None]] = []
+        self.heartbeat_interval = heartbeat_interval
+        self.heartbeat_timeout = heartbeat_timeout
+        # Opted-in connections and when each last sent a frame
+        # (``time.monotonic``). Other connections are not tracked at all.
+        self._heartbeat_clients: Dict[WebSocket, float] = {}
+        self._heartbeat_task: Optional[asyncio.Task] = None
+        self.heartbeats_sent = 0
+        # Evicted connections, by close reason.
+        self.evictions: Dict[str, int] = {}
+
+    @property
+    def active_connections(self) -> ConnectionRegistry:
+        """The registered connections: O(1) membership, snapshot iteration."""
+        return self._connections
+
+    @active_connections.setter
+    def active_connections(self, connections: Iterable[WebSocket]) -> None:
+        self._connections = ConnectionRegistry(connections)
+
+    def attach_backplane(self, backplane: Backplane, channel: str) -> None:
+        """Share broadcasts with the managers on ``channel`` in other workers.
+
+        Every ``broadcast`` / ``broadcast_server`` is then published on the
+        backplane as well as delivered locally, and broadcasts published by
+        other workers are delivered to this worker's connections.
+        """
+        self.detach_backplane()
+        backplane.subscribe(channel, self._on_backplane_message)
+        self.backplane = backplane
+        self.channel = channel
+
+    def detach_backplane(self) -> None:
+        if self.backplane is not None:
+            self.backplane.unsubscribe(self.channel)
+        self.backplane = None
+        self.channel = None
+
+    async def _publish(self, payload: dict) -> None:
+        if self.backplane is None:
+            return
+        # Local clients already have the message; a relay failure must not
+        # fail the request that broadcast it.
+        try:
+            await self.backplane.publish(self.channel, payload)
+        except Exception as e:
+            logger.error(f"Error publishing broadcast to backplane channel '{self.channel}': {str(e)}")
+
+    def add_remote_listener(self, listener: Callable[[dict], None]) -> None:
+        """Call ``listener`` with each envelope another worker publishes on this channel.
+
+        Lets a worker react to events handled elsewhere, e.g. drop state
+        derived from data another worker has just written.
+        """
+        self._remote_listeners.append(listener)
+
+    def _on_backplane_message(self, payload: dict) -> None:
+        for listener in self._remote_listeners:
+            try:
+                listener(payload)
+            except Exception as e:
+                logger.error(f"Error in backplane listener on channel '{self.channel}': {str(e)}")
+        self._deliver_remote(payload)
+
+    def _deliver_remote(self, payload: dict) -> None:
+        if payload.get("kind") == "server":
+            recipients = self.active_connections.select(payload.get("user_id"), payload.get("role"), payload.get("topics"))
+            self._enqueue_all(encode_frame(payload["message"]), payload["message"].get("type"), recipients)
+        else:
+            self._enqueue_user_frames(payload["data"], payload["type"], payload["timestamp"])
 
     # Connect without authentication
     async def connect(self, websocket: WebSocket):
         await websocket.accept()
-        self.active_connections.append(websocket)
+        self.active_connections.add(websocket)
 
     # Connect authenticated - now validating receiver roles
     async def auth_connect(self, websocket: WebSocket):
@@ -179,7 +317,7 @@ class ConnectionManager:
                 "roles": claims.get("roles", [])
             }
 
-            self.active_connections.append(websocket)
+            self.active_connections.add(websocket)
             registered = True
         finally:
             # `auth_connect` historically registered only after successful
@@ -216,7 +354,59 @@ class ConnectionManager:
             pass
 
     def disconnect(self, websocket: WebSocket):
-        self.active_connections.remove(websocket)
+        # A broadcast may already have evicted the socket.
+        self.active_connections.discard(websocket)
+        self._heartbeat_clients.pop(websocket, None)
+        send_queue = self._send_queues.pop(websocket, None)
+        if send_queue is not None:
+            send_queue.close()
+
+    def _enqueue(self, websocket: WebSocket, frame: str, message_type: str) -> None:
+        """Queue an encoded frame for ``websocket`` in O(1), applying the overflow policy."""
+        send_queue = self._send_queues.get(websocket)
+        if send_queue is None:
+            send_queue = SendQueue(
+                websocket,
+                max_size=self.queue_size,
+                policy=self.overflow_policy,
+                send_timeout=self.send_timeout,
+                on_failure=self._on_send_failure,
+                coalesce_types=self.coalesce_types,
+            )
+            self._send_queues[websocket] = send_queue
+        if not send_queue.put(frame, message_type):
+            logger.warning(f"Disconnecting WebSocket client whose send queue is full ({self.queue_size} messages)")
+            self._evict(websocket, code=1013, reason="Send queue full")
+
+    def _on_send_failure(self, websocket: WebSocket, exc: BaseException) -> None:
+        if isinstance(exc, asyncio.TimeoutError):
+            logger.error(f"Error broadcasting to client: send timed out after {self.send_timeout}s")
+        else:
+            logger.error(f"Error broadcasting to client: {str(exc)}")
+        self._evict(websocket, code=1011, reason="Send failed")
+
+    async def flush(self) -> None:
+        """Wait until every queued broadcast has been sent or its connection evicted."""
+        await asyncio.gather(*(send_queue.join() for send_queue in list(self._send_queues.values())))
+
+    def _evict(self, websocket: WebSocket, code: int, reason: str) -> None:
+        """Drop a connection from the broadcast list and close it in the background."""
+        self.evictions[reason] = self.evictions.get(reason, 0) + 1
+        self.disconnect(websocket)
+        task = asyncio.create_task(self._close_evicted(websocket, code, reason))
+        self._close_tasks.add(task)
+        task.add_done_callback(self._close_tasks.discard)
+
+    @staticmethod
+    async def _close_evicted(websocket: WebSocket, code: int, reason: str) -> None:
+        try:
+            await asyncio.wait_for(
+                websocket.close(code=code, reason=reason),
+                timeout=EVICTION_CLOSE_TIMEOUT_SECONDS,
+            )
+        except Exception:
+            # Already gone, or too stalled to close cleanly.
+            pass
 
     # Validate sender roles before allowing message sending
     def _validate_sender_roles(self, websocket: WebSocket) -> bool:
@@ -247,6 +437,12 @@ class ConnectionManager:
         # as the user is sending to themselves
         await websocket.send_text(message)
                 
+    @staticmethod
+    def _validate_type(type: str) -> None:
+        valid_types = ["message", "create", "update", "delete"]
+        if type not in valid_types:
+            raise ValueError(f"Invalid type parameter: '{type}'. Must be one of: {', '.join(valid_types)}")
+
     # New method to send JSON data with a username property and type
     async def send(self, data: dict, type: str, websocket: WebSocket, sender_websocket: WebSocket = None):
         """
@@ -267,26 +463,49 @@ class ConnectionManager:
             logger.warning(f"Data send attempt from user without sender role: {sender_websocket.state.user.get('name')}")
             return
             
-            # Validate type
-        valid_types = ["message", "create", "update", "delete"]
-        if type not in valid_types:
-            raise ValueError(f"Invalid type parameter: '{type}'. Must be one of: {', '.join(valid_types)}")
-            
+        self._validate_type(type)
+
+        await websocket.send_json(self._user_message(data, type, websocket))
+
+    @staticmethod
+    def _recipient_username(websocket: WebSocket):
         username = "unknown"
         if hasattr(websocket.state, "user"):
             username = websocket.state.user.get("name", "unknown")
-        
+        return username
+
+    @classmethod
+    def _user_message(cls, data: dict, type: str, websocket: WebSocket) -> dict:
         # Add current timestamp in ISO format
         current_time = datetime.datetime.now().isoformat()
 
-        data_with_metadata = {
+        return {
             **data, 
-            "username": username,
+            "username": cls._recipient_username(websocket),
             "type": type,
             "timestamp": current_time
         }
-        
-        await websocket.send_json(data_with_metadata)
+
+    @staticmethod
+    def _user_frame_encoder(data: dict, type: str, current_time: Optional[str] = None) -> Callable[[Any], str]:
+        """Encode a ``broadcast`` envelope once, leaving a slot for the username.
+
+        The returned function produces the same text as encoding
+        ``_user_message`` for a recipient with that username: the payload and
+        the trailing ``type`` / ``timestamp`` are encoded here once, and only
+        the username is encoded per call.
+        """
+        if current_time is None:
+            current_time = datetime.datetime.now().isoformat()
+        if not _ENVELOPE_KEYS.isdisjoint(data):
+            # ``data`` carries a metadata key that the envelope overrides in
+            # place; keep the dict semantics exactly.
+            return lambda username: encode_frame(
+                {**data, "username": username, "type": type, "timestamp": current_time}
+            )
+        head = encode_frame(data)[:-1] + ("," if data else "") + '"username":'
+        tail = "," + encode_frame({"type": type, "timestamp": current_time})[1:]
+        return lambda username: head + encode_frame(username) + tail
 
     async def broadcast(self, data: dict, type: str, sender_websocket: WebSocket = None, skip_self: bool = True):
         """
@@ -301,19 +520,41 @@ class ConnectionManager:
         Automatically includes for each recipient:
         - `username` property extracted from the recipient's websocket.state.user
         - `type` to indicate the CRUD operation
+
+        The message is queued for each recipient and sent by that
+        connection's writer task, so this never waits on a peer; see
+        ``overflow_policy`` for full queues. A recipient whose send fails or
+        exceeds ``send_timeout`` is evicted. With a backplane attached, the
+        broadcast also reaches every client of the other workers.
         """
         # Validate sender permission if a sender websocket is provided
         if sender_websocket and not self._validate_sender_roles(sender_websocket):
             logger.warning(f"Data broadcast attempt from user without sender role: {sender_websocket.state.user.get('name')}")
             return
         
-        # Send to all connected clients (except sender if skip_self is True)
+        # Reject a bad type once, before any socket could be blamed for it
+        self._validate_type(type)
+
+        # Queue for all connected clients (except sender if skip_self is
+        # True), then relay to the other workers, whose clients all receive it.
+        current_time = datetime.datetime.now().isoformat()
+        self._enqueue_user_frames(data, type, current_time, sender_websocket if skip_self else None)
+        await self._publish({"kind": "user", "data": data, "type": type, "timestamp": current_time})
+
+    def _enqueue_user_frames(self, data: dict, type: str, current_time: str, skip: WebSocket = None) -> None:
+        # Iterating the registry walks a snapshot, so evictions are safe.
+        # Only the username differs per recipient, so only that is encoded
+        # per recipient.
+        frame_for = self._user_frame_encoder(data, type, current_time)
+        frames: Dict[Any, str] = {}
         for connection in self.active_connections:
-            # Skip sender if requested
-            if skip_self and connection == sender_websocket:
+            if skip is not None and connection == skip:
                 continue
-                
-            await self.send(data, type, connection)
+            username = self._recipient_username(connection)
+            frame = frames.get(username)
+            if frame is None:
+                frame = frames[username] = frame_for(username)
+            self._enqueue(connection, frame, type)
 
     async def send_server(self, data: dict, type: str, websocket: WebSocket, username: str = "SERVER"):
         """
@@ -326,20 +567,30 @@ class ConnectionManager:
             websocket: The WebSocket connection to send to
             username: Optional custom username to use instead of "SERVER"
         """
+        await websocket.send_json(self._server_message(data, type, username))
+
+    @staticmethod
+    def _server_message(data: dict, type: str, username: str) -> dict:
         # Add server indicator and timestamp
         current_time = datetime.datetime.now().isoformat()
         
-        data_with_metadata = {
+        return {
             **data, 
             "username": username,
             "type": type,
             "timestamp": current_time,
             "server_initiated": True
         }
-        
-        await websocket.send_json(data_with_metadata)
 
-    async def broadcast_server(self, data: dict, type: str, username: str = "SERVER"):
+    async def broadcast_server(
+        self,
+        data: dict,
+        type: str,
+        username: str = "SERVER",
+        user_id: Optional[str] = None,
+        role: Optional[str] = None,
+        topics: Optional[List[str]] = None,
+    ):
         """
         Broadcasts JSON data from the server to all connected clients without authentication checks.
         Used for server-initiated broadcasts like system notifications or background process updates.
@@ -348,17 +599,147 @@ class ConnectionManager:
             data: The data payload to broadcast
             type: Type of operation or message
             username: Optional custom username to use instead of "SERVER"
+            user_id: Only send to the connections of this user (``sub`` claim)
+            role: Only send to connections whose user has this role
+            topics: Topics the event is published under. Only connections
+                subscribed to one of them, or not subscribed to any topic,
+                receive it. None sends to every connection
+
+        Targeted broadcasts look their recipients up in the registry's user,
+        role and topic indexes instead of scanning every connection.
+
+        The message is built and encoded once and the same frame queued
+        for every client, as in ``broadcast``; this never waits on a peer.
         """
+        recipients = self.active_connections.select(user_id, role, topics)
+
         # Log server broadcast for audit trail
-        logger.info(f"Server broadcasting message of type '{type}' from '{username}' to {len(self.active_connections)} clients")
+        log_event(
+            logger, "info", "socket.broadcast_server",
+            "Server broadcasting message of type '{type}' from '{username}' to {recipients} clients",
+            type=type, username=username, recipients=len(recipients),
+        )
         
-        # Send to all connected clients
-        for connection in self.active_connections:
-            try:
-                await self.send_server(data, type, connection, username)
-            except Exception as e:
-                # Log error but continue with other connections
-                logger.error(f"Error broadcasting to client: {str(e)}")
+        # Queue for the recipients, then relay to the other workers.
+        # The envelope is the same for everyone, so it is encoded once.
+        message = self._server_message(data, type, username)
+        self._enqueue_all(encode_frame(message), type, recipients)
+        await self._publish({
+            "kind": "server",
+            "message": message,
+            "user_id": user_id,
+            "role": role,
+            "topics": list(topics) if topics is not None else None,
+        })
+
+    def _enqueue_all(self, frame: str, type: str, recipients: Iterable[WebSocket]) -> None:
+        # ``recipients`` is a snapshot, so evictions are safe.
+        for connection in recipients:
+            self._enqueue(connection, frame, type)
+
+    async def handle_control_frame(self, websocket: WebSocket, text: str) -> bool:
+        """Apply a control frame sent by a client.
+
+        A control frame is a JSON object with an ``action``:
+
+        - ``"subscribe"`` / ``"unsubscribe"`` with a ``topics`` list, e.g.
+          ``{"action": "subscribe", "topics": ["experiment:EXP-001"]}``.
+          ``unsubscribe`` without ``topics`` drops every subscription, so
+          the client receives every event again. The client is answered
+          with a ``subscriptions`` message listing its topics, or an
+          ``error`` message.
+        - ``"heartbeat"`` opts the connection into the heartbeat, answered
+          with a ``heartbeat`` message giving ``interval`` and ``timeout``.
+        - ``"pong"`` answers a heartbeat; it gets no reply.
+
+        Endpoints pass every text frame here; any frame keeps an opted-in
+        connection alive.
+
+        Returns:
+            bool: True if ``text`` was a control frame, False for any other message
+        """
+        if websocket in self._heartbeat_clients:
+            self._heartbeat_clients[websocket] = time.monotonic()
+        try:
+            frame = json.loads(text)
+        except ValueError:
+            return False
+        if not isinstance(frame, dict) or not isinstance(frame.get("action"), str):
+            return False
+        if websocket not in self.active_connections:
+            return False
+        return await self._handle_control_action(websocket, frame["action"], frame)
+
+    async def _handle_control_action(self, websocket: WebSocket, action: str, frame: dict) -> bool:
+        """Handle one control ``action``; False if this manager does not know it."""
+        if action in ("heartbeat", "pong") and self.heartbeat_interval is not None:
+            if action == "heartbeat":
+                await self._start_heartbeat(websocket)
+            return True
+        if action not in ("subscribe", "unsubscribe"):
+            return False
+
+        topics = frame.get("topics")
+        if topics is None and action == "unsubscribe":
+            subscribed = self.active_connections.unsubscribe(websocket)
+        elif (
+            not isinstance(topics, list)
+            or not all(isinstance(topic, str) and 0 < len(topic) <= MAX_TOPIC_LENGTH for topic in topics)
+        ):
+            await self.send_server(
+                {"detail": f"'topics' must be a list of non-empty strings of at most {MAX_TOPIC_LENGTH} characters"},
+                "error",
+                websocket,
+            )
+            return True
+        elif action == "subscribe":
+            current = self.active_connections.subscriptions(websocket)
+            if len(current | set(topics)) > MAX_TOPICS_PER_CONNECTION:
+                await self.send_server(
+                    {"detail": f"At most {MAX_TOPICS_PER_CONNECTION} topic subscriptions per connection"},
+                    "error",
+                    websocket,
+                )
+                return True
+            subscribed = self.active_connections.subscribe(websocket, topics)
+        else:
+            subscribed = self.active_connections.unsubscribe(websocket, topics)
+
+        await self.send_server({"topics": sorted(subscribed)}, "subscriptions", websocket)
+        return True
+
+    async def _start_heartbeat(self, websocket: WebSocket) -> None:
+        self._heartbeat_clients[websocket] = time.monotonic()
+        loop = asyncio.get_running_loop()
+        task = self._heartbeat_task
+        if task is None or task.done() or task.get_loop() is not loop:
+            self._heartbeat_task = loop.create_task(self._heartbeat_loop())
+        await self.send_server(
+            {"interval": self.heartbeat_interval, "timeout": self.heartbeat_timeout},
+            "heartbeat",
+            websocket,
+        )
+
+    async def _heartbeat_loop(self) -> None:
+        # Runs only while some connection has opted in.
+        while self._heartbeat_clients:
+            await asyncio.sleep(self.heartbeat_interval)
+            self._sweep_heartbeats()
+
+    def _sweep_heartbeats(self) -> None:
+        """Send heartbeats to silent opted-in connections; evict unresponsive ones."""
+        now = time.monotonic()
+        frame = None
+        for websocket, last_seen in list(self._heartbeat_clients.items()):
+            silent = now - last_seen
+            if silent >= self.heartbeat_timeout:
+                logger.info(f"Evicting WebSocket client silent for {silent:.0f}s")
+                self._evict(websocket, code=1001, reason="Heartbeat timeout")
+            elif silent >= self.heartbeat_interval:
+                if frame is None:
+                    frame = encode_frame(self._server_message({}, "heartbeat", "SERVER"))
+                self._enqueue(websocket, frame, "heartbeat")
+                self.heartbeats_sent += 1
 
     def get_server_sender(self):
         """Create a pseudo-sender with admin privileges for server-initiated broadcasts"""
@@ -1,7 +1,9 @@
 import pytest
 import asyncio
 import datetime
+import json
 from common.socket import ConnectionManager
+from common.send_queue import OverflowPolicy, encode_frame
 from fastapi import WebSocket
 import sys
 import gc
@@ -9,6 +11,8 @@ import gc
 # Create a dummy logger class for tests to avoid missing attributes on the logger.
 class DummyLogger:
     level = 0
+    def isEnabledFor(self, level):
+        return True
     def warning(self, *args, **kwargs):
         pass
     def error(self, *args, **kwargs):
@@ -38,6 +42,11 @@ class FakeWebSocket:
     async def send_json(self, data: dict):
         self.sent_jsons.append(data)
 
+    @property
+    def text_jsons(self):
+        # Broadcasts arrive as pre-encoded text frames.
+        return [json.loads(message) for message in self.sent_texts]
+
     async def receive_json(self):
         # The test will set this attribute as needed.
         return self.received_json
@@ -150,24 +159,25 @@ async def test_broadcast_text(manager):
     
     # Call broadcast with required type parameter
     await manager.broadcast(data, "message")
+    await manager.flush()
     
     # Check that the message was received as JSON
-    assert len(ws1.sent_jsons) == 1
-    assert len(ws2.sent_jsons) == 1
-    assert ws1.sent_jsons[0]["message"] == "Broadcast message"
-    assert ws2.sent_jsons[0]["message"] == "Broadcast message"
-    assert ws1.sent_jsons[0]["type"] == "message"
-    assert ws2.sent_jsons[0]["type"] == "message"
+    assert len(ws1.text_jsons) == 1
+    assert len(ws2.text_jsons) == 1
+    assert ws1.text_jsons[0]["message"] == "Broadcast message"
+    assert ws2.text_jsons[0]["message"] == "Broadcast message"
+    assert ws1.text_jsons[0]["type"] == "message"
+    assert ws2.text_jsons[0]["type"] == "message"
     
     # Check that timestamps exist and are valid
-    assert "timestamp" in ws1.sent_jsons[0]
-    assert "timestamp" in ws2.sent_jsons[0]
+    assert "timestamp" in ws1.text_jsons[0]
+    assert "timestamp" in ws2.text_jsons[0]
     # Verify timestamps are in valid ISO format
     for websocket in [ws1, ws2]:
         try:
-            datetime.datetime.fromisoformat(websocket.sent_jsons[0]["timestamp"])
+            datetime.datetime.fromisoformat(websocket.text_jsons[0]["timestamp"])
         except ValueError:
-            pytest.fail(f"Timestamp is not in valid ISO format: {websocket.sent_jsons[0]['timestamp']}")
+            pytest.fail(f"Timestamp is not in valid ISO format: {websocket.text_jsons[0]['timestamp']}")
 
 @pytest.mark.asyncio
 async def test_send_method(manager, fake_websocket):
@@ -264,15 +274,16 @@ async def test_broadcast_data(manager):
     # Test broadcasting data
     data = {"record_id": "123", "content": "broadcast test"}
     await manager.broadcast(data, "update", sender, skip_self=True)
+    await manager.flush()
     
     # Verify only ws1 and ws2 received the data (sender was skipped)
-    assert len(ws1.sent_jsons) == 1
-    assert len(ws2.sent_jsons) == 1
-    assert len(sender.sent_jsons) == 0
+    assert len(ws1.text_jsons) == 1
+    assert len(ws2.text_jsons) == 1
+    assert len(sender.text_jsons) == 0
     
     # Verify the message content for each recipient including timestamp
     for websocket in [ws1, ws2]:
-        sent_json = websocket.sent_jsons[0]
+        sent_json = websocket.text_jsons[0]
         assert sent_json["record_id"] == "123"
         assert sent_json["content"] == "broadcast test"
         assert sent_json["type"] == "update"
@@ -298,18 +309,19 @@ async def test_broadcast_with_skip_self_false(manager):
     # Test broadcasting data with skip_self=False
     data = {"record_id": "456", "content": "include sender test"}
     await manager.broadcast(data, "create", sender, skip_self=False)
+    await manager.flush()
     
     # Verify both ws1 and sender received the data
-    assert len(ws1.sent_jsons) == 1
-    assert len(sender.sent_jsons) == 1
+    assert len(ws1.text_jsons) == 1
+    assert len(sender.text_jsons) == 1
     
     # Verify the message content for each recipient
-    assert ws1.sent_jsons[0]["record_id"] == "456"
-    assert ws1.sent_jsons[0]["type"] == "create"
+    assert ws1.text_jsons[0]["record_id"] == "456"
+    assert ws1.text_jsons[0]["type"] == "create"
     
-    assert sender.sent_jsons[0]["record_id"] == "456"
-    assert sender.sent_jsons[0]["type"] == "create"
-    assert sender.sent_jsons[0]["username"] == "Sender"
+    assert sender.text_jsons[0]["record_id"] == "456"
+    assert sender.text_jsons[0]["type"] == "create"
+    assert sender.text_jsons[0]["username"] == "Sender"
 
 @pytest.mark.asyncio
 async def test_auth_connect_success(manager, monkeypatch, fake_websocket):
@@ -336,7 +348,7 @@ async def test_auth_connect_fail_missing_token(manager, monkeypatch, fake_websoc
 
     # Simulate a receive_json with missing token. Start from a pre-existing
     # tracking entry to verify every failed handshake path cleans it up.
-    manager.active_connections.append(fake_websocket)
+    manager.active_connections.add(fake_websocket)
     fake_websocket.received_json = {}
     await manager.auth_connect(fake_websocket)
     # Expect the websocket to be closed with code 1008 ("Missing authentication token").
@@ -471,11 +483,12 @@ async def test_broadcast_server(manager, monkeypatch):
     
     # Broadcast server message
     await manager.broadcast_server(data, "notification")
+    await manager.flush()
     
     # Verify all clients received the message
     for websocket in [ws1, ws2]:
-        assert len(websocket.sent_jsons) == 1
-        sent = websocket.sent_jsons[0]
+        assert len(websocket.text_jsons) == 1
+        sent = websocket.text_jsons[0]
         
         # Check message contents
         assert sent["action"] == "experiment_created"
@@ -516,11 +529,12 @@ async def test_broadcast_server_with_custom_username(manager, monkeypatch):
     
     # Broadcast server message with custom username
     await manager.broadcast_server(data, "alert", username="Divergence Meter")
+    await manager.flush()
     
     # Verify all clients received the message with custom username
     for websocket in [ws1, ws2]:
-        assert len(websocket.sent_jsons) == 1
-        sent = websocket.sent_jsons[0]
+        assert len(websocket.text_jsons) == 1
+        sent = websocket.text_jsons[0]
         assert sent["username"] == "Divergence Meter"
         assert sent["server_initiated"] is True
 
@@ -544,7 +558,7 @@ async def test_broadcast_server_with_errors(manager, monkeypatch):
     
     # Create a problematic websocket that will raise an exception
     class ProblemWebSocket(FakeWebSocket):
-        async def send_json(self, data: dict):
+        async def send_text(self, message: str):
             raise Exception("Connection error")
     
     problem_ws = ProblemWebSocket()
@@ -558,17 +572,18 @@ async def test_broadcast_server_with_errors(manager, monkeypatch):
     
     # Broadcast server message
     await manager.broadcast_server(data, "alert")
+    await manager.flush()
     
     # Verify the normal websocket received the message
-    assert len(normal_ws.sent_jsons) == 1
-    assert normal_ws.sent_jsons[0]["action"] == "system_notification"
+    assert len(normal_ws.text_jsons) == 1
+    assert normal_ws.text_jsons[0]["action"] == "system_notification"
     
     # Verify an error was logged for the problematic websocket
     assert len(error_messages) == 1
     assert "Error broadcasting to client" in error_messages[0]
 
     # Ensure the broadcast continued despite the error
-    assert len(normal_ws.sent_jsons) == 1
+    assert len(normal_ws.text_jsons) == 1
 
 
 @pytest.mark.asyncio
@@ -922,3 +937,480 @@ async def test_auth_connect_closes_on_claims_missing_sub(
     # rejected after the token was accepted.
     assert not hasattr(fake_websocket.state, "user")
     assert any("missing required 'sub' claim" in w for w in warnings), warnings
+
+
+class StalledWebSocket(FakeWebSocket):
+    """A peer whose sends never complete (full TCP window, frozen client)."""
+
+    async def send_text(self, message: str):
+        await asyncio.Event().wait()
+
+
+class GatedWebSocket(FakeWebSocket):
+    """A peer whose sends block until the test sets ``gate``."""
+
+    def __init__(self, gate: asyncio.Event):
+        super().__init__()
+        self.gate = gate
+
+    async def send_text(self, message: str):
+        await self.gate.wait()
+        await super().send_text(message)
+
+
+@pytest.mark.asyncio
+async def test_broadcast_server_evicts_stalled_client_without_delaying_others(monkeypatch):
+    """A stalled send is cut off at send_timeout and its socket evicted."""
+    monkeypatch.setattr("common.socket.logger", DummyLogger())
+    manager = ConnectionManager(send_timeout=0.05)
+    healthy = [FakeWebSocket() for _ in range(3)]
+    stalled = StalledWebSocket()
+    manager.active_connections = [healthy[0], stalled, *healthy[1:]]
+
+    await manager.broadcast_server({"action": "ping"}, "notification")
+    # Healthy peers are served without waiting for the stalled one.
+    await asyncio.gather(*(manager._send_queues[ws].join() for ws in healthy))
+    assert all(len(ws.text_jsons) == 1 for ws in healthy)
+
+    await manager.flush()
+    assert list(manager.active_connections) == healthy
+    assert manager.evictions == {"Send failed": 1}
+    await asyncio.gather(*manager._close_tasks)
+    assert stalled.closed == (1011, "Send failed")
+
+
+@pytest.mark.asyncio
+async def test_broadcast_evicts_failed_client_and_rejects_bad_type_up_front(manager, monkeypatch):
+    monkeypatch.setattr("common.socket.logger", DummyLogger())
+
+    class BrokenWebSocket(FakeWebSocket):
+        async def send_text(self, message: str):
+            raise RuntimeError("socket closed")
+
+    healthy, broken = FakeWebSocket(), BrokenWebSocket()
+    healthy.state.user = {"name": "Okabe"}
+    broken.state.user = {"name": "Daru"}
+    manager.active_connections = [broken, healthy]
+
+    # A bad type is the caller's error, not the sockets': nothing is evicted.
+    with pytest.raises(ValueError):
+        await manager.broadcast({"x": 1}, "invalid")
+    assert list(manager.active_connections) == [broken, healthy]
+
+    await manager.broadcast({"x": 1}, "update")
+    await manager.flush()
+
+    assert healthy.text_jsons[0]["username"] == "Okabe"
+    assert list(manager.active_connections) == [healthy]
+    # The endpoint's own disconnect after an eviction is harmless.
+    manager.disconnect(broken)
+
+
+@pytest.mark.asyncio
+async def test_broadcast_never_waits_on_a_peer(monkeypatch):
+    """Producers only enqueue; each connection's writer delivers in order."""
+    monkeypatch.setattr("common.socket.logger", DummyLogger())
+    manager = ConnectionManager(send_timeout=5)
+    gate = asyncio.Event()
+    gated, healthy = GatedWebSocket(gate), FakeWebSocket()
+    manager.active_connections = [gated, healthy]
+
+    # Every broadcast returns while the gated peer cannot complete a send.
+    for i in range(10):
+        await manager.broadcast_server({"seq": i}, "notification")
+    assert not gate.is_set()
+
+    await manager._send_queues[healthy].join()
+    assert [message["seq"] for message in healthy.text_jsons] == list(range(10))
+    # One frame is in flight to the gated peer; the rest wait in its queue.
+    gated_queue = manager._send_queues[gated]
+    assert gated.sent_texts == []
+    assert (len(gated_queue), gated_queue.dropped) == (9, 0)
+
+    gate.set()
+    await manager.flush()
+    assert [message["seq"] for message in gated.text_jsons] == list(range(10))
+    assert manager.evictions == {}
+
+
+@pytest.mark.asyncio
+async def test_slow_client_drops_oldest_frames_at_queue_size(monkeypatch):
+    monkeypatch.setattr("common.socket.logger", DummyLogger())
+    manager = ConnectionManager(queue_size=3, overflow_policy=OverflowPolicy.DROP_OLDEST)
+    gate = asyncio.Event()
+    gated, healthy = GatedWebSocket(gate), FakeWebSocket()
+    manager.active_connections = [gated, healthy]
+
+    # No await yields to the writers, so every frame lands in the queues.
+    for i in range(10):
+        await manager.broadcast_server({"seq": i}, "notification")
+    gated_queue, healthy_queue = manager._send_queues[gated], manager._send_queues[healthy]
+    assert (len(gated_queue), gated_queue.dropped) == (3, 7)
+    assert (len(healthy_queue), healthy_queue.dropped) == (3, 7)
+
+    gate.set()
+    await manager.flush()
+    assert [message["seq"] for message in gated.text_jsons] == [7, 8, 9]
+    assert [message["seq"] for message in healthy.text_jsons] == [7, 8, 9]
+    assert list(manager.active_connections) == [gated, healthy]
+
+
+@pytest.mark.asyncio
+async def test_full_queue_disconnects_with_1013(monkeypatch):
+    monkeypatch.setattr("common.socket.logger", DummyLogger())
+    manager = ConnectionManager(queue_size=2, overflow_policy=OverflowPolicy.DISCONNECT)
+    stalled, healthy = StalledWebSocket(), FakeWebSocket()
+    manager.active_connections = [stalled, healthy]
+
+    for i in range(4):
+        await manager.broadcast_server({"seq": i}, "notification")
+        # Let the healthy writer drain between broadcasts; the stalled
+        # writer takes the first frame in flight and queues the rest.
+        await manager._send_queues[healthy].join()
+
+    assert list(manager.active_connections) == [healthy]
+    assert manager.evictions == {"Send queue full": 1}
+    await asyncio.gather(*manager._close_tasks)
+    assert stalled.closed == (1013, "Send queue full")
+    await manager.flush()
+    assert len(healthy.text_jsons) == 4
+
+
+@pytest.mark.asyncio
+async def test_worldline_snapshots_coalesce_for_a_slow_client(monkeypatch):
+    monkeypatch.setattr("common.socket.logger", DummyLogger())
+    release = asyncio.Event()
+
+    class SlowWebSocket(FakeWebSocket):
+        async def send_text(self, message: str):
+            await release.wait()
+            await super().send_text(message)
+
+    manager = ConnectionManager(overflow_policy=OverflowPolicy.COALESCE_LATEST)
+    slow = SlowWebSocket()
+    manager.active_connections = [slow]
+
+    for worldline in (1.0, 1.1, 1.2, 1.3):
+        await manager.broadcast_server({"current_worldline": worldline}, "worldline_update")
+        await asyncio.sleep(0)
+    release.set()
+    await manager.flush()
+
+    # The first snapshot was already in flight; the rest collapsed to the latest.
+    assert [message["current_worldline"] for message in slow.text_jsons] == [1.0, 1.3]
+
+
+@pytest.mark.asyncio
+async def test_broadcast_p99_latency_with_1k_connections_and_stalled_peers(monkeypatch):
+    """Benchmark: 1k sockets that drain every frame, plus five stalled peers per round.
+
+    The latencies are printed for comparison, not asserted: wall-clock
+    thresholds flake on a loaded box. What is asserted is deterministic:
+    the stalled peers hold no one up, their queues keep exactly the newest
+    ``queue_size`` frames, and they are evicted once their sends fail.
+    """
+    monkeypatch.setattr("common.socket.logger", DummyLogger())
+    queue_size, rounds, frames_per_round = 4, 5, 8
+    manager = ConnectionManager(queue_size=queue_size, overflow_policy=OverflowPolicy.DROP_OLDEST)
+
+    class FailingGatedWebSocket(GatedWebSocket):
+        async def send_text(self, message: str):
+            await self.gate.wait()
+            raise ConnectionResetError("peer went away")
+
+    healthy = [FakeWebSocket() for _ in range(1000)]
+    loop = asyncio.get_running_loop()
+    broadcast_latencies, delivery_latencies = [], []
+    for round_number in range(rounds):
+        # Fresh stalled peers each round, as if new frozen clients joined.
+        gate = asyncio.Event()
+        stalled = [FailingGatedWebSocket(gate) for _ in range(5)]
+        manager.active_connections = healthy + stalled
+        for i in range(frames_per_round):
+            started = loop.time()
+            await manager.broadcast_server({"seq": i}, "notification")
+            broadcast_latencies.append(loop.time() - started)
+            await asyncio.gather(*(manager._send_queues[ws].join() for ws in healthy))
+            delivery_latencies.append(loop.time() - started)
+
+        # Healthy peers got every frame while the stalled ones were blocked.
+        assert not gate.is_set()
+        assert all(len(ws.sent_texts) == (round_number + 1) * frames_per_round for ws in healthy)
+        # Each stalled writer holds the first frame in flight; the queue
+        # keeps the newest ``queue_size`` of the rest.
+        for websocket in stalled:
+            send_queue = manager._send_queues[websocket]
+            assert (len(send_queue), send_queue.dropped) == (queue_size, frames_per_round - 1 - queue_size)
+
+        gate.set()
+        await manager.flush()
+        assert list(manager.active_connections) == healthy
+        assert manager.evictions == {"Send failed": 5 * (round_number + 1)}
+
+    def p99(samples):
+        return sorted(samples)[int(len(samples) * 0.99) - 1]
+
+    print(
+        f"broadcast to 1000+5 sockets: enqueue p99={p99(broadcast_latencies) * 1000:.1f}ms "
+        f"delivery p99={p99(delivery_latencies) * 1000:.1f}ms"
+    )
+    for websocket in healthy:
+        manager.disconnect(websocket)
+
+
+@pytest.mark.asyncio
+async def test_broadcast_server_encodes_payload_once(manager, monkeypatch):
+    """One encode per broadcast, however many recipients."""
+    monkeypatch.setattr("common.socket.logger", DummyLogger())
+    calls = []
+
+    def counting_encode_frame(message):
+        calls.append(message)
+        return encode_frame(message)
+
+    monkeypatch.setattr("common.socket.encode_frame", counting_encode_frame)
+    sockets = [FakeWebSocket() for _ in range(50)]
+    manager.active_connections = list(sockets)
+
+    await manager.broadcast_server({"action": "ping"}, "notification")
+    await manager.flush()
+
+    assert len(calls) == 1
+    # Every recipient got the very same frame object.
+    assert len({id(ws.sent_texts[0]) for ws in sockets}) == 1
+
+
+@pytest.mark.parametrize("data", [
+    {},
+    {"record_id": "123", "notes": "El Psy Kongroo 世界線", "tags": [1, None]},
+    # Payload keys the envelope overrides keep their position.
+    {"type": "spoofed", "record_id": "123", "username": "spoofed"},
+])
+@pytest.mark.parametrize("name", ["Okabe", 'Hououin "Kyouma"', "牧瀬紅莉栖", None])
+def test_user_frame_encoder_matches_full_encoding(data, name, monkeypatch):
+    frozen = type("FrozenDatetime", (), {"now": staticmethod(lambda: datetime.datetime(2010, 8, 21))})
+    monkeypatch.setattr("common.socket.datetime", type("FrozenModule", (), {"datetime": frozen}))
+    websocket = FakeWebSocket()
+    websocket.state.user = {"name": name}
+
+    frame = ConnectionManager._user_frame_encoder(data, "update")(name)
+
+    expected = ConnectionManager._user_message(data, "update", websocket)
+    assert frame == json.dumps(expected, separators=(",", ":"), ensure_ascii=False)
+
+
+@pytest.mark.asyncio
+async def test_broadcast_encodes_once_per_distinct_username(manager, monkeypatch):
+    monkeypatch.setattr("common.socket.logger", DummyLogger())
+    calls = []
+
+    def counting_encode_frame(message):
+        calls.append(message)
+        return encode_frame(message)
+
+    monkeypatch.setattr("common.socket.encode_frame", counting_encode_frame)
+    sockets = [FakeWebSocket() for _ in range(20)]
+    for i, websocket in enumerate(sockets):
+        websocket.state.user = {"name": "Okabe" if i % 2 else "Kurisu"}
+    manager.active_connections = list(sockets)
+
+    await manager.broadcast({"record_id": "123"}, "update")
+    await manager.flush()
+
+    # Payload and trailer once, then one username each.
+    assert len(calls) == 2 + 2
+    assert {ws.text_jsons[0]["username"] for ws in sockets} == {"Okabe", "Kurisu"}
+    assert all(ws.text_jsons[0]["record_id"] == "123" for ws in sockets)
+
+
+@pytest.mark.asyncio
+async def test_broadcast_server_targets_users_and_roles_via_the_index(manager, monkeypatch):
+    monkeypatch.setattr("common.socket.logger", DummyLogger())
+    okabe, kurisu, mayuri = FakeWebSocket(), FakeWebSocket(), FakeWebSocket()
+    okabe.state.user = {"sub": "okabe", "name": "Okabe", "roles": ["Admin"]}
+    kurisu.state.user = {"sub": "kurisu", "name": "Kurisu", "roles": ["Admin"]}
+    mayuri.state.user = {"sub": "mayuri", "name": "Mayuri", "roles": []}
+    manager.active_connections = [okabe, kurisu, mayuri]
+
+    await manager.broadcast_server({"action": "dm"}, "notification", user_id="mayuri")
+    await manager.broadcast_server({"action": "admins"}, "notification", role="admin")
+    await manager.flush()
+
+    assert [m["action"] for m in okabe.text_jsons] == ["admins"]
+    assert [m["action"] for m in kurisu.text_jsons] == ["admins"]
+    assert [m["action"] for m in mayuri.text_jsons] == ["dm"]
+
+
+@pytest.mark.asyncio
+async def test_broadcast_server_skips_sockets_disconnected_mid_broadcast(monkeypatch):
+    """Disconnecting while a broadcast walks the registry neither raises nor skips others."""
+    monkeypatch.setattr("common.socket.logger", DummyLogger())
+    manager = ConnectionManager(queue_size=1, overflow_policy=OverflowPolicy.DISCONNECT)
+    stalled = [StalledWebSocket() for _ in range(3)]
+    healthy = FakeWebSocket()
+    manager.active_connections = [*stalled, healthy]
+
+    # The stalled writers take the first message and queue the second; the
+    # third evicts the stalled sockets one by one while iterating.
+    for seq in range(3):
+        await manager.broadcast_server({"seq": seq}, "notification")
+        await asyncio.sleep(0.01)
+
+    assert list(manager.active_connections) == [healthy]
+    assert [m["seq"] for m in healthy.text_jsons] == [0, 1, 2]
+    await asyncio.gather(*manager._close_tasks)
+
+
+@pytest.mark.asyncio
+async def test_control_frames_manage_topic_subscriptions(manager):
+    websocket = FakeWebSocket()
+    manager.active_connections = [websocket]
+
+    handled = await manager.handle_control_frame(
+        websocket, json.dumps({"action": "subscribe", "topics": ["experiment:EXP-001", "status:planned"]})
+    )
+    assert handled is True
+    assert websocket.sent_jsons[-1]["type"] == "subscriptions"
+    assert websocket.sent_jsons[-1]["topics"] == ["experiment:EXP-001", "status:planned"]
+
+    await manager.handle_control_frame(websocket, '{"action": "unsubscribe", "topics": ["status:planned"]}')
+    assert websocket.sent_jsons[-1]["topics"] == ["experiment:EXP-001"]
+
+    await manager.handle_control_frame(websocket, '{"action": "unsubscribe"}')
+    assert websocket.sent_jsons[-1]["topics"] == []
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("frame", [
+    '{"action": "subscribe"}',
+    '{"action": "subscribe", "topics": "experiment:EXP-001"}',
+    '{"action": "subscribe", "topics": [""]}',
+    '{"action": "subscribe", "topics": [42]}',
+    json.dumps({"action": "subscribe", "topics": [f"experiment:{i}" for i in range(101)]}),
+])
+async def test_invalid_control_frames_are_answered_with_an_error(manager, frame):
+    websocket = FakeWebSocket()
+    manager.active_connections = [websocket]
+
+    assert await manager.handle_control_frame(websocket, frame) is True
+
+    assert websocket.sent_jsons[-1]["type"] == "error"
+    assert manager.active_connections.subscriptions(websocket) == frozenset()
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("text", ["ping", "[1, 2]", '{"action": "dance"}', "{broken"])
+async def test_other_messages_are_not_control_frames(manager, text):
+    websocket = FakeWebSocket()
+    manager.active_connections = [websocket]
+
+    assert await manager.handle_control_frame(websocket, text) is False
+    assert websocket.sent_jsons == []
+
+
+@pytest.mark.asyncio
+async def test_broadcast_server_routes_by_topic(manager, monkeypatch):
+    monkeypatch.setattr("common.socket.logger", DummyLogger())
+    watcher, other, firehose = FakeWebSocket(), FakeWebSocket(), FakeWebSocket()
+    manager.active_connections = [watcher, other, firehose]
+    manager.active_connections.subscribe(watcher, ["experiment:EXP-001"])
+    manager.active_connections.subscribe(other, ["experiment:EXP-002"])
+
+    await manager.broadcast_server({"id": "EXP-001"}, "update", topics=["experiment:EXP-001", "status:planned"])
+    await manager.broadcast_server({"id": "-"}, "notification")
+    await manager.flush()
+
+    assert [m["id"] for m in watcher.text_jsons] == ["EXP-001", "-"]
+    assert [m["id"] for m in other.text_jsons] == ["-"]
+    assert [m["id"] for m in firehose.text_jsons] == ["EXP-001", "-"]
+
+
+@pytest.mark.asyncio
+async def test_heartbeat_opt_in_is_acknowledged():
+    manager = ConnectionManager(heartbeat_interval=0.01, heartbeat_timeout=0.05)
+    websocket = FakeWebSocket()
+    manager.active_connections = [websocket]
+
+    assert await manager.handle_control_frame(websocket, '{"action": "heartbeat"}') is True
+
+    reply = websocket.sent_jsons[-1]
+    assert (reply["type"], reply["interval"], reply["timeout"]) == ("heartbeat", 0.01, 0.05)
+    manager.disconnect(websocket)
+    await manager._heartbeat_task
+
+
+@pytest.mark.asyncio
+async def test_heartbeat_keeps_answering_clients_and_evicts_silent_ones(monkeypatch):
+    monkeypatch.setattr("common.socket.logger", DummyLogger())
+    manager = ConnectionManager(heartbeat_interval=0.01, heartbeat_timeout=0.05)
+    responsive, silent, passive = FakeWebSocket(), FakeWebSocket(), FakeWebSocket()
+    manager.active_connections = [responsive, silent, passive]
+    for websocket in (responsive, silent):
+        await manager.handle_control_frame(websocket, '{"action": "heartbeat"}')
+
+    # The responsive client answers every heartbeat it receives
+    answered = 0
+    for _ in range(10):
+        await asyncio.sleep(0.01)
+        heartbeats = [m for m in responsive.text_jsons if m["type"] == "heartbeat"]
+        for _ in heartbeats[answered:]:
+            assert await manager.handle_control_frame(responsive, '{"action": "pong"}') is True
+        answered = len(heartbeats)
+
+    assert list(manager.active_connections) == [responsive, passive]
+    assert silent.closed == (1001, "Heartbeat timeout")
+    assert manager.evictions == {"Heartbeat timeout": 1}
+    assert answered > 0
+    assert any(m["type"] == "heartbeat" for m in silent.text_jsons)
+    # Connections that never opted in are neither pinged nor evicted
+    assert passive.sent_texts == [] and passive.closed is None
+    assert manager.heartbeats_sent >= answered
+    await asyncio.gather(*manager._close_tasks)
+
+    # The task stops once no connection is on the heartbeat
+    manager.disconnect(responsive)
+    await asyncio.wait_for(manager._heartbeat_task, timeout=1)
+
+
+@pytest.mark.asyncio
+async def test_any_frame_counts_as_heartbeat_activity(monkeypatch):
+    monkeypatch.setattr("common.socket.logger", DummyLogger())
+    manager = ConnectionManager(heartbeat_interval=0.01, heartbeat_timeout=0.03)
+    websocket = FakeWebSocket()
+    manager.active_connections = [websocket]
+    await manager.handle_control_frame(websocket, '{"action": "heartbeat"}')
+
+    for _ in range(8):
+        await asyncio.sleep(0.01)
+        # Not a control frame, but the client is evidently alive
+        assert await manager.handle_control_frame(websocket, "ping") is False
+
+    assert websocket in manager.active_connections
+    assert manager.evictions == {}
+    manager.disconnect(websocket)
+    await manager._heartbeat_task
+
+
+@pytest.mark.asyncio
+async def test_heartbeat_can_be_disabled():
+    manager = ConnectionManager(heartbeat_interval=None)
+    websocket = FakeWebSocket()
+    manager.active_connections = [websocket]
+
+    assert await manager.handle_control_frame(websocket, '{"action": "heartbeat"}') is False
+    assert manager._heartbeat_task is None
+
+
+@pytest.mark.asyncio
+async def test_evictions_are_counted_by_reason(monkeypatch):
+    monkeypatch.setattr("common.socket.logger", DummyLogger())
+    manager = ConnectionManager(queue_size=1, overflow_policy=OverflowPolicy.DISCONNECT)
+    websocket = FakeWebSocket()
+    manager.active_connections = [websocket]
+
+    # The writer has not run yet, so the second message overflows the queue
+    await manager.broadcast_server({"seq": 0}, "notification")
+    await manager.broadcast_server({"seq": 1}, "notification")
+
+    assert manager.evictions == {"Send queue full": 1}
+    await asyncio.gather(*manager._close_tasks)
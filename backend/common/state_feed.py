@@ -0,0 +1,150 @@
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from fastapi import WebSocket
+
+from common.send_queue import encode_frame
+from common.socket import ConnectionManager
+
+# ---------------------------------------------------------------------------
+# Versioned state feeds
+#
+# Some channels publish successive versions of one state document (the
+# worldline status) rather than independent events, and most of the
+# document is unchanged from one version to the next. A
+# ``StateFeedConnectionManager`` numbers the versions and can send each
+# client only the fields that changed:
+#
+#   1. After authenticating, a client sends ``{"action": "resync"}``. It is
+#      answered with the full state as a ``state_type`` message carrying
+#      ``seq``, and is switched to deltas.
+#   2. Each later version reaches it as a ``delta_type`` message:
+#      ``{"seq": n, "base_seq": n - 1, "changes": {...}, "removed": [...]}``
+#      Applying it to version ``base_seq`` gives version ``seq``.
+#   3. A client ignores a message with ``seq`` not above its own. If a
+#      delta's ``base_seq`` is not its ``seq``, a message was dropped (e.g.
+#      a full send queue); the client sends ``resync`` again.
+#
+# Clients that never send ``resync`` keep receiving the full document on
+# every version, with ``seq`` added. So do delta clients that subscribed to
+# topics: they skip the versions outside their topics, and every delta
+# would leave them with a gap.
+#
+# Sequence numbers are per worker. With a backplane, workers relay the
+# state itself, and each derives its own versions and deltas for the
+# clients it holds.
+# ---------------------------------------------------------------------------
+
+StateLoader = Callable[[], Awaitable[Dict[str, Any]]]
+
+
+def diff_state(previous: Dict[str, Any], current: Dict[str, Any]) -> Tuple[Dict[str, Any], List[str]]:
+    """Fields of ``current`` that differ from ``previous``, and the keys it dropped."""
+    changes = {key: value for key, value in current.items() if key not in previous or previous[key] != value}
+    removed = [key for key in previous if key not in current]
+    return changes, removed
+
+
+class StateFeedConnectionManager(ConnectionManager):
+    """Connection manager that publishes a versioned state, as deltas where possible.
+
+    Args:
+        state_type: Message type of full-state messages
+        delta_type: Message type of delta messages
+        state_loader: Loads the current state when a client resyncs before
+            anything was published
+        **kwargs: Passed to ``ConnectionManager``
+    """
+
+    def __init__(
+        self,
+        *args,
+        state_type: str,
+        delta_type: str,
+        state_loader: Optional[StateLoader] = None,
+        **kwargs,
+    ):
+        super().__init__(*args, **kwargs)
+        self.state_type = state_type
+        self.delta_type = delta_type
+        self.state_loader = state_loader
+        self.seq = 0
+        self._state: Optional[Dict[str, Any]] = None
+        self._state_username = "SERVER"
+        # Connections that asked for deltas.
+        self._delta_clients: Dict[WebSocket, None] = {}
+
+    async def publish_state(
+        self,
+        state: Dict[str, Any],
+        username: str = "SERVER",
+        topics: Optional[List[str]] = None,
+    ) -> int:
+        """Publish a new version of the state to this and the other workers.
+
+        Args:
+            state: The complete new state
+            username: Shown as the sender of the update
+            topics: Topics of the event behind this version, as for
+                ``broadcast_server``
+
+        Returns:
+            This worker's sequence number of the new version
+        """
+        seq = self._deliver_state(state, username, topics)
+        await self._publish({"kind": "state", "state": state, "username": username, "topics": topics})
+        return seq
+
+    def _deliver_state(self, state: Dict[str, Any], username: str, topics: Optional[List[str]]) -> int:
+        previous = self._state
+        self._state, self._state_username = state, username
+        self.seq += 1
+
+        full_frame = encode_frame(self._snapshot_message())
+        delta_frame = None
+        for connection in self.active_connections.select(topics=topics):
+            if connection not in self._delta_clients or self.active_connections.subscriptions(connection):
+                self._enqueue(connection, full_frame, self.state_type)
+                continue
+            if delta_frame is None:
+                # Encoded once, and only if a delta client is in the audience.
+                changes, removed = diff_state(previous or {}, state)
+                delta_frame = encode_frame(self._server_message(
+                    {"seq": self.seq, "base_seq": self.seq - 1, "changes": changes, "removed": removed},
+                    self.delta_type,
+                    username,
+                ))
+            self._enqueue(connection, delta_frame, self.delta_type)
+        return self.seq
+
+    def _snapshot_message(self) -> Dict[str, Any]:
+        return self._server_message({**self._state, "seq": self.seq}, self.state_type, self._state_username)
+
+    async def _handle_control_action(self, websocket: WebSocket, action: str, frame: dict) -> bool:
+        if action != "resync":
+            return await super()._handle_control_action(websocket, action, frame)
+
+        if self._state is None:
+            if self.state_loader is None:
+                await self.send_server({"detail": "No state has been published yet"}, "error", websocket)
+                return True
+            state = await self.state_loader()
+            # A version may have been published while loading.
+            if self._state is None:
+                self._state = state
+                self.seq += 1
+        self._delta_clients[websocket] = None
+        # Queued behind the frames already on their way to this client, so
+        # the writer delivers everything in ``seq`` order. Under
+        # ``COALESCE_LATEST`` it replaces a queued full update it supersedes.
+        self._enqueue(websocket, encode_frame(self._snapshot_message()), self.state_type)
+        return True
+
+    def disconnect(self, websocket: WebSocket):
+        super().disconnect(websocket)
+        self._delta_clients.pop(websocket, None)
+
+    def _deliver_remote(self, payload: dict) -> None:
+        if payload.get("kind") == "state":
+            self._deliver_state(payload["state"], payload["username"], payload.get("topics"))
+        else:
+            super()._deliver_remote(payload)
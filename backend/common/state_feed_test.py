@@ -0,0 +1,236 @@
+import asyncio
+import json
+
+import pytest
+
+from common.backplane import InMemoryBackplane, InMemoryBroker
+from common.send_queue import OverflowPolicy
+from common.state_feed import StateFeedConnectionManager, diff_state
+from common.socket_test import DummyLogger, FakeWebSocket, GatedWebSocket
+
+RESYNC = '{"action": "resync"}'
+
+
+@pytest.fixture(autouse=True)
+def quiet_logger(monkeypatch):
+    monkeypatch.setattr("common.socket.logger", DummyLogger())
+
+
+def _manager(**kwargs):
+    return StateFeedConnectionManager(
+        state_type="worldline_update",
+        delta_type="worldline_delta",
+        overflow_policy=OverflowPolicy.COALESCE_LATEST,
+        **kwargs,
+    )
+
+
+def _status(worldline, **extra):
+    return {
+        "current_worldline": worldline,
+        "base_worldline": 1.0,
+        "closest_reading": {"value": 1.048596, "status": "steins_gate", "notes": "El Psy Kongroo " * 20},
+        "experiment_count": 7,
+        **extra,
+    }
+
+
+class DeltaClient:
+    """Applies the feed protocol the way a browser client would."""
+
+    def __init__(self, websocket):
+        self.websocket = websocket
+        self.state = None
+        self.seq = 0
+        self.resyncs_needed = 0
+        self._seen = 0
+
+    def apply_received(self):
+        messages = self.websocket.text_jsons[self._seen:]
+        self._seen += len(messages)
+        for message in messages:
+            if message["seq"] <= self.seq:
+                continue
+            if message["type"] == "worldline_update":
+                self.state = {k: v for k, v in message.items() if k not in ("seq", "type", "username", "timestamp", "server_initiated")}
+            elif message["base_seq"] != self.seq:
+                self.resyncs_needed += 1
+                continue
+            else:
+                self.state.update(message["changes"])
+                for key in message["removed"]:
+                    del self.state[key]
+            self.seq = message["seq"]
+
+
+def test_diff_state():
+    assert diff_state({"a": 1, "b": {"x": 1}, "c": 3}, {"a": 1, "b": {"x": 2}, "d": 4}) == (
+        {"b": {"x": 2}, "d": 4},
+        ["c"],
+    )
+
+
+@pytest.mark.asyncio
+async def test_delta_clients_rebuild_the_state_from_snapshot_and_deltas():
+    manager = _manager()
+    legacy, websocket = FakeWebSocket(), FakeWebSocket()
+    manager.active_connections = [legacy, websocket]
+    await manager.publish_state(_status(1.0))
+    await manager.flush()
+
+    assert await manager.handle_control_frame(websocket, RESYNC) is True
+    await manager.flush()
+    client = DeltaClient(websocket)
+    client.apply_received()
+    assert (client.seq, client.state) == (1, _status(1.0))
+
+    await manager.publish_state(_status(1.1, message="New experiment", includes_preview=True))
+    await manager.flush()
+    await manager.publish_state(_status(1.2))
+    await manager.flush()
+    client.apply_received()
+
+    assert (client.seq, client.state) == (3, _status(1.2))
+    assert client.resyncs_needed == 0
+    # Version 1 was sent before the resync, as a full update, then again
+    # as the resync snapshot.
+    queued = websocket.text_jsons
+    assert [(m["type"], m["seq"]) for m in queued] == [
+        ("worldline_update", 1), ("worldline_update", 1), ("worldline_delta", 2), ("worldline_delta", 3),
+    ]
+    assert queued[3]["changes"] == {"current_worldline": 1.2}
+    assert sorted(queued[3]["removed"]) == ["includes_preview", "message"]
+    # Clients that never resynced still get the full state, now numbered.
+    assert [(m["type"], m["seq"], m["current_worldline"]) for m in legacy.text_jsons] == [
+        ("worldline_update", 1, 1.0), ("worldline_update", 2, 1.1), ("worldline_update", 3, 1.2),
+    ]
+    # The point of the exercise: a delta is much smaller than the full state.
+    assert len(websocket.sent_texts[3]) * 2 < len(legacy.sent_texts[2])
+
+
+@pytest.mark.asyncio
+async def test_resync_before_any_publish_loads_the_state():
+    async def load():
+        return _status(1.048596)
+
+    manager = _manager(state_loader=load)
+    websocket = FakeWebSocket()
+    manager.active_connections = [websocket]
+
+    await manager.handle_control_frame(websocket, RESYNC)
+    await manager.flush()
+
+    assert websocket.text_jsons[0]["seq"] == 1
+    assert websocket.text_jsons[0]["current_worldline"] == 1.048596
+
+    without_loader = _manager()
+    without_loader.active_connections = [websocket]
+    await without_loader.handle_control_frame(websocket, RESYNC)
+    assert websocket.sent_jsons[-1]["type"] == "error"
+
+
+@pytest.mark.asyncio
+async def test_resync_snapshot_is_queued_in_order_with_updates():
+    manager = _manager()
+    gate = asyncio.Event()
+    websocket = GatedWebSocket(gate)
+    manager.active_connections = [websocket]
+    client = DeltaClient(websocket)
+
+    await manager.publish_state(_status(1.0))
+    # Let the writer take version 1 and block on the peer.
+    await asyncio.sleep(0)
+    await manager.handle_control_frame(websocket, RESYNC)
+    await manager.publish_state(_status(1.1))
+    await manager.publish_state(_status(1.2))
+    # A second resync while the first snapshot is still queued replaces it.
+    await manager.handle_control_frame(websocket, RESYNC)
+    await manager.publish_state(_status(1.3))
+
+    # Nothing bypassed the writer while it was blocked.
+    assert websocket.sent_texts == [] and websocket.sent_jsons == []
+    assert len(manager._send_queues[websocket]) == 4
+    gate.set()
+    await manager.flush()
+
+    assert [(m["type"], m["seq"]) for m in websocket.text_jsons] == [
+        ("worldline_update", 1),
+        ("worldline_update", 3),
+        ("worldline_delta", 2),
+        ("worldline_delta", 3),
+        ("worldline_delta", 4),
+    ]
+    client.apply_received()
+    assert (client.seq, client.state, client.resyncs_needed) == (4, _status(1.3), 0)
+
+
+@pytest.mark.asyncio
+async def test_topic_subscribers_get_full_state_and_resync_recovers_a_gap():
+    manager = _manager()
+    filtered, websocket = FakeWebSocket(), FakeWebSocket()
+    manager.active_connections = [filtered, websocket]
+    await manager.publish_state(_status(1.0))
+    for client in (filtered, websocket):
+        await manager.handle_control_frame(client, RESYNC)
+    manager.active_connections.subscribe(filtered, ["experiment:EXP-001"])
+    client = DeltaClient(websocket)
+
+    await manager.publish_state(_status(1.1), topics=["experiment:EXP-002"])
+    await manager.publish_state(_status(1.2), topics=["experiment:EXP-001"])
+    await manager.flush()
+
+    # The filtered client skipped version 2 and got version 3 whole.
+    assert [(m["type"], m["seq"]) for m in filtered.text_jsons] == [("worldline_update", 3)]
+
+    # Lose a delta, as an overflowing send queue would. (The first frame
+    # is the resync snapshot of version 1, which replaced the full update
+    # still queued from the first publish.)
+    assert [(m["type"], m["seq"]) for m in websocket.text_jsons] == [
+        ("worldline_update", 1), ("worldline_delta", 2), ("worldline_delta", 3),
+    ]
+    websocket.sent_texts.pop(1)
+    client.apply_received()
+    assert client.resyncs_needed == 1
+    await manager.handle_control_frame(websocket, RESYNC)
+    await manager.flush()
+    client.apply_received()
+    assert (client.seq, client.state) == (3, _status(1.2))
+
+
+@pytest.mark.asyncio
+async def test_each_worker_numbers_relayed_versions_itself():
+    broker = InMemoryBroker()
+    workers = []
+    for node in ("a", "b"):
+        manager = _manager()
+        manager.attach_backplane(InMemoryBackplane(broker, node_id=node), "worldline")
+        workers.append(manager)
+    websocket = FakeWebSocket()
+    workers[1].active_connections = [websocket]
+
+    # Worker a has history from before worker b joined.
+    await workers[0].backplane.start()
+    for worldline in (0.9, 0.95, 0.99):
+        await workers[0].publish_state(_status(worldline))
+    await workers[1].backplane.start()
+    await workers[1].publish_state(_status(1.0))
+    await workers[1].handle_control_frame(websocket, RESYNC)
+    await workers[0].publish_state(_status(1.3))
+    await workers[1].flush()
+
+    delta = json.loads(websocket.sent_texts[-1])
+    assert (delta["seq"], delta["base_seq"], delta["changes"]) == (2, 1, {"current_worldline": 1.3})
+    assert workers[0].seq == 5
+
+
+@pytest.mark.asyncio
+async def test_disconnect_forgets_delta_clients():
+    manager = _manager()
+    websocket = FakeWebSocket()
+    manager.active_connections = [websocket]
+    await manager.publish_state(_status(1.0))
+    await manager.handle_control_frame(websocket, RESYNC)
+
+    manager.disconnect(websocket)
+
+    assert websocket not in manager._delta_clients
@@ -0,0 +1,165 @@
+from os import environ as os_environ
+from typing import Callable, Iterable, Optional, Tuple
+import random
+import time
+
+from opencensus.ext.fastapi.fastapi_middleware import FastAPIMiddleware
+from opencensus.trace import samplers
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from common.log import logger
+
+# ---------------------------------------------------------------------------
+# Request trace sampling
+#
+# OpenCensus' ``FastAPIMiddleware`` used to trace every request with
+# ``ProbabilitySampler(1.0)``. That included the App Service health probe
+# and every static asset of the SPA. It is a ``BaseHTTPMiddleware``, so
+# even a request its sampler turns down costs an extra task, a body relay
+# and a tracer. ``SampledFastAPIMiddleware`` decides first, from the path
+# alone, and hands an unsampled request straight to the app. Only sampled
+# requests reach the OpenCensus code, and they are always traced.
+#
+# A request is traced when:
+#
+#   1. its path starts with one of TRACE_INCLUDE_PATHS (default: the API
+#      routers; the SPA assets served by ``frontend_handler`` are not),
+#   2. and with none of TRACE_EXCLUDE_PATHS (default: the health probe),
+#   3. and it wins a TRACE_SAMPLE_RATE draw (default 1.0, i.e. always),
+#   4. and fewer than TRACE_MAX_PER_SECOND requests were traced recently
+#      (token bucket; default 0, i.e. no limit).
+#
+# Path lists are comma-separated prefixes. An empty TRACE_INCLUDE_PATHS
+# includes every path.
+# ---------------------------------------------------------------------------
+
+TRACE_INCLUDE_PATHS_ENV = "TRACE_INCLUDE_PATHS"
+TRACE_EXCLUDE_PATHS_ENV = "TRACE_EXCLUDE_PATHS"
+TRACE_SAMPLE_RATE_ENV = "TRACE_SAMPLE_RATE"
+TRACE_MAX_PER_SECOND_ENV = "TRACE_MAX_PER_SECOND"
+
+DEFAULT_TRACE_INCLUDE_PATHS = ("/api/", "/future-gadget-lab/")
+DEFAULT_TRACE_EXCLUDE_PATHS = ("/health",)
+DEFAULT_TRACE_SAMPLE_RATE = 1.0
+DEFAULT_TRACE_MAX_PER_SECOND = 0.0
+
+
+class TokenBucket:
+    """Allows ``rate`` events per second on average, in bursts of up to ``burst``.
+
+    Args:
+        rate: Refill rate, in tokens per second
+        burst: Bucket size (default: ``rate``, at least 1)
+        clock: Monotonic clock, in seconds
+    """
+
+    def __init__(self, rate: float, burst: Optional[float] = None, clock: Callable[[], float] = time.monotonic):
+        self.rate = rate
+        self.burst = max(1.0, burst if burst is not None else rate)
+        self._clock = clock
+        self._tokens = self.burst
+        self._updated = clock()
+
+    def take(self) -> bool:
+        """Take a token; False if the bucket is empty."""
+        now = self._clock()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        if self._tokens < 1.0:
+            return False
+        self._tokens -= 1.0
+        return True
+
+
+class TraceSamplingPolicy:
+    """Decides from a request path whether the request is traced.
+
+    Args:
+        include_paths: Path prefixes eligible for tracing; empty for all
+        exclude_paths: Path prefixes never traced
+        sample_rate: Probability of tracing an eligible request
+        max_per_second: Rate limit on traced requests; 0 for none
+        rng: Returns a float in [0, 1) (default ``random.random``)
+        clock: Monotonic clock for the rate limit, in seconds
+    """
+
+    def __init__(
+        self,
+        include_paths: Iterable[str] = DEFAULT_TRACE_INCLUDE_PATHS,
+        exclude_paths: Iterable[str] = DEFAULT_TRACE_EXCLUDE_PATHS,
+        sample_rate: float = DEFAULT_TRACE_SAMPLE_RATE,
+        max_per_second: float = DEFAULT_TRACE_MAX_PER_SECOND,
+        rng: Callable[[], float] = random.random,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        # Tuples, for ``str.startswith``
+        self.include_paths: Tuple[str, ...] = tuple(include_paths)
+        self.exclude_paths: Tuple[str, ...] = tuple(exclude_paths)
+        self.sample_rate = min(1.0, max(0.0, sample_rate))
+        self.max_per_second = max(0.0, max_per_second)
+        self._rng = rng
+        self._bucket = TokenBucket(self.max_per_second, clock=clock) if self.max_per_second else None
+
+    def should_trace(self, path: str) -> bool:
+        if self.include_paths and not path.startswith(self.include_paths):
+            return False
+        if self.exclude_paths and path.startswith(self.exclude_paths):
+            return False
+        if self.sample_rate < 1.0 and self._rng() >= self.sample_rate:
+            return False
+        return self._bucket is None or self._bucket.take()
+
+
+def _paths_from_env(name: str, default: Tuple[str, ...]) -> Tuple[str, ...]:
+    raw = os_environ.get(name)
+    if raw is None:
+        return default
+    return tuple(path.strip() for path in raw.split(",") if path.strip())
+
+
+def _float_from_env(name: str, default: float) -> float:
+    raw = os_environ.get(name, "").strip()
+    try:
+        return float(raw) if raw else default
+    except ValueError:
+        logger.warning(f"Ignoring invalid {name} value '{raw}'; using {default}")
+        return default
+
+
+def trace_sampling_policy_from_env() -> TraceSamplingPolicy:
+    """Create the sampling policy configured by the ``TRACE_*`` variables."""
+    return TraceSamplingPolicy(
+        include_paths=_paths_from_env(TRACE_INCLUDE_PATHS_ENV, DEFAULT_TRACE_INCLUDE_PATHS),
+        exclude_paths=_paths_from_env(TRACE_EXCLUDE_PATHS_ENV, DEFAULT_TRACE_EXCLUDE_PATHS),
+        sample_rate=_float_from_env(TRACE_SAMPLE_RATE_ENV, DEFAULT_TRACE_SAMPLE_RATE),
+        max_per_second=_float_from_env(TRACE_MAX_PER_SECOND_ENV, DEFAULT_TRACE_MAX_PER_SECOND),
+    )
+
+
+class SampledFastAPIMiddleware(FastAPIMiddleware):
+    """OpenCensus request tracing for the requests a ``TraceSamplingPolicy`` selects.
+
+    Args:
+        app: The ASGI app
+        policy: Selects the traced requests (default: from the environment)
+        **kwargs: Passed to ``FastAPIMiddleware`` (e.g. ``exporter``); the
+            sampler is always-on, the policy has already decided
+    """
+
+    def __init__(self, app: ASGIApp, policy: Optional[TraceSamplingPolicy] = None, **kwargs):
+        super().__init__(app, sampler=samplers.AlwaysOnSampler(), **kwargs)
+        self.policy = policy if policy is not None else trace_sampling_policy_from_env()
+        self.traced = 0
+        self.skipped = 0
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        if not self.policy.should_trace(scope["path"]):
+            # No tracer, span or request wrapper
+            self.skipped += 1
+            await self.app(scope, receive, send)
+            return
+        self.traced += 1
+        await super().__call__(scope, receive, send)
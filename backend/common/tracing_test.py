@@ -0,0 +1,167 @@
+from unittest.mock import patch
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from common.tracing import (
+    SampledFastAPIMiddleware,
+    TokenBucket,
+    TraceSamplingPolicy,
+    trace_sampling_policy_from_env,
+)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class RecordingExporter:
+    def __init__(self):
+        self.spans = []
+
+    def export(self, span_datas):
+        self.spans.extend(span_datas)
+
+
+def _unlimited(**kwargs):
+    return TraceSamplingPolicy(max_per_second=0, **kwargs)
+
+
+@pytest.mark.parametrize("path, traced", [
+    ("/api/user-data", True),
+    ("/future-gadget-lab/lab-experiments", True),
+    ("/health", False),
+    ("/", False),
+    ("/index.html", False),
+    ("/assets/index-abc123.js", False),
+])
+def test_default_policy_traces_only_api_routes(path, traced):
+    assert _unlimited().should_trace(path) is traced
+
+
+def test_exclude_list_wins_over_include_list():
+    policy = _unlimited(include_paths=(), exclude_paths=("/health", "/assets/"))
+
+    assert policy.should_trace("/") is True
+    assert policy.should_trace("/health") is False
+    assert policy.should_trace("/assets/app.js") is False
+
+
+def test_sample_rate_draws_per_request():
+    draws = iter([0.05, 0.25, 0.5, 0.24])
+    policy = _unlimited(sample_rate=0.25, rng=lambda: next(draws))
+
+    assert [policy.should_trace("/api/x") for _ in range(4)] == [True, False, False, True]
+
+
+def test_excluded_paths_do_not_consume_draws_or_tokens():
+    def fail():
+        raise AssertionError("drew for an excluded path")
+
+    clock = FakeClock()
+    policy = TraceSamplingPolicy(sample_rate=0.5, max_per_second=1, rng=fail, clock=clock)
+
+    assert policy.should_trace("/health") is False
+    assert policy._bucket._tokens == 1.0
+
+
+def test_rate_limit_caps_traced_requests_per_second():
+    clock = FakeClock()
+    policy = TraceSamplingPolicy(max_per_second=2, clock=clock)
+
+    assert [policy.should_trace("/api/x") for _ in range(5)] == [True, True, False, False, False]
+    clock.now = 0.5
+    assert [policy.should_trace("/api/x") for _ in range(2)] == [True, False]
+    clock.now = 10.0
+    assert [policy.should_trace("/api/x") for _ in range(3)] == [True, True, False]
+
+
+def test_token_bucket_allows_one_event_below_one_per_second():
+    clock = FakeClock()
+    bucket = TokenBucket(0.5, clock=clock)
+
+    assert bucket.take() is True
+    assert bucket.take() is False
+    clock.now = 2.0
+    assert bucket.take() is True
+
+
+def test_policy_from_env(monkeypatch):
+    monkeypatch.setenv("TRACE_INCLUDE_PATHS", "")
+    monkeypatch.setenv("TRACE_EXCLUDE_PATHS", " /health , /assets/ ")
+    monkeypatch.setenv("TRACE_SAMPLE_RATE", "0.1")
+    monkeypatch.setenv("TRACE_MAX_PER_SECOND", "5")
+
+    policy = trace_sampling_policy_from_env()
+
+    assert policy.include_paths == ()
+    assert policy.exclude_paths == ("/health", "/assets/")
+    assert policy.sample_rate == 0.1
+    assert policy.max_per_second == 5.0
+    assert policy._bucket is not None
+
+
+def test_policy_from_env_defaults_and_invalid_values(monkeypatch):
+    for name in ("TRACE_INCLUDE_PATHS", "TRACE_EXCLUDE_PATHS"):
+        monkeypatch.delenv(name, raising=False)
+    monkeypatch.setenv("TRACE_SAMPLE_RATE", "often")
+    monkeypatch.setenv("TRACE_MAX_PER_SECOND", "")
+
+    with patch("common.tracing.logger") as mock_logger:
+        policy = trace_sampling_policy_from_env()
+
+    assert policy.include_paths == ("/api/", "/future-gadget-lab/")
+    assert policy.exclude_paths == ("/health",)
+    assert policy.sample_rate == 1.0
+    # Unset means no rate limit.
+    assert policy.max_per_second == 0.0
+    assert policy._bucket is None
+    mock_logger.warning.assert_called_once()
+
+
+def _traced_app(policy):
+    exporter = RecordingExporter()
+    app = FastAPI()
+
+    @app.get("/health")
+    async def health():
+        return {"status": "ok"}
+
+    @app.get("/api/user-data")
+    async def user_data():
+        return {"data": "El Psy Kongroo"}
+
+    app.add_middleware(SampledFastAPIMiddleware, exporter=exporter, policy=policy)
+    return app, exporter
+
+
+def test_only_sampled_requests_are_traced():
+    app, exporter = _traced_app(_unlimited())
+
+    with TestClient(app) as client:
+        assert client.get("/health").json() == {"status": "ok"}
+        assert client.get("/api/user-data").status_code == 200
+
+    assert len(exporter.spans) == 1
+    assert exporter.spans[0].attributes["http.route"] == "/api/user-data"
+    middleware = app.middleware_stack
+    while not isinstance(middleware, SampledFastAPIMiddleware):
+        middleware = middleware.app
+    assert (middleware.traced, middleware.skipped) == (1, 1)
+
+
+def test_unsampled_requests_create_no_tracer():
+    """Requests the policy turns down never reach OpenCensus"""
+    app, exporter = _traced_app(_unlimited(sample_rate=0.0))
+
+    with patch("opencensus.trace.tracer.Tracer") as tracer, TestClient(app) as client:
+        for _ in range(3):
+            assert client.get("/api/user-data").status_code == 200
+
+    tracer.assert_not_called()
+    assert exporter.spans == []
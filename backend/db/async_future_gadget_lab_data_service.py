@@ -0,0 +1,633 @@
+"""Awaitable data services for the Future Gadget Lab.
+
+The route handlers in ``api/future_gadget_api.py`` are ``async def`` and run
+on the event loop, but ``FutureGadgetLabDataService`` drives the synchronous
+``azure.cosmos`` client. Calling it inline meant one slow Cosmos round trip
+stalled every WebSocket and HTTP request served by that worker. The routes
+now ``await`` one of the two services in this module instead:
+
+- ``ThreadPoolFutureGadgetLabDataService`` runs the synchronous service on a
+  bounded thread pool. Used for the TinyDB mock and as the fallback.
+- ``AsyncFutureGadgetLabDataService`` talks to Cosmos natively through
+  ``azure.cosmos.aio`` with one long-lived, pooled client per worker. It is
+  opened and closed by the ``main.py`` lifespan hook.
+"""
+
+import asyncio
+import functools
+import itertools
+import os
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional, Tuple
+
+from db.future_gadget_lab_data_service import (
+    CosmosHttpResponseError,
+    CosmosResourceNotFoundError,
+    FilterPredicate,
+    FutureGadgetLabDataService,
+    InvalidContinuationTokenError,
+    _DEFAULT_PARTITION_KEY_PATH,
+    _FutureGadgetLabPayloadMixin,
+    _build_cosmos_query,
+    _decode_continuation,
+    _encode_continuation,
+    _validate_cosmos_query_inputs,
+)
+from db.divergence_reading_index import DivergenceReadingIndex
+from db.worldline_aggregate import WorldlineAggregate
+from common.log import logger
+
+try:  # pragma: no cover - optional dependency import
+    import aiohttp  # type: ignore[import-error]
+    from azure.core.pipeline.transport import AioHttpTransport  # type: ignore[import-error]
+    from azure.cosmos.aio import CosmosClient as AsyncCosmosClient  # type: ignore[import-error]
+    from azure.identity.aio import DefaultAzureCredential as AsyncDefaultAzureCredential  # type: ignore[import-error]
+except ImportError:  # pragma: no cover - optional dependency import
+    aiohttp = None
+    AioHttpTransport = None
+    AsyncCosmosClient = None
+    AsyncDefaultAzureCredential = None
+
+# Upper bound on concurrent blocking data-service calls per worker. Each slot
+# is one thread in the executor below; excess calls queue in the executor
+# rather than on the event loop.
+FGL_DB_MAX_WORKERS_ENV = "FGL_DB_MAX_WORKERS"
+DEFAULT_FGL_DB_MAX_WORKERS = 8
+
+# Items pulled from a synchronous ``iter_*`` iterator per executor hop when
+# streaming through ``ThreadPoolFutureGadgetLabDataService``; matches the
+# default Cosmos page size, so one hop usually costs at most one round trip.
+FGL_STREAM_BATCH_SIZE = 100
+
+# HTTP connection pool limits for the native asyncio Cosmos client (aiohttp
+# ``TCPConnector`` ``limit`` / ``limit_per_host``). 0 means "no limit", as in
+# aiohttp.
+FGL_COSMOS_CONNECTION_LIMIT_ENV = "FGL_COSMOS_CONNECTION_LIMIT"
+DEFAULT_FGL_COSMOS_CONNECTION_LIMIT = 100
+FGL_COSMOS_CONNECTION_LIMIT_PER_HOST_ENV = "FGL_COSMOS_CONNECTION_LIMIT_PER_HOST"
+DEFAULT_FGL_COSMOS_CONNECTION_LIMIT_PER_HOST = 0
+
+
+def _int_from_env(name: str, default: int, minimum: int) -> int:
+    raw = os.environ.get(name, "").strip()
+    try:
+        value = int(raw) if raw else default
+    except ValueError:
+        value = default
+    return max(minimum, value)
+
+
+def _next_batch(iterator: Iterator[Dict], size: int) -> List[Dict]:
+    return list(itertools.islice(iterator, size))
+
+
+def fgl_db_max_workers() -> int:
+    """Read the executor size from ``FGL_DB_MAX_WORKERS`` (default 8, minimum 1)."""
+    return _int_from_env(FGL_DB_MAX_WORKERS_ENV, DEFAULT_FGL_DB_MAX_WORKERS, 1)
+
+
+def fgl_cosmos_connection_limits() -> Dict[str, int]:
+    """Read the aiohttp pool limits for the native Cosmos client from the environment."""
+    return {
+        "connection_limit": _int_from_env(
+            FGL_COSMOS_CONNECTION_LIMIT_ENV, DEFAULT_FGL_COSMOS_CONNECTION_LIMIT, 0
+        ),
+        "connection_limit_per_host": _int_from_env(
+            FGL_COSMOS_CONNECTION_LIMIT_PER_HOST_ENV, DEFAULT_FGL_COSMOS_CONNECTION_LIMIT_PER_HOST, 0
+        ),
+    }
+
+
+class ThreadPoolFutureGadgetLabDataService:
+    """Run the synchronous data service on a bounded thread pool.
+
+    Every CRUD method of ``FutureGadgetLabDataService`` is mirrored as a
+    coroutine that hands the blocking call to a dedicated
+    ``ThreadPoolExecutor``, so the event loop keeps serving other requests
+    while Cosmos answers.
+
+    Args:
+        service_provider: Zero-argument callable returning the service to
+            call. It is resolved on every call, so the facade follows the
+            module-level ``fgl_service`` in ``api/future_gadget_api.py`` even
+            when that name is rebound (tests patch it).
+        max_workers: Maximum number of concurrent blocking calls. Use 1 for
+            backends that are not thread-safe (the in-memory TinyDB mock).
+    """
+
+    def __init__(
+        self,
+        service_provider: Callable[[], FutureGadgetLabDataService],
+        max_workers: Optional[int] = None,
+    ) -> None:
+        self._service_provider = service_provider
+        self.max_workers = max_workers if max_workers is not None else fgl_db_max_workers()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._executor_lock = threading.Lock()
+
+    @property
+    def service(self) -> FutureGadgetLabDataService:
+        return self._service_provider()
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        # Created lazily (and re-created after ``shutdown``) so an app whose
+        # lifespan is entered several times, as in the test suite, keeps
+        # working.
+        if self._executor is None:
+            with self._executor_lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=self.max_workers,
+                        thread_name_prefix="fgl-db",
+                    )
+        return self._executor
+
+    async def _run(self, method_name: str, *args: Any) -> Any:
+        method = getattr(self._service_provider(), method_name)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._get_executor(), functools.partial(method, *args))
+
+    async def _drain(self, iterator: Iterator[Dict]) -> AsyncIterator[Dict]:
+        # Advance the blocking iterator on the executor, a batch at a time.
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await loop.run_in_executor(self._get_executor(), _next_batch, iterator, FGL_STREAM_BATCH_SIZE)
+            if not batch:
+                return
+            for item in batch:
+                yield item
+
+    def shutdown(self, wait: bool = True) -> None:
+        """Stop the executor; the next call starts a fresh one."""
+        with self._executor_lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait)
+
+    # ----- EXPERIMENT CRUD OPERATIONS -----
+
+    async def get_all_experiments(self) -> List[Dict]:
+        return await self._run("get_all_experiments")
+
+    async def get_experiment_by_id(self, experiment_id: str) -> Optional[Dict]:
+        return await self._run("get_experiment_by_id", experiment_id)
+
+    async def search_experiments(self, query_params: Dict) -> List[Dict]:
+        return await self._run("search_experiments", query_params)
+
+    async def iter_experiments(self, query_params: Optional[Dict] = None) -> AsyncIterator[Dict]:
+        return self._drain(await self._run("iter_experiments", query_params))
+
+    async def get_experiments_page(
+        self,
+        limit: int,
+        continuation: Optional[str] = None,
+        query_params: Optional[Dict] = None,
+    ) -> Tuple[List[Dict], Optional[str]]:
+        return await self._run("get_experiments_page", limit, continuation, query_params)
+
+    async def create_experiment(self, experiment_data: Dict) -> Dict:
+        return await self._run("create_experiment", experiment_data)
+
+    async def update_experiment(self, experiment_id: str, experiment_data: Dict) -> Optional[Dict]:
+        return await self._run("update_experiment", experiment_id, experiment_data)
+
+    async def delete_experiment(self, experiment_id: str) -> bool:
+        return await self._run("delete_experiment", experiment_id)
+
+    # ----- WORLDLINE STATUS -----
+
+    async def get_worldline_status(self, preview_experiment: Optional[Dict] = None) -> Dict:
+        return await self._run("get_worldline_status", preview_experiment)
+
+    # ----- DIVERGENCE METER READINGS CRUD OPERATIONS -----
+
+    async def get_all_divergence_readings(self) -> List[Dict]:
+        return await self._run("get_all_divergence_readings")
+
+    async def search_divergence_readings(self, predicates: List[FilterPredicate]) -> List[Dict]:
+        return await self._run("search_divergence_readings", predicates)
+
+    async def iter_divergence_readings(self, predicates: Optional[List[FilterPredicate]] = None) -> AsyncIterator[Dict]:
+        return self._drain(await self._run("iter_divergence_readings", predicates))
+
+    async def get_divergence_readings_page(
+        self,
+        limit: int,
+        continuation: Optional[str] = None,
+        predicates: Optional[List[FilterPredicate]] = None,
+    ) -> Tuple[List[Dict], Optional[str]]:
+        return await self._run("get_divergence_readings_page", limit, continuation, predicates)
+
+    async def get_divergence_reading_by_id(self, reading_id: str) -> Optional[Dict]:
+        return await self._run("get_divergence_reading_by_id", reading_id)
+
+    async def create_divergence_reading(self, reading_data: Dict) -> Dict:
+        return await self._run("create_divergence_reading", reading_data)
+
+    async def update_divergence_reading(self, reading_id: str, reading_data: Dict) -> Optional[Dict]:
+        return await self._run("update_divergence_reading", reading_id, reading_data)
+
+    async def delete_divergence_reading(self, reading_id: str) -> bool:
+        return await self._run("delete_divergence_reading", reading_id)
+
+    async def get_latest_divergence_reading(self) -> Optional[Dict]:
+        return await self._run("get_latest_divergence_reading")
+
+
+class AsyncFutureGadgetLabDataService(_FutureGadgetLabPayloadMixin):
+    """Native asyncio Cosmos backend built on ``azure.cosmos.aio``.
+
+    Mirrors every CRUD method of ``FutureGadgetLabDataService`` as a
+    coroutine. One instance (and therefore one pooled ``CosmosClient``) is
+    meant to live for the whole worker: ``open()`` it from the FastAPI
+    lifespan startup and ``close()`` it on shutdown. The database and
+    container are expected to exist already; the synchronous service creates
+    them at import time.
+
+    Args:
+        cosmos_account_uri: Cosmos DB account endpoint
+        cosmos_database: Database name
+        cosmos_container: Container name
+        cosmos_partition_key: Partition key path of the container
+        credential: Optional async credential; defaults to the async
+            ``DefaultAzureCredential``, which is then owned and closed here
+        connection_limit: Total connections in the aiohttp pool (0 = unlimited)
+        connection_limit_per_host: Connections per host (0 = unlimited)
+    """
+
+    def __init__(
+        self,
+        cosmos_account_uri: str,
+        cosmos_database: str,
+        cosmos_container: str,
+        cosmos_partition_key: str = _DEFAULT_PARTITION_KEY_PATH,
+        credential: Optional[Any] = None,
+        connection_limit: int = DEFAULT_FGL_COSMOS_CONNECTION_LIMIT,
+        connection_limit_per_host: int = DEFAULT_FGL_COSMOS_CONNECTION_LIMIT_PER_HOST,
+    ) -> None:
+        self.cosmos_account_uri = cosmos_account_uri
+        self.cosmos_database_name = cosmos_database
+        self.cosmos_container_name = cosmos_container
+        self.cosmos_partition_key_path = (
+            cosmos_partition_key if cosmos_partition_key.startswith("/") else f"/{cosmos_partition_key}"
+        )
+        self.connection_limit = connection_limit
+        self.connection_limit_per_host = connection_limit_per_host
+        self._external_credential = credential
+        self._owned_credential = None
+        self.storage_backend = "cosmos"
+        self.divergence_readings_table = None
+        self.cosmos_client = None
+        self.cosmos_container = None
+        self.worldline_aggregate = WorldlineAggregate()
+        self.divergence_index = DivergenceReadingIndex()
+
+    async def open(self) -> "AsyncFutureGadgetLabDataService":
+        """Create the pooled client and resolve the container."""
+        if AsyncCosmosClient is None or aiohttp is None:
+            raise ImportError("azure-cosmos and aiohttp are required for the asyncio Cosmos backend")
+        if self.cosmos_client is not None:
+            return self
+
+        logger.info(
+            "Using Azure Cosmos DB (NoSQL, asyncio) at %s/%s with connection limit %s (per host %s)",
+            self.cosmos_account_uri,
+            self.cosmos_database_name,
+            self.connection_limit,
+            self.connection_limit_per_host,
+        )
+
+        credential = self._external_credential
+        if credential is None:
+            credential = self._owned_credential = AsyncDefaultAzureCredential(
+                exclude_interactive_browser_credential=True
+            )
+
+        session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(
+                limit=self.connection_limit,
+                limit_per_host=self.connection_limit_per_host,
+            )
+        )
+        client = AsyncCosmosClient(
+            self.cosmos_account_uri,
+            credential=credential,
+            transport=AioHttpTransport(session=session, session_owner=True),
+        )
+        try:
+            await client.__aenter__()
+        except Exception:
+            await client.close()
+            raise
+        database = client.get_database_client(self.cosmos_database_name)
+        self.cosmos_container = database.get_container_client(self.cosmos_container_name)
+        self.cosmos_client = client
+        return self
+
+    async def close(self) -> None:
+        """Close the client (and its connection pool) and any owned credential."""
+        client, self.cosmos_client = self.cosmos_client, None
+        self.cosmos_container = None
+        if client is not None:
+            await client.close()
+        credential, self._owned_credential = self._owned_credential, None
+        if credential is not None:
+            await credential.close()
+
+    async def __aenter__(self) -> "AsyncFutureGadgetLabDataService":
+        return await self.open()
+
+    async def __aexit__(self, *exc_info: Any) -> None:
+        await self.close()
+
+    # ----- EXPERIMENT CRUD OPERATIONS -----
+
+    async def get_all_experiments(self) -> List[Dict]:
+        """Get all experiments"""
+        return await self._query_cosmos_items("experiment")
+
+    async def get_experiment_by_id(self, experiment_id: str) -> Optional[Dict]:
+        """Get experiment by ID"""
+        return await self._read_cosmos_item(experiment_id, "experiment")
+
+    async def search_experiments(self, query_params: Dict) -> List[Dict]:
+        """Search experiments based on query parameters"""
+        return await self._query_cosmos_items("experiment", query_params)
+
+    async def iter_experiments(self, query_params: Optional[Dict] = None) -> AsyncIterator[Dict]:
+        """Iterate experiments lazily, one Cosmos page at a time"""
+        return self._iter_cosmos_items("experiment", query_params)
+
+    async def get_experiments_page(
+        self,
+        limit: int,
+        continuation: Optional[str] = None,
+        query_params: Optional[Dict] = None,
+    ) -> Tuple[List[Dict], Optional[str]]:
+        """Get one page of experiments, optionally filtered like ``search_experiments``"""
+        return await self._query_cosmos_page("experiment", limit, continuation, query_params)
+
+    async def create_experiment(self, experiment_data: Dict) -> Dict:
+        """Create a new experiment"""
+        stored = self._prepare_experiment_payload(experiment_data)
+        stored["type"] = "experiment"
+        try:
+            await self._upsert_cosmos_item(stored)
+        except CosmosHttpResponseError as exc:
+            logger.error("Failed to insert experiment into Cosmos: %s", exc)
+            raise
+        self.worldline_aggregate.upsert(stored)
+        return stored
+
+    async def update_experiment(self, experiment_id: str, experiment_data: Dict) -> Optional[Dict]:
+        """Update an existing experiment"""
+        updated = await self._update_cosmos_item(
+            experiment_id,
+            "experiment",
+            self._prepare_experiment_update_payload(experiment_data),
+        )
+        if updated is not None:
+            self.worldline_aggregate.upsert(updated)
+        return updated
+
+    async def delete_experiment(self, experiment_id: str) -> bool:
+        """Delete an experiment"""
+        deleted = await self._delete_cosmos_item(experiment_id, "experiment")
+        if deleted:
+            self.worldline_aggregate.remove(experiment_id)
+        return deleted
+
+    # ----- WORLDLINE STATUS -----
+
+    async def get_worldline_status(self, preview_experiment: Optional[Dict] = None) -> Dict:
+        """Get the current worldline status from the maintained aggregate"""
+        if self.worldline_aggregate.needs_reconcile():
+            version = self.worldline_aggregate.version
+            self.worldline_aggregate.reconcile(await self.get_all_experiments(), since_version=version)
+        if self.divergence_index.needs_reconcile():
+            version = self.divergence_index.version
+            self.divergence_index.reconcile(await self.get_all_divergence_readings(), since_version=version)
+        return self._worldline_status_from_aggregate(preview_experiment)
+
+    # ----- DIVERGENCE METER READINGS CRUD OPERATIONS -----
+
+    async def get_all_divergence_readings(self) -> List[Dict]:
+        """Get all divergence meter readings"""
+        return await self._query_cosmos_items("divergence_reading")
+
+    async def search_divergence_readings(self, predicates: List[FilterPredicate]) -> List[Dict]:
+        """Get the divergence meter readings matching every predicate"""
+        return await self._query_cosmos_items("divergence_reading", predicates=predicates)
+
+    async def iter_divergence_readings(self, predicates: Optional[List[FilterPredicate]] = None) -> AsyncIterator[Dict]:
+        """Iterate divergence meter readings lazily, one Cosmos page at a time"""
+        return self._iter_cosmos_items("divergence_reading", predicates=predicates)
+
+    async def get_divergence_readings_page(
+        self,
+        limit: int,
+        continuation: Optional[str] = None,
+        predicates: Optional[List[FilterPredicate]] = None,
+    ) -> Tuple[List[Dict], Optional[str]]:
+        """Get one page of divergence meter readings, optionally filtered"""
+        return await self._query_cosmos_page("divergence_reading", limit, continuation, predicates=predicates)
+
+    async def get_divergence_reading_by_id(self, reading_id: str) -> Optional[Dict]:
+        """Get divergence reading by ID"""
+        return await self._read_cosmos_item(reading_id, "divergence_reading")
+
+    async def create_divergence_reading(self, reading_data: Dict) -> Dict:
+        """Create a new divergence meter reading"""
+        stored = self._prepare_divergence_payload(reading_data)
+        stored["type"] = "divergence_reading"
+        try:
+            await self._upsert_cosmos_item(stored)
+        except CosmosHttpResponseError as exc:
+            logger.error("Failed to insert divergence reading into Cosmos: %s", exc)
+            raise
+        self.divergence_index.upsert(stored)
+        return stored
+
+    async def update_divergence_reading(self, reading_id: str, reading_data: Dict) -> Optional[Dict]:
+        """Update an existing divergence meter reading"""
+        updated = await self._update_cosmos_item(
+            reading_id,
+            "divergence_reading",
+            self._prepare_divergence_update_payload(reading_data),
+        )
+        if updated is not None:
+            self.divergence_index.upsert(updated)
+        return updated
+
+    async def delete_divergence_reading(self, reading_id: str) -> bool:
+        """Delete a divergence meter reading"""
+        deleted = await self._delete_cosmos_item(reading_id, "divergence_reading")
+        if deleted:
+            self.divergence_index.remove(reading_id)
+        return deleted
+
+    async def get_latest_divergence_reading(self) -> Optional[Dict]:
+        """Get the most recent divergence meter reading"""
+        items = await self._query_cosmos_items(
+            "divergence_reading",
+            order_by="c.timestamp DESC",
+            limit=1,
+        )
+        return items[0] if items else None
+
+    # ----- INTERNAL HELPERS -----
+
+    async def _query_cosmos_items(
+        self,
+        item_type: str,
+        filters: Optional[Dict[str, Any]] = None,
+        order_by: Optional[str] = None,
+        limit: Optional[int] = None,
+        predicates: Optional[List[FilterPredicate]] = None,
+    ) -> List[Dict]:
+        # Same ordering as the sync backend: validate before touching Cosmos.
+        _validate_cosmos_query_inputs(filters or {}, order_by, predicates)
+        if not self.cosmos_container:
+            return []
+
+        query, parameters = _build_cosmos_query(item_type, filters, order_by, limit, predicates)
+        try:
+            return [
+                self._cosmos_clean_item(item)
+                async for item in self.cosmos_container.query_items(query=query, parameters=parameters)
+                if item is not None
+            ]
+        except CosmosHttpResponseError as exc:
+            logger.error("Failed to query Cosmos container: %s", exc)
+            return []
+
+    def _iter_cosmos_items(
+        self,
+        item_type: str,
+        filters: Optional[Dict[str, Any]] = None,
+        predicates: Optional[List[FilterPredicate]] = None,
+    ) -> AsyncIterator[Dict]:
+        filters = filters or {}
+        _validate_cosmos_query_inputs(filters, None, predicates)
+        if not self.cosmos_container:
+            return self._clean_cosmos_stream(None)
+
+        query, parameters = _build_cosmos_query(item_type, filters, predicates=predicates)
+        # The async pager only fetches a page when the previous one is used up.
+        return self._clean_cosmos_stream(self.cosmos_container.query_items(query=query, parameters=parameters))
+
+    async def _clean_cosmos_stream(self, pager: Optional[AsyncIterator[Dict[str, Any]]]) -> AsyncIterator[Dict]:
+        if pager is None:
+            return
+        # As in the sync backend: raised once part of the stream is out.
+        produced = False
+        try:
+            async for item in pager:
+                if item is not None:
+                    produced = True
+                    yield self._cosmos_clean_item(item)
+        except CosmosHttpResponseError as exc:
+            logger.error("Failed to query Cosmos container: %s", exc)
+            if produced:
+                raise
+
+    async def _query_cosmos_page(
+        self,
+        item_type: str,
+        limit: int,
+        continuation: Optional[str] = None,
+        filters: Optional[Dict[str, Any]] = None,
+        predicates: Optional[List[FilterPredicate]] = None,
+    ) -> Tuple[List[Dict], Optional[str]]:
+        filters = filters or {}
+        _validate_cosmos_query_inputs(filters, None, predicates)
+        cosmos_token = _decode_continuation(continuation, "c")
+
+        if not self.cosmos_container:
+            return [], None
+
+        query, parameters = _build_cosmos_query(item_type, filters, predicates=predicates)
+        try:
+            pager = self.cosmos_container.query_items(
+                query=query,
+                parameters=parameters,
+                max_item_count=limit,
+            ).by_page(cosmos_token)
+            try:
+                page = await pager.__anext__()
+            except StopAsyncIteration:
+                return [], None
+            items = [self._cosmos_clean_item(item) async for item in page if item is not None]
+            next_token = pager.continuation_token
+        except CosmosHttpResponseError as exc:
+            if cosmos_token is not None and getattr(exc, "status_code", None) == 400:
+                raise InvalidContinuationTokenError("Invalid continuation token") from exc
+            logger.error("Failed to query Cosmos container: %s", exc)
+            return [], None
+
+        return items, _encode_continuation({"c": next_token}) if next_token else None
+
+    async def _read_cosmos_item(self, item_id: str, item_type: str) -> Optional[Dict[str, Any]]:
+        if not self.cosmos_container:
+            return None
+
+        try:
+            item = await self.cosmos_container.read_item(item=item_id, partition_key=item_type)
+        except CosmosResourceNotFoundError:
+            return None
+        except CosmosHttpResponseError as exc:
+            logger.error("Failed to read item %s from Cosmos: %s", item_id, exc)
+            return None
+
+        return self._cosmos_clean_item(item)
+
+    async def _upsert_cosmos_item(self, item: Dict[str, Any]) -> None:
+        if not self.cosmos_container:
+            raise RuntimeError("Cosmos container is not initialized")
+
+        if "id" not in item:
+            item["id"] = str(uuid.uuid4())
+
+        try:
+            await self.cosmos_container.upsert_item(item)
+        except CosmosHttpResponseError as exc:
+            logger.error("Failed to upsert item into Cosmos: %s", exc)
+            raise
+
+    async def _update_cosmos_item(self, item_id: str, item_type: str, update_payload: Dict) -> Optional[Dict]:
+        if not self.cosmos_container:
+            return None
+
+        try:
+            item = await self.cosmos_container.read_item(item_id, partition_key=item_type)
+        except CosmosResourceNotFoundError:
+            return None
+        except CosmosHttpResponseError as exc:
+            logger.error("Failed to load %s %s from Cosmos: %s", item_type, item_id, exc)
+            raise
+
+        item.update(update_payload)
+        item["type"] = item_type
+
+        try:
+            replaced = await self.cosmos_container.replace_item(item=item_id, body=item)
+        except CosmosHttpResponseError as exc:
+            logger.error("Failed to update %s %s in Cosmos: %s", item_type, item_id, exc)
+            raise
+        return self._cosmos_clean_item(replaced)
+
+    async def _delete_cosmos_item(self, item_id: str, item_type: str) -> bool:
+        if not self.cosmos_container:
+            return False
+
+        try:
+            await self.cosmos_container.delete_item(item=item_id, partition_key=item_type)
+        except CosmosResourceNotFoundError:
+            return False
+        except CosmosHttpResponseError as exc:
+            logger.error("Failed to delete %s %s from Cosmos: %s", item_type, item_id, exc)
+            return False
+        return True
@@ -0,0 +1,468 @@
+import asyncio
+import time
+
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+
+from db.async_future_gadget_lab_data_service import (
+    DEFAULT_FGL_COSMOS_CONNECTION_LIMIT,
+    DEFAULT_FGL_DB_MAX_WORKERS,
+    FGL_STREAM_BATCH_SIZE,
+    AsyncFutureGadgetLabDataService,
+    ThreadPoolFutureGadgetLabDataService,
+    fgl_cosmos_connection_limits,
+    fgl_db_max_workers,
+)
+from db.future_gadget_lab_data_service import CosmosResourceNotFoundError, InvalidContinuationTokenError
+from mock.mock_future_gadget_lab_data_service import MockFutureGadgetLabDataService
+from common.log import logger
+
+
+class SafeLogHandler:
+    """A minimal handler implementation with all the necessary attributes."""
+    def __init__(self):
+        self.level = 0
+        self.filters = []
+        self.stream = None
+
+    def handle(self, record):
+        return
+
+
+@pytest.fixture(autouse=True)
+def patch_logger_handlers(monkeypatch):
+    """Replace logger handlers with safe dummy handlers to avoid attribute errors."""
+    monkeypatch.setattr(logger, "handlers", [SafeLogHandler() for _ in getattr(logger, "handlers", [])])
+
+
+class SlowDataService:
+    """Stand-in for a Cosmos-backed service whose queries block for a while."""
+
+    def __init__(self, delay):
+        self.delay = delay
+
+    def get_all_experiments(self):
+        time.sleep(self.delay)
+        return [{"id": "EXP-1"}]
+
+    def get_all_divergence_readings(self):
+        time.sleep(self.delay)
+        return []
+
+
+async def _max_loop_lag(stop: asyncio.Event, interval: float = 0.005) -> float:
+    """Tick on the event loop and report the worst scheduling delay seen."""
+    worst = 0.0
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        worst = max(worst, time.perf_counter() - started - interval)
+    return worst
+
+
+@pytest.fixture
+def facade():
+    service = MockFutureGadgetLabDataService()
+    facade = ThreadPoolFutureGadgetLabDataService(lambda: service, max_workers=1)
+    yield facade
+    facade.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_crud_round_trip(facade):
+    created = await facade.create_experiment({
+        "name": "Phone Microwave",
+        "description": "d",
+        "status": "planned",
+        "creator_id": "Okabe",
+        "world_line_change": 0.1,
+    })
+    assert await facade.get_experiment_by_id(created["id"]) == created
+    assert await facade.search_experiments({"name": "Phone Microwave"}) == [created]
+
+    updated = await facade.update_experiment(created["id"], {"status": "completed"})
+    assert updated["status"] == "completed"
+    assert await facade.get_all_experiments() == [updated]
+    assert await facade.delete_experiment(created["id"]) is True
+    assert await facade.get_all_experiments() == []
+
+    reading = await facade.create_divergence_reading({"reading": 1.048596})
+    assert await facade.get_divergence_reading_by_id(reading["id"]) == reading
+    assert (await facade.update_divergence_reading(reading["id"], {"notes": "x"}))["notes"] == "x"
+    assert (await facade.get_latest_divergence_reading())["id"] == reading["id"]
+    assert len(await facade.get_all_divergence_readings()) == 1
+    assert await facade.delete_divergence_reading(reading["id"]) is True
+
+
+@pytest.mark.asyncio
+async def test_event_loop_stays_responsive_during_slow_query():
+    facade = ThreadPoolFutureGadgetLabDataService(lambda: SlowDataService(0.3), max_workers=2)
+    stop = asyncio.Event()
+    lag_task = asyncio.create_task(_max_loop_lag(stop))
+    try:
+        results = await asyncio.gather(
+            facade.get_all_experiments(),
+            facade.get_all_divergence_readings(),
+        )
+    finally:
+        stop.set()
+        worst_lag = await lag_task
+        facade.shutdown()
+
+    assert results == [[{"id": "EXP-1"}], []]
+    # Inline, the two 300 ms calls would have frozen the loop for 600 ms.
+    assert worst_lag < 0.1
+
+
+@pytest.mark.asyncio
+async def test_concurrency_is_bounded_by_max_workers():
+    active = 0
+    peak = 0
+
+    class CountingService:
+        def get_all_experiments(self):
+            nonlocal active, peak
+            active += 1
+            peak = max(peak, active)
+            time.sleep(0.02)
+            active -= 1
+            return []
+
+    facade = ThreadPoolFutureGadgetLabDataService(lambda: CountingService(), max_workers=2)
+    try:
+        await asyncio.gather(*(facade.get_all_experiments() for _ in range(8)))
+    finally:
+        facade.shutdown()
+
+    assert peak <= 2
+
+
+@pytest.mark.asyncio
+async def test_service_provider_is_resolved_per_call():
+    first, second = MagicMock(), MagicMock()
+    first.get_all_experiments.return_value = ["first"]
+    second.get_all_experiments.return_value = ["second"]
+    current = {"service": first}
+    facade = ThreadPoolFutureGadgetLabDataService(lambda: current["service"], max_workers=1)
+    try:
+        assert await facade.get_all_experiments() == ["first"]
+        current["service"] = second
+        assert await facade.get_all_experiments() == ["second"]
+    finally:
+        facade.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_facade_streams_sync_iterator_in_batches():
+    """Streaming pulls from the blocking iterator one batch per executor hop"""
+    pulled = []
+
+    class StreamingService:
+        def iter_divergence_readings(self, predicates=None):
+            def generate():
+                for i in range(FGL_STREAM_BATCH_SIZE * 2 + 5):
+                    pulled.append(i)
+                    yield {"id": i}
+            return generate()
+
+    facade = ThreadPoolFutureGadgetLabDataService(lambda: StreamingService(), max_workers=1)
+    try:
+        items = await facade.iter_divergence_readings()
+        assert pulled == []
+        assert (await items.__anext__()) == {"id": 0}
+        assert len(pulled) == FGL_STREAM_BATCH_SIZE
+        rest = [item["id"] async for item in items]
+        assert rest == list(range(1, FGL_STREAM_BATCH_SIZE * 2 + 5))
+    finally:
+        facade.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_facade_streams_filtered_readings(facade):
+    for i in range(5):
+        await facade.create_divergence_reading({"reading": i / 2})
+
+    items = await facade.iter_divergence_readings([("reading_value", "ge", 1.0)])
+
+    assert [item["reading"] async for item in items] == [1.0, 1.5, 2.0]
+    with pytest.raises(ValueError):
+        await facade.iter_divergence_readings([("reading_value", "ne", 1.0)])
+
+
+@pytest.mark.asyncio
+async def test_executor_is_recreated_after_shutdown(facade):
+    await facade.get_all_experiments()
+    facade.shutdown()
+    assert await facade.get_all_experiments() == []
+
+
+@pytest.mark.parametrize("raw, expected", [
+    (None, DEFAULT_FGL_DB_MAX_WORKERS),
+    ("", DEFAULT_FGL_DB_MAX_WORKERS),
+    ("16", 16),
+    ("0", 1),
+    ("lots", DEFAULT_FGL_DB_MAX_WORKERS),
+])
+def test_fgl_db_max_workers_env(monkeypatch, raw, expected):
+    if raw is None:
+        monkeypatch.delenv("FGL_DB_MAX_WORKERS", raising=False)
+    else:
+        monkeypatch.setenv("FGL_DB_MAX_WORKERS", raw)
+    assert fgl_db_max_workers() == expected
+
+
+async def _aiter(items):
+    for item in items:
+        yield item
+
+
+class FakeAsyncPager:
+    """Mimics ``AsyncItemPaged``: async-iterable, with ``by_page`` continuation."""
+
+    def __init__(self, items, page_size):
+        self.items = items
+        self.page_size = page_size or len(items) or 1
+        self.continuation_token = None
+
+    def __aiter__(self):
+        return _aiter(self.items).__aiter__()
+
+    def by_page(self, continuation_token=None):
+        self.continuation_token = continuation_token
+        return self
+
+    async def __anext__(self):
+        start = int(self.continuation_token or 0)
+        if start >= len(self.items):
+            raise StopAsyncIteration
+        end = start + self.page_size
+        self.continuation_token = str(end) if end < len(self.items) else None
+        return _aiter(self.items[start:end])
+
+
+class FakeAsyncContainer:
+    """In-memory stand-in for an ``azure.cosmos.aio`` container client."""
+
+    def __init__(self):
+        self.items = {}
+        self.queries = []
+
+    def query_items(self, query, parameters, max_item_count=None):
+        self.queries.append((query, parameters))
+        item_type = next(p["value"] for p in parameters if p["name"] == "@type")
+        matches = [dict(item) for item in self.items.values() if item["type"] == item_type]
+        if "ORDER BY c.timestamp DESC" in query:
+            matches.sort(key=lambda item: item.get("timestamp") or "", reverse=True)
+        if "TOP 1" in query:
+            matches = matches[:1]
+        for param in parameters:
+            if param["name"] != "@type":
+                matches = [item for item in matches if param["value"] in item.values()]
+
+        return FakeAsyncPager([{**item, "_rid": "rid", "_etag": "etag"} for item in matches], max_item_count)
+
+    async def read_item(self, item, partition_key):
+        stored = self.items.get(item)
+        if stored is None or stored["type"] != partition_key:
+            raise CosmosResourceNotFoundError(status_code=404, message="not found")
+        return dict(stored)
+
+    async def upsert_item(self, body):
+        self.items[body["id"]] = dict(body)
+        return dict(body)
+
+    async def replace_item(self, item, body):
+        self.items[item] = dict(body)
+        return dict(body)
+
+    async def delete_item(self, item, partition_key):
+        if item not in self.items:
+            raise CosmosResourceNotFoundError(status_code=404, message="not found")
+        del self.items[item]
+
+
+@pytest.fixture
+def cosmos_service():
+    service = AsyncFutureGadgetLabDataService("https://acct.documents.azure.com:443/", "db", "container")
+    service.cosmos_container = FakeAsyncContainer()
+    return service
+
+
+@pytest.mark.asyncio
+async def test_native_cosmos_crud_round_trip(cosmos_service):
+    created = await cosmos_service.create_experiment({
+        "name": "Phone Microwave",
+        "description": "d",
+        "status": "planned",
+        "creator_id": "Okabe",
+        "world_line_change": 0.1,
+    })
+    assert "type" not in await cosmos_service.get_experiment_by_id(created["id"])
+    assert [e["id"] for e in await cosmos_service.search_experiments({"name": "Phone Microwave"})] == [created["id"]]
+
+    updated = await cosmos_service.update_experiment(created["id"], {"status": "completed"})
+    assert updated["status"] == "completed"
+    assert "type" not in (await cosmos_service.get_all_experiments())[0]
+    assert await cosmos_service.update_experiment("missing", {"status": "completed"}) is None
+    assert await cosmos_service.delete_experiment(created["id"]) is True
+    assert await cosmos_service.delete_experiment(created["id"]) is False
+
+    first = await cosmos_service.create_divergence_reading({"reading": 1.048596, "timestamp": "2025-01-01T00:00:00"})
+    second = await cosmos_service.create_divergence_reading({"reading": 0.571024, "timestamp": "2025-02-01T00:00:00"})
+    assert (await cosmos_service.get_latest_divergence_reading())["id"] == second["id"]
+    assert (await cosmos_service.update_divergence_reading(first["id"], {"notes": "x"}))["notes"] == "x"
+    assert len(await cosmos_service.get_all_divergence_readings()) == 2
+    assert await cosmos_service.get_divergence_reading_by_id("missing") is None
+
+
+@pytest.mark.asyncio
+async def test_native_cosmos_worldline_status_tracks_writes(cosmos_service):
+    await cosmos_service.create_divergence_reading({"reading": 1.2})
+    assert (await cosmos_service.get_worldline_status())["experiment_count"] == 0
+
+    created = await cosmos_service.create_experiment({
+        "name": "n", "description": "d", "status": "planned",
+        "creator_id": "c", "world_line_change": 0.2,
+    })
+    queries_before = len(cosmos_service.cosmos_container.queries)
+    status = await cosmos_service.get_worldline_status()
+    assert status["current_worldline"] == 1.2
+    assert status["closest_reading"]["distance"] == 0.0
+    # Experiments and readings both came from the maintained in-memory state.
+    assert len(cosmos_service.cosmos_container.queries) == queries_before
+
+    await cosmos_service.delete_experiment(created["id"])
+    assert (await cosmos_service.get_worldline_status())["experiment_count"] == 0
+
+
+@pytest.mark.asyncio
+async def test_native_cosmos_pages_follow_continuation_tokens(cosmos_service):
+    for i in range(5):
+        await cosmos_service.create_divergence_reading({"reading": i / 10})
+
+    seen, token = [], None
+    while True:
+        items, token = await cosmos_service.get_divergence_readings_page(2, token)
+        seen.extend(item["id"] for item in items)
+        if token is None:
+            break
+
+    assert len(seen) == len(set(seen)) == 5
+    with pytest.raises(InvalidContinuationTokenError):
+        await cosmos_service.get_divergence_readings_page(2, "not-a-token!")
+
+
+@pytest.mark.asyncio
+async def test_native_cosmos_streams_cleaned_items(cosmos_service):
+    for i in range(3):
+        await cosmos_service.create_experiment({
+            "name": f"exp-{i}", "description": "d", "status": "planned", "creator_id": "Okabe",
+        })
+
+    items = await cosmos_service.iter_experiments()
+
+    streamed = [item async for item in items]
+    assert [item["name"] for item in streamed] == ["exp-0", "exp-1", "exp-2"]
+    assert all("type" not in item for item in streamed)
+    # Invalid input is rejected on the call, before anything is streamed.
+    with pytest.raises(ValueError):
+        await cosmos_service.iter_experiments({"bad key": "x"})
+
+
+@pytest.mark.asyncio
+async def test_native_cosmos_uses_parameterised_queries(cosmos_service):
+    await cosmos_service.search_experiments({"creator_id": "Okabe'; DROP"})
+
+    query, parameters = cosmos_service.cosmos_container.queries[-1]
+    assert query == "SELECT * FROM c WHERE c.type = @type AND c.creator_id = @p0"
+    assert {"name": "@p0", "value": "Okabe'; DROP"} in parameters
+
+    with pytest.raises(ValueError):
+        await cosmos_service.search_experiments({"bad key": "x"})
+
+    await cosmos_service.get_divergence_readings_page(5, predicates=[("recorded_by", "eq", "Okabe")])
+    query, parameters = cosmos_service.cosmos_container.queries[-1]
+    assert query == "SELECT * FROM c WHERE c.type = @type AND c.recorded_by = @f0"
+    assert {"name": "@f0", "value": "Okabe"} in parameters
+
+    with pytest.raises(ValueError):
+        await cosmos_service.search_divergence_readings([("reading_value", "ne", 1.0)])
+
+
+@pytest.mark.asyncio
+async def test_native_cosmos_without_container_is_empty():
+    service = AsyncFutureGadgetLabDataService("https://acct.documents.azure.com:443/", "db", "container")
+    assert await service.get_all_experiments() == []
+    assert await service.get_experiment_by_id("x") is None
+    assert await service.delete_divergence_reading("x") is False
+    with pytest.raises(RuntimeError):
+        await service.create_experiment({
+            "name": "n", "description": "d", "status": "planned", "creator_id": "c",
+        })
+
+
+@pytest.mark.asyncio
+async def test_open_uses_pooled_transport_and_close_releases_it(monkeypatch):
+    from azure.cosmos.aio._cosmos_client_connection_async import CosmosClientConnection
+
+    # ``__aenter__`` reads the database account; keep the test offline.
+    monkeypatch.setattr(CosmosClientConnection, "_setup", AsyncMock())
+    credential = MagicMock()
+    service = AsyncFutureGadgetLabDataService(
+        "https://acct.documents.azure.com:443/",
+        "db",
+        "container",
+        credential=credential,
+        connection_limit=7,
+        connection_limit_per_host=3,
+    )
+    await service.open()
+    try:
+        transport = service.cosmos_client.client_connection.pipeline_client._pipeline._transport
+        connector = transport.session.connector
+        assert (connector.limit, connector.limit_per_host) == (7, 3)
+        assert service.cosmos_container is not None
+        # A second open() is a no-op: still one client per worker.
+        client = service.cosmos_client
+        await service.open()
+        assert service.cosmos_client is client
+    finally:
+        await service.close()
+
+    assert service.cosmos_client is None
+    assert transport.session is None or transport.session.closed
+    # The caller-supplied credential is not ours to close.
+    credential.close.assert_not_called()
+
+
+@pytest.mark.parametrize("env, expected", [
+    ({}, {"connection_limit": DEFAULT_FGL_COSMOS_CONNECTION_LIMIT, "connection_limit_per_host": 0}),
+    ({"FGL_COSMOS_CONNECTION_LIMIT": "20", "FGL_COSMOS_CONNECTION_LIMIT_PER_HOST": "5"},
+     {"connection_limit": 20, "connection_limit_per_host": 5}),
+    ({"FGL_COSMOS_CONNECTION_LIMIT": "-1", "FGL_COSMOS_CONNECTION_LIMIT_PER_HOST": "x"},
+     {"connection_limit": 0, "connection_limit_per_host": 0}),
+])
+def test_fgl_cosmos_connection_limits_env(monkeypatch, env, expected):
+    monkeypatch.delenv("FGL_COSMOS_CONNECTION_LIMIT", raising=False)
+    monkeypatch.delenv("FGL_COSMOS_CONNECTION_LIMIT_PER_HOST", raising=False)
+    for name, value in env.items():
+        monkeypatch.setenv(name, value)
+    assert fgl_cosmos_connection_limits() == expected
+
+
+@pytest.mark.asyncio
+async def test_native_cosmos_stream_error_after_the_first_item_is_raised(cosmos_service):
+    from db.future_gadget_lab_data_service import CosmosHttpResponseError
+
+    async def pager(items):
+        for item in items:
+            yield item
+        raise CosmosHttpResponseError(status_code=503, message="unavailable")
+
+    received = []
+    with pytest.raises(CosmosHttpResponseError):
+        async for item in cosmos_service._clean_cosmos_stream(pager([{"id": "DR-001", "type": "divergence_reading"}])):
+            received.append(item)
+    assert received == [{"id": "DR-001"}]
+
+    assert [item async for item in cosmos_service._clean_cosmos_stream(pager([]))] == []
@@ -0,0 +1,186 @@
+"""Sorted index of divergence readings for nearest-worldline lookups.
+
+Finding the reading closest to the current worldline used to be a linear
+scan over every reading that re-parsed ``reading`` / ``value`` strings to
+float on each call. ``DivergenceReadingIndex`` coerces each reading once,
+when it is inserted or updated, keeps the distinct values in a sorted array
+and answers nearest-value queries by binary search in O(log n).
+
+The data services keep one index per process, updated by
+``create_divergence_reading`` / ``update_divergence_reading`` /
+``delete_divergence_reading`` and periodically reconciled against the store
+like ``WorldlineAggregate``. ``build_worldline_history`` builds a throwaway
+index from the readings it was given.
+"""
+
+import bisect
+import math
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from db.worldline_aggregate import PeriodicReconciliation
+
+
+def coerce_reading_value(reading: Dict[str, Any]) -> float:
+    """Numeric value of a reading, as ``calculate_worldline_status`` reads it.
+
+    ``reading`` is preferred over ``value``; a missing or unparsable value
+    counts as 0.0.
+    """
+    reading_value = reading.get("reading")
+    if reading_value is None:
+        reading_value = reading.get("value")
+    if reading_value is None:
+        return 0.0
+    if isinstance(reading_value, str):
+        try:
+            return float(reading_value)
+        except ValueError:
+            return 0.0
+    return float(reading_value)
+
+
+class DivergenceReadingIndex(PeriodicReconciliation):
+    """Readings sorted by value, answering nearest-value queries.
+
+    Ties between equidistant readings go to the reading that comes first in
+    store order, matching the linear scan: each reading gets an ordinal when
+    it is added (list position on ``reconcile``, next ordinal on ``upsert``
+    of a new id) and keeps it across updates. Readings whose value is NaN or
+    infinite are counted but never returned, as the scan never selected them.
+
+    Args:
+        reconcile_seconds: See ``PeriodicReconciliation``
+        clock: Monotonic clock, injectable for tests
+    """
+
+    def __init__(
+        self,
+        reconcile_seconds: Optional[float] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        super().__init__(reconcile_seconds, clock)
+        self._reset()
+
+    @classmethod
+    def from_readings(cls, readings: Iterable[Dict[str, Any]]) -> "DivergenceReadingIndex":
+        """Build an index over a fixed list of readings."""
+        index = cls(reconcile_seconds=0)
+        index.reconcile(readings)
+        return index
+
+    def __len__(self) -> int:
+        return len(self._by_id)
+
+    def _reset(self) -> None:
+        # id -> (value, ordinal, reading)
+        self._by_id: Dict[Any, Tuple[float, int, Dict[str, Any]]] = {}
+        # Sorted distinct finite values, and for each value the ordinals of
+        # the readings holding it (ascending).
+        self._values: List[float] = []
+        self._ordinals_by_value: Dict[float, List[int]] = {}
+        self._id_by_ordinal: Dict[int, Any] = {}
+        self._next_ordinal = 0
+
+    def reconcile(self, readings: Iterable[Dict[str, Any]], since_version: Optional[int] = None) -> None:
+        """Rebuild the index from a full list of readings, in store order.
+
+        Args:
+            readings: Every reading currently in the store
+            since_version: ``version`` read before the list was fetched
+        """
+        with self._lock:
+            self._reset()
+            for reading in readings:
+                self._add(reading, keep_sorted=False)
+            self._values = sorted(self._ordinals_by_value)
+            self._mark_reconciled(since_version)
+
+    def upsert(self, reading: Dict[str, Any]) -> None:
+        """Apply a created or updated reading."""
+        with self._lock:
+            self._version += 1
+            existing = self._by_id.get(reading.get("id"))
+            if existing is None:
+                self._add(reading)
+                return
+            self._discard(reading.get("id"))
+            self._add(reading, ordinal=existing[1])
+
+    def remove(self, reading_id: Any) -> None:
+        """Apply a deleted reading."""
+        with self._lock:
+            self._version += 1
+            self._discard(reading_id)
+
+    def closest(self, target: float) -> Tuple[Optional[Dict[str, Any]], float]:
+        """Return ``(reading, distance)`` for the reading closest to ``target``.
+
+        Returns ``(None, inf)`` when no reading is at a finite distance.
+        """
+        with self._lock:
+            values = self._values
+            if not values or not math.isfinite(target):
+                return None, math.inf
+
+            position = bisect.bisect_left(values, target)
+            best_distance = math.inf
+            best_ordinal = -1
+
+            # Rounding can make neighbouring values equidistant from
+            # ``target``, so walk each side while the distance does not grow.
+            for step, start in ((-1, position - 1), (1, position)):
+                side_distance = math.inf
+                i = start
+                while 0 <= i < len(values):
+                    distance = abs(values[i] - target)
+                    if distance > side_distance:
+                        break
+                    side_distance = distance
+                    ordinal = self._ordinals_by_value[values[i]][0]
+                    if distance < best_distance or (distance == best_distance and ordinal < best_ordinal):
+                        best_distance, best_ordinal = distance, ordinal
+                    i += step
+
+            if best_ordinal < 0:
+                return None, math.inf
+            return self._by_id[self._id_by_ordinal[best_ordinal]][2], best_distance
+
+    def _add(self, reading: Dict[str, Any], ordinal: Optional[int] = None, keep_sorted: bool = True) -> None:
+        # Caller holds ``_lock``. ``keep_sorted=False`` leaves ``_values`` for
+        # the caller to rebuild in one sort.
+        if ordinal is None:
+            ordinal = self._next_ordinal
+            self._next_ordinal += 1
+        value = coerce_reading_value(reading)
+        reading_id = reading.get("id")
+        if reading_id is None or reading_id in self._by_id:
+            # Lists handed to ``from_readings`` may lack ids or repeat one;
+            # every entry still takes part in the search, as in the scan.
+            reading_id = ("_ordinal", ordinal)
+        self._by_id[reading_id] = (value, ordinal, dict(reading))
+        self._id_by_ordinal[ordinal] = reading_id
+        if not math.isfinite(value):
+            return
+        ordinals = self._ordinals_by_value.get(value)
+        if ordinals is None:
+            if keep_sorted:
+                bisect.insort(self._values, value)
+            self._ordinals_by_value[value] = [ordinal]
+        else:
+            bisect.insort(ordinals, ordinal)
+
+    def _discard(self, reading_id: Any) -> None:
+        # Caller holds ``_lock``.
+        entry = self._by_id.pop(reading_id, None)
+        if entry is None:
+            return
+        value, ordinal, _ = entry
+        del self._id_by_ordinal[ordinal]
+        ordinals = self._ordinals_by_value.get(value)
+        if ordinals is None:
+            return
+        ordinals.remove(ordinal)
+        if not ordinals:
+            del self._ordinals_by_value[value]
+            del self._values[bisect.bisect_left(self._values, value)]
@@ -0,0 +1,103 @@
+import math
+import random
+
+import pytest
+
+from db.divergence_reading_index import DivergenceReadingIndex, coerce_reading_value
+
+
+def _linear_closest(readings, target):
+    """The scan calculate_worldline_status used before the index."""
+    closest, best = None, math.inf
+    for reading in readings:
+        distance = abs(coerce_reading_value(reading) - target)
+        if distance < best:
+            closest, best = reading, distance
+    return closest, best
+
+
+@pytest.mark.parametrize("reading, expected", [
+    ({"reading": 1.5}, 1.5),
+    ({"reading": "0.571024"}, 0.571024),
+    ({"value": 2}, 2.0),
+    ({"reading": None, "value": "3.5"}, 3.5),
+    ({"reading": "n/a"}, 0.0),
+    ({}, 0.0),
+])
+def test_coerce_reading_value(reading, expected):
+    assert coerce_reading_value(reading) == expected
+
+
+def test_closest_uses_binary_search_neighbours():
+    index = DivergenceReadingIndex.from_readings([
+        {"id": "a", "reading": 0.571024},
+        {"id": "b", "reading": 1.048596},
+        {"id": "c", "reading": "1.130205"},
+    ])
+
+    reading, distance = index.closest(1.1)
+
+    assert reading["id"] == "c"
+    assert distance == pytest.approx(0.030205)
+    assert len(index) == 3
+
+
+def test_ties_go_to_first_reading_in_store_order():
+    index = DivergenceReadingIndex.from_readings([
+        {"id": "high", "reading": 1.75},
+        {"id": "low", "reading": 1.25},
+        {"id": "low-dup", "reading": 1.25},
+    ])
+    assert index.closest(1.5)[0]["id"] == "high"
+
+    index.remove("high")
+    assert index.closest(1.5)[0]["id"] == "low"
+
+
+def test_update_keeps_position_and_recoerces_value():
+    index = DivergenceReadingIndex(reconcile_seconds=0)
+    index.reconcile([{"id": "a", "reading": 1.0}, {"id": "b", "reading": 3.0}])
+
+    index.upsert({"id": "b", "reading": "1.0"})
+    index.upsert({"id": "a", "reading": 1.0, "notes": "edited"})
+
+    reading, distance = index.closest(1.0)
+    assert (reading["id"], reading["notes"], distance) == ("a", "edited", 0.0)
+    assert index.closest(5.0)[0]["id"] == "a"
+
+
+def test_non_finite_values_are_counted_but_never_returned():
+    index = DivergenceReadingIndex.from_readings([{"id": "nan", "reading": math.nan}, {"id": "inf", "reading": "inf"}])
+
+    assert len(index) == 2
+    assert index.closest(1.0) == (None, math.inf)
+    assert DivergenceReadingIndex.from_readings([{"id": "a", "reading": 1.0}]).closest(math.nan) == (None, math.inf)
+
+
+def test_incremental_updates_match_linear_scan():
+    rng = random.Random(7)
+    index = DivergenceReadingIndex(reconcile_seconds=0)
+    index.reconcile([])
+    store = {}
+    next_id = 0
+    for _ in range(500):
+        op = rng.random()
+        if op < 0.5 or not store:
+            reading = {"id": f"DR-{next_id}", "reading": rng.choice([round(rng.uniform(0, 2), 2), "1.5", None])}
+            next_id += 1
+            store[reading["id"]] = reading
+            index.upsert(reading)
+        elif op < 0.8:
+            reading_id = rng.choice(list(store))
+            store[reading_id] = {"id": reading_id, "reading": round(rng.uniform(0, 2), 2)}
+            index.upsert(store[reading_id])
+        else:
+            reading_id = rng.choice(list(store))
+            del store[reading_id]
+            index.remove(reading_id)
+
+        target = rng.uniform(-0.5, 2.5)
+        expected_reading, expected_distance = _linear_closest(list(store.values()), target)
+        reading, distance = index.closest(target)
+        assert distance == expected_distance
+        assert (reading or {}).get("id") == (expected_reading or {}).get("id")
@@ -1,11 +1,17 @@
 from tinydb import TinyDB, Query
+from tinydb.queries import QueryInstance
 from tinydb.storages import MemoryStorage
 from pathlib import Path
+import base64
+import binascii
 import datetime
+import itertools
+import json
 import logging
+import operator
 import re
 import uuid
-from typing import Dict, List, Optional, Union, Any
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple, Union
 from enum import Enum
 
 try:  # pragma: no cover - optional dependency import
@@ -31,6 +37,8 @@ except ImportError:  # pragma: no cover - optional dependency import
         pass
 
 from common.log import logger
+from db.divergence_reading_index import DivergenceReadingIndex, coerce_reading_value
+from db.worldline_aggregate import WorldlineAggregate
 
 _DEFAULT_PARTITION_KEY_PATH = "/type"
 
@@ -82,6 +90,52 @@ _COSMOS_SELECT_PREFIX = "SELECT * FROM c WHERE "
 _COSMOS_ORDER_BY_PREFIX = " ORDER BY "
 _COSMOS_SELECT_ALL = "SELECT *"
 
+# ---------------------------------------------------------------------------
+# Structured filters
+#
+# Range and equality predicates are ``(field, op, value)`` tuples. They are
+# compiled into the storage query (a parameterised WHERE clause on Cosmos, a
+# single TinyDB query elsewhere) instead of being applied in Python after
+# every row has been fetched. ``READING_VALUE_FIELD`` is a virtual field for
+# a divergence reading's numeric value, read as ``coerce_reading_value``
+# does: ``reading`` first, then ``value``, else 0.
+# ---------------------------------------------------------------------------
+
+FilterPredicate = Tuple[str, str, Any]
+
+READING_VALUE_FIELD = "reading_value"
+
+_FILTER_OPERATORS = {"eq": "=", "lt": "<", "le": "<=", "gt": ">", "ge": ">="}
+_TINYDB_OPERATORS = {
+    "eq": operator.eq,
+    "lt": operator.lt,
+    "le": operator.le,
+    "gt": operator.gt,
+    "ge": operator.ge,
+}
+
+def _cosmos_number_expr(prop: str) -> str:
+    """Cosmos SQL for ``prop`` as a number: numbers as is, numeric strings converted, else 0."""
+    return (
+        f"(IS_NUMBER({prop}) ? {prop} : "
+        f"((IS_STRING({prop}) AND IS_NUMBER(StringToNumber({prop}))) ? StringToNumber({prop}) : 0))"
+    )
+
+
+def _cosmos_present_expr(prop: str) -> str:
+    return f"(IS_DEFINED({prop}) AND NOT IS_NULL({prop}))"
+
+
+# ``reading`` if it is set, else ``value``, else 0, each converted as by
+# ``coerce_reading_value``: stored readings may be numeric strings.
+# ``value`` is a reserved word in Cosmos SQL, hence the bracket accessor.
+_COSMOS_READING_VALUE_EXPR = "({} ? {} : ({} ? {} : 0))".format(
+    _cosmos_present_expr("c.reading"),
+    _cosmos_number_expr("c.reading"),
+    _cosmos_present_expr('c["value"]'),
+    _cosmos_number_expr('c["value"]'),
+)
+
 
 def _validate_cosmos_filter_keys(filters: Dict[str, Any]) -> None:
     """Reject any filter key that is not a plain Cosmos DB column name.
@@ -111,7 +165,235 @@ def _validate_cosmos_order_by(order_by: str) -> None:
         )
 
 
-class FutureGadgetLabDataService:
+def _validate_filter_predicates(predicates: List[FilterPredicate]) -> None:
+    """Reject any predicate whose field or operator could not be embedded safely.
+
+    Fields follow the same ``_COSMOS_COLUMN_RE`` rail as equality filter keys
+    (``READING_VALUE_FIELD`` is a plain identifier too); operators must be
+    one of ``_FILTER_OPERATORS``, so only the mapped SQL operator ever reaches
+    the query string.
+    """
+    invalid = [
+        predicate for predicate in predicates
+        if not isinstance(predicate, (tuple, list))
+        or len(predicate) != 3
+        or not isinstance(predicate[0], str)
+        or not _COSMOS_COLUMN_RE.match(predicate[0])
+        or predicate[1] not in _FILTER_OPERATORS
+    ]
+    if invalid:
+        raise ValueError(
+            f"Invalid filter predicates: {invalid!r}. Predicates must be "
+            f"(field, op, value) with field matching {_COSMOS_COLUMN_PATTERN!r} "
+            f"and op one of {sorted(_FILTER_OPERATORS)!r}."
+        )
+
+
+def _validate_cosmos_query_inputs(
+    filters: Dict[str, Any],
+    order_by: Optional[str],
+    predicates: Optional[List[FilterPredicate]] = None,
+) -> None:
+    """Run every query-construction safety rail on caller-supplied inputs."""
+    _validate_cosmos_filter_keys(filters)
+    if order_by is not None:
+        _validate_cosmos_order_by(order_by)
+    if predicates:
+        _validate_filter_predicates(predicates)
+
+
+def _build_cosmos_query(
+    item_type: str,
+    filters: Optional[Dict[str, Any]] = None,
+    order_by: Optional[str] = None,
+    limit: Optional[int] = None,
+    predicates: Optional[List[FilterPredicate]] = None,
+) -> Tuple[str, List[Dict[str, Any]]]:
+    """Build the parameterised query shared by the sync and async Cosmos backends.
+
+    Filter keys, predicates and ``order_by`` are validated first, so the
+    returned query string only ever embeds values that passed the safety
+    rails above.
+    """
+    filters = filters or {}
+    predicates = predicates or []
+    _validate_cosmos_query_inputs(filters, order_by, predicates)
+
+    parameters = [{"name": "@type", "value": item_type}]
+    where_clauses = ["c.type = @type"]
+
+    for idx, (key, value) in enumerate(filters.items()):
+        param_name = f"@p{idx}"
+        # `key` has been validated against _COSMOS_COLUMN_RE above.
+        where_clauses.append("c." + key + " = " + param_name)
+        parameters.append({"name": param_name, "value": value})
+
+    for idx, (field, op, value) in enumerate(predicates):
+        param_name = f"@f{idx}"
+        # `field` matched _COSMOS_COLUMN_RE and `op` is a _FILTER_OPERATORS key.
+        lhs = _COSMOS_READING_VALUE_EXPR if field == READING_VALUE_FIELD else "c." + field
+        where_clauses.append(lhs + " " + _FILTER_OPERATORS[op] + " " + param_name)
+        parameters.append({"name": param_name, "value": value})
+
+    query = _COSMOS_SELECT_PREFIX + " AND ".join(where_clauses)
+
+    if order_by:
+        query = query + _COSMOS_ORDER_BY_PREFIX + order_by
+
+    if limit is not None:
+        query = query.replace(_COSMOS_SELECT_ALL, f"SELECT TOP {int(limit)} *")
+
+    return query, parameters
+
+
+def _compile_tinydb_query(
+    filters: Optional[Dict[str, Any]] = None,
+    predicates: Optional[List[FilterPredicate]] = None,
+) -> Optional[QueryInstance]:
+    """Compile equality filters and predicates into one TinyDB query.
+
+    Returns None when there is nothing to filter on, so callers can fall
+    back to reading the whole table.
+    """
+    predicates = predicates or []
+    _validate_filter_predicates(predicates)
+
+    Record = Query()
+    conditions = [getattr(Record, key) == value for key, value in (filters or {}).items()]
+    for field, op, value in predicates:
+        # ``map`` evaluates the whole document, matching how
+        # ``coerce_reading_value`` reads ``reading`` / ``value``.
+        lhs = Record.map(coerce_reading_value) if field == READING_VALUE_FIELD else getattr(Record, field)
+        conditions.append(_TINYDB_OPERATORS[op](lhs, value))
+
+    query = None
+    for condition in conditions:
+        query = condition if query is None else (query & condition)
+    return query
+
+
+# ---------------------------------------------------------------------------
+# Continuation tokens
+#
+# Paged reads hand the caller an opaque ``next`` token. It is URL-safe
+# base64 over a small JSON object that wraps either the Cosmos continuation
+# token ({"c": ...}) or, for TinyDB, the offset of the next document
+# ({"o": ...}). Callers must treat it as opaque.
+# ---------------------------------------------------------------------------
+
+
+class InvalidContinuationTokenError(ValueError):
+    """Raised when a continuation token is malformed or was rejected by the store."""
+
+
+def _encode_continuation(payload: Dict[str, Any]) -> str:
+    raw = json.dumps(payload, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def _decode_continuation(token: Optional[str], key: str) -> Any:
+    """Return the ``key`` entry of ``token``, or None for the first page."""
+    if not token:
+        return None
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+    except (binascii.Error, UnicodeError, ValueError) as exc:
+        raise InvalidContinuationTokenError("Invalid continuation token") from exc
+    if not isinstance(payload, dict) or key not in payload:
+        raise InvalidContinuationTokenError("Invalid continuation token")
+    return payload[key]
+
+
+class _FutureGadgetLabPayloadMixin:
+    """Payload preparation shared by the sync and async data services.
+
+    Subclasses provide ``storage_backend``, ``worldline_aggregate``,
+    ``divergence_index`` and, for TinyDB, ``divergence_readings_table`` (used
+    for sequential reading IDs).
+    """
+
+    def _worldline_status_from_aggregate(self, preview_experiment: Optional[Dict] = None) -> Dict:
+        totals = self.worldline_aggregate.totals()
+        current_worldline = 1.0 + totals["total_divergence"]
+        experiment_count = totals["experiment_count"]
+        last_experiment_timestamp = totals["last_experiment_timestamp"]
+
+        # A preview experiment is counted on top of the stored ones, exactly
+        # like appending it to the experiment list used to.
+        if preview_experiment is not None:
+            experiment_count += 1
+            if preview_experiment.get("world_line_change") is not None:
+                current_worldline += preview_experiment["world_line_change"]
+            preview_timestamp = preview_experiment.get("timestamp")
+            if preview_timestamp and (
+                last_experiment_timestamp is None or preview_timestamp > last_experiment_timestamp
+            ):
+                last_experiment_timestamp = preview_timestamp
+
+        return build_worldline_status(
+            current_worldline,
+            experiment_count,
+            last_experiment_timestamp,
+            reading_index=self.divergence_index,
+        )
+
+    def _prepare_experiment_payload(self, experiment_data: Dict) -> Dict:
+        payload = experiment_data.copy()
+        if 'id' not in payload:
+            payload['id'] = f"EXP-{uuid.uuid4()}"
+        if 'created_at' not in payload:
+            payload['created_at'] = datetime.datetime.now(datetime.timezone.utc).isoformat()
+        if 'world_line_change' in payload and isinstance(payload['world_line_change'], str):
+            payload['world_line_change'] = float(payload['world_line_change'])
+        if 'timestamp' not in payload:
+            payload['timestamp'] = datetime.datetime.now(datetime.timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3] + 'Z'
+        return payload
+
+    def _prepare_experiment_update_payload(self, update_data: Dict) -> Dict:
+        payload = update_data.copy()
+        payload.pop('id', None)
+        if 'world_line_change' in payload and isinstance(payload['world_line_change'], str):
+            payload['world_line_change'] = float(payload['world_line_change'])
+        payload['updated_at'] = datetime.datetime.now(datetime.timezone.utc).isoformat()
+        return payload
+
+    def _prepare_divergence_payload(self, reading_data: Dict) -> Dict:
+        payload = reading_data.copy()
+        if 'id' not in payload:
+            if self.storage_backend == "tinydb" and self.divergence_readings_table is not None:
+                current_count = len(self.divergence_readings_table)  # type: ignore[arg-type]
+                payload['id'] = f"DR-{current_count + 1:03d}"
+            else:
+                payload['id'] = f"DR-{uuid.uuid4()}"
+        if 'timestamp' not in payload:
+            payload['timestamp'] = datetime.datetime.now(datetime.timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3] + 'Z'
+        if 'reading' in payload and isinstance(payload['reading'], str):
+            payload['reading'] = float(payload['reading'])
+        if 'value' in payload and isinstance(payload['value'], str):
+            payload['value'] = float(payload['value'])
+        if 'status' not in payload and 'world_line_status' not in payload:
+            payload['status'] = WorldLineStatus.ALPHA.value
+        return payload
+
+    def _prepare_divergence_update_payload(self, update_data: Dict) -> Dict:
+        payload = update_data.copy()
+        payload.pop('id', None)
+        if 'reading' in payload and isinstance(payload['reading'], str):
+            payload['reading'] = float(payload['reading'])
+        if 'value' in payload and isinstance(payload['value'], str):
+            payload['value'] = float(payload['value'])
+        return payload
+
+    def _cosmos_clean_item(self, document: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        if document is None:
+            return None
+        cleaned = dict(document)
+        cleaned.pop('type', None)
+        return cleaned
+
+
+class FutureGadgetLabDataService(_FutureGadgetLabPayloadMixin):
     """Service for storing and retrieving research data from the Future Gadget Laboratory."""
 
     def __init__(
@@ -137,6 +419,8 @@ class FutureGadgetLabDataService:
         self.divergence_readings_table = None
         self.cosmos_client = None
         self.cosmos_container = None
+        self.worldline_aggregate = WorldlineAggregate()
+        self.divergence_index = DivergenceReadingIndex()
         self._initialize_db()
 
     def _initialize_db(self) -> None:
@@ -222,18 +506,47 @@ class FutureGadgetLabDataService:
         if self.storage_backend == "cosmos":
             return self._query_cosmos_items("experiment", query_params)
 
-        Experiment = Query()
-        query = None
-
-        for key, value in query_params.items():
-            condition = getattr(Experiment, key) == value
-            query = condition if query is None else (query & condition)
-
+        query = _compile_tinydb_query(query_params)
         if query is None:
             return self.get_all_experiments()
 
         return self.experiments_table.search(query)  # type: ignore[union-attr]
 
+    def iter_experiments(self, query_params: Optional[Dict] = None) -> Iterator[Dict]:
+        """Iterate experiments lazily, optionally filtered like ``search_experiments``.
+
+        Inputs are validated on the call; storage is read as the iterator is
+        consumed, one Cosmos page at a time.
+        """
+        if self.storage_backend == "cosmos":
+            return self._iter_cosmos_items("experiment", query_params)
+        return self._iter_tinydb(self.experiments_table, query_params)
+
+    def get_experiments_page(
+        self,
+        limit: int,
+        continuation: Optional[str] = None,
+        query_params: Optional[Dict] = None,
+    ) -> Tuple[List[Dict], Optional[str]]:
+        """Get one page of experiments, optionally filtered like ``search_experiments``.
+
+        Args:
+            limit: Maximum number of experiments in the page
+            continuation: ``next`` token from the previous page, or None
+            query_params: Optional equality filters
+
+        Returns:
+            Tuple of the page items and the token for the next page (None on
+            the last page)
+
+        Raises:
+            InvalidContinuationTokenError: If ``continuation`` is not a token
+                issued by this backend
+        """
+        if self.storage_backend == "cosmos":
+            return self._query_cosmos_page("experiment", limit, continuation, query_params)
+        return self._tinydb_page(self.experiments_table, limit, continuation, query_params)
+
     def create_experiment(self, experiment_data: Dict) -> Dict:
         """Create a new experiment"""
         prepared = self._prepare_experiment_payload(experiment_data)
@@ -246,9 +559,11 @@ class FutureGadgetLabDataService:
             except CosmosHttpResponseError as exc:
                 logger.error("Failed to insert experiment into Cosmos: %s", exc)
                 raise
+            self.worldline_aggregate.upsert(stored)
             return stored
 
         self.experiments_table.insert(prepared)  # type: ignore[union-attr]
+        self.worldline_aggregate.upsert(prepared)
         return prepared
 
     def update_experiment(self, experiment_id: str, experiment_data: Dict) -> Optional[Dict]:
@@ -276,11 +591,16 @@ class FutureGadgetLabDataService:
             except CosmosHttpResponseError as exc:
                 logger.error("Failed to update experiment %s in Cosmos: %s", experiment_id, exc)
                 raise
-            return self._cosmos_clean_item(replaced)
+            updated = self._cosmos_clean_item(replaced)
+            self.worldline_aggregate.upsert(updated)
+            return updated
 
         Experiment = Query()
         self.experiments_table.update(update_payload, Experiment.id == experiment_id)  # type: ignore[union-attr]
-        return self.get_experiment_by_id(experiment_id)
+        updated = self.get_experiment_by_id(experiment_id)
+        if updated is not None:
+            self.worldline_aggregate.upsert(updated)
+        return updated
 
     def delete_experiment(self, experiment_id: str) -> bool:
         """Delete an experiment"""
@@ -292,12 +612,35 @@ class FutureGadgetLabDataService:
             except CosmosHttpResponseError as exc:
                 logger.error("Failed to delete experiment %s from Cosmos: %s", experiment_id, exc)
                 return False
+            self.worldline_aggregate.remove(experiment_id)
             return True
 
         Experiment = Query()
         removed = self.experiments_table.remove(Experiment.id == experiment_id)  # type: ignore[union-attr]
+        if removed:
+            self.worldline_aggregate.remove(experiment_id)
         return len(removed) > 0
 
+    # ----- WORLDLINE STATUS -----
+
+    def get_worldline_status(self, preview_experiment: Optional[Dict] = None) -> Dict:
+        """Get the current worldline status from the maintained aggregate.
+
+        Args:
+            preview_experiment: Optional experiment counted on top of the
+                stored ones (used by the worldline broadcast)
+
+        Returns:
+            Same shape as ``calculate_worldline_status(experiments, readings)``
+        """
+        if self.worldline_aggregate.needs_reconcile():
+            version = self.worldline_aggregate.version
+            self.worldline_aggregate.reconcile(self.get_all_experiments(), since_version=version)
+        if self.divergence_index.needs_reconcile():
+            version = self.divergence_index.version
+            self.divergence_index.reconcile(self.get_all_divergence_readings(), since_version=version)
+        return self._worldline_status_from_aggregate(preview_experiment)
+
     # ----- DIVERGENCE METER READINGS CRUD OPERATIONS -----
 
     def get_all_divergence_readings(self) -> List[Dict]:
@@ -306,6 +649,50 @@ class FutureGadgetLabDataService:
             return self._query_cosmos_items("divergence_reading")
         return self.divergence_readings_table.all()  # type: ignore[union-attr]
 
+    def search_divergence_readings(self, predicates: List[FilterPredicate]) -> List[Dict]:
+        """Get the divergence meter readings matching every predicate.
+
+        Args:
+            predicates: ``(field, op, value)`` tuples; ``op`` is one of
+                ``eq``, ``lt``, ``le``, ``gt``, ``ge`` and ``field`` may be
+                ``READING_VALUE_FIELD`` for the numeric reading
+
+        Raises:
+            ValueError: If a predicate has an invalid field or operator
+        """
+        if self.storage_backend == "cosmos":
+            return self._query_cosmos_items("divergence_reading", predicates=predicates)
+
+        query = _compile_tinydb_query(predicates=predicates)
+        if query is None:
+            return self.get_all_divergence_readings()
+        return self.divergence_readings_table.search(query)  # type: ignore[union-attr]
+
+    def iter_divergence_readings(self, predicates: Optional[List[FilterPredicate]] = None) -> Iterator[Dict]:
+        """Iterate divergence meter readings lazily.
+
+        See ``iter_experiments``; ``predicates`` are as for
+        ``search_divergence_readings``.
+        """
+        if self.storage_backend == "cosmos":
+            return self._iter_cosmos_items("divergence_reading", predicates=predicates)
+        return self._iter_tinydb(self.divergence_readings_table, predicates=predicates)
+
+    def get_divergence_readings_page(
+        self,
+        limit: int,
+        continuation: Optional[str] = None,
+        predicates: Optional[List[FilterPredicate]] = None,
+    ) -> Tuple[List[Dict], Optional[str]]:
+        """Get one page of divergence meter readings, optionally filtered.
+
+        See ``get_experiments_page`` for the arguments and return value, and
+        ``search_divergence_readings`` for ``predicates``.
+        """
+        if self.storage_backend == "cosmos":
+            return self._query_cosmos_page("divergence_reading", limit, continuation, predicates=predicates)
+        return self._tinydb_page(self.divergence_readings_table, limit, continuation, predicates=predicates)
+
     def get_divergence_reading_by_id(self, reading_id: str) -> Optional[Dict]:
         """Get divergence reading by ID"""
         if self.storage_backend == "cosmos":
@@ -326,9 +713,11 @@ class FutureGadgetLabDataService:
             except CosmosHttpResponseError as exc:
                 logger.error("Failed to insert divergence reading into Cosmos: %s", exc)
                 raise
+            self.divergence_index.upsert(stored)
             return stored
 
         self.divergence_readings_table.insert(prepared)  # type: ignore[union-attr]
+        self.divergence_index.upsert(prepared)
         return prepared
 
     def update_divergence_reading(self, reading_id: str, reading_data: Dict) -> Optional[Dict]:
@@ -356,11 +745,16 @@ class FutureGadgetLabDataService:
             except CosmosHttpResponseError as exc:
                 logger.error("Failed to update divergence reading %s in Cosmos: %s", reading_id, exc)
                 raise
-            return self._cosmos_clean_item(replaced)
+            updated = self._cosmos_clean_item(replaced)
+            self.divergence_index.upsert(updated)
+            return updated
 
         Reading = Query()
         self.divergence_readings_table.update(update_payload, Reading.id == reading_id)  # type: ignore[union-attr]
-        return self.get_divergence_reading_by_id(reading_id)
+        updated = self.get_divergence_reading_by_id(reading_id)
+        if updated is not None:
+            self.divergence_index.upsert(updated)
+        return updated
 
     def delete_divergence_reading(self, reading_id: str) -> bool:
         """Delete a divergence meter reading"""
@@ -372,10 +766,13 @@ class FutureGadgetLabDataService:
             except CosmosHttpResponseError as exc:
                 logger.error("Failed to delete divergence reading %s from Cosmos: %s", reading_id, exc)
                 return False
+            self.divergence_index.remove(reading_id)
             return True
 
         Reading = Query()
         removed = self.divergence_readings_table.remove(Reading.id == reading_id)  # type: ignore[union-attr]
+        if removed:
+            self.divergence_index.remove(reading_id)
         return len(removed) > 0
 
     def get_latest_divergence_reading(self) -> Optional[Dict]:
@@ -401,34 +798,18 @@ class FutureGadgetLabDataService:
         filters: Optional[Dict[str, Any]] = None,
         order_by: Optional[str] = None,
         limit: Optional[int] = None,
+        predicates: Optional[List[FilterPredicate]] = None,
     ) -> List[Dict]:
         # Validate before the cosmos_container check so an invalid filter
-        # key / ORDER BY expression is rejected even on backends that have
-        # not been wired up (mock storage, dev environments, etc.).
+        # key / predicate / ORDER BY expression is rejected even on backends
+        # that have not been wired up (mock storage, dev environments, etc.).
         filters = filters or {}
-        _validate_cosmos_filter_keys(filters)
-        if order_by is not None:
-            _validate_cosmos_order_by(order_by)
+        _validate_cosmos_query_inputs(filters, order_by, predicates)
 
         if not self.cosmos_container:
             return []
 
-        parameters = [{"name": "@type", "value": item_type}]
-        where_clauses = ["c.type = @type"]
-
-        for idx, (key, value) in enumerate(filters.items()):
-            param_name = f"@p{idx}"
-            # `key` has been validated against _COSMOS_COLUMN_RE above.
-            where_clauses.append("c." + key + " = " + param_name)
-            parameters.append({"name": param_name, "value": value})
-
-        query = _COSMOS_SELECT_PREFIX + " AND ".join(where_clauses)
-
-        if order_by:
-            query = query + _COSMOS_ORDER_BY_PREFIX + order_by
-
-        if limit is not None:
-            query = query.replace(_COSMOS_SELECT_ALL, f"SELECT TOP {int(limit)} *")
+        query, parameters = _build_cosmos_query(item_type, filters, order_by, limit, predicates)
 
         try:
             items = list(
@@ -444,6 +825,108 @@ class FutureGadgetLabDataService:
 
         return [self._cosmos_clean_item(item) for item in items if item is not None]
 
+    def _iter_cosmos_items(
+        self,
+        item_type: str,
+        filters: Optional[Dict[str, Any]] = None,
+        predicates: Optional[List[FilterPredicate]] = None,
+    ) -> Iterator[Dict]:
+        filters = filters or {}
+        _validate_cosmos_query_inputs(filters, None, predicates)
+        if not self.cosmos_container:
+            return iter(())
+
+        query, parameters = _build_cosmos_query(item_type, filters, predicates=predicates)
+        # ``query_items`` only fetches a page when the previous one is used up.
+        pager = self.cosmos_container.query_items(
+            query=query,
+            parameters=parameters,
+            enable_cross_partition_query=True,
+        )
+        return self._clean_cosmos_stream(pager)
+
+    def _clean_cosmos_stream(self, pager: Iterable[Dict[str, Any]]) -> Iterator[Dict]:
+        # A failure before the first item reads as an empty result, as in
+        # ``_query_cosmos_items``. After it the consumer has part of the
+        # collection, so the error is raised rather than ending the stream
+        # as if it were complete (see ``common/json_stream.py``).
+        produced = False
+        try:
+            for item in pager:
+                if item is not None:
+                    produced = True
+                    yield self._cosmos_clean_item(item)
+        except CosmosHttpResponseError as exc:
+            logger.error("Failed to query Cosmos container: %s", exc)
+            if produced:
+                raise
+
+    def _iter_tinydb(
+        self,
+        table: Any,
+        query_params: Optional[Dict] = None,
+        predicates: Optional[List[FilterPredicate]] = None,
+    ) -> Iterator[Dict]:
+        query = _compile_tinydb_query(query_params, predicates)
+        documents = iter(table)
+        if query is None:
+            return documents
+        return (document for document in documents if query(document))
+
+    def _query_cosmos_page(
+        self,
+        item_type: str,
+        limit: int,
+        continuation: Optional[str] = None,
+        filters: Optional[Dict[str, Any]] = None,
+        predicates: Optional[List[FilterPredicate]] = None,
+    ) -> Tuple[List[Dict], Optional[str]]:
+        filters = filters or {}
+        _validate_cosmos_query_inputs(filters, None, predicates)
+        cosmos_token = _decode_continuation(continuation, "c")
+
+        if not self.cosmos_container:
+            return [], None
+
+        query, parameters = _build_cosmos_query(item_type, filters, predicates=predicates)
+
+        try:
+            pager = self.cosmos_container.query_items(
+                query=query,
+                parameters=parameters,
+                enable_cross_partition_query=True,
+                max_item_count=limit,
+            ).by_page(cosmos_token)
+            page = next(pager, [])
+            items = [self._cosmos_clean_item(item) for item in page if item is not None]
+            next_token = pager.continuation_token
+        except CosmosHttpResponseError as exc:
+            if cosmos_token is not None and getattr(exc, "status_code", None) == 400:
+                raise InvalidContinuationTokenError("Invalid continuation token") from exc
+            logger.error("Failed to query Cosmos container: %s", exc)
+            return [], None
+
+        return items, _encode_continuation({"c": next_token}) if next_token else None
+
+    def _tinydb_page(
+        self,
+        table: Any,
+        limit: int,
+        continuation: Optional[str] = None,
+        query_params: Optional[Dict] = None,
+        predicates: Optional[List[FilterPredicate]] = None,
+    ) -> Tuple[List[Dict], Optional[str]]:
+        documents = self._iter_tinydb(table, query_params, predicates)
+        offset = _decode_continuation(continuation, "o") or 0
+        if not isinstance(offset, int) or offset < 0:
+            raise InvalidContinuationTokenError("Invalid continuation token")
+
+        # Read one document past the page to know whether another page exists.
+        window = list(itertools.islice(documents, offset, offset + limit + 1))
+        items = window[:limit]
+        next_token = _encode_continuation({"o": offset + limit}) if len(window) > limit else None
+        return items, next_token
+
     def _read_cosmos_item(self, item_id: str, item_type: str) -> Optional[Dict[str, Any]]:
         if not self.cosmos_container:
             return None
@@ -471,60 +954,6 @@ class FutureGadgetLabDataService:
             logger.error("Failed to upsert item into Cosmos: %s", exc)
             raise
 
-    def _prepare_experiment_payload(self, experiment_data: Dict) -> Dict:
-        payload = experiment_data.copy()
-        if 'id' not in payload:
-            payload['id'] = f"EXP-{uuid.uuid4()}"
-        if 'created_at' not in payload:
-            payload['created_at'] = datetime.datetime.now(datetime.timezone.utc).isoformat()
-        if 'world_line_change' in payload and isinstance(payload['world_line_change'], str):
-            payload['world_line_change'] = float(payload['world_line_change'])
-        if 'timestamp' not in payload:
-            payload['timestamp'] = datetime.datetime.now(datetime.timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3] + 'Z'
-        return payload
-
-    def _prepare_experiment_update_payload(self, update_data: Dict) -> Dict:
-        payload = update_data.copy()
-        payload.pop('id', None)
-        if 'world_line_change' in payload and isinstance(payload['world_line_change'], str):
-            payload['world_line_change'] = float(payload['world_line_change'])
-        payload['updated_at'] = datetime.datetime.now(datetime.timezone.utc).isoformat()
-        return payload
-
-    def _prepare_divergence_payload(self, reading_data: Dict) -> Dict:
-        payload = reading_data.copy()
-        if 'id' not in payload:
-            if self.storage_backend == "tinydb" and self.divergence_readings_table is not None:
-                current_count = len(self.divergence_readings_table)  # type: ignore[arg-type]
-                payload['id'] = f"DR-{current_count + 1:03d}"
-            else:
-                payload['id'] = f"DR-{uuid.uuid4()}"
-        if 'timestamp' not in payload:
-            payload['timestamp'] = datetime.datetime.now(datetime.timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3] + 'Z'
-        if 'reading' in payload and isinstance(payload['reading'], str):
-            payload['reading'] = float(payload['reading'])
-        if 'value' in payload and isinstance(payload['value'], str):
-            payload['value'] = float(payload['value'])
-        if 'status' not in payload and 'world_line_status' not in payload:
-            payload['status'] = WorldLineStatus.ALPHA.value
-        return payload
-
-    def _prepare_divergence_update_payload(self, update_data: Dict) -> Dict:
-        payload = update_data.copy()
-        payload.pop('id', None)
-        if 'reading' in payload and isinstance(payload['reading'], str):
-            payload['reading'] = float(payload['reading'])
-        if 'value' in payload and isinstance(payload['value'], str):
-            payload['value'] = float(payload['value'])
-        return payload
-
-    def _cosmos_clean_item(self, document: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
-        if document is None:
-            return None
-        cleaned = dict(document)
-        cleaned.pop('type', None)
-        return cleaned
-
 def generate_test_data(service: FutureGadgetLabDataService) -> Dict[str, List[Dict]]:
     """Generate test data for experiments and divergence readings"""
     # Dictionary to store all created items
@@ -743,59 +1172,89 @@ def calculate_worldline_status(experiments, readings=None):
         if sorted_experiments:
             last_experiment_timestamp = sorted_experiments[0].get('timestamp')
 
+    return build_worldline_status(
+        current_worldline,
+        len(experiments),
+        last_experiment_timestamp,
+        readings,
+        base_worldline=base_worldline,
+    )
+
+
+def build_worldline_status(current_worldline, experiment_count, last_experiment_timestamp, readings=None, base_worldline=1.0, reading_index=None):
+    """
+    Build the worldline status response from precomputed totals.
+
+    Shared by ``calculate_worldline_status`` (totals derived from a list of
+    experiments) and the data services' ``get_worldline_status`` (totals
+    read from the maintained ``WorldlineAggregate``).
+
+    Args:
+        current_worldline: Base worldline plus all experiment divergences
+        experiment_count: Number of experiments contributing
+        last_experiment_timestamp: Most recent experiment timestamp, if any
+        readings: Optional list of divergence readings to find closest match
+        base_worldline: Starting worldline value
+        reading_index: Optional ``DivergenceReadingIndex`` used instead of
+                 scanning ``readings`` for the closest match
+
+    Returns:
+        Dict containing calculated worldline value and related information
+    """
     # Initialize response with calculated values
     response = {
         "current_worldline": round(current_worldline, 6),
         "base_worldline": base_worldline,
         "total_divergence": round(current_worldline - base_worldline, 6),
-        "experiment_count": len(experiments),
+        "experiment_count": experiment_count,
         "last_experiment_timestamp": last_experiment_timestamp
     }
 
-    # Rest of the function remains unchanged
-    if readings:
+    if reading_index is not None:
+        if len(reading_index):
+            closest_reading, min_distance = reading_index.closest(current_worldline)
+            response["closest_reading"] = closest_reading_summary(closest_reading, min_distance, current_worldline)
+    elif readings:
         closest_reading = None
         min_distance = float('inf')
 
         for reading in readings:
-            # Get reading value, checking both "reading" and "value" fields
-            reading_value = reading.get("reading")
-            if reading_value is None:
-                reading_value = reading.get("value")
-
-            # Default to 0.0 if neither field exists
-            if reading_value is None:
-                reading_value = 0.0
-
-            # Convert to float if it's a string
-            if isinstance(reading_value, str):
-                try:
-                    reading_value = float(reading_value)
-                except ValueError:
-                    reading_value = 0.0
-
-            distance = abs(reading_value - current_worldline)
+            distance = abs(coerce_reading_value(reading) - current_worldline)
 
             if distance < min_distance:
                 min_distance = distance
                 closest_reading = reading
 
-        # If no readings found, create a placeholder
-        if not closest_reading:
-            closest_reading = {
-                "reading": current_worldline,
-                "status": "unknown",
-                "recorded_by": "System",
-                "notes": "No divergence readings available for comparison"
-            }
-
-        # Add closest reading to response
-        response["closest_reading"] = {
-            "value": closest_reading.get("reading"),
-            "status": closest_reading.get("status"),
-            "recorded_by": closest_reading.get("recorded_by", "Unknown"),
-            "notes": closest_reading.get("notes", ""),
-            "distance": round(min_distance, 6)
-        }
+        response["closest_reading"] = closest_reading_summary(closest_reading, min_distance, current_worldline)
 
     return response
+
+
+def closest_reading_summary(closest_reading, min_distance, current_worldline):
+    """
+    Format the ``closest_reading`` block of a worldline status response.
+
+    Args:
+        closest_reading: The matched reading, or None if no reading matched
+        min_distance: Distance between the reading and the current worldline
+        current_worldline: Used for the placeholder when nothing matched
+
+    Returns:
+        Dict with the reading's value, status, recorder, notes and distance
+    """
+    # If no readings found, create a placeholder
+    if not closest_reading:
+        closest_reading = {
+            "reading": current_worldline,
+            "status": "unknown",
+            "recorded_by": "System",
+            "notes": "No divergence readings available for comparison"
+        }
+
+    return {
+        "value": closest_reading.get("reading"),
+        "status": closest_reading.get("status"),
+        "recorded_by": closest_reading.get("recorded_by", "Unknown"),
+        "notes": closest_reading.get("notes", ""),
+        "distance": round(min_distance, 6)
+    }
@@ -1,7 +1,10 @@
 import pytest
 import datetime
+import json
 import re
+from db.divergence_reading_index import coerce_reading_value
 from db.future_gadget_lab_data_service import (
+    _COSMOS_READING_VALUE_EXPR,
     FutureGadgetLabDataService,
     WorldLineStatus,
     ExperimentStatus,
@@ -467,49 +470,37 @@ def test_worldline_history_with_experiment_details():
         mock_service.get_all_experiments.return_value = experiments
         mock_service.get_all_divergence_readings.return_value = readings
         
-        # Create a function to mock calculate_worldline_status
-        def mock_calculate_status(exps, readings=None):
-            # Return different statuses based on the number of experiments
-            exp_count = len(exps)
-            base = {"current_worldline": 1.0 + exp_count * 0.1, "base_worldline": 1.0}
-            if exp_count == 0:
-                return base
-            base["experiment_count"] = exp_count
-            return base
+        # Create a mock token object directly instead of using an async function
+        mock_token = type('obj', (object,), {'roles': ["Admin"]})
         
-        # Apply the mock
-        with patch("api.future_gadget_api.calculate_worldline_status", side_effect=mock_calculate_status):
-            # Create a mock token object directly instead of using an async function
-            mock_token = type('obj', (object,), {'roles': ["Admin"]})
+        # Patch the Security dependency in the function
+        with patch("api.future_gadget_api.azure_scheme") as mock_scheme:
+            # Configure the mock to return our token
+            mock_scheme.return_value = mock_token
             
-            # Patch the Security dependency in the function
-            with patch("api.future_gadget_api.azure_scheme") as mock_scheme:
-                # Configure the mock to return our token
-                mock_scheme.return_value = mock_token
-                
-                # Call the function directly with our mock token
-                import asyncio
-                loop = asyncio.get_event_loop()
-                result = loop.run_until_complete(get_worldline_history(token=mock_token))
-                
-                # Now validate the results
-                assert len(result) == 3  # Base state + 2 experiments
-                
-                # Check base state has no experiment
-                assert result[0]["added_experiment"] is None
-                
-                # Check experiment 1 details are included
-                assert result[1]["added_experiment"]["id"] == "EXP-001"
-                assert result[1]["added_experiment"]["name"] == "Test Experiment 1"
-                assert result[1]["added_experiment"]["description"] == "First test experiment"
-                assert result[1]["added_experiment"]["creator_id"] == "Okabe Rintaro"
-                assert "Makise Kurisu" in result[1]["added_experiment"]["collaborators"]
-
-                # Check experiment 2 details are included
-                assert result[2]["added_experiment"]["id"] == "EXP-002"
-                assert result[2]["added_experiment"]["name"] == "Test Experiment 2"
-                assert result[2]["added_experiment"]["status"] == "in_progress"
-                assert result[2]["added_experiment"]["world_line_change"] == -0.048256
+            # Call the function directly with our mock token
+            import asyncio
+            loop = asyncio.get_event_loop()
+            result = loop.run_until_complete(get_worldline_history(token=mock_token))
+            
+            # Now validate the results
+            assert len(result) == 3  # Base state + 2 experiments
+            
+            # Check base state has no experiment
+            assert result[0]["added_experiment"] is None
+            
+            # Check experiment 1 details are included
+            assert result[1]["added_experiment"]["id"] == "EXP-001"
+            assert result[1]["added_experiment"]["name"] == "Test Experiment 1"
+            assert result[1]["added_experiment"]["description"] == "First test experiment"
+            assert result[1]["added_experiment"]["creator_id"] == "Okabe Rintaro"
+            assert "Makise Kurisu" in result[1]["added_experiment"]["collaborators"]
+
+            # Check experiment 2 details are included
+            assert result[2]["added_experiment"]["id"] == "EXP-002"
+            assert result[2]["added_experiment"]["name"] == "Test Experiment 2"
+            assert result[2]["added_experiment"]["status"] == "in_progress"
+            assert result[2]["added_experiment"]["world_line_change"] == -0.048256
 
 
 # ---------------------------------------------------------------------------
@@ -716,4 +707,389 @@ def test_query_cosmos_items_rejects_invalid_input_even_without_cosmos_container(
         service._query_cosmos_items("experiment", filters={"c.evil": "x"})
 
     with pytest.raises(ValueError, match="Invalid Cosmos DB ORDER BY clause"):
-        service._query_cosmos_items("experiment", order_by="evil")
\ No newline at end of file
+        service._query_cosmos_items("experiment", order_by="evil")
+
+
+def test_query_cosmos_items_compiles_range_predicates_to_parameterised_where():
+    service = _cosmos_service()
+
+    service.search_divergence_readings([
+        ("status", "eq", "alpha"),
+        ("reading_value", "ge", 0.5),
+        ("reading_value", "lt", 1.5),
+    ])
+
+    call = service._cosmos_query_recorder.calls[0]
+    reading_value = _COSMOS_READING_VALUE_EXPR
+    assert call["query"] == (
+        "SELECT * FROM c WHERE c.type = @type AND c.status = @f0"
+        f" AND {reading_value} >= @f1 AND {reading_value} < @f2"
+    )
+    assert call["parameters"] == [
+        {"name": "@type", "value": "divergence_reading"},
+        {"name": "@f0", "value": "alpha"},
+        {"name": "@f1", "value": 0.5},
+        {"name": "@f2", "value": 1.5},
+    ]
+
+
+@pytest.mark.parametrize("predicate", [
+    ("c.status", "eq", "x"),
+    ("status = @type OR 1=1 --", "eq", "x"),
+    ("status", "!=", "x"),
+    ("status", "= @f0 OR 1=1 --", "x"),
+    ("status", "eq"),
+])
+def test_filter_predicates_reject_unsafe_fields_and_operators(predicate):
+    service = _cosmos_service()
+
+    with pytest.raises(ValueError, match="Invalid filter predicates"):
+        service.search_divergence_readings([predicate])
+    assert service._cosmos_query_recorder.calls == []
+
+    # TinyDB validates the same way, so the rails hold in every backend.
+    with pytest.raises(ValueError, match="Invalid filter predicates"):
+        MockFutureGadgetLabDataService().search_divergence_readings([predicate])
+
+
+def test_tinydb_search_divergence_readings_matches_python_filters(db_service):
+    """Compiled TinyDB predicates select what the old list comprehensions did"""
+    readings = [
+        {"reading": 1.048596, "status": "steins_gate", "recorded_by": "Okabe"},
+        {"reading": "0.571024", "status": "alpha", "recorded_by": "Okabe"},
+        {"value": 1.382733, "status": "beta", "recorded_by": "Suzuha"},
+        {"status": "alpha", "recorded_by": "Mayuri"},
+    ]
+    for reading in readings:
+        db_service.create_divergence_reading(reading)
+
+    def ids(predicates):
+        return [r["id"] for r in db_service.search_divergence_readings(predicates)]
+
+    assert ids([("reading_value", "ge", 1.0)]) == ["DR-001", "DR-003"]
+    assert ids([("reading_value", "le", 1.0)]) == ["DR-002", "DR-004"]
+    assert ids([("reading_value", "gt", 0.0), ("status", "eq", "alpha")]) == ["DR-002"]
+    assert ids([("recorded_by", "eq", "Okabe"), ("reading_value", "lt", 1.0)]) == ["DR-002"]
+    assert ids([]) == ["DR-001", "DR-002", "DR-003", "DR-004"]
+
+
+class _CosmosExpr:
+    """Evaluates the subset of Cosmos SQL used by ``_COSMOS_READING_VALUE_EXPR``.
+
+    Ternaries, AND / NOT, numbers, ``c.prop`` / ``c["prop"]`` and the type
+    check functions, with Cosmos' ``undefined`` for missing properties and
+    unparsable ``StringToNumber`` arguments.
+    """
+
+    UNDEFINED = object()
+    TOKEN = re.compile(r'\s*(?:(\d+(?:\.\d+)?)|"([^"]*)"|([A-Za-z_]\w*)|(.))')
+
+    def __init__(self, expr):
+        self.tokens = [m.groups() for m in self.TOKEN.finditer(expr) if m.group(0).strip()]
+
+    def evaluate(self, document):
+        self.pos, self.document = 0, document
+        value = self.ternary()
+        assert self.pos == len(self.tokens)
+        return value
+
+    def peek(self):
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else (None, None, None, None)
+
+    def take(self, expected=None):
+        token = self.tokens[self.pos]
+        self.pos += 1
+        if expected is not None:
+            assert expected in token, (expected, token)
+        return token
+
+    def ternary(self):
+        condition = self.conjunction()
+        if self.peek()[3] != "?":
+            return condition
+        self.take("?")
+        when_true = self.ternary()
+        self.take(":")
+        when_false = self.ternary()
+        return when_true if condition is True else when_false
+
+    def conjunction(self):
+        value = self.negation()
+        while self.peek()[2] == "AND":
+            self.take("AND")
+            right = self.negation()
+            value = value is True and right is True
+        return value
+
+    def negation(self):
+        if self.peek()[2] == "NOT":
+            self.take("NOT")
+            return not self.negation()
+        return self.primary()
+
+    def primary(self):
+        number, string, name, punct = self.take()
+        if punct == "(":
+            value = self.ternary()
+            self.take(")")
+            return value
+        if number is not None:
+            return float(number)
+        if name == "c":
+            if self.take()[3] == ".":
+                prop = self.take()[2]
+            else:
+                prop = self.take()[1]
+                self.take("]")
+            return self.document.get(prop, self.UNDEFINED)
+        self.take("(")
+        argument = self.ternary()
+        self.take(")")
+        return getattr(self, "fn_" + name)(argument)
+
+    def fn_IS_DEFINED(self, value):
+        return value is not self.UNDEFINED
+
+    def fn_IS_NULL(self, value):
+        return value is None
+
+    def fn_IS_NUMBER(self, value):
+        return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+    def fn_IS_STRING(self, value):
+        return isinstance(value, str)
+
+    def fn_StringToNumber(self, value):
+        try:
+            number = json.loads(value.strip())
+        except (AttributeError, ValueError):
+            return self.UNDEFINED
+        return number if self.fn_IS_NUMBER(number) else self.UNDEFINED
+
+
+@pytest.mark.parametrize("reading", [
+    {"reading": 1.048596},
+    {"reading": "1.048596"},
+    {"reading": " 0.571024 "},
+    {"reading": "1e-3"},
+    {"reading": "n/a", "value": 2.0},
+    {"reading": None, "value": "3.5"},
+    {"value": 1.382733},
+    {"value": "abc"},
+    {"reading": 2},
+    {},
+])
+def test_cosmos_reading_value_matches_coerce_reading_value(reading):
+    """Cosmos and TinyDB filter on the same value of a reading, string readings included"""
+    assert _CosmosExpr(_COSMOS_READING_VALUE_EXPR).evaluate(reading) == coerce_reading_value(reading)
+
+
+def test_iter_cosmos_items_reads_the_pager_lazily():
+    """Cosmos items are pulled from the pager only as the iterator is consumed"""
+    service = MockFutureGadgetLabDataService()
+    service.storage_backend = "cosmos"
+    service.cosmos_container = MagicMock()
+    pulled = []
+
+    def pager():
+        for i in range(3):
+            pulled.append(i)
+            yield {"id": f"EXP-{i}", "type": "experiment"}
+
+    service.cosmos_container.query_items.return_value = pager()
+
+    items = service.iter_experiments({"status": "planned"})
+
+    assert pulled == []
+    assert next(items) == {"id": "EXP-0"}
+    assert pulled == [0]
+    assert list(items) == [{"id": "EXP-1"}, {"id": "EXP-2"}]
+    assert service.cosmos_container.query_items.call_args.kwargs["query"] == (
+        "SELECT * FROM c WHERE c.type = @type AND c.status = @p0"
+    )
+    with pytest.raises(ValueError):
+        service.iter_experiments({"bad key": "x"})
+
+
+def test_tinydb_iter_divergence_readings_applies_predicates(db_service):
+    for i in range(4):
+        db_service.create_divergence_reading({"reading": i / 2})
+
+    items = db_service.iter_divergence_readings([("reading_value", "lt", 1.0)])
+
+    assert [item["reading"] for item in items] == [0.0, 0.5]
+    assert len(list(db_service.iter_divergence_readings())) == 4
+
+
+def test_tinydb_divergence_pages_apply_predicates_before_paging(db_service):
+    """Every page but the last is full when a predicate filters rows out"""
+    for i in range(10):
+        db_service.create_divergence_reading({"reading": i / 10})
+
+    pages, token = [], None
+    while True:
+        items, token = db_service.get_divergence_readings_page(2, token, [("reading_value", "ge", 0.45)])
+        pages.append([item["reading"] for item in items])
+        if token is None:
+            break
+
+    assert pages == [[0.5, 0.6], [0.7, 0.8], [0.9]]
+
+
+def test_get_worldline_status_matches_full_recalculation(db_service):
+    """The maintained aggregate agrees with calculate_worldline_status after writes"""
+    from db.future_gadget_lab_data_service import calculate_worldline_status
+
+    db_service.create_divergence_reading({"reading": 1.048596, "status": "steins_gate"})
+    first = db_service.create_experiment({
+        "name": "Phone Microwave", "description": "d", "status": "completed",
+        "creator_id": "Okabe", "world_line_change": 0.337192,
+        "timestamp": "2025-04-07T12:00:00.000Z",
+    })
+    db_service.get_worldline_status()
+
+    second = db_service.create_experiment({
+        "name": "D-Mail", "description": "d", "status": "completed",
+        "creator_id": "Kurisu", "world_line_change": -0.048256,
+        "timestamp": "2025-04-08T12:00:00.000Z",
+    })
+    db_service.update_experiment(first["id"], {"world_line_change": 0.1})
+    db_service.delete_experiment(second["id"])
+
+    expected = calculate_worldline_status(
+        db_service.get_all_experiments(), db_service.get_all_divergence_readings()
+    )
+    assert db_service.get_worldline_status() == expected
+
+
+def test_get_worldline_status_does_not_rescan_experiments(db_service):
+    """Only the first status read (or a due reconciliation) lists experiments"""
+    db_service.get_worldline_status()
+    with patch.object(db_service, "get_all_experiments", side_effect=AssertionError("full scan")):
+        db_service.create_experiment({
+            "name": "n", "description": "d", "status": "planned",
+            "creator_id": "c", "world_line_change": 0.5,
+        })
+        status = db_service.get_worldline_status()
+    assert status["experiment_count"] == 1
+    assert status["current_worldline"] == 1.5
+
+
+def test_get_worldline_status_counts_preview_experiment(db_service):
+    """A preview experiment is added on top of the stored experiments"""
+    from db.future_gadget_lab_data_service import calculate_worldline_status
+
+    stored = db_service.create_experiment({
+        "name": "n", "description": "d", "status": "planned",
+        "creator_id": "c", "world_line_change": 0.25,
+        "timestamp": "2025-04-07T12:00:00.000Z",
+    })
+    preview = dict(stored, timestamp="2025-04-09T12:00:00.000Z")
+
+    assert db_service.get_worldline_status(preview_experiment=preview) == calculate_worldline_status(
+        [stored, preview], db_service.get_all_divergence_readings()
+    )
+
+
+def test_get_worldline_status_tracks_reading_writes(db_service):
+    """Reading CRUD keeps the divergence index in step with the store"""
+    from db.future_gadget_lab_data_service import calculate_worldline_status
+
+    db_service.get_worldline_status()
+    with patch.object(db_service, "get_all_divergence_readings", side_effect=AssertionError("full scan")):
+        near = db_service.create_divergence_reading({"reading": "1.1", "status": "beta"})
+        far = db_service.create_divergence_reading({"reading": 0.4})
+        assert db_service.get_worldline_status()["closest_reading"]["value"] == 1.1
+
+        db_service.update_divergence_reading(far["id"], {"reading": 1.0})
+        assert db_service.get_worldline_status()["closest_reading"]["value"] == 1.0
+        db_service.delete_divergence_reading(far["id"])
+        status = db_service.get_worldline_status()
+
+    assert status == calculate_worldline_status([], [near])
+
+
+def test_tinydb_pages_cover_collection_in_order(db_service):
+    """Offset cursors walk the table in insertion order without overlap"""
+    created = [db_service.create_divergence_reading({"reading": i / 10}) for i in range(7)]
+
+    pages, token = [], None
+    while True:
+        items, token = db_service.get_divergence_readings_page(3, token)
+        pages.append([item["id"] for item in items])
+        if token is None:
+            break
+
+    assert pages == [
+        [r["id"] for r in created[0:3]],
+        [r["id"] for r in created[3:6]],
+        [r["id"] for r in created[6:7]],
+    ]
+
+
+def test_tinydb_experiment_pages_apply_filters(db_service):
+    """Filtered pages only contain matching experiments"""
+    for i in range(5):
+        db_service.create_experiment({
+            "name": f"exp-{i}", "description": "d",
+            "status": "completed" if i % 2 else "planned", "creator_id": "c",
+        })
+
+    items, token = db_service.get_experiments_page(10, query_params={"status": "completed"})
+
+    assert [item["name"] for item in items] == ["exp-1", "exp-3"]
+    assert token is None
+
+
+@pytest.mark.parametrize("token", ["%%%", "bm90LWpzb24", "eyJjIjoiYWJjIn0"])
+def test_invalid_continuation_token_is_rejected(db_service, token):
+    """Garbage, non-JSON and Cosmos-shaped tokens are rejected by TinyDB"""
+    from db.future_gadget_lab_data_service import InvalidContinuationTokenError
+
+    with pytest.raises(InvalidContinuationTokenError):
+        db_service.get_divergence_readings_page(5, token)
+
+
+def test_cosmos_page_round_trips_continuation_token():
+    """Cosmos continuation tokens are wrapped opaquely and handed back to by_page"""
+    from db.future_gadget_lab_data_service import _decode_continuation
+
+    service = MockFutureGadgetLabDataService()
+    service.storage_backend = "cosmos"
+    service.cosmos_container = MagicMock()
+    pager = MagicMock()
+    pager.__next__.return_value = [{"id": "EXP-1", "type": "experiment"}]
+    pager.continuation_token = '{"token":"+RID:abc","range":{"min":"","max":"FF"}}'
+    service.cosmos_container.query_items.return_value.by_page.return_value = pager
+
+    items, token = service.get_experiments_page(1, query_params={"status": "planned"})
+
+    assert items == [{"id": "EXP-1"}]
+    assert _decode_continuation(token, "c") == pager.continuation_token
+    kwargs = service.cosmos_container.query_items.call_args.kwargs
+    assert kwargs["max_item_count"] == 1
+    assert kwargs["query"] == "SELECT * FROM c WHERE c.type = @type AND c.status = @p0"
+
+    pager.continuation_token = None
+    service.get_experiments_page(1, continuation=token)
+    service.cosmos_container.query_items.return_value.by_page.assert_called_with(
+        '{"token":"+RID:abc","range":{"min":"","max":"FF"}}'
+    )
+
+
+def test_cosmos_stream_error_after_the_first_item_is_raised():
+    """A stream cut short by Cosmos must not look complete"""
+    from db.future_gadget_lab_data_service import CosmosHttpResponseError
+    service = MockFutureGadgetLabDataService()
+
+    def pager(items):
+        yield from items
+        raise CosmosHttpResponseError(status_code=503, message="unavailable")
+
+    items = service._clean_cosmos_stream(pager([{"id": "EXP-0", "type": "experiment"}]))
+    assert next(items) == {"id": "EXP-0"}
+    with pytest.raises(CosmosHttpResponseError):
+        next(items)
+
+    # Before any item, the error reads as an empty result
+    assert list(service._clean_cosmos_stream(pager([]))) == []
@@ -0,0 +1,194 @@
+"""Incrementally maintained worldline totals for the Future Gadget Lab.
+
+``calculate_worldline_status`` needs the sum of every experiment's
+``world_line_change``, the experiment count and the latest experiment
+timestamp. Re-deriving those from ``get_all_experiments()`` on every status
+read meant a full container scan per ``GET /worldline-status``, per
+non-admin ping on ``/ws/worldline-status`` and per broadcast.
+``WorldlineAggregate`` keeps them in memory instead: the data service applies
+each create / update / delete to it, and a status read is O(1).
+
+The aggregate is per process. With a WebSocket backplane, an experiment
+event relayed from another worker marks it dirty, so that worker's write is
+picked up on the next read (see ``api/future_gadget_api.py``). Other writes
+(directly in Cosmos, or without a backplane) are picked up by a periodic full
+reconciliation against the store, every ``FGL_WORLDLINE_RECONCILE_SECONDS``
+(default 30).
+"""
+
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, Optional
+
+FGL_WORLDLINE_RECONCILE_SECONDS_ENV = "FGL_WORLDLINE_RECONCILE_SECONDS"
+DEFAULT_FGL_WORLDLINE_RECONCILE_SECONDS = 30.0
+
+
+def fgl_worldline_reconcile_seconds() -> float:
+    """Read the reconciliation interval from the environment (0 disables the timer)."""
+    raw = os.environ.get(FGL_WORLDLINE_RECONCILE_SECONDS_ENV, "").strip()
+    try:
+        value = float(raw) if raw else DEFAULT_FGL_WORLDLINE_RECONCILE_SECONDS
+    except ValueError:
+        value = DEFAULT_FGL_WORLDLINE_RECONCILE_SECONDS
+    return max(0.0, value)
+
+
+def _contribution(experiment: Dict[str, Any]) -> Optional[float]:
+    value = experiment.get("world_line_change")
+    return float(value) if value is not None else None
+
+
+class PeriodicReconciliation:
+    """Bookkeeping for in-memory state that is periodically rebuilt from the store.
+
+    Subclasses bump ``_version`` under ``_lock`` on every incremental change
+    and call ``_mark_reconciled`` after a full rebuild.
+
+    Args:
+        reconcile_seconds: Maximum age of the last full reconciliation before
+            ``needs_reconcile()`` asks for another one. ``0`` means only
+            reconcile when the state has never been built.
+        clock: Monotonic clock, injectable for tests
+    """
+
+    def __init__(
+        self,
+        reconcile_seconds: Optional[float] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.reconcile_seconds = (
+            reconcile_seconds if reconcile_seconds is not None else fgl_worldline_reconcile_seconds()
+        )
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._reconciled_at: Optional[float] = None
+        self._version = 0
+
+    @property
+    def version(self) -> int:
+        """Counter bumped by every incremental change; pass it to ``reconcile``."""
+        return self._version
+
+    def needs_reconcile(self) -> bool:
+        """Whether the state should be rebuilt from the store before use."""
+        with self._lock:
+            if self._reconciled_at is None:
+                return True
+            if self.reconcile_seconds <= 0:
+                return False
+            return self._clock() - self._reconciled_at >= self.reconcile_seconds
+
+    def mark_dirty(self) -> None:
+        """Force a full reconciliation on the next read."""
+        with self._lock:
+            self._reconciled_at = None
+
+    def _mark_reconciled(self, since_version: Optional[int]) -> None:
+        # Caller holds ``_lock``. If a write was applied while the full list
+        # was being fetched, the list may already be out of date, so the
+        # state stays due for another reconciliation.
+        raced = since_version is not None and since_version != self._version
+        self._reconciled_at = None if raced else self._clock()
+
+
+class WorldlineAggregate(PeriodicReconciliation):
+    """Running worldline totals, updated per write and reconciled periodically.
+
+    Args:
+        reconcile_seconds: See ``PeriodicReconciliation``
+        clock: Monotonic clock, injectable for tests
+    """
+
+    def __init__(
+        self,
+        reconcile_seconds: Optional[float] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        super().__init__(reconcile_seconds, clock)
+        self._contributions: Dict[str, float] = {}
+        self._timestamps: Dict[str, str] = {}
+        self._experiment_ids: set = set()
+        self._total = 0.0
+        self._latest_timestamp: Optional[str] = None
+        self._latest_stale = False
+
+    def reconcile(self, experiments: Iterable[Dict[str, Any]], since_version: Optional[int] = None) -> None:
+        """Rebuild the totals from a full list of experiments.
+
+        Args:
+            experiments: Every experiment currently in the store
+            since_version: ``version`` read before the list was fetched
+        """
+        contributions: Dict[str, float] = {}
+        timestamps: Dict[str, str] = {}
+        experiment_ids = set()
+        total = 0.0
+        for experiment in experiments:
+            experiment_id = experiment.get("id")
+            experiment_ids.add(experiment_id)
+            value = _contribution(experiment)
+            if value is not None:
+                contributions[experiment_id] = value
+                total += value
+            if experiment.get("timestamp"):
+                timestamps[experiment_id] = experiment["timestamp"]
+
+        with self._lock:
+            self._contributions = contributions
+            self._timestamps = timestamps
+            self._experiment_ids = experiment_ids
+            self._total = total
+            self._latest_timestamp = max(timestamps.values()) if timestamps else None
+            self._latest_stale = False
+            self._mark_reconciled(since_version)
+
+    def upsert(self, experiment: Dict[str, Any]) -> None:
+        """Apply a created or updated experiment."""
+        experiment_id = experiment.get("id")
+        value = _contribution(experiment)
+        timestamp = experiment.get("timestamp") or None
+        with self._lock:
+            self._version += 1
+            self._total -= self._contributions.pop(experiment_id, 0.0)
+            if value is not None:
+                self._contributions[experiment_id] = value
+                self._total += value
+            self._experiment_ids.add(experiment_id)
+
+            previous = self._timestamps.pop(experiment_id, None)
+            if timestamp:
+                self._timestamps[experiment_id] = timestamp
+            if previous is not None and previous == self._latest_timestamp and previous != timestamp:
+                self._latest_stale = True
+            elif timestamp and not self._latest_stale and (
+                self._latest_timestamp is None or timestamp > self._latest_timestamp
+            ):
+                self._latest_timestamp = timestamp
+
+    def remove(self, experiment_id: str) -> None:
+        """Apply a deleted experiment."""
+        with self._lock:
+            self._version += 1
+            self._total -= self._contributions.pop(experiment_id, 0.0)
+            self._experiment_ids.discard(experiment_id)
+            if not self._contributions:
+                # Reset rather than carry float residue from the subtractions.
+                self._total = 0.0
+            previous = self._timestamps.pop(experiment_id, None)
+            if previous is not None and previous == self._latest_timestamp:
+                self._latest_stale = True
+
+    def totals(self) -> Dict[str, Any]:
+        """Return the summed divergence, experiment count and latest timestamp."""
+        with self._lock:
+            if self._latest_stale:
+                # Only after the latest experiment was deleted or back-dated.
+                self._latest_timestamp = max(self._timestamps.values()) if self._timestamps else None
+                self._latest_stale = False
+            return {
+                "total_divergence": self._total,
+                "experiment_count": len(self._experiment_ids),
+                "last_experiment_timestamp": self._latest_timestamp,
+            }
@@ -0,0 +1,105 @@
+import pytest
+
+from db.worldline_aggregate import (
+    DEFAULT_FGL_WORLDLINE_RECONCILE_SECONDS,
+    WorldlineAggregate,
+    fgl_worldline_reconcile_seconds,
+)
+
+
+class FakeClock:
+    def __init__(self, start=100.0):
+        self.now = start
+
+    def __call__(self):
+        return self.now
+
+
+def _exp(exp_id, change, timestamp):
+    return {"id": exp_id, "world_line_change": change, "timestamp": timestamp}
+
+
+def test_needs_reconcile_until_first_build_and_after_interval():
+    clock = FakeClock()
+    aggregate = WorldlineAggregate(reconcile_seconds=30, clock=clock)
+    assert aggregate.needs_reconcile()
+
+    aggregate.reconcile([_exp("A", 0.5, "2025-01-01")])
+    assert not aggregate.needs_reconcile()
+
+    clock.now += 30
+    assert aggregate.needs_reconcile()
+
+
+def test_zero_interval_only_reconciles_once():
+    clock = FakeClock()
+    aggregate = WorldlineAggregate(reconcile_seconds=0, clock=clock)
+    aggregate.reconcile([])
+    clock.now += 10_000
+    assert not aggregate.needs_reconcile()
+    aggregate.mark_dirty()
+    assert aggregate.needs_reconcile()
+
+
+def test_incremental_changes_match_reconciled_totals():
+    aggregate = WorldlineAggregate(reconcile_seconds=0)
+    aggregate.reconcile([_exp("A", 0.5, "2025-01-01"), _exp("B", None, "2025-01-03")])
+
+    aggregate.upsert(_exp("C", -0.25, "2025-01-02"))
+    aggregate.upsert(_exp("A", 0.75, "2025-01-01"))
+    aggregate.remove("B")
+
+    rebuilt = WorldlineAggregate(reconcile_seconds=0)
+    rebuilt.reconcile([_exp("A", 0.75, "2025-01-01"), _exp("C", -0.25, "2025-01-02")])
+    assert aggregate.totals() == rebuilt.totals() == {
+        "total_divergence": 0.5,
+        "experiment_count": 2,
+        "last_experiment_timestamp": "2025-01-02",
+    }
+
+
+def test_latest_timestamp_recomputed_when_latest_is_back_dated():
+    aggregate = WorldlineAggregate(reconcile_seconds=0)
+    aggregate.reconcile([_exp("A", 0.1, "2025-01-01"), _exp("B", 0.1, "2025-01-05")])
+
+    aggregate.upsert(_exp("B", 0.1, "2024-12-31"))
+
+    assert aggregate.totals()["last_experiment_timestamp"] == "2025-01-01"
+
+
+def test_removing_last_experiment_resets_totals():
+    aggregate = WorldlineAggregate(reconcile_seconds=0)
+    aggregate.reconcile([_exp("A", 0.1, "2025-01-01"), _exp("B", 0.2, "2025-01-02")])
+    aggregate.remove("A")
+    aggregate.remove("B")
+
+    assert aggregate.totals() == {
+        "total_divergence": 0.0,
+        "experiment_count": 0,
+        "last_experiment_timestamp": None,
+    }
+
+
+def test_reconcile_racing_a_write_stays_due():
+    aggregate = WorldlineAggregate(reconcile_seconds=0)
+    version = aggregate.version
+    aggregate.upsert(_exp("A", 0.1, "2025-01-01"))
+
+    # The list was fetched before "A" was written.
+    aggregate.reconcile([], since_version=version)
+
+    assert aggregate.needs_reconcile()
+
+
+@pytest.mark.parametrize("raw, expected", [
+    (None, DEFAULT_FGL_WORLDLINE_RECONCILE_SECONDS),
+    ("5", 5.0),
+    ("-1", 0.0),
+    ("soon", DEFAULT_FGL_WORLDLINE_RECONCILE_SECONDS),
+])
+def test_reconcile_seconds_env(monkeypatch, raw, expected):
+    if raw is None:
+        monkeypatch.delenv("FGL_WORLDLINE_RECONCILE_SECONDS", raising=False)
+    else:
+        monkeypatch.setenv("FGL_WORLDLINE_RECONCILE_SECONDS", raw)
+    assert fgl_worldline_reconcile_seconds() == expected
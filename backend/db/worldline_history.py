@@ -0,0 +1,76 @@
+"""Worldline history engine.
+
+``GET /worldline-history`` reports the worldline state after each experiment,
+in timestamp order. It used to call ``calculate_worldline_status`` once per
+experiment on a growing copy of the experiment list, re-summing the prefix,
+re-sorting it and scanning every reading each time (O(n²·m)).
+
+``build_worldline_history`` produces the same states in O((n + m) log m):
+
+- experiments are sorted once, and the cumulative worldline is a prefix sum
+  accumulated in the same order as before, so every float is identical;
+- the closest reading for each state is found by binary search in a
+  ``DivergenceReadingIndex`` built once from the readings, which breaks ties
+  and skips NaN / infinite values exactly as the linear scan did.
+"""
+
+from typing import Any, Dict, List, Optional
+
+from db.divergence_reading_index import DivergenceReadingIndex
+from db.future_gadget_lab_data_service import build_worldline_status
+
+
+def _added_experiment(experiment: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "id": experiment.get("id"),
+        "name": experiment.get("name"),
+        "description": experiment.get("description", ""),
+        "status": experiment.get("status"),
+        "world_line_change": experiment.get("world_line_change", 0),
+        "creator_id": experiment.get("creator_id", "Unknown"),
+        "collaborators": experiment.get("collaborators", []),
+        "results": experiment.get("results", ""),
+        "timestamp": experiment.get("timestamp"),
+    }
+
+
+def build_worldline_history(
+    experiments: List[Dict[str, Any]],
+    readings: Optional[List[Dict[str, Any]]] = None,
+) -> List[Dict[str, Any]]:
+    """Calculate the worldline state before and after each experiment.
+
+    Args:
+        experiments: All experiments; those without a timestamp are skipped
+        readings: Divergence readings used to find the closest reading
+
+    Returns:
+        The base state followed by one state per experiment in timestamp
+        order, each with an ``added_experiment`` summary (``None`` for the
+        base state). Identical to calling ``calculate_worldline_status`` on
+        every prefix of the sorted experiments.
+    """
+    reading_index = DivergenceReadingIndex.from_readings(readings or [])
+
+    sorted_experiments = sorted(
+        [exp for exp in experiments if exp.get('timestamp')],
+        key=lambda x: x.get('timestamp', ''),
+    )
+
+    base_state = build_worldline_status(1.0, 0, None, reading_index=reading_index)
+    base_state["added_experiment"] = None
+    history = [base_state]
+
+    current_worldline = 1.0
+    for count, experiment in enumerate(sorted_experiments, start=1):
+        if experiment.get("world_line_change") is not None:
+            current_worldline += experiment.get("world_line_change", 0.0)
+        # The prefix is in ascending timestamp order, so its latest
+        # timestamp is the one just added.
+        state = build_worldline_status(
+            current_worldline, count, experiment.get("timestamp"), reading_index=reading_index
+        )
+        state["added_experiment"] = _added_experiment(experiment)
+        history.append(state)
+
+    return history
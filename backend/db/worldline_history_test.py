@@ -0,0 +1,140 @@
+import json
+import math
+import os
+import random
+import time
+
+import pytest
+
+from db.future_gadget_lab_data_service import calculate_worldline_status
+from db.worldline_history import build_worldline_history
+
+
+def _legacy_history(all_experiments, readings):
+    """The worldline-history loop as it was before the history engine."""
+    sorted_experiments = sorted(
+        [exp for exp in all_experiments if exp.get('timestamp')],
+        key=lambda x: x.get('timestamp', ''),
+    )
+    history = []
+    accumulated_experiments = []
+    base_state = calculate_worldline_status([], readings)
+    base_state["added_experiment"] = None
+    history.append(base_state)
+    for experiment in sorted_experiments:
+        accumulated_experiments.append(experiment)
+        state = calculate_worldline_status(accumulated_experiments.copy(), readings)
+        state["added_experiment"] = {
+            "id": experiment.get("id"),
+            "name": experiment.get("name"),
+            "description": experiment.get("description", ""),
+            "status": experiment.get("status"),
+            "world_line_change": experiment.get("world_line_change", 0),
+            "creator_id": experiment.get("creator_id", "Unknown"),
+            "collaborators": experiment.get("collaborators", []),
+            "results": experiment.get("results", ""),
+            "timestamp": experiment.get("timestamp")
+        }
+        history.append(state)
+    return history
+
+
+def _experiments(rng, count):
+    experiments = []
+    for i in range(count):
+        experiment = {
+            "id": f"EXP-{i:06d}",
+            "name": f"Experiment {i}",
+            "status": "completed",
+            "world_line_change": rng.choice([None, round(rng.uniform(-0.5, 0.5), 6), rng.uniform(-1, 1)]),
+            # Few distinct timestamps, so equal-timestamp ordering is exercised.
+            "timestamp": rng.choice([None, ""] + [f"2025-04-{day:02d}T12:00:00.000Z" for day in range(1, 29)]),
+        }
+        if rng.random() < 0.2:
+            del experiment["world_line_change"]
+        experiments.append(experiment)
+    return experiments
+
+
+def _readings(rng, count):
+    readings = []
+    for i in range(count):
+        value = rng.choice([
+            round(rng.uniform(0.0, 2.0), 6),
+            rng.uniform(0.0, 2.0),
+            1.0,
+            str(round(rng.uniform(0.0, 2.0), 6)),
+            "not-a-number",
+            None,
+        ])
+        reading = {"id": f"DR-{i:03d}", "status": "alpha", "recorded_by": "Okabe"}
+        if rng.random() < 0.3:
+            reading["value"] = value
+        else:
+            reading["reading"] = value
+        readings.append(reading)
+    return readings
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_matches_legacy_history_byte_for_byte(seed):
+    rng = random.Random(seed)
+    experiments = _experiments(rng, rng.randint(0, 60))
+    readings = _readings(rng, rng.randint(0, 40))
+
+    assert json.dumps(build_worldline_history(experiments, readings)) == json.dumps(
+        _legacy_history(experiments, readings)
+    )
+
+
+def test_equidistant_readings_prefer_first_in_list():
+    experiments = [{"id": "E", "world_line_change": 0.5, "timestamp": "2025-01-01"}]
+    readings = [
+        {"id": "high", "reading": 1.75},
+        {"id": "low", "reading": 1.25},
+        {"id": "dup", "reading": 1.25, "status": "beta"},
+    ]
+
+    history = build_worldline_history(experiments, readings)
+
+    assert history == _legacy_history(experiments, readings)
+    assert history[1]["closest_reading"]["value"] == 1.75
+
+
+def test_non_finite_readings_and_worldlines_fall_back_to_placeholder():
+    experiments = [{"id": "E", "world_line_change": math.inf, "timestamp": "2025-01-01"}]
+    readings = [{"id": "nan", "reading": math.nan}, {"id": "inf", "reading": "inf"}]
+
+    assert json.dumps(build_worldline_history(experiments, readings)) == json.dumps(
+        _legacy_history(experiments, readings)
+    )
+
+
+def test_without_readings_has_no_closest_reading():
+    history = build_worldline_history([{"id": "E", "world_line_change": 0.1, "timestamp": "t"}], [])
+    assert history == _legacy_history([{"id": "E", "world_line_change": 0.1, "timestamp": "t"}], [])
+    assert "closest_reading" not in history[1]
+
+
+def _benchmark(count, reading_count=1000):
+    rng = random.Random(count)
+    experiments = _experiments(rng, count)
+    readings = _readings(rng, reading_count)
+    started = time.perf_counter()
+    history = build_worldline_history(experiments, readings)
+    return history, time.perf_counter() - started
+
+
+def test_benchmark_10k_experiments():
+    history, elapsed = _benchmark(10_000)
+    assert len(history) > 1
+    # The per-prefix loop took ~30s for this input; the engine takes ~0.1s.
+    assert elapsed < 2.0
+
+
+@pytest.mark.skipif(not os.environ.get("FGL_RUN_BENCHMARKS"), reason="set FGL_RUN_BENCHMARKS=1 to run")
+def test_benchmark_100k_experiments():
+    history, elapsed = _benchmark(100_000)
+    print(f"worldline history: 100k experiments in {elapsed:.3f}s")
+    assert len(history) > 1
+    assert elapsed < 10.0
@@ -6,17 +6,13 @@ from contextlib import asynccontextmanager
 import os.path
 import re
 import uvicorn
-# for Application Insights
-from opencensus.ext.fastapi.fastapi_middleware import FastAPIMiddleware
-from opencensus.trace.samplers import ProbabilitySampler
 # Security headers middleware (issue #98): adds CSP, HSTS, X-Frame-Options,
 # X-Content-Type-Options, Referrer-Policy, Permissions-Policy to every
 # HTTP response. The F1 (free) App Service tier does not inject these
 # by default, so the FastAPI app must emit them itself.
 import logging
-from starlette.middleware.base import BaseHTTPMiddleware
-from starlette.responses import JSONResponse, Response
-from starlette.types import ASGIApp
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 
 _logger = logging.getLogger(__name__)
 
@@ -52,48 +48,84 @@ _SECURITY_HEADERS_REFERRER = "strict-origin-when-cross-origin"
 _SECURITY_HEADERS_PERMISSIONS = "camera=(), microphone=(), geolocation=()"
 
 
-class SecurityHeadersMiddleware(BaseHTTPMiddleware):
+# Header names and values, pre-encoded for the ASGI ``http.response.start``
+# message.
+_SECURITY_HEADERS = tuple(
+    (name.lower().encode("latin-1"), value.encode("latin-1"))
+    for name, value in (
+        ("Content-Security-Policy", _SECURITY_HEADERS_CSP),
+        ("Strict-Transport-Security", _SECURITY_HEADERS_HSTS),
+        ("X-Frame-Options", "DENY"),
+        ("X-Content-Type-Options", "nosniff"),
+        ("Referrer-Policy", _SECURITY_HEADERS_REFERRER),
+        ("Permissions-Policy", _SECURITY_HEADERS_PERMISSIONS),
+    )
+)
+
+
+class SecurityHeadersMiddleware:
     """Adds baseline security response headers to every HTTP response.
 
-    See issue #98. ``setdefault`` is used on every header so that
-    downstream middleware (CORS, OpenCensus telemetry) can still emit
+    See issue #98. A header the response already carries is left alone,
+    so downstream middleware (CORS, OpenCensus telemetry) can still emit
     their own headers without being clobbered by this layer.
 
-    The dispatch body is wrapped in ``try/except`` so that unhandled
-    exceptions raised by route handlers (or any inner middleware) still
-    produce a 500 response with the baseline security headers attached.
-    Starlette's ``ServerErrorMiddleware`` sits OUTSIDE the user
-    middleware stack and synthesizes a 500 response directly to the
-    client — bypassing this middleware — so without the explicit catch
-    any uncaught exception would produce a 500 with no security
-    headers. The exception is logged before the synthesized 500 is
-    returned so the traceback still reaches application log
-    aggregation (ServerErrorMiddleware would otherwise log it on its
-    own path, but we never reach that path).
+    This is a plain ASGI middleware: it adds the headers to the
+    ``http.response.start`` message on its way out and passes the body
+    through untouched. Starlette's ``BaseHTTPMiddleware`` would run every
+    request in an extra task and relay the body through a memory stream,
+    which costs time on every request and re-chunks streaming responses.
+
+    Unhandled exceptions raised by route handlers (or any inner
+    middleware) before the response has started still produce a 500
+    response with the baseline security headers attached. Starlette's
+    ``ServerErrorMiddleware`` sits OUTSIDE the user middleware stack and
+    synthesizes a 500 response directly to the client — bypassing this
+    middleware — so without the explicit catch any uncaught exception
+    would produce a 500 with no security headers. The exception is
+    logged before the synthesized 500 is sent so the traceback still
+    reaches application log aggregation (ServerErrorMiddleware would
+    otherwise log it on its own path, but we never reach that path). An
+    exception after the response has started can no longer change it
+    and is re-raised.
     """
 
     def __init__(self, app: ASGIApp) -> None:
-        super().__init__(app)
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        response_started = False
+
+        async def send_with_security_headers(message: Message) -> None:
+            nonlocal response_started
+            if message["type"] == "http.response.start":
+                response_started = True
+                headers = message.get("headers", ())
+                present = {name.lower() for name, _ in headers}
+                message["headers"] = [
+                    *headers,
+                    *(header for header in _SECURITY_HEADERS if header[0] not in present),
+                ]
+            await send(message)
 
-    async def dispatch(self, request, call_next):
         try:
-            resp: Response = await call_next(request)
+            await self.app(scope, receive, send_with_security_headers)
         except Exception:
+            if response_started:
+                raise
             _logger.exception(
                 "Unhandled exception in request handler; returning 500 "
                 "with baseline security headers"
             )
-            resp = JSONResponse(
+            response = JSONResponse(
                 {"detail": "Internal Server Error"},
                 status_code=500,
             )
-        resp.headers.setdefault("Content-Security-Policy", _SECURITY_HEADERS_CSP)
-        resp.headers.setdefault("Strict-Transport-Security", _SECURITY_HEADERS_HSTS)
-        resp.headers.setdefault("X-Frame-Options", "DENY")
-        resp.headers.setdefault("X-Content-Type-Options", "nosniff")
-        resp.headers.setdefault("Referrer-Policy", _SECURITY_HEADERS_REFERRER)
-        resp.headers.setdefault("Permissions-Policy", _SECURITY_HEADERS_PERMISSIONS)
-        return resp
+            await response(scope, receive, send_with_security_headers)
 
 
 # get routers
@@ -151,6 +183,48 @@ def _should_seed_fgl_test_data() -> bool:
     return mock_enabled
 
 
+def _websocket_channels():
+    """Backplane channel name of each WebSocket connection manager."""
+    from api.api import chatConnectionManager
+    from api.future_gadget_api import experiment_connection_manager, worldline_connection_manager
+
+    return {
+        "chat": chatConnectionManager,
+        "experiments": experiment_connection_manager,
+        "worldline": worldline_connection_manager,
+    }
+
+
+async def _open_websocket_backplane():
+    """Start the cross-worker broadcast backplane selected by ``WS_BACKPLANE``.
+
+    Returns the started backplane, or None if none is configured or it
+    could not be started (broadcasts then stay within this worker).
+    """
+    from common.backplane import backplane_from_env
+
+    backplane = backplane_from_env()
+    if backplane is None:
+        return None
+    try:
+        await backplane.start()
+    except Exception as exc:
+        _logger.error("Failed to start WebSocket backplane, broadcasts stay within this worker: %s", exc)
+        await backplane.close()
+        return None
+    for channel, manager in _websocket_channels().items():
+        manager.attach_backplane(backplane, channel)
+    return backplane
+
+
+async def _close_websocket_backplane(backplane) -> None:
+    if backplane is None:
+        return
+    for manager in _websocket_channels().values():
+        manager.detach_backplane()
+    await backplane.close()
+
+
 # Init FastAPI - hide API discovery surface (/docs, /redoc, /openapi.json)
 # in non-dev environments so the schema, Entra app id, Cosmos endpoint,
 # and every privileged route are not exposed to anonymous callers (#95).
@@ -168,8 +242,28 @@ async def lifespan(app: FastAPI):
     where MOCK mode is on — it will only fill an empty store on
     first start.
 
-    Shutdown: nothing to do; the lifespan completes silently.
+    Startup also opens the native asyncio Cosmos client when Cosmos is
+    configured (one pooled client per worker), and the WebSocket broadcast
+    backplane when ``WS_BACKPLANE`` selects one, so broadcasts reach the
+    clients of every worker.
+
+    Shutdown: drop a pending worldline broadcast, close that client and
+    the backplane, and stop the thread pool that runs blocking
+    data-service calls off the event loop (it is re-created lazily on
+    next use).
+
+    Log export is queued while the app runs: it starts first and stops
+    last, writing out the records still queued (see ``common/log.py``).
     """
+    from api.future_gadget_api import (
+        close_async_cosmos_service,
+        fgl_thread_pool_service,
+        open_async_cosmos_service,
+        worldline_broadcaster,
+    )
+    from common.log import log_export
+
+    log_export.start()
     if _should_seed_fgl_test_data():
         # Imported lazily so the lifespan import doesn't pull the
         # data service (and its Cosmos client) at module scope before
@@ -177,7 +271,14 @@ async def lifespan(app: FastAPI):
         from db.future_gadget_lab_data_service import seed_test_data_if_empty
 
         seed_test_data_if_empty(fgl_service, _logger)
+    await open_async_cosmos_service()
+    backplane = await _open_websocket_backplane()
     yield
+    await worldline_broadcaster.close()
+    await _close_websocket_backplane(backplane)
+    await close_async_cosmos_service()
+    fgl_thread_pool_service.shutdown(wait=False)
+    log_export.stop()
 
 
 app = FastAPI(
@@ -187,19 +288,28 @@ app = FastAPI(
     lifespan=lifespan,
 )
 
-from common.log import log_azure_exporter
+from common.log import LogContextMiddleware, log_azure_exporter
+# Application Insights request tracing, sampled per TRACE_* settings
+from common.tracing import SampledFastAPIMiddleware, trace_sampling_policy_from_env
 
 # Only add custom CORS origins if in development
 app.add_middleware(CORSMiddleware,allow_origins=origins, allow_credentials=True, allow_methods=["*"], allow_headers=["*"])
 
-# Add OpenCensus middleware to capture request telemetry
-app.add_middleware( FastAPIMiddleware,  exporter=log_azure_exporter, sampler=ProbabilitySampler(1.0))
+# Add OpenCensus middleware to capture request telemetry. By default only
+# API requests are traced, not the health probe or SPA assets; untraced
+# requests skip OpenCensus entirely (see ``common/tracing.py``).
+app.add_middleware(SampledFastAPIMiddleware, exporter=log_azure_exporter, policy=trace_sampling_policy_from_env())
 
-# Security headers (issue #98). Added last so this middleware ends up
-# OUTERMOST in the stack and therefore sets headers on the final response
-# after CORS and OpenCensus have processed it.
+# Security headers (issue #98). Added after CORS and OpenCensus so it wraps
+# them and sets headers on the final response after they have processed it.
+# Only the log context middleware below sits outside it.
 app.add_middleware(SecurityHeadersMiddleware)
 
+# Per-request log context (request id, route, user, duration) for the
+# structured logs, see ``common/log.py``. Outermost, so it spans the whole
+# request.
+app.add_middleware(LogContextMiddleware)
+
 # Register API Router
 app.include_router(api_router, prefix="/api")
 
@@ -284,7 +284,7 @@ class TestMainModule:
         # Verify at minimum that credentials are allowed, which indicates CORS is enabled
         assert response.headers.get("access-control-allow-credentials") == "true"
     
-    @patch('main.FastAPIMiddleware')
+    @patch('main.SampledFastAPIMiddleware')
     def test_opencensus_middleware_configuration(self, mock_middleware):
         """Test that OpenCensus middleware is configured with the exporter"""
         # This is a bit tricky to test directly. We'll check that the app has middleware
@@ -899,6 +899,146 @@ class TestSecurityHeadersMiddleware:
             ]
 
 
+    @staticmethod
+    async def _call_asgi(asgi_app, path="/", scope_type="http"):
+        """Run one request through ``asgi_app``; return the messages it sent."""
+        sent = []
+
+        async def receive():
+            return {"type": "http.request", "body": b"", "more_body": False}
+
+        async def send(message):
+            sent.append(message)
+
+        scope = {
+            "type": scope_type, "method": "GET", "path": path, "raw_path": path.encode(),
+            "root_path": "", "scheme": "http", "query_string": b"", "headers": [],
+            "client": ("127.0.0.1", 1234), "server": ("testserver", 80),
+            # As uvicorn reports it: responses need not watch for disconnects
+            "http_version": "1.1", "asgi": {"version": "3.0", "spec_version": "2.4"},
+        }
+        await asgi_app(scope, receive, send)
+        return sent
+
+    @pytest.mark.asyncio
+    async def test_streamed_body_passes_through_unchanged(self):
+        """Body messages are forwarded as-is: no buffering, no re-chunking"""
+        from main import SecurityHeadersMiddleware
+
+        body_messages = [
+            {"type": "http.response.body", "body": b"[1,", "more_body": True},
+            {"type": "http.response.body", "body": b"2]", "more_body": True},
+            {"type": "http.response.body", "body": b"", "more_body": False},
+        ]
+
+        async def streaming_app(scope, receive, send):
+            await send({"type": "http.response.start", "status": 200, "headers": [(b"content-type", b"application/json")]})
+            for message in body_messages:
+                await send(message)
+
+        sent = await self._call_asgi(SecurityHeadersMiddleware(streaming_app))
+
+        assert sent[1:] == body_messages
+        names = {name.decode() for name, _ in sent[0]["headers"]}
+        assert self.REQUIRED_HEADERS | {"content-type"} == names
+
+    @pytest.mark.asyncio
+    async def test_existing_security_header_is_kept(self):
+        from main import SecurityHeadersMiddleware
+
+        async def framed_app(scope, receive, send):
+            await send({"type": "http.response.start", "status": 200, "headers": [(b"X-Frame-Options", b"SAMEORIGIN")]})
+            await send({"type": "http.response.body", "body": b""})
+
+        sent = await self._call_asgi(SecurityHeadersMiddleware(framed_app))
+
+        frame_options = [value for name, value in sent[0]["headers"] if name.lower() == b"x-frame-options"]
+        assert frame_options == [b"SAMEORIGIN"]
+
+    @pytest.mark.asyncio
+    async def test_exception_after_response_start_is_reraised(self):
+        """A started response cannot become a 500; the error propagates"""
+        from main import SecurityHeadersMiddleware
+
+        async def failing_stream(scope, receive, send):
+            await send({"type": "http.response.start", "status": 200, "headers": []})
+            raise RuntimeError("stream broke")
+
+        with pytest.raises(RuntimeError, match="stream broke"):
+            await self._call_asgi(SecurityHeadersMiddleware(failing_stream))
+
+    @pytest.mark.asyncio
+    async def test_websocket_scope_is_passed_through(self):
+        from main import SecurityHeadersMiddleware
+
+        seen = []
+
+        async def websocket_app(scope, receive, send):
+            seen.append(scope["type"])
+            await send({"type": "websocket.accept"})
+
+        sent = await self._call_asgi(SecurityHeadersMiddleware(websocket_app), scope_type="websocket")
+
+        assert seen == ["websocket"]
+        assert sent == [{"type": "websocket.accept"}]
+
+    @pytest.mark.asyncio
+    async def test_security_headers_benchmark_health_and_static(self, tmp_path):
+        """Benchmark: per-request cost of the ASGI middleware vs BaseHTTPMiddleware."""
+        import time
+        from fastapi import FastAPI
+        from fastapi.responses import FileResponse
+        from starlette.middleware.base import BaseHTTPMiddleware
+        from main import SecurityHeadersMiddleware, _SECURITY_HEADERS
+
+        class BaseHTTPSecurityHeaders(BaseHTTPMiddleware):
+            # The previous implementation, for comparison
+            async def dispatch(self, request, call_next):
+                response = await call_next(request)
+                for name, value in _SECURITY_HEADERS:
+                    response.headers.setdefault(name.decode(), value.decode())
+                return response
+
+        asset = tmp_path / "index-abc123.js"
+        asset.write_text("console.log('El Psy Kongroo');" * 100)
+
+        def build(middleware):
+            bench_app = FastAPI()
+
+            @bench_app.get("/health")
+            async def health():
+                return {"status": "ok"}
+
+            @bench_app.get("/assets/app.js")
+            async def static_asset():
+                return FileResponse(asset, media_type="application/javascript")
+
+            if middleware is not None:
+                bench_app.add_middleware(middleware)
+            return bench_app
+
+        apps = {
+            "none": build(None),
+            "asgi": build(SecurityHeadersMiddleware),
+            "base_http": build(BaseHTTPSecurityHeaders),
+        }
+        requests = 500
+        timings = {}
+        for path in ("/health", "/assets/app.js"):
+            for name, bench_app in apps.items():
+                await self._call_asgi(bench_app, path)  # warm up
+                started = time.perf_counter()
+                for _ in range(requests):
+                    sent = await self._call_asgi(bench_app, path)
+                timings[path, name] = (time.perf_counter() - started) / requests
+                assert sent[0]["status"] == 200
+
+        print(", ".join(
+            f"{path} {name}: {seconds * 1e6:.0f}us/request" for (path, name), seconds in timings.items()
+        ))
+        for path in ("/health", "/assets/app.js"):
+            assert timings[path, "asgi"] < timings[path, "base_http"]
+
 # Module-level fixture for the /health endpoint is no longer needed:
 # the health handler now returns a static ``{"status": "ok"}`` payload
 # (issue #100) and no longer calls psutil, so there is nothing to mock.
@@ -1157,6 +1297,31 @@ class TestFglTestDataSeeding:
             assert len(main.fgl_service.get_all_divergence_readings()) == before_read
 
 
+class TestWebSocketBackplaneLifespan:
+    """The lifespan hook attaches every WebSocket manager to the backplane."""
+
+    def test_backplane_is_off_by_default(self, monkeypatch):
+        monkeypatch.delenv("WS_BACKPLANE", raising=False)
+        monkeypatch.setenv("SEED_FGL_TEST_DATA", "false")
+        with TestClient(main.app):
+            assert all(m.backplane is None for m in main._websocket_channels().values())
+
+    def test_unix_backplane_attached_for_app_lifetime(self, monkeypatch, tmp_path):
+        monkeypatch.setenv("WS_BACKPLANE", "unix")
+        monkeypatch.setenv("WS_BACKPLANE_DIR", str(tmp_path))
+        monkeypatch.setenv("SEED_FGL_TEST_DATA", "false")
+
+        with TestClient(main.app):
+            channels = main._websocket_channels()
+            backplanes = {id(m.backplane) for m in channels.values()}
+            assert len(backplanes) == 1 and None not in {m.backplane for m in channels.values()}
+            assert {m.channel for m in channels.values()} == {"chat", "experiments", "worldline"}
+            assert len(list(tmp_path.glob("*.sock"))) == 1
+
+        assert all(m.backplane is None for m in main._websocket_channels().values())
+        assert list(tmp_path.glob("*.sock")) == []
+
+
 class TestSeedTestDataIfEmpty:
     """Unit tests for the ``seed_test_data_if_empty`` helper itself,
     independent of the ``main`` lifespan wiring.
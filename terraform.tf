@@ -72,6 +72,8 @@ resource "azurerm_linux_web_app" "web" {
     "APPINSIGHTS_INSTRUMENTATIONKEY" = azurerm_application_insights.log.instrumentation_key
     // !!! IMPORTANT or python site will not build !!!
     "SCM_DO_BUILD_DURING_DEPLOYMENT" = true
+    // Relay WebSocket broadcasts between the gunicorn workers of an instance
+    "WS_BACKPLANE" = "unix"
   }
 }
 